@@ -1,6 +1,6 @@
 import numpy as np
 from argparse import ArgumentParser
-from adaptiveleak.utils.file_utils import read_json_gz
+from adaptiveleak.utils.message_log import read_result
 
 
 if __name__ == '__main__':
@@ -9,7 +9,7 @@ if __name__ == '__main__':
     parser.add_argument('--label', type=int, required=True)
     args = parser.parse_args()
 
-    log = read_json_gz(args.file)
+    log = read_result(args.file)
     test = log['attack']['test']
     idx = args.label
 
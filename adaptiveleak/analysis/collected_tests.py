@@ -1,12 +1,14 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import scipy.stats as stats
 import os.path
 from argparse import ArgumentParser
 from collections import defaultdict
-from typing import DefaultDict, Dict, List
+from typing import DefaultDict, Dict, List, Tuple
 
 from adaptiveleak.analysis.plot_utils import PLOT_STYLE, PLOT_SIZE, TITLE_FONT, AXIS_FONT, to_label
-from adaptiveleak.utils.file_utils import read_json_gz
+from adaptiveleak.utils.analysis import summary_path
+from adaptiveleak.utils.file_utils import read_json, read_json_gz
 
 
 CLASS_LABELS = {
@@ -14,28 +16,45 @@ CLASS_LABELS = {
 }
 
 
+def size_stats_from_summary(path: str) -> Tuple[str, Dict[int, Tuple[float, float, int]]]:
+    """
+    Reads the (mean, sample std, count) of the message sizes for each label from the result summary.
+    """
+    summary = read_json(path)
+    label_stats = {int(label): (group['num_bytes']['mean'], group['num_bytes']['std'], group['num_bytes']['count']) for label, group in summary['labels'].items()}
+    return summary['policy']['policy_name'], label_stats
 
-if __name__ == '__main__':
-    parser = ArgumentParser()
-    parser.add_argument('--log-file', type=str, required=True)
-    parser.add_argument('--output-file', type=str)
-    args = parser.parse_args()
-
-    sim_log = read_json_gz(args.log_file)
-    policy_name = sim_log['policy']['policy_name']
 
-    # Get the labels and number of bytes
-    labels: List[int] = sim_log['labels']
-    num_bytes: List[int] = sim_log['num_bytes']
+def size_stats_from_log(path: str) -> Tuple[str, Dict[int, Tuple[float, float, int]]]:
+    """
+    Computes the (mean, sample std, count) of the message sizes for each label from the full log.
+    """
+    sim_log = read_json_gz(path)
 
     # Group the byte distributions by label
     label_counts: DefaultDict[int, List[int]] = defaultdict(list)
 
-    for label, byte_count in zip(labels, num_bytes):
+    for label, byte_count in zip(sim_log['labels'], sim_log['num_bytes']):
         label_counts[label].append(byte_count)
 
+    label_stats = {label: (np.average(counts), np.std(counts, ddof=1), len(counts)) for label, counts in label_counts.items()}
+    return sim_log['policy']['policy_name'], label_stats
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log-file', type=str, required=True)
+    parser.add_argument('--output-file', type=str)
+    args = parser.parse_args()
+
+    # Use the compact summary when available (avoids reading the full log)
+    if os.path.exists(summary_path(args.log_file)):
+        policy_name, size_stats = size_stats_from_summary(summary_path(args.log_file))
+    else:
+        policy_name, size_stats = size_stats_from_log(args.log_file)
+
     # Get the number of classes
-    num_classes = max(labels) + 1
+    num_classes = max(size_stats.keys()) + 1
 
     # Execute the t-tests
     test_results: List[List[int]] = []
@@ -44,7 +63,10 @@ if __name__ == '__main__':
         label1_results: List[int] = []
 
         for label2 in range(num_classes):
-            test_stat, p_value = stats.ttest_ind(label_counts[label1], label_counts[label2], equal_var=False)
+            mean1, std1, count1 = size_stats.get(label1, (0.0, 0.0, 0))
+            mean2, std2, count2 = size_stats.get(label2, (0.0, 0.0, 0))
+
+            test_stat, p_value = stats.ttest_ind_from_stats(mean1, std1, count1, mean2, std2, count2, equal_var=False)
             label1_results.append(p_value)
 
         test_results.append(label1_results)
@@ -1,5 +1,6 @@
 import numpy as np
 import math
+import os.path
 import scipy.stats as stats
 import time
 from argparse import ArgumentParser
@@ -9,7 +10,8 @@ from typing import Dict, List, DefaultDict, Optional, Tuple, Iterable
 
 from adaptiveleak.analysis.plot_utils import iterate_policy_folders
 from adaptiveleak.utils.constants import POLICIES, SMALL_NUMBER
-from adaptiveleak.utils.file_utils import read_json_gz, iterate_dir, save_json_gz
+from adaptiveleak.utils.file_utils import read_json_gz, iterate_dir
+from adaptiveleak.utils.message_log import message_log_path, read_message_log, save_result_output
 
 
 BIN_FACTOR = 10
@@ -115,27 +117,35 @@ if __name__ == '__main__':
 
     for folder in iterate_policy_folders([args.folder], dataset=args.dataset):
         for sim_file in iterate_dir(folder, pattern='.*json.gz'):
-            model = read_json_gz(sim_file)
+            log_path = message_log_path(sim_file)
 
-            num_bytes = model['num_bytes']
-            labels = model['labels']
+            if os.path.exists(log_path):
+                message_log = read_message_log(log_path)
+                num_bytes = message_log['num_bytes'].tolist()
+                labels = message_log['labels'].tolist()
+                policy_dict = message_log.metadata['policy']
+            else:
+                model = read_json_gz(sim_file)
+                num_bytes = model['num_bytes']
+                labels = model['labels']
+                policy_dict = model['policy']
 
             byte_dist: DefaultDict[int, List[int]] = defaultdict(list)
             for label, byte_count in zip(labels, num_bytes):
                 byte_dist[label].append(byte_count)
 
-            encoding_mode = model['policy']['encoding_mode'].lower()
+            encoding_mode = policy_dict['encoding_mode'].lower()
 
             if encoding_mode in ('single_group', 'group_unshifted'):
                 continue
 
-            name = '{0}_{1}'.format(model['policy']['policy_name'].lower(), encoding_mode)
-            energy_per_seq = model['policy']['energy_per_seq']
+            name = '{0}_{1}'.format(policy_dict['policy_name'].lower(), encoding_mode)
+            energy_per_seq = policy_dict['energy_per_seq']
 
             if name not in ('adaptive_heuristic_standard', 'adaptive_deviation_standard', 'skip_rnn_standard'):
                 test_result = run_test(byte_dist, num_trials=1)
             else:
                 test_result = run_test(byte_dist, num_trials=args.trials)
 
-            model['mutual_information'] = test_result
-            save_json_gz(model, sim_file)
+            # Save the test outcome in the sidecar (rewriting the full result is slow)
+            save_result_output(sim_file, key='mutual_information', value=test_result)
@@ -8,7 +8,8 @@ from adaptiveleak.analysis.plot_utils import COLORS, PLOT_STYLE, LINE_WIDTH, MAR
 from adaptiveleak.analysis.plot_utils import LEGEND_FONT, AXIS_FONT, PLOT_SIZE, TITLE_FONT
 from adaptiveleak.analysis.plot_utils import iterate_policy_folders, dataset_label
 from adaptiveleak.utils.constants import POLICIES, SMALL_NUMBER
-from adaptiveleak.utils.file_utils import read_json_gz, iterate_dir
+from adaptiveleak.utils.file_utils import iterate_dir
+from adaptiveleak.utils.message_log import read_result
 
 
 def plot(information_results: DefaultDict[str, Dict[float, float]], dataset: str, output_file: Optional[str]):
@@ -67,7 +68,7 @@ if __name__ == '__main__':
 
     for folder in iterate_policy_folders([args.folder], dataset=args.dataset):
         for sim_file in iterate_dir(folder, pattern='.*json.gz'):
-            model = read_json_gz(sim_file)
+            model = read_result(sim_file)
 
             if model['policy']['encoding_mode'].lower() in ('single_group', 'group_unshifted', 'pruned'):
                 continue
@@ -3,7 +3,8 @@ import os.path
 from itertools import chain
 from typing import List, Tuple, Iterable, Dict, Optional, Any
 
-from adaptiveleak.utils.file_utils import iterate_dir, read_json_gz
+from adaptiveleak.utils.file_utils import iterate_dir
+from adaptiveleak.utils.message_log import read_result
 
 
 PLOT_STYLE = 'seaborn-ticks'
@@ -85,7 +86,7 @@ def extract_results(folder: str, field: str, aggregate_mode: Optional[str], defa
     name = ''
 
     for path in iterate_dir(folder, '.*json.gz'):
-        serialized = read_json_gz(path)
+        serialized = read_result(path)
 
         energy_per_seq = serialized['policy']['energy_per_seq']
         name = '{0}_{1}'.format(serialized['policy']['policy_name'].lower(), serialized['policy']['encoding_mode'].lower())
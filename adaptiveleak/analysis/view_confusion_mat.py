@@ -1,6 +1,6 @@
 from argparse import ArgumentParser
 
-from adaptiveleak.utils.file_utils import read_json_gz
+from adaptiveleak.utils.message_log import read_result
 
 
 if __name__ == '__main__':
@@ -8,6 +8,6 @@ if __name__ == '__main__':
     parser.add_argument('--log-path', type=str, required=True, help='Path to the target jsonl.gz log.')
     args = parser.parse_args()
 
-    attack_log = read_json_gz(args.log_path)['attack']['test']
+    attack_log = read_result(args.log_path)['attack']['test']
     print('Confusion Matrices for all 5 folds.')
     print(attack_log['confusion_mat'])
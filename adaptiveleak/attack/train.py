@@ -12,8 +12,9 @@ from typing import Any, Dict, Tuple, List, DefaultDict
 
 from adaptiveleak.utils.analysis import geometric_mean
 from adaptiveleak.utils.constants import ENCODING, POLICIES
-from adaptiveleak.utils.file_utils import read_json_gz, save_json_gz, iterate_dir, make_dir
+from adaptiveleak.utils.file_utils import read_json_gz, iterate_dir, make_dir
 from adaptiveleak.utils.loading import load_data
+from adaptiveleak.utils.message_log import message_log_path, read_message_log, save_result_output
 
 
 AttackResult = namedtuple('AttackResult', ['accuracy', 'precision', 'recall', 'f1', 'ndcg', 'dcg', 'top2', 'confusion_mat'])
@@ -231,14 +232,20 @@ if __name__ == '__main__':
     for path in iterate_dir(policy_folder, '.*json.gz'):
         print('===== STARTING {0} ====='.format(path))
 
-        policy_result = read_json_gz(path)
-
         model_name = os.path.basename(path)
         model_name = model_name.split('.')[0]
 
-        # Get the message sizes
-        message_sizes = policy_result['num_bytes']
-        message_labels = policy_result['labels']
+        # Get the message sizes (from the columnar log when available, which avoids parsing the full result)
+        log_path = message_log_path(path)
+
+        if os.path.exists(log_path):
+            message_log = read_message_log(log_path)
+            message_sizes = message_log['num_bytes'].tolist()
+            message_labels = message_log['labels'].tolist()
+        else:
+            policy_result = read_json_gz(path)
+            message_sizes = policy_result['num_bytes']
+            message_labels = policy_result['labels']
 
         # Pad with the average message size when the budget expires
         if len(message_labels) < len(test_labels):
@@ -255,6 +262,5 @@ if __name__ == '__main__':
                                          name=model_name,
                                          save_folder=save_folder)
 
-        # Save the attack result
-        policy_result['attack'] = attack_result
-        save_json_gz(policy_result, path)
+        # Save the attack result in the sidecar (rewriting the full result is slow)
+        save_result_output(path, key='attack', value=attack_result)
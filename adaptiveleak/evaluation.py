@@ -0,0 +1,177 @@
+import numpy as np
+from collections import namedtuple
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+from adaptiveleak.server import reconstruct_sequences
+from adaptiveleak.utils.analysis import ErrorAccumulator
+
+
+DEFAULT_CHUNK_SIZE = 64
+
+SharedArrayInfo = namedtuple('SharedArrayInfo', ['name', 'shape', 'dtype'])
+EvaluationResult = namedtuple('EvaluationResult', ['errors', 'maes', 'rmses'])
+
+
+# The shared arrays attached in each worker process
+_WORKER_ARRAYS: Dict[str, np.ndarray] = dict()
+_WORKER_MEMORY: List[SharedMemory] = []
+
+
+def evaluate_chunk(inputs: np.ndarray, measurements: np.ndarray, collected_mask: np.ndarray, seq_errors: np.ndarray, start: int, end: int) -> ErrorAccumulator:
+    """
+    Reconstructs and scores the sequences in [start, end).
+
+    Args:
+        inputs: A [N, T, D] array of true sequences
+        measurements: A [N, T, D] array holding the collected measurements
+        collected_mask: A [N, T] boolean array marking the collected elements
+        seq_errors: A [N, 2] array which receives the MAE and RMSE of each sequence
+        start: The first sequence index
+        end: The (exclusive) last sequence index
+    Returns:
+        The error metrics of the chunk
+    """
+    reconstructed = reconstruct_sequences(measurements=measurements[start:end], collected_mask=collected_mask[start:end])  # [B, T, D]
+    accumulator = ErrorAccumulator(num_features=inputs.shape[-1])
+
+    for offset, (true, pred) in enumerate(zip(inputs[start:end], reconstructed)):
+        errors = accumulator.add(y_true=true, y_pred=pred)
+        seq_errors[start + offset, 0] = errors.mae
+        seq_errors[start + offset, 1] = errors.rmse
+
+    return accumulator
+
+
+def _attach_worker(infos: Dict[str, SharedArrayInfo]):
+    for key, info in infos.items():
+        memory = SharedMemory(name=info.name)
+        _WORKER_MEMORY.append(memory)
+        _WORKER_ARRAYS[key] = np.ndarray(shape=info.shape, dtype=info.dtype, buffer=memory.buf)
+
+
+def _evaluate_shared_chunk(bounds: Tuple[int, int]) -> ErrorAccumulator:
+    return evaluate_chunk(inputs=_WORKER_ARRAYS['inputs'],
+                          measurements=_WORKER_ARRAYS['measurements'],
+                          collected_mask=_WORKER_ARRAYS['collected_mask'],
+                          seq_errors=_WORKER_ARRAYS['seq_errors'],
+                          start=bounds[0],
+                          end=bounds[1])
+
+
+class ParallelEvaluator:
+    """
+    Reconstructs and scores batches of sequences on a process pool. The inputs,
+    collected measurements and masks live in shared memory, so callers fill the
+    arrays in place and the tasks only send chunk bounds. Each chunk returns its own
+    ErrorAccumulator, and the accumulators are merged (in order) at the end.
+    With a single worker, the chunks run in the calling process.
+    """
+
+    def __init__(self, max_num_sequences: int, seq_length: int, num_features: int, num_workers: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        assert max_num_sequences > 0, 'Must provide a positive number of sequences'
+        assert num_workers >= 1, 'Must provide at least one worker'
+        assert chunk_size >= 1, 'Must provide a positive chunk size'
+
+        self._max_num_sequences = max_num_sequences
+        self._num_features = num_features
+        self._num_workers = num_workers
+        self._chunk_size = chunk_size
+
+        shapes = {
+            'inputs': ((max_num_sequences, seq_length, num_features), np.float64),
+            'measurements': ((max_num_sequences, seq_length, num_features), np.float64),
+            'collected_mask': ((max_num_sequences, seq_length), np.bool_),
+            'seq_errors': ((max_num_sequences, 2), np.float64)
+        }
+
+        self._memory: List[SharedMemory] = []
+        self._arrays: Dict[str, np.ndarray] = dict()
+        infos: Dict[str, SharedArrayInfo] = dict()
+
+        for key, (shape, dtype) in shapes.items():
+            num_bytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            memory = SharedMemory(create=True, size=num_bytes)
+
+            self._memory.append(memory)
+            self._arrays[key] = np.ndarray(shape=shape, dtype=dtype, buffer=memory.buf)
+            infos[key] = SharedArrayInfo(name=memory.name, shape=shape, dtype=np.dtype(dtype).str)
+
+        self._arrays['collected_mask'][:] = False
+
+        self._pool: Optional[Any] = None
+        if num_workers > 1:
+            self._pool = Pool(processes=num_workers, initializer=_attach_worker, initargs=(infos, ))
+
+    @property
+    def max_num_sequences(self) -> int:
+        return self._max_num_sequences
+
+    @property
+    def num_workers(self) -> int:
+        return self._num_workers
+
+    @property
+    def inputs(self) -> np.ndarray:
+        return self._arrays['inputs']
+
+    @property
+    def measurements(self) -> np.ndarray:
+        return self._arrays['measurements']
+
+    @property
+    def collected_mask(self) -> np.ndarray:
+        return self._arrays['collected_mask']
+
+    def evaluate(self, num_sequences: Optional[int] = None) -> EvaluationResult:
+        """
+        Reconstructs and scores the first num_sequences sequences of the shared arrays.
+
+        Returns:
+            The merged error metrics and the [N] per-sequence MAE and RMSE values
+        """
+        num_sequences = self._max_num_sequences if num_sequences is None else num_sequences
+        assert 0 < num_sequences <= self._max_num_sequences, 'Can evaluate at most {0} sequences. Got {1}'.format(self._max_num_sequences, num_sequences)
+
+        chunks = [(start, min(start + self._chunk_size, num_sequences)) for start in range(0, num_sequences, self._chunk_size)]
+
+        if self._pool is not None:
+            chunk_errors = self._pool.map(_evaluate_shared_chunk, chunks)
+        else:
+            chunk_errors = [evaluate_chunk(inputs=self.inputs,
+                                           measurements=self.measurements,
+                                           collected_mask=self.collected_mask,
+                                           seq_errors=self._arrays['seq_errors'],
+                                           start=start,
+                                           end=end) for start, end in chunks]
+
+        errors = ErrorAccumulator(num_features=self._num_features)
+        for accumulator in chunk_errors:
+            errors.merge(accumulator)
+
+        seq_errors = self._arrays['seq_errors']
+        return EvaluationResult(errors=errors,
+                                maes=seq_errors[0:num_sequences, 0].copy(),
+                                rmses=seq_errors[0:num_sequences, 1].copy())
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        # Release the array views before closing the shared blocks
+        self._arrays.clear()
+
+        for memory in self._memory:
+            memory.close()
+            memory.unlink()
+
+        self._memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,97 @@
+#!/bin/python3
+
+import numpy as np
+import os.path
+from argparse import ArgumentParser
+from typing import List, Tuple
+
+from adaptiveleak.policies import BudgetWrappedPolicy
+from adaptiveleak.size_predictor import SizePredictor, mean_group_width, size_model_path, calibrate_threshold, policy_messages, message_features, sample_inputs
+from adaptiveleak.size_predictor import DEFAULT_L2, NUM_SAMPLES
+from adaptiveleak.utils.file_utils import make_dir
+from adaptiveleak.utils.loading import load_data
+
+
+def collect_samples(policy: BudgetWrappedPolicy, inputs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Runs the exact group encoder on the policy's message for each sequence. The policy
+    uses the calibrated threshold (see calibrate_threshold()) on the given inputs.
+
+    Args:
+        policy: The (group encoding) policy
+        inputs: A [N, T, D] array of sequences
+    Returns:
+        A tuple of three elements:
+            (1) A [N, F] array of message features
+            (2) A [N] array of the unpadded message sizes
+            (3) A [N] array of the average group widths
+    """
+    calibrate_threshold(policy, inputs=inputs)
+    messages = policy_messages(policy, inputs=inputs)
+
+    size_list: List[int] = []
+    width_list: List[float] = []
+
+    for policy_result in messages:
+        group_encoding = policy.encode_group(measurements=policy_result.measurements,
+                                             collected_indices=policy_result.collected_indices)
+
+        size_list.append(len(group_encoding.encoded))
+        width_list.append(mean_group_width(group_encoding.widths, group_encoding.group_sizes))
+
+    return message_features(policy, messages), np.array(size_list), np.array(width_list)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--dataset', type=str, required=True)
+    parser.add_argument('--policy', type=str, required=True, choices=['adaptive_heuristic', 'adaptive_deviation'])
+    parser.add_argument('--encoding', type=str, default='group', choices=['group', 'group_unshifted', 'single_group'])
+    parser.add_argument('--collection-rates', type=float, nargs='+', required=True)
+    parser.add_argument('--collect', type=str, required=True, choices=['tiny', 'low', 'med', 'high'])
+    parser.add_argument('--encryption', type=str, required=True, choices=['stream', 'block'])
+    parser.add_argument('--num-samples', type=int, default=NUM_SAMPLES)
+    parser.add_argument('--l2', type=float, default=DEFAULT_L2)
+    args = parser.parse_args()
+
+    # Fit on the validation set and measure the errors on the (held-out) training set
+    inputs, _ = load_data(args.dataset, fold='validation')
+    test_inputs, _ = load_data(args.dataset, fold='train')
+
+    num_seq, seq_length, num_features = inputs.shape
+    rand = np.random.RandomState(seed=9812)
+
+    train_samples: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+    test_samples: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+
+    for collection_rate in args.collection_rates:
+        policy = BudgetWrappedPolicy(name=args.policy,
+                                     collection_rate=collection_rate,
+                                     seq_length=seq_length,
+                                     num_features=num_features,
+                                     encryption_mode=args.encryption,
+                                     collect_mode=args.collect,
+                                     encoding=args.encoding,
+                                     dataset=args.dataset,
+                                     should_compress=False)
+
+        train_samples.append(collect_samples(policy, sample_inputs(inputs, args.num_samples, rand)))
+        test_samples.append(collect_samples(policy, sample_inputs(test_inputs, args.num_samples, rand)))
+
+    train_features, train_sizes, train_widths = [np.concatenate(arrays) for arrays in zip(*train_samples)]
+    test_features, test_sizes, test_widths = [np.concatenate(arrays) for arrays in zip(*test_samples)]
+
+    predictor = SizePredictor.fit(features=train_features, num_bytes=train_sizes, widths=train_widths, l2=args.l2)
+    errors = predictor.evaluate(features=test_features, num_bytes=test_sizes, widths=test_widths)
+
+    print('Held-out samples: {0}'.format(test_features.shape[0]))
+    for name, error in errors.items():
+        print('{0:>9}: Worst Case {1:.4f}, P99 {2:.4f}, MAE {3:.4f}'.format(name, error.max_error, error.p99_error, error.mae))
+
+    output_path = size_model_path(dataset=args.dataset,
+                                  policy_name=args.policy,
+                                  encoding=args.encoding,
+                                  encryption=args.encryption,
+                                  collect_mode=args.collect)
+    make_dir(os.path.dirname(output_path))
+    predictor.save(output_path)
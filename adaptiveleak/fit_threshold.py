@@ -3,18 +3,26 @@
 import os.path
 import numpy as np
 import time
-from collections import defaultdict, namedtuple
+from collections import OrderedDict, defaultdict, namedtuple
 from argparse import ArgumentParser
-from typing import List
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
 
-from adaptiveleak.server import reconstruct_sequence
+from adaptiveleak.evaluation import ParallelEvaluator, SharedArrayInfo
+from adaptiveleak.server import reconstruct_sequences
 from adaptiveleak.policies import run_policy, BudgetWrappedPolicy
-from adaptiveleak.utils.constants import SMALL_NUMBER, BIG_NUMBER
+from adaptiveleak.size_predictor import SizePredictor, size_model_path, calibrate_threshold, policy_messages, message_features, sample_inputs
+from adaptiveleak.size_predictor import NUM_SAMPLES
+from adaptiveleak.threshold_sweep import fit_by_sweep, supports_sweep, curve_key, curve_thresholds, collected_counts, invert_energy_curve, sequence_energy, CURVE_SIZE
+from adaptiveleak.utils.constants import SMALL_NUMBER, BIG_NUMBER, MIN_WIDTH
 from adaptiveleak.utils.loading import load_data
 from adaptiveleak.utils.file_utils import iterate_dir, read_json, save_json_gz, read_json_gz
 
 
 BatchResult = namedtuple('BatchResult', ['mae', 'did_exhaust'])
+BatchCollection = namedtuple('BatchCollection', ['collected', 'collected_mask', 'did_exhaust'])
+SearchTask = namedtuple('SearchTask', ['collection_rate', 'threshold', 'batch_indices', 'energy_margin', 'seed'])
 VAL_BATCH_SIZE = 512
 MAX_ITER = 100  # Prevents any unexpected infinite looping
 
@@ -25,42 +33,281 @@ MARGIN_FACTOR = 0.001  # Go in increments of 0.1% of the total budget (~10mJ)
 THRESHOLD_FACTOR_UPPER = 1.75  # Bias toward reducing the energy rate every time we increase the margin
 THRESHOLD_FACTOR_LOWER = 0.5
 TOLERANCE = 1e-4
+SEARCH_SEED = 581
+SIZE_SEED = 9812
+VAL_SEED = 3485
+MAX_CACHED_BATCHES = 4096
 
 
-def execute_on_batch(policy: BudgetWrappedPolicy, batch: np.ndarray, energy_margin: float) -> BatchResult:
+# The policy configuration, cached policies and shared fitting inputs of each search worker
+_SEARCH_STATE: Dict[str, Any] = dict()
+
+
+def collect_batch(policy: BudgetWrappedPolicy, batch: np.ndarray, energy_margin: float, stop_on_exhaust: bool = False) -> BatchCollection:
+    """
+    Executes the policy on each sequence under the (reduced) budget, placing the collected
+    measurements into a [B, T, D] array so we can later reconstruct the whole batch at once.
+
+    Args:
+        policy: The policy to execute
+        batch: A [B, T, D] array of sequences
+        energy_margin: The fraction of the budget to hold back
+        stop_on_exhaust: Whether to stop at the first sequence which exhausts the budget. The collected
+            values are then incomplete, so only the exhaustion flag is meaningful.
+    Returns:
+        The collected measurements, the [B, T] collected mask and whether the policy exhausted the budget
+    """
     policy.init_for_experiment(num_sequences=batch.shape[0])
 
     # Reduce the budget by the given margin factor
     margin = policy._budget * energy_margin
     policy._budget -= margin
 
-    # Execute the policy on each sequence
-    estimated_list: List[np.ndarray] = []
-
-    num_collected = 0
-    total = 0
+    collected = np.zeros(shape=batch.shape, dtype=float)
+    collected_mask = np.zeros(shape=batch.shape[:2], dtype=bool)
 
     for seq_idx, sequence in enumerate(batch):
         policy.reset()
         policy_result = run_policy(policy=policy, sequence=sequence, should_enforce_budget=True)
 
-        # Reconstruct the sequence elements, [T, D]
-        reconstructed = reconstruct_sequence(measurements=policy_result.measurements,
-                                             collected_indices=policy_result.collected_indices,
-                                             seq_length=seq_length)
+        if stop_on_exhaust and policy.has_exhausted_budget():
+            break
 
-        estimated_list.append(np.expand_dims(reconstructed, axis=0))
+        collected[seq_idx, policy_result.collected_indices] = policy_result.measurements
+        collected_mask[seq_idx, policy_result.collected_indices] = True
+
+    return BatchCollection(collected=collected,
+                           collected_mask=collected_mask,
+                           did_exhaust=policy.has_exhausted_budget())
+
+
+def score_batch(batch: np.ndarray, collection: BatchCollection, evaluator: Optional[ParallelEvaluator] = None) -> float:
+    """
+    Reconstructs the collected batch and returns the MAE. The (optional) evaluator
+    holds these arrays in shared memory and scores the batch on a process pool.
+    """
+    if evaluator is not None:
+        batch_size = batch.shape[0]
+        evaluator.inputs[0:batch_size] = batch
+        evaluator.measurements[0:batch_size] = collection.collected
+        evaluator.collected_mask[0:batch_size] = collection.collected_mask
 
-        num_collected += policy_result.num_collected
-        total += len(sequence)
+        return evaluator.evaluate(num_sequences=batch_size).errors.mae()
 
-    estimated = np.vstack(estimated_list)  # [B, T, D]
+    # Reconstruct the sequence elements, [B, T, D]
+    estimated = reconstruct_sequences(measurements=collection.collected, collected_mask=collection.collected_mask)
 
     # Compute the error over the batch
-    error = np.average(np.abs(batch - estimated))
+    return np.average(np.abs(batch - estimated))
+
+
+def sequence_maes(batch: np.ndarray, collection: BatchCollection, evaluator: Optional[ParallelEvaluator] = None) -> np.ndarray:
+    """
+    Reconstructs the collected batch and returns the [B] MAE of each sequence.
+    """
+    if evaluator is not None:
+        batch_size = batch.shape[0]
+        evaluator.inputs[0:batch_size] = batch
+        evaluator.measurements[0:batch_size] = collection.collected
+        evaluator.collected_mask[0:batch_size] = collection.collected_mask
+
+        return evaluator.evaluate(num_sequences=batch_size).maes
+
+    estimated = reconstruct_sequences(measurements=collection.collected, collected_mask=collection.collected_mask)
+    return np.average(np.abs(batch - estimated), axis=(1, 2))
+
+
+def execute_on_batch(policy: BudgetWrappedPolicy,
+                     batch: np.ndarray,
+                     energy_margin: float,
+                     evaluator: Optional[ParallelEvaluator] = None,
+                     exhaust_only: bool = False) -> BatchResult:
+    """
+    Executes and scores the policy on the given batch. When exhaust_only is set, we stop
+    once the policy exhausts the budget and skip the reconstruction (the MAE is then None).
+    """
+    collection = collect_batch(policy=policy, batch=batch, energy_margin=energy_margin, stop_on_exhaust=exhaust_only)
+
+    if exhaust_only:
+        return BatchResult(mae=None, did_exhaust=collection.did_exhaust)
+
+    return BatchResult(mae=score_batch(batch=batch, collection=collection, evaluator=evaluator),
+                       did_exhaust=collection.did_exhaust)
+
+
+def policy_key(policy: BudgetWrappedPolicy) -> Tuple[Any, ...]:
+    """
+    Returns a hashable key for the policy configuration and its current threshold. The key
+    omits the budget, which changes with the energy margin.
+    """
+    config = policy.as_dict()
+    config.pop('budget', None)
+    config['threshold'] = getattr(policy._policy, 'threshold', None)
+    return tuple(sorted(config.items()))
+
+
+class CachedBatch:
+    """
+    The per-sequence energies and collected masks of a policy (without a budget) on one batch.
+    The run stops once the energy passes the budget of the first request, so the record may
+    only hold a prefix of the batch. The per-sequence MAE values are computed on first use.
+    """
+
+    def __init__(self, energy: np.ndarray, collected_mask: np.ndarray, is_complete: bool):
+        self.energy = energy  # [L]
+        self.consumed = np.cumsum(energy)  # [L]
+        self.collected_mask = collected_mask  # [L, T]
+        self.is_complete = is_complete
+        self.maes: Optional[np.ndarray] = None
+
+    def covers(self, budget: float) -> bool:
+        """
+        Returns whether the record holds every sequence which fits in the given budget.
+        """
+        return self.is_complete or (self.consumed[-1] > budget)
+
+
+class BatchCache:
+    """
+    Memoizes batch executions across energy margins. A policy resets before each sequence,
+    so the energy and reconstruction error of each sequence only depend on the threshold;
+    the margin only moves the point at which the budget runs out. We store these per-sequence
+    values (keyed by the inputs, policy configuration, threshold and batch indices) and re-score
+    a batch at any margin with a cumulative sum over the cached energies.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_BATCHES):
+        assert max_entries > 0, 'The cache size must be positive. Got {0}'.format(max_entries)
+
+        self._max_entries = max_entries
+        self._batches: 'OrderedDict[Tuple[Any, ...], CachedBatch]' = OrderedDict()
+        self._inputs: Dict[int, np.ndarray] = dict()  # Holds each input array so its identity stays unique
+        self._hits = 0
+        self._misses = 0
 
-    return BatchResult(mae=error,
-                       did_exhaust=policy.has_exhausted_budget())
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+    def get_batch(self, policy: BudgetWrappedPolicy, inputs: np.ndarray, batch_idx: np.ndarray, budget: float) -> CachedBatch:
+        """
+        Returns the cached execution of the policy on the given batch, which covers every sequence
+        within the given budget. On a miss, we run the policy until the energy passes the budget.
+        """
+        batch_idx = np.asarray(batch_idx)
+        self._inputs[id(inputs)] = inputs
+        key = (id(inputs), policy_key(policy), batch_idx.tobytes())
+
+        cached = self._batches.get(key)
+        if (cached is not None) and cached.covers(budget):
+            self._hits += 1
+            self._batches.move_to_end(key)
+            return cached
+
+        self._misses += 1
+
+        batch = inputs[batch_idx]
+        batch_size, seq_length = batch.shape[0:2]
+        policy.init_for_experiment(num_sequences=batch_size)
+
+        energy = np.zeros(shape=(batch_size, ), dtype=float)
+        collected_mask = np.zeros(shape=(batch_size, seq_length), dtype=bool)
+
+        num_sequences = 0
+        for seq_idx, sequence in enumerate(batch):
+            policy_result = run_policy(policy=policy, sequence=sequence, should_enforce_budget=False)
+
+            collected_mask[seq_idx, policy_result.collected_indices] = True
+            energy[seq_idx] = policy_result.energy
+            num_sequences += 1
+
+            if policy.consumed_energy > budget:
+                break
+
+        cached = CachedBatch(energy=energy[0:num_sequences],
+                             collected_mask=collected_mask[0:num_sequences],
+                             is_complete=(num_sequences == batch_size))
+
+        # Evict the least-recently used batches
+        self._batches.pop(key, None)
+        while len(self._batches) >= self._max_entries:
+            self._batches.popitem(last=False)
+
+        self._batches[key] = cached
+        return cached
+
+    def execute(self,
+                policy: BudgetWrappedPolicy,
+                inputs: np.ndarray,
+                batch_idx: np.ndarray,
+                energy_margin: float,
+                evaluator: Optional[ParallelEvaluator] = None,
+                score_exhausted: bool = True) -> BatchResult:
+        """
+        Scores the policy on the given batch in the same manner as execute_on_batch(). Sequences
+        past the budget become random sequences drawn (in order) from the policy. When score_exhausted
+        is False, batches which exhaust the budget skip the scoring (the MAE is then None).
+        """
+        batch = inputs[batch_idx]
+
+        # Match the budget of execute_on_batch()
+        budget = policy.energy_per_seq * batch.shape[0]
+        budget -= budget * energy_margin
+
+        cached = self.get_batch(policy=policy, inputs=inputs, batch_idx=batch_idx, budget=budget)
+
+        policy.init_for_experiment(num_sequences=batch.shape[0])
+        policy._budget = budget
+
+        # A sequence runs out of energy once the cumulative energy passes the budget
+        is_valid = cached.consumed <= policy.budget
+        num_valid = int(np.sum(is_valid))
+        did_exhaust = (num_valid < batch.shape[0])
+
+        policy._consumed_energy = (policy.budget + SMALL_NUMBER) if did_exhaust else cached.consumed[-1]
+
+        if did_exhaust and (not score_exhausted):
+            # Match the random state of collect_batch(), which draws a random sequence for the exhausting sequence
+            policy.get_random_sequence()
+            return BatchResult(mae=None, did_exhaust=True)
+
+        # Reconstruct the cached sequences on first use
+        if cached.maes is None:
+            prefix = batch[0:len(cached.energy)]
+            collection = BatchCollection(collected=np.where(np.expand_dims(cached.collected_mask, axis=-1), prefix, 0.0),
+                                         collected_mask=cached.collected_mask,
+                                         did_exhaust=False)
+            cached.maes = sequence_maes(batch=prefix, collection=collection, evaluator=evaluator)
+
+        maes = np.zeros(shape=(batch.shape[0], ), dtype=float)
+        maes[0:num_valid] = cached.maes[0:num_valid]
+
+        for seq_idx in range(num_valid, batch.shape[0]):
+            maes[seq_idx] = np.average(np.abs(batch[seq_idx] - policy.get_random_sequence()))
+
+        return BatchResult(mae=np.average(maes), did_exhaust=did_exhaust)
+
+    def clear(self):
+        self._batches.clear()
+        self._inputs.clear()
+
+    def cache_info(self) -> Dict[str, Any]:
+        total = self._hits + self._misses
+
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'size': len(self._batches),
+            'max_entries': self._max_entries,
+            'hit_rate': (self._hits / total) if total > 0 else 0.0
+        }
 
 
 def fit(policy: BudgetWrappedPolicy,
@@ -70,7 +317,9 @@ def fit(policy: BudgetWrappedPolicy,
         upper: float,
         batches_per_trial: int,
         energy_margin: float,
-        should_print: bool) -> float:
+        should_print: bool,
+        evaluator: Optional[ParallelEvaluator] = None,
+        cache: Optional[BatchCache] = None) -> float:
     assert batches_per_trial >= 1, 'The # of Batches per Trial must be positive'
 
     seq_length = inputs.shape[1]
@@ -102,22 +351,37 @@ def fit(policy: BudgetWrappedPolicy,
         # Make lists to track results
         did_exhaust_list: List[bool] = []
         error_list: List[float] = []
+        pending: List[Tuple[np.ndarray, BatchCollection]] = []
 
         # Execute the policy on each batch
         for _ in range(batches_per_trial):
-            # Make the batch
+            # Make the batch. We draw every batch (even after exhausting the budget)
+            # to keep the batches of later iterations.
             batch_idx = rand.choice(sample_idx, size=batch_size, replace=False)
-            batch = inputs[batch_idx]
-
-            batch_result = execute_on_batch(policy=policy, batch=batch, energy_margin=energy_margin)
-
-            error_list.append(batch_result.mae)
-            did_exhaust_list.append(batch_result.did_exhaust)
 
-        # Get aggregate metrics
-        error = np.average(error_list)
+            # The error only matters when every batch stays within the budget
+            if any(did_exhaust_list):
+                continue
+
+            if cache is not None:
+                batch_result = cache.execute(policy=policy, inputs=inputs, batch_idx=batch_idx, energy_margin=energy_margin, evaluator=evaluator, score_exhausted=False)
+                error_list.append(batch_result.mae)
+                did_exhaust_list.append(batch_result.did_exhaust)
+            else:
+                batch = inputs[batch_idx]
+                collection = collect_batch(policy=policy, batch=batch, energy_margin=energy_margin, stop_on_exhaust=True)
+                did_exhaust_list.append(collection.did_exhaust)
+                pending.append((batch, collection))
+
+        # Get aggregate metrics, deferring the reconstruction to thresholds which stay within the budget
         did_exhaust = any(did_exhaust_list)
 
+        if did_exhaust:
+            error = BIG_NUMBER
+        else:
+            error_list.extend(score_batch(batch=batch, collection=collection, evaluator=evaluator) for batch, collection in pending)
+            error = np.average(error_list)
+
         # Track the best error
         if (error < best_error) and (not did_exhaust):
             best_threshold = current
@@ -147,17 +411,269 @@ def fit(policy: BudgetWrappedPolicy,
     return best_threshold
 
 
+def evaluate_threshold(policy: BudgetWrappedPolicy,
+                       inputs: np.ndarray,
+                       threshold: float,
+                       batch_indices: np.ndarray,
+                       energy_margin: float,
+                       seed: int) -> BatchResult:
+    """
+    Executes the policy with the given threshold on each batch. The random sequences which replace
+    sequences past the budget come from the given seed, so the result does not depend on
+    which process runs the evaluation.
+
+    Args:
+        policy: The policy to execute
+        inputs: A [N, T, D] array of fitting sequences
+        threshold: The threshold to evaluate
+        batch_indices: A [K, B] array holding the sequence indices of each batch
+        energy_margin: The fraction of the budget to hold back
+        seed: The seed for the random fallback sequences
+    Returns:
+        The average error and whether any batch exhausted the budget
+    """
+    policy.set_threshold(threshold=threshold)
+
+    # Use the seeded state for the duration of the evaluation, leaving the caller's state untouched
+    caller_rand = policy._rand
+    policy._rand = np.random.RandomState(seed=seed)
+
+    try:
+        # Collect every batch before scoring, as the error only matters when all batches stay within the budget
+        pending: List[Tuple[np.ndarray, BatchCollection]] = []
+        for batch_idx in batch_indices:
+            batch = inputs[batch_idx]
+            collection = collect_batch(policy=policy, batch=batch, energy_margin=energy_margin, stop_on_exhaust=True)
+
+            if collection.did_exhaust:
+                return BatchResult(mae=BIG_NUMBER, did_exhaust=True)
+
+            pending.append((batch, collection))
+
+        return BatchResult(mae=np.average([score_batch(batch=batch, collection=collection) for batch, collection in pending]),
+                           did_exhaust=False)
+    finally:
+        policy._rand = caller_rand
+
+
+def _attach_search_worker(policy_config: Dict[str, Any], info: SharedArrayInfo):
+    memory = SharedMemory(name=info.name)
+    _SEARCH_STATE['memory'] = memory
+    _SEARCH_STATE['inputs'] = np.ndarray(shape=info.shape, dtype=info.dtype, buffer=memory.buf)
+    _SEARCH_STATE['config'] = policy_config
+    _SEARCH_STATE['policies'] = dict()
+
+
+def _evaluate_search_task(task: SearchTask) -> BatchResult:
+    # Build each policy once per worker, as some policies (e.g. Skip RNNs) load their parameters from disk
+    policies = _SEARCH_STATE['policies']
+    if task.collection_rate not in policies:
+        policies[task.collection_rate] = BudgetWrappedPolicy(collection_rate=task.collection_rate, **_SEARCH_STATE['config'])
+
+    return evaluate_threshold(policy=policies[task.collection_rate],
+                              inputs=_SEARCH_STATE['inputs'],
+                              threshold=task.threshold,
+                              batch_indices=task.batch_indices,
+                              energy_margin=task.energy_margin,
+                              seed=task.seed)
+
+
+class ThresholdSearchPool:
+    """
+    Evaluates several thresholds at once on a process pool. The fitting inputs live in shared memory,
+    so the tasks only send the threshold and the batch indices. Each worker builds its own
+    policies from the given configuration. With a single worker, the thresholds run in the calling process.
+    """
+
+    def __init__(self, inputs: np.ndarray, policy_config: Dict[str, Any], num_workers: int):
+        assert num_workers >= 1, 'Must provide at least one worker'
+
+        self._num_workers = num_workers
+        self._memory = SharedMemory(create=True, size=max(inputs.nbytes, 1))
+        self._inputs = np.ndarray(shape=inputs.shape, dtype=inputs.dtype, buffer=self._memory.buf)
+        self._inputs[:] = inputs
+
+        self._pool: Optional[Any] = None
+        if num_workers > 1:
+            info = SharedArrayInfo(name=self._memory.name, shape=inputs.shape, dtype=inputs.dtype.str)
+            self._pool = Pool(processes=num_workers, initializer=_attach_search_worker, initargs=(policy_config, info))
+
+    @property
+    def num_workers(self) -> int:
+        return self._num_workers
+
+    @property
+    def inputs(self) -> np.ndarray:
+        return self._inputs
+
+    def evaluate(self, policy: BudgetWrappedPolicy, thresholds: np.ndarray, batch_indices: np.ndarray, energy_margin: float, seed: int) -> List[BatchResult]:
+        """
+        Evaluates each threshold on the same batches and random fallback sequences.
+
+        Args:
+            policy: The policy to execute (used when running in-process)
+            thresholds: A [M] array of thresholds
+            batch_indices: A [K, B] array holding the sequence indices of each batch
+            energy_margin: The fraction of the budget to hold back
+            seed: The seed for the random fallback sequences
+        Returns:
+            The result for each threshold (in order)
+        """
+        if self._pool is None:
+            return [evaluate_threshold(policy=policy,
+                                       inputs=self._inputs,
+                                       threshold=float(threshold),
+                                       batch_indices=batch_indices,
+                                       energy_margin=energy_margin,
+                                       seed=seed) for threshold in thresholds]
+
+        tasks = [SearchTask(collection_rate=policy.collection_rate,
+                            threshold=float(threshold),
+                            batch_indices=batch_indices,
+                            energy_margin=energy_margin,
+                            seed=seed) for threshold in thresholds]
+
+        return self._pool.map(_evaluate_search_task, tasks)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        if self._memory is not None:
+            # Release the array view before closing the shared block
+            self._inputs = None
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def fit_by_ksection(policy: BudgetWrappedPolicy,
+                    search_pool: ThresholdSearchPool,
+                    batch_size: int,
+                    lower: float,
+                    upper: float,
+                    batches_per_trial: int,
+                    energy_margin: float,
+                    num_thresholds: int,
+                    should_print: bool) -> float:
+    """
+    Fits the threshold with a k-section search. Each round evaluates num_thresholds evenly-spaced
+    thresholds on the same batches (in parallel) and keeps the sub-interval which holds the budget boundary,
+    so the interval shrinks by a factor of (num_thresholds + 1) per round. A single threshold per
+    round gives the bisection of fit(). The batches and random fallback sequences of each round come
+    from a fixed seed, so the fitted threshold does not depend on the number of workers.
+    """
+    assert num_thresholds >= 1, 'Must evaluate at least one threshold per round'
+    assert batches_per_trial >= 1, 'The # of Batches per Trial must be positive'
+
+    sample_idx = np.arange(search_pool.inputs.shape[0])
+
+    batch_size = min(len(sample_idx), batch_size)
+    if batch_size == len(sample_idx):
+        batches_per_trial = 1
+
+    best_threshold = upper
+    best_error = BIG_NUMBER
+
+    round_idx = 0
+    while (round_idx < MAX_ITER) and (abs(upper - lower) > TOLERANCE):
+        round_rand = np.random.RandomState(seed=SEARCH_SEED + round_idx)
+        batch_indices = np.vstack([round_rand.choice(sample_idx, size=batch_size, replace=False) for _ in range(batches_per_trial)])
+        seed = round_rand.randint(low=0, high=2**31 - 1)
+
+        # The interior points of the current interval, [M + 2]
+        edges = lower + (upper - lower) * np.arange(num_thresholds + 2) / (num_thresholds + 1)
+        thresholds = edges[1:-1]
+
+        results = search_pool.evaluate(policy=policy,
+                                       thresholds=thresholds,
+                                       batch_indices=batch_indices,
+                                       energy_margin=energy_margin,
+                                       seed=seed)
+
+        # Track the best error within the budget
+        for threshold, result in zip(thresholds, results):
+            if (result.mae < best_error) and (not result.did_exhaust):
+                best_threshold = float(threshold)
+                best_error = result.mae
+
+        if should_print:
+            print('Best Error: {0:.7f}, Best Threshold: {1:.7f}'.format(best_error, best_threshold), end='\r')
+
+        # Move to the interval between the last exhausted threshold and the first feasible threshold
+        feasible_idx = [idx for idx, result in enumerate(results) if not result.did_exhaust]
+        upper_idx = (feasible_idx[0] + 1) if len(feasible_idx) > 0 else (num_thresholds + 1)
+
+        lower = float(edges[upper_idx - 1])
+        upper = float(edges[upper_idx])
+        round_idx += 1
+
+    if should_print:
+        print()
+
+    # Leave the (parent) policy at the fitted threshold. The workers only set the thresholds of their own copies.
+    policy.set_threshold(threshold=best_threshold)
+
+    return best_threshold
+
+
+def should_skip_rate(predictor: SizePredictor,
+                     policy_name: str,
+                     encoding: str,
+                     inputs: np.ndarray,
+                     collection_rate: float,
+                     encryption: str,
+                     collect_mode: str,
+                     dataset: str,
+                     min_width: float,
+                     rand: np.random.RandomState,
+                     num_samples: int = NUM_SAMPLES) -> bool:
+    """
+    Uses the size predictor to check whether group-encoded messages at the given rate
+    cannot reach the minimum average width (even under the worst-case prediction error).
+    We query the predictor with the group policy's messages on a sample of the inputs,
+    as the predictor's errors only hold on the distribution of messages it was fit on.
+    """
+    group_policy = BudgetWrappedPolicy(name=policy_name,
+                                       collection_rate=collection_rate,
+                                       seq_length=inputs.shape[1],
+                                       num_features=inputs.shape[2],
+                                       encryption_mode=encryption,
+                                       collect_mode=collect_mode,
+                                       encoding=encoding,
+                                       dataset=dataset,
+                                       should_compress=False)
+
+    sample = sample_inputs(inputs, num_samples=num_samples, rand=rand)
+    calibrate_threshold(group_policy, inputs=sample)
+
+    features = message_features(group_policy, policy_messages(group_policy, inputs=sample))
+    return predictor.should_discard(features, min_width=min_width)
+
+
 def validate_thresholds(policy: BudgetWrappedPolicy,
                         inputs: np.ndarray,
                         threshold: float,
                         energy_margin: float,
                         num_batches: int,
-                        rand: np.random.RandomState) -> List[BatchResult]:
+                        rand: np.random.RandomState,
+                        evaluator: Optional[ParallelEvaluator] = None,
+                        cache: Optional[BatchCache] = None,
+                        exhaust_only: bool = False) -> List[BatchResult]:
     """
-    Validates the policy and thresholds on a set of held-out inputs.
+    Validates the policy and thresholds on a set of held-out inputs. When exhaust_only is set,
+    we only check the budget and skip the reconstruction of each batch.
     """
-    # Set the threshold
-    policy._threshold = threshold
+    # Set the threshold (of the inner policy)
+    policy.set_threshold(threshold=threshold)
 
     # Create the sample indices for batch creation
     sample_idx = np.arange(len(inputs))
@@ -175,25 +691,142 @@ def validate_thresholds(policy: BudgetWrappedPolicy,
     for _ in range(num_batches):
         # Make the validation batch
         batch_idx = rand.choice(sample_idx, size=batch_size, replace=False)
-        batch = inputs[batch_idx]
 
         # Run the policy on the given batch
-        val_result = execute_on_batch(policy=policy, batch=batch, energy_margin=energy_margin)
+        if cache is not None:
+            val_result = cache.execute(policy=policy, inputs=inputs, batch_idx=batch_idx, energy_margin=energy_margin, evaluator=evaluator, score_exhausted=(not exhaust_only))
+        else:
+            batch = inputs[batch_idx]
+            val_result = execute_on_batch(policy=policy, batch=batch, energy_margin=energy_margin, evaluator=evaluator, exhaust_only=exhaust_only)
 
         results.append(val_result)
 
     return results
 
 
+def fit_with_margins(policy: BudgetWrappedPolicy,
+                     inputs: np.ndarray,
+                     val_inputs: np.ndarray,
+                     lower: float,
+                     upper: float,
+                     min_threshold: float,
+                     max_threshold: float,
+                     batch_size: int,
+                     batches_per_trial: int,
+                     rand: np.random.RandomState,
+                     should_print: bool,
+                     sweep_size: Optional[int] = None,
+                     search_pool: Optional[ThresholdSearchPool] = None,
+                     search_size: Optional[int] = None,
+                     evaluator: Optional[ParallelEvaluator] = None,
+                     cache: Optional[BatchCache] = None) -> float:
+    """
+    Fits the threshold under increasing energy margins until the threshold stays within
+    the budget on the validation inputs. The (optional) cache only memoizes the bisection
+    and validation batches; the sweep and k-section searches run without it. The cache never
+    changes the fitted threshold.
+
+    Args:
+        policy: The policy to fit
+        inputs: A [N, T, D] array of fitting sequences
+        val_inputs: A [M, T, D] array of validation sequences
+        lower: The initial lower bound on the threshold
+        upper: The initial upper bound on the threshold
+        min_threshold: The smallest threshold the policy accepts
+        max_threshold: The largest threshold the policy accepts
+        batch_size: The number of sequences per fitting batch
+        batches_per_trial: The number of batches per threshold
+        rand: The random state which draws the validation batches
+        should_print: Whether to print the search progress
+        sweep_size: The number of swept thresholds per round (for policies which support sweeps)
+        search_pool: The (optional) pool which runs a k-section search
+        search_size: The number of thresholds per k-section round
+        evaluator: The (optional) process pool which scores batches
+        cache: The (optional) cache of batch executions
+    Returns:
+        The fitted threshold
+    """
+    final_threshold = None
+    energy_margin = MARGIN_FACTOR
+    did_exhaust = True
+
+    while (did_exhaust) and (energy_margin < MAX_MARGIN_FACTOR):
+        # Fit the policy using the given rate and energy margin
+        if (sweep_size is not None) and supports_sweep(policy):
+            threshold = fit_by_sweep(policy=policy,
+                                     inputs=inputs,
+                                     batch_size=batch_size,
+                                     lower=lower,
+                                     upper=upper,
+                                     batches_per_trial=batches_per_trial,
+                                     energy_margin=energy_margin,
+                                     num_thresholds=sweep_size,
+                                     should_print=should_print)
+        elif search_pool is not None:
+            threshold = fit_by_ksection(policy=policy,
+                                        search_pool=search_pool,
+                                        batch_size=batch_size,
+                                        lower=lower,
+                                        upper=upper,
+                                        batches_per_trial=batches_per_trial,
+                                        energy_margin=energy_margin,
+                                        num_thresholds=search_size,
+                                        should_print=should_print)
+        else:
+            threshold = fit(policy=policy,
+                            inputs=inputs,
+                            batch_size=batch_size,
+                            lower=lower,
+                            upper=upper,
+                            batches_per_trial=batches_per_trial,
+                            energy_margin=energy_margin,
+                            should_print=should_print,
+                            evaluator=evaluator,
+                            cache=cache)
+
+            if (cache is not None) and (should_print):
+                print('Batch Cache: {0}'.format(cache.cache_info()))
+
+        # Run on the validation set
+        val_results = validate_thresholds(policy=policy,
+                                          threshold=threshold,
+                                          inputs=val_inputs,
+                                          energy_margin=energy_margin,
+                                          num_batches=batches_per_trial,
+                                          rand=rand,
+                                          evaluator=evaluator,
+                                          cache=cache,
+                                          exhaust_only=True)
+
+        did_exhaust = any(r.did_exhaust for r in val_results)
+        final_threshold = threshold
+
+        # Reset the bounds to speed up the next iteration
+        upper = min(threshold * THRESHOLD_FACTOR_UPPER, max_threshold)
+        lower = max(threshold * THRESHOLD_FACTOR_LOWER, min_threshold)
+
+        energy_margin += MARGIN_FACTOR
+
+    return final_threshold
+
+
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('--dataset', type=str, required=True)
-    parser.add_argument('--policy', type=str, required=True, choices=['adaptive_heuristic', 'adaptive_deviation'])
+    parser.add_argument('--policy', type=str, required=True, choices=['adaptive_heuristic', 'adaptive_deviation', 'skip_rnn'])
     parser.add_argument('--collection-rates', type=float, nargs='+', required=True)
     parser.add_argument('--collect', type=str, required=True, choices=['tiny', 'low', 'med', 'high'])
     parser.add_argument('--encryption', type=str, required=True, choices=['stream', 'block'])
     parser.add_argument('--batch-size', type=int, default=256)
     parser.add_argument('--batches-per-trial', type=int, default=3)
+    parser.add_argument('--size-model-encoding', type=str, choices=['group', 'group_unshifted', 'single_group'], help='Skip rates for which the fitted size model of this encoding predicts too-narrow groups.')
+    parser.add_argument('--min-group-width', type=float, default=MIN_WIDTH + 1)
+    parser.add_argument('--sweep-size', type=int, help='When provided, fit thresholds of adaptive policies by sweeping this many thresholds per round in one vectorized pass (instead of bisection).')
+    parser.add_argument('--search-size', type=int, help='When provided, fit thresholds which cannot be swept with a k-section search which evaluates this many thresholds per round (in parallel over --num-workers).')
+    parser.add_argument('--single-pass', action='store_true', help='Whether to start the search of adaptive policies from the inverse of an energy-vs-threshold curve (computed once on the fitting inputs).')
+    parser.add_argument('--curve-size', type=int, default=CURVE_SIZE, help='The number of thresholds on the energy curve of --single-pass.')
+    parser.add_argument('--memoize-batches', action='store_true', help='Whether to cache per-sequence energies and errors of the bisection and validation batches, so repeated (threshold, batch) executions are re-scored at each energy margin. The fitted thresholds do not change. The sweep and k-section searches do not use the cache.')
+    parser.add_argument('--num-workers', type=int, default=1, help='The number of processes which reconstruct and score each batch. A single worker runs in-process.')
     parser.add_argument('--should-print', action='store_true')
     args = parser.parse_args()
 
@@ -207,8 +840,13 @@ if __name__ == '__main__':
     # Unpack the data dimensions
     num_seq, seq_length, num_features = inputs.shape
 
-    # Get the maximum threshold value based on the data
-    max_threshold = np.max(np.sum(np.abs(inputs), axis=-1)) + 1000.0
+    # Get the threshold range based on the model type. Skip RNNs only accept thresholds in [0, 1].
+    if args.policy == 'skip_rnn':
+        min_threshold = 0.0
+        max_threshold = 1.0
+    else:
+        max_threshold = np.max(np.sum(np.abs(inputs), axis=-1)) + 1000.0
+        min_threshold = -1 * max_threshold
 
     # Load the parameter files
     encryption = args.encryption
@@ -226,64 +864,116 @@ if __name__ == '__main__':
 
     # Create parameters for policy validation data splitting
     val_indices = np.arange(val_inputs.shape[0])
-    rand = np.random.RandomState(seed=3485)
+    rand = np.random.RandomState(seed=VAL_SEED)
+
+    # Make the (optional) energy curves. The collected elements only depend on the threshold and
+    # the skip parameters, so rates with the same parameters share the collected counts.
+    curve_points = curve_thresholds(inputs, num_thresholds=args.curve_size) if args.single_pass else None
+    curve_counts: Dict[Any, np.ndarray] = dict()
+
+    # Make the (optional) cache which re-scores repeated bisection and validation batches at each energy margin
+    batch_cache = BatchCache() if args.memoize_batches else None
+
+    # Load the (optional) size predictor used to discard configurations before fitting
+    size_predictor = None
+    if args.size_model_encoding is not None:
+        size_predictor = SizePredictor.restore(size_model_path(dataset=args.dataset,
+                                                               policy_name=policy_name,
+                                                               encoding=args.size_model_encoding,
+                                                               encryption=encryption,
+                                                               collect_mode=collect_mode))
+
+    # The configuration of each fitted policy (aside from the collection rate)
+    policy_config = dict(name=policy_name,
+                         seq_length=seq_length,
+                         num_features=num_features,
+                         encryption_mode=encryption,
+                         collect_mode=collect_mode,
+                         encoding='standard',
+                         dataset=args.dataset,
+                         should_compress=False)
+
+    # Make the (optional) process pool which evaluates k-section thresholds on the shared fitting inputs
+    search_pool = None
+    if args.search_size is not None:
+        search_pool = ThresholdSearchPool(inputs=inputs, policy_config=policy_config, num_workers=args.num_workers)
+
+    # Make the (optional) process pool which scores batches from shared memory
+    evaluator = None
+    if args.num_workers > 1:
+        evaluator = ParallelEvaluator(max_num_sequences=max(min(args.batch_size, num_seq), min(VAL_BATCH_SIZE, val_inputs.shape[0])),
+                                      seq_length=seq_length,
+                                      num_features=num_features,
+                                      num_workers=args.num_workers)
 
     for collection_rate in args.collection_rates:
 
+        if (size_predictor is not None) and should_skip_rate(predictor=size_predictor,
+                                                             policy_name=policy_name,
+                                                             encoding=args.size_model_encoding,
+                                                             inputs=inputs,
+                                                             collection_rate=collection_rate,
+                                                             encryption=encryption,
+                                                             collect_mode=collect_mode,
+                                                             dataset=args.dataset,
+                                                             min_width=args.min_group_width,
+                                                             rand=np.random.RandomState(seed=SIZE_SEED)):
+            print('Skipping {0}: predicted group widths are below {1}'.format(collection_rate, args.min_group_width))
+            continue
+
         # Set the lower threshold based on the model type
-        lower = -1 * max_threshold
+        lower = min_threshold
         upper = max_threshold
 
         if args.should_print:
             print('Starting {0}'.format(collection_rate))
 
         # Create the policy for which to fit thresholds
-        policy = BudgetWrappedPolicy(name=policy_name,
-                                     collection_rate=collection_rate,
-                                     seq_length=seq_length,
-                                     num_features=num_features,
-                                     encryption_mode=encryption,
-                                     collect_mode=collect_mode,
-                                     encoding='standard',
-                                     dataset=args.dataset,
-                                     should_compress=False)
-
-        final_threshold = None
-        energy_margin = MARGIN_FACTOR
-        did_exhaust = True
-
-        while (did_exhaust) and (energy_margin < MAX_MARGIN_FACTOR):
-            # Fit the policy using the given rate and energy margin
-            threshold = fit(policy=policy,
-                            inputs=inputs,
-                            batch_size=args.batch_size,
-                            lower=lower,
-                            upper=upper,
-                            batches_per_trial=args.batches_per_trial,
-                            energy_margin=energy_margin,
-                            should_print=args.should_print)
-
-            # Run on the validation set
-            val_results = validate_thresholds(policy=policy,
-                                              threshold=threshold,
-                                              inputs=val_inputs,
-                                              energy_margin=energy_margin,
-                                              num_batches=args.batches_per_trial,
-                                              rand=rand)
-
-            did_exhaust = any(r.did_exhaust for r in val_results)
-            final_threshold = threshold
-
-            # Reset the bounds to speed up the next iteration
-            upper = threshold * THRESHOLD_FACTOR_UPPER
-            lower = threshold * THRESHOLD_FACTOR_LOWER
-
-            energy_margin += MARGIN_FACTOR
+        policy = BudgetWrappedPolicy(collection_rate=collection_rate, **policy_config)
+
+        # Narrow the initial bounds to the thresholds around the rate's energy on the curve
+        if (curve_points is not None) and supports_sweep(policy):
+            key = curve_key(policy)
+            if key not in curve_counts:
+                curve_counts[key] = collected_counts(policy, inputs=inputs, thresholds=curve_points)
+
+            curve_energy = curve_counts[key].dot(sequence_energy(policy)) / num_seq
+            lower, upper = invert_energy_curve(thresholds=curve_points,
+                                               energy=curve_energy,
+                                               target=policy.energy_per_seq * (1.0 - MARGIN_FACTOR),
+                                               lower=lower,
+                                               upper=upper)
+
+            if args.should_print:
+                print('Initial Bounds: [{0:.7f}, {1:.7f}]'.format(lower, upper))
+
+        final_threshold = fit_with_margins(policy=policy,
+                                           inputs=inputs,
+                                           val_inputs=val_inputs,
+                                           lower=lower,
+                                           upper=upper,
+                                           min_threshold=min_threshold,
+                                           max_threshold=max_threshold,
+                                           batch_size=args.batch_size,
+                                           batches_per_trial=args.batches_per_trial,
+                                           rand=rand,
+                                           should_print=args.should_print,
+                                           sweep_size=args.sweep_size,
+                                           search_pool=search_pool,
+                                           search_size=args.search_size,
+                                           evaluator=evaluator,
+                                           cache=batch_cache)
 
         threshold_map[policy_name][collect_mode][str(round(collection_rate, 2))] = final_threshold
 
         if args.should_print:
             print('==========')
 
+    if evaluator is not None:
+        evaluator.close()
+
+    if search_pool is not None:
+        search_pool.close()
+
     # Save the results
     save_json_gz(threshold_map, output_file)
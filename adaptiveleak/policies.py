@@ -9,15 +9,18 @@ from typing import Tuple, List, Dict, Any, Optional
 
 from adaptiveleak.energy_systems import EnergyUnit, convert_rate_to_energy, get_group_target_bytes, get_padded_collection_rate
 from adaptiveleak.utils.constants import BITS_PER_BYTE, MIN_WIDTH, SMALL_NUMBER, SHIFT_BITS, MAX_SHIFT_GROUPS
-from adaptiveleak.utils.constants import MIN_SHIFT_GROUPS, PERIOD, LENGTH_SIZE, BT_FRAME_SIZE
-from adaptiveleak.utils.data_utils import get_group_widths, get_num_groups, calculate_bytes, pad_to_length, sigmoid, truncate_to_block, round_to_block
+from adaptiveleak.utils.constants import MIN_SHIFT_GROUPS, PERIOD, LENGTH_SIZE, BT_FRAME_SIZE, COMPRESSION_DICT_FILE
+from adaptiveleak.utils.data_utils import get_group_widths, get_num_groups, calculate_bytes, pad_buffer, sigmoid, truncate_to_block, round_to_block
 from adaptiveleak.utils.data_utils import prune_sequence, calculate_grouped_bytes, set_widths, select_range_shifts_array, num_bits_for_value, get_max_num_groups
+from adaptiveleak.utils.data_utils import QuantizationTable, get_quantization_table
 from adaptiveleak.utils.shifting import merge_shift_groups
-from adaptiveleak.utils.message import encode_standard_measurements, decode_standard_measurements
-from adaptiveleak.utils.message import encode_stable_measurements, decode_stable_measurements
+from adaptiveleak.utils.compression import Codec, make_codec, DEFAULT_CODEC
+from adaptiveleak.utils.bits import BitWriter
+from adaptiveleak.utils.message import decode_standard_measurements, write_standard_measurements
+from adaptiveleak.utils.message import encode_stable_measurements, decode_stable_measurements, write_stable_measurements
 from adaptiveleak.utils.encryption import AES_BLOCK_SIZE, CHACHA_NONCE_LEN
 from adaptiveleak.utils.file_utils import read_json, read_pickle_gz, read_json_gz
-from adaptiveleak.utils.data_types import EncodingMode, EncryptionMode, PolicyType, PolicyResult, CollectMode
+from adaptiveleak.utils.data_types import EncodingMode, EncryptionMode, PolicyType, PolicyResult, CollectMode, DecodedBatch, GroupEncoding, GroupSelection
 
 
 class Policy:
@@ -42,6 +45,8 @@ class Policy:
         self._encoding_mode = encoding_mode
         self._collect_mode = collect_mode
         self._should_compress = should_compress
+        self._codec = make_codec(DEFAULT_CODEC)
+        self._quantization_table = get_quantization_table(non_fractional=width - precision, max_width=width)
 
         self._rand = np.random.RandomState(seed=78362)
 
@@ -108,10 +113,21 @@ class Policy:
     def should_compress(self) -> bool:
         return self._should_compress
 
+    @property
+    def codec(self) -> Codec:
+        return self._codec
+
+    @property
+    def quantization_table(self) -> QuantizationTable:
+        return self._quantization_table
+
     @property
     def target_bytes(self) -> int:
         return self._target_bytes
 
+    def set_codec(self, codec: Codec):
+        self._codec = codec
+
     def collect(self, measurement: np.ndarray):
         self._estimate = np.copy(measurement.reshape(-1))  # [D]
 
@@ -119,20 +135,36 @@ class Policy:
         self._estimate = np.zeros((self._num_features, ))  # [D]
 
     def encode(self, measurements: np.ndarray, collected_indices: List[int]) -> bytes:
-        return encode_standard_measurements(measurements=measurements,
-                                            collected_indices=collected_indices,
-                                            seq_length=self.seq_length,
-                                            precision=self.precision,
-                                            width=self.width,
-                                            should_compress=self.should_compress)
-
-    def decode(self, message: bytes) -> Tuple[np.ndarray, List[int]]:
+        writer = BitWriter()
+        self.encode_into(writer, measurements=measurements, collected_indices=collected_indices)
+        return writer.getvalue()
+
+    def encode_into(self, writer: BitWriter, measurements: np.ndarray, collected_indices: List[int]):
+        """
+        Appends the encoded message to the given (byte-aligned) writer. The writer
+        is aligned after the message.
+        """
+        write_standard_measurements(writer,
+                                    measurements=measurements,
+                                    collected_indices=collected_indices,
+                                    seq_length=self.seq_length,
+                                    precision=self.precision,
+                                    width=self.width,
+                                    should_compress=self.should_compress,
+                                    codec=self.codec,
+                                    table=self.quantization_table)
+        writer.align()
+
+    def decode(self, message: bytes, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[int], List[int]]:
         return decode_standard_measurements(byte_str=message,
                                             seq_length=self.seq_length,
                                             num_features=self.num_features,
                                             precision=self.precision,
                                             width=self.width,
-                                            should_compress=self.should_compress)
+                                            should_compress=self.should_compress,
+                                            out=out,
+                                            codec=self.codec,
+                                            table=self.quantization_table)
 
     def step(self, count: int, seq_idx: int):
         self._measurement_count += count
@@ -154,7 +186,8 @@ class Policy:
             'encryption_mode': self.encryption_mode.name,
             'encoding_mode': self.encoding_mode.name,
             'collect_mode': self.collect_mode.name,
-            'should_compress': self.should_compress
+            'should_compress': self.should_compress,
+            'codec': self.codec.name
         }
 
     @property
@@ -258,19 +291,15 @@ class AdaptivePolicy(Policy):
         self._current_skip = 0
         self._sample_skip = 0
 
-    def encode(self, measurements: np.ndarray, collected_indices: List[int]) -> bytes:
+    def encode_into(self, writer: BitWriter, measurements: np.ndarray, collected_indices: List[int]):
+        writer.align()
+        start = len(writer)
+
         if self.encoding_mode == EncodingMode.STANDARD:
-            return super().encode(measurements, collected_indices)
+            super().encode_into(writer, measurements, collected_indices)
+            return
         elif self.encoding_mode == EncodingMode.PADDED:
-            encoded = super().encode(measurements, collected_indices)
-
-            if self.encryption_mode == EncryptionMode.STREAM:
-                return pad_to_length(encoded, length=self.target_bytes - CHACHA_NONCE_LEN - LENGTH_SIZE)
-            elif self.encryption_mode == EncryptionMode.BLOCK:
-                return pad_to_length(encoded, length=self.target_bytes - AES_BLOCK_SIZE - LENGTH_SIZE)
-            else:
-                raise ValueError('Unknown encryption mode {0}'.format(self.encryption_mode.name))
-
+            super().encode_into(writer, measurements, collected_indices)
         elif self.encoding_mode == EncodingMode.PRUNED:
             metadata_bytes = int(math.ceil(self.seq_length / BITS_PER_BYTE)) + LENGTH_SIZE
 
@@ -294,149 +323,186 @@ class AdaptivePolicy(Policy):
                                                              seq_length=self.seq_length)
 
             # Encode the pruned sequence
-            encoded = super().encode(measurements, collected_indices)
-
-            # Pad the sequence if needed
-            if self.encryption_mode == EncryptionMode.STREAM:
-                return pad_to_length(encoded, length=self.target_bytes - CHACHA_NONCE_LEN - LENGTH_SIZE)
-            elif self.encryption_mode == EncryptionMode.BLOCK:
-                return pad_to_length(encoded, length=self.target_bytes - AES_BLOCK_SIZE - LENGTH_SIZE)
-            else:
-                raise ValueError('Unknown encryption mode {0}'.format(self.encryption_mode.name))
-
+            super().encode_into(writer, measurements, collected_indices)
         elif self.encoding_mode in (EncodingMode.GROUP, EncodingMode.GROUP_UNSHIFTED, EncodingMode.SINGLE_GROUP):
-            target_bytes = self._target_bytes
-
-            # Conservatively Estimate the meta-data bytes associated with stable encoding
-            mask_bytes = int(math.ceil(self.seq_length / BITS_PER_BYTE))
-            metadata_bytes = mask_bytes + LENGTH_SIZE
-
-            if self.encryption_mode == EncryptionMode.STREAM:
-                metadata_bytes += CHACHA_NONCE_LEN
-            else:
-                metadata_bytes += AES_BLOCK_SIZE
-
-            # Compute the target number of data bytes (without the shift part)
-            target_data_bytes = target_bytes - metadata_bytes
+            groups = self.select_groups(measurements, collected_indices)
+
+            write_stable_measurements(writer,
+                                      measurements=groups.measurements,
+                                      collected_indices=groups.collected_indices,
+                                      widths=groups.widths,
+                                      shifts=groups.shifts,
+                                      group_sizes=groups.group_sizes,
+                                      non_fractional=self.non_fractional,
+                                      seq_length=self.seq_length,
+                                      table=self.quantization_table)
+            writer.align()
+        else:
+            raise ValueError('Unknown encoding type {0}'.format(self.encoding_mode.name))
 
-            # Compute the maximum number of groups
-            max_num_groups = get_max_num_groups(width=self.width,
-                                                num_collected=len(collected_indices),
-                                                num_features=self.num_features,
-                                                target_bytes=target_data_bytes)
+        # Pad the sequence if needed
+        if self.encryption_mode == EncryptionMode.STREAM:
+            pad_buffer(writer.buffer, start=start, length=self.target_bytes - CHACHA_NONCE_LEN - LENGTH_SIZE)
+        elif self.encryption_mode == EncryptionMode.BLOCK:
+            pad_buffer(writer.buffer, start=start, length=self.target_bytes - AES_BLOCK_SIZE - LENGTH_SIZE)
+        else:
+            raise ValueError('Unknown encryption mode {0}'.format(self.encryption_mode.name))
+
+    def encode_group(self, measurements: np.ndarray, collected_indices: List[int]) -> GroupEncoding:
+        """
+        Encodes the measurements using the (unpadded) group encoding of the current mode.
+
+        Args:
+            measurements: A [K, D] array of the collected measurements
+            collected_indices: The K indices of the collected measurements
+        Returns:
+            The unpadded message, the width and size of each group, and the number of
+            measurements remaining after pruning.
+        """
+        groups = self.select_groups(measurements, collected_indices)
+
+        encoded = encode_stable_measurements(measurements=groups.measurements,
+                                             collected_indices=groups.collected_indices,
+                                             widths=groups.widths,
+                                             shifts=groups.shifts,
+                                             group_sizes=groups.group_sizes,
+                                             non_fractional=self.non_fractional,
+                                             seq_length=self.seq_length,
+                                             table=self.quantization_table)
 
-            # Cap the max number of groups at the predefined number
-            max_num_groups = max(max_num_groups, self.max_num_groups)
+        return GroupEncoding(encoded=encoded,
+                             widths=groups.widths,
+                             group_sizes=groups.group_sizes,
+                             num_collected=len(groups.collected_indices))
 
-            # Compute the number of bytes needed for the shifting meta-data
-            size_width = num_bits_for_value(len(collected_indices))
-            size_bytes = int(math.ceil((size_width * max_num_groups) / BITS_PER_BYTE))
-            shift_bytes = 1 + max_num_groups + size_bytes
-            target_data_bytes -= shift_bytes
+    def select_groups(self, measurements: np.ndarray, collected_indices: List[int]) -> GroupSelection:
+        """
+        Prunes the measurements and selects the width, shift and size of each group
+        for the group encoding of the current mode.
+        """
+        assert self.encoding_mode in (EncodingMode.GROUP, EncodingMode.GROUP_UNSHIFTED, EncodingMode.SINGLE_GROUP), 'Must use a group encoding'
 
-            # Get the target data bits via a conservative estimate
-            target_data_bits = (target_data_bytes - max_num_groups) * BITS_PER_BYTE
+        target_bytes = self._target_bytes
 
-            assert target_data_bits > 0, 'Must have a positive number of target data bits'
+        # Conservatively Estimate the meta-data bytes associated with stable encoding
+        mask_bytes = int(math.ceil(self.seq_length / BITS_PER_BYTE))
+        metadata_bytes = mask_bytes + LENGTH_SIZE
 
-            # Estimate the maximum number of measurements we can collect
-            max_features = int(target_data_bits / MIN_WIDTH)
-            max_collected = int(max_features / self.num_features)
+        if self.encryption_mode == EncryptionMode.STREAM:
+            metadata_bytes += CHACHA_NONCE_LEN
+        else:
+            metadata_bytes += AES_BLOCK_SIZE
 
-            # Prune measurements if needed
-            measurements, collected_indices = prune_sequence(measurements=measurements,
-                                                             collected_indices=collected_indices,
-                                                             max_collected=max_collected,
-                                                             seq_length=self.seq_length)
+        # Compute the target number of data bytes (without the shift part)
+        target_data_bytes = target_bytes - metadata_bytes
 
-            flattened = measurements.T.reshape(-1)
-            min_width = int(target_data_bits / (self.num_features * len(collected_indices)))
-            min_width = min(min_width, self.width)
-
-            group_sizes: List[int] = []
-            merged_shifts: List[int] = []
-
-            if self.encoding_mode == EncodingMode.GROUP:
-                # Select the range shifts
-                shifts = select_range_shifts_array(measurements=flattened,
-                                                   old_width=self.width,
-                                                   old_precision=self.precision,
-                                                   new_width=min_width,
-                                                   num_range_bits=SHIFT_BITS)
-
-                # Merge the shift groups
-                merged_shifts, group_sizes = merge_shift_groups(values=flattened,
-                                                                shifts=shifts,
-                                                                max_num_groups=max_num_groups)
-            elif self.encoding_mode == EncodingMode.GROUP_UNSHIFTED:
-                # Set the group sizes 'evenly'
-                features_per_group = int(round(len(flattened) / self.max_num_groups))
-
-                feature_count = 0
-                for group_idx in range(self.max_num_groups - 1):
-                    group_sizes.append(features_per_group)
-                    feature_count += features_per_group
-
-                # Include the remaining elements in the last group
-                group_sizes.append(len(flattened) - feature_count)
-
-                # For the 'un-shifted' variant, we set all the shift values to zero
-                merged_shifts = [0 for _ in group_sizes]
-            elif self.encoding_mode == EncodingMode.SINGLE_GROUP:
-                group_sizes.append(len(flattened))  # Use a single group with no shift
-                merged_shifts.append(0)
-            else:
-                raise ValueError('Unknown encoding mode: {0}'.format(self.encoding_mode))
+        # Compute the maximum number of groups
+        max_num_groups = get_max_num_groups(width=self.width,
+                                            num_collected=len(collected_indices),
+                                            num_features=self.num_features,
+                                            target_bytes=target_data_bytes)
+
+        # Cap the max number of groups at the predefined number
+        max_num_groups = max(max_num_groups, self.max_num_groups)
+
+        # Compute the number of bytes needed for the shifting meta-data
+        size_width = num_bits_for_value(len(collected_indices))
+        size_bytes = int(math.ceil((size_width * max_num_groups) / BITS_PER_BYTE))
+        shift_bytes = 1 + max_num_groups + size_bytes
+        target_data_bytes -= shift_bytes
+
+        # Get the target data bits via a conservative estimate
+        target_data_bits = (target_data_bytes - max_num_groups) * BITS_PER_BYTE
+
+        assert target_data_bits > 0, 'Must have a positive number of target data bits'
+
+        # Estimate the maximum number of measurements we can collect
+        max_features = int(target_data_bits / MIN_WIDTH)
+        max_collected = int(max_features / self.num_features)
+
+        # Prune measurements if needed
+        measurements, collected_indices = prune_sequence(measurements=measurements,
+                                                         collected_indices=collected_indices,
+                                                         max_collected=max_collected,
+                                                         seq_length=self.seq_length)
+
+        flattened = measurements.T.reshape(-1)
+        min_width = int(target_data_bits / (self.num_features * len(collected_indices)))
+        min_width = min(min_width, self.width)
+
+        group_sizes: List[int] = []
+        merged_shifts: List[int] = []
+
+        if self.encoding_mode == EncodingMode.GROUP:
+            # Select the range shifts
+            shifts = select_range_shifts_array(measurements=flattened,
+                                               old_width=self.width,
+                                               old_precision=self.precision,
+                                               new_width=min_width,
+                                               num_range_bits=SHIFT_BITS)
+
+            # Merge the shift groups
+            merged_shifts, group_sizes = merge_shift_groups(values=flattened,
+                                                            shifts=shifts,
+                                                            max_num_groups=max_num_groups)
+        elif self.encoding_mode == EncodingMode.GROUP_UNSHIFTED:
+            # Set the group sizes 'evenly'
+            features_per_group = int(round(len(flattened) / self.max_num_groups))
+
+            feature_count = 0
+            for group_idx in range(self.max_num_groups - 1):
+                group_sizes.append(features_per_group)
+                feature_count += features_per_group
+
+            # Include the remaining elements in the last group
+            group_sizes.append(len(flattened) - feature_count)
+
+            # For the 'un-shifted' variant, we set all the shift values to zero
+            merged_shifts = [0 for _ in group_sizes]
+        elif self.encoding_mode == EncodingMode.SINGLE_GROUP:
+            group_sizes.append(len(flattened))  # Use a single group with no shift
+            merged_shifts.append(0)
+        else:
+            raise ValueError('Unknown encoding mode: {0}'.format(self.encoding_mode))
 
-            # Re-calculate the meta-data size based on the given shift groups. Smaller
-            # ranges allow for greater savings.
-            num_groups = len(group_sizes)
-            size_width = num_bits_for_value(max(group_sizes))
-            size_bytes = int(math.ceil((size_width * num_groups) / BITS_PER_BYTE))
+        # Re-calculate the meta-data size based on the given shift groups. Smaller
+        # ranges allow for greater savings.
+        num_groups = len(group_sizes)
+        size_width = num_bits_for_value(max(group_sizes))
+        size_bytes = int(math.ceil((size_width * num_groups) / BITS_PER_BYTE))
 
-            shift_bytes = 1 + num_groups + size_bytes
-            metadata_bytes = shift_bytes + mask_bytes + LENGTH_SIZE
+        shift_bytes = 1 + num_groups + size_bytes
+        metadata_bytes = shift_bytes + mask_bytes + LENGTH_SIZE
 
-            if self.encryption_mode == EncryptionMode.STREAM:
-                metadata_bytes += CHACHA_NONCE_LEN
-            else:
-                metadata_bytes += AES_BLOCK_SIZE
+        if self.encryption_mode == EncryptionMode.STREAM:
+            metadata_bytes += CHACHA_NONCE_LEN
+        else:
+            metadata_bytes += AES_BLOCK_SIZE
 
-            target_data_bytes = target_bytes - metadata_bytes
+        target_data_bytes = target_bytes - metadata_bytes
 
-            # Check whether any group is all zero
-            flattened = measurements.T.reshape(-1)
-            group_idx = 0
+        # Check whether any group is all zero
+        flattened = measurements.T.reshape(-1)
+        group_idx = 0
 
-            groups_all_zero: List[bool] = []
-            for group_size in group_sizes:
-                is_all_zero = np.all(np.isclose(flattened[group_idx:group_idx+group_size], 0.0))
-                groups_all_zero.append(is_all_zero)
-                group_idx += group_size
+        groups_all_zero: List[bool] = []
+        for group_size in group_sizes:
+            is_all_zero = np.all(np.isclose(flattened[group_idx:group_idx+group_size], 0.0))
+            groups_all_zero.append(is_all_zero)
+            group_idx += group_size
 
-            # Set the group sizes
-            group_widths = set_widths(group_sizes, is_all_zero=groups_all_zero, target_bytes=target_data_bytes, start_width=MIN_WIDTH, max_width=self.width)
+        # Set the group sizes
+        group_widths = set_widths(group_sizes, is_all_zero=groups_all_zero, target_bytes=target_data_bytes, start_width=MIN_WIDTH, max_width=self.width)
 
-            encoded = encode_stable_measurements(measurements=measurements,
-                                                 collected_indices=collected_indices,
-                                                 widths=group_widths,
-                                                 shifts=merged_shifts,
-                                                 group_sizes=group_sizes,
-                                                 non_fractional=self.non_fractional,
-                                                 seq_length=self.seq_length)
+        return GroupSelection(measurements=measurements,
+                              collected_indices=collected_indices,
+                              widths=group_widths,
+                              shifts=merged_shifts,
+                              group_sizes=group_sizes)
 
-            if self.encryption_mode == EncryptionMode.STREAM:
-                return pad_to_length(encoded, length=target_bytes - CHACHA_NONCE_LEN - LENGTH_SIZE)
-            elif self.encryption_mode == EncryptionMode.BLOCK:
-                return pad_to_length(encoded, length=target_bytes - AES_BLOCK_SIZE - LENGTH_SIZE)
-            else:
-                raise ValueError('Unknown encryption mode {0}'.format(self.encryption_mode.name))
-        else:
-            raise ValueError('Unknown encoding type {0}'.format(self.encoding_mode.name))
-
-    def decode(self, message: bytes) -> Tuple[np.ndarray, List[int]]:
+    def decode(self, message: bytes, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[int], List[int]]:
         if self.encoding_mode in (EncodingMode.STANDARD, EncodingMode.PRUNED, EncodingMode.PADDED):
-            return super().decode(message)
+            return super().decode(message, out=out)
         elif self.encoding_mode in (EncodingMode.GROUP, EncodingMode.GROUP_UNSHIFTED, EncodingMode.SINGLE_GROUP):
             non_fractional = self.width - self.precision
             max_group_size = max(int(BITS_PER_BYTE * AES_BLOCK_SIZE), 1)
@@ -444,7 +510,9 @@ class AdaptivePolicy(Policy):
             return decode_stable_measurements(encoded=message,
                                               seq_length=self.seq_length,
                                               num_features=self.num_features,
-                                              non_fractional=non_fractional)
+                                              non_fractional=non_fractional,
+                                              out=out,
+                                              table=self.quantization_table)
         else:
             raise ValueError('Unknown encoding type {0}'.format(self.encoding_mode.name))
 
@@ -836,6 +904,10 @@ class BudgetWrappedPolicy(Policy):
                                    should_compress=should_compress,
                                    **kwargs)
 
+        # Set the (optional) compression codec
+        compression = str(kwargs.get('compression', DEFAULT_CODEC))
+        self._policy.set_codec(make_dataset_codec(name=compression, dataset=dataset))
+
         # Call the base constructor to set the internal fields
         super().__init__(seq_length=seq_length,
                          num_features=num_features,
@@ -884,15 +956,29 @@ class BudgetWrappedPolicy(Policy):
     def consumed_energy(self) -> float:
         return self._consumed_energy
 
+    @property
+    def codec(self) -> Codec:
+        return self._policy.codec
+
     def set_threshold(self, threshold: float):
         self._policy.set_threshold(threshold)
 
+    def set_codec(self, codec: Codec):
+        self._policy.set_codec(codec)
+
     def encode(self, measurements: np.ndarray, collected_indices: List[int]) -> bytes:
         return self._policy.encode(measurements=measurements,
                                    collected_indices=collected_indices)
 
-    def decode(self, message: bytes) -> Tuple[np.ndarray, List[int]]:
-        return self._policy.decode(message=message)
+    def encode_into(self, writer: BitWriter, measurements: np.ndarray, collected_indices: List[int]):
+        self._policy.encode_into(writer, measurements=measurements, collected_indices=collected_indices)
+
+    def decode(self, message: bytes, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[int], List[int]]:
+        return self._policy.decode(message=message, out=out)
+
+    def encode_group(self, measurements: np.ndarray, collected_indices: List[int]) -> GroupEncoding:
+        return self._policy.encode_group(measurements=measurements,
+                                         collected_indices=collected_indices)
 
     def should_collect(self, seq_idx: int) -> bool:
         return self._policy.should_collect(seq_idx=seq_idx)
@@ -935,7 +1021,7 @@ class BudgetWrappedPolicy(Policy):
         return result
 
 
-def run_policy(policy: BudgetWrappedPolicy, sequence: np.ndarray, should_enforce_budget: bool) -> PolicyResult:
+def run_policy(policy: BudgetWrappedPolicy, sequence: np.ndarray, should_enforce_budget: bool, writer: Optional[BitWriter] = None) -> PolicyResult:
     """
     Executes the policy on the given sequence.
 
@@ -943,6 +1029,8 @@ def run_policy(policy: BudgetWrappedPolicy, sequence: np.ndarray, should_enforce
         policy: The sampling policy
         sequence: A [T, D] array of features (D) for each element (T)
         should_enforce_budget: Whether to enforce the current energy budget
+        writer: An optional writer which holds the encoded message. When provided, the message
+            is appended to the writer's (shared) buffer and the result holds no encoded bytes.
     Returns:
         A tuple of three elements:
             (1) A [K, D] array of the collected measurements
@@ -985,13 +1073,19 @@ def run_policy(policy: BudgetWrappedPolicy, sequence: np.ndarray, should_enforce
     # Stack collected features into a numpy array
     collected = np.vstack(collected_list)  # [K, D]
 
-    # Encode the results into a byte string
-    encoded = policy.encode(measurements=collected,
-                            collected_indices=collected_indices)
+    # Encode the results into a byte string (or directly into the writer's buffer)
+    if writer is not None:
+        start = len(writer)
+        policy.encode_into(writer, measurements=collected, collected_indices=collected_indices)
 
-    # Compute the number of bytes accounting for the length and encryption algorithm
-    num_bytes = len(encoded)
+        encoded = None
+        num_bytes = len(writer) - start
+    else:
+        encoded = policy.encode(measurements=collected,
+                                collected_indices=collected_indices)
+        num_bytes = len(encoded)
 
+    # Compute the number of bytes accounting for the length and encryption algorithm
     if policy.encryption_mode == EncryptionMode.STREAM:
         num_bytes += CHACHA_NONCE_LEN  # Add the Nonce
     elif policy.encryption_mode == EncryptionMode.BLOCK:
@@ -1011,6 +1105,10 @@ def run_policy(policy: BudgetWrappedPolicy, sequence: np.ndarray, should_enforce
         rand_measurements = policy.get_random_sequence()
         policy._consumed_energy = policy._budget + SMALL_NUMBER
 
+        # The message is never sent
+        if writer is not None:
+            del writer.buffer[start:]
+
         return PolicyResult(measurements=rand_measurements,
                             collected_indices=list(range(seq_length)),
                             num_collected=seq_length,
@@ -1026,6 +1124,90 @@ def run_policy(policy: BudgetWrappedPolicy, sequence: np.ndarray, should_enforce
                         energy=energy)
 
 
+def encode_batch(policy: Policy, measurements_list: List[np.ndarray], indices_list: List[List[int]]) -> Tuple[bytearray, np.ndarray]:
+    """
+    Encodes a batch of sequences into a single contiguous buffer.
+
+    Args:
+        policy: The policy used to encode each sequence
+        measurements_list: A list of N [K_i, D] arrays of collected measurements
+        indices_list: A list of N lists containing the collected indices
+    Returns:
+        A tuple of two elements:
+            (1) A byte array holding all N messages back-to-back
+            (2) A [N + 1] array of int64 offsets. Message i is buffer[offsets[i]:offsets[i+1]].
+    """
+    assert len(measurements_list) == len(indices_list), 'Must provide the same number of measurements ({0}) and indices ({1})'.format(len(measurements_list), len(indices_list))
+
+    # Each message is written directly into the shared buffer
+    writer = BitWriter()
+    offsets = np.empty(shape=(len(measurements_list) + 1, ), dtype=np.int64)
+    offsets[0] = 0
+
+    for idx, (measurements, collected_indices) in enumerate(zip(measurements_list, indices_list)):
+        policy.encode_into(writer, measurements=measurements, collected_indices=collected_indices)
+        offsets[idx + 1] = len(writer)
+
+    return writer.buffer, offsets
+
+
+def decode_batch(policy: Policy, buffer: bytes, offsets: np.ndarray) -> DecodedBatch:
+    """
+    Decodes a batch of messages held in a single contiguous buffer.
+
+    Args:
+        policy: The policy used to decode each message
+        buffer: The byte buffer containing all N messages
+        offsets: A [N + 1] array of message offsets (from encode_batch)
+    Returns:
+        A DecodedBatch holding a [N, T, D] array of measurements and
+        a [N, T] boolean mask of the collected indices. Elements which
+        are not collected (and empty messages) are left as zero.
+    """
+    assert len(offsets.shape) == 1 and offsets.shape[0] >= 1, 'Must provide a 1d array of N + 1 offsets'
+
+    num_seq = offsets.shape[0] - 1
+    seq_length, num_features = policy.seq_length, policy.num_features
+
+    measurements = np.zeros(shape=(num_seq, seq_length, num_features), dtype=float)
+    mask = np.zeros(shape=(num_seq, seq_length), dtype=bool)
+
+    # Decode into a single scratch buffer and scatter the results
+    view = memoryview(buffer)
+    scratch = np.empty(shape=(seq_length, num_features), dtype=float)
+
+    for idx in range(num_seq):
+        start, end = int(offsets[idx]), int(offsets[idx + 1])
+
+        # Empty messages denote sequences that were never sent
+        if end <= start:
+            continue
+
+        decoded, collected_indices, _ = policy.decode(message=view[start:end], out=scratch)
+
+        measurements[idx, collected_indices] = decoded
+        mask[idx, collected_indices] = True
+
+    return DecodedBatch(measurements=measurements, mask=mask)
+
+
+def make_dataset_codec(name: str, dataset: str) -> Codec:
+    """
+    Creates the compression codec with the given name. Dictionary-based codecs
+    use the dictionary trained on the given dataset (see scripts/benchmark_compression.py).
+    """
+    if not name.lower().startswith('zlib_dict'):
+        return make_codec(name)
+
+    base = os.path.dirname(__file__)
+    dictionary_path = os.path.join(base, 'saved_models', dataset, COMPRESSION_DICT_FILE)
+
+    if not os.path.exists(dictionary_path):
+        raise ValueError('No compression dictionary exists for dataset {0}. Expected: {1}'.format(dataset, dictionary_path))
+
+    return make_codec(name, dictionary=read_pickle_gz(dictionary_path))
+
+
 def make_policy(name: str,
                 seq_length: int,
                 num_features: int,
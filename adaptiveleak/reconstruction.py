@@ -0,0 +1,144 @@
+import numpy as np
+import scipy.sparse as sp
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from adaptiveleak.utils.message import encode_collected_mask
+
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024  # 64 MB
+
+
+def interpolation_matrix(collected_indices: List[int], seq_length: int) -> sp.csr_matrix:
+    """
+    Creates the sparse matrix which linearly interpolates the collected values
+    (clamping at the edges, as in np.interp()). Each row has at most two non-zeros.
+
+    Args:
+        collected_indices: A list of [K] (sorted) indices of the collected elements
+        seq_length: The length of the full sequence (T)
+    Returns:
+        A [T, K] sparse matrix. Multiplying with the [K, D] collected values
+        yields the [T, D] reconstructed sequence.
+    """
+    xp = np.asarray(collected_indices, dtype=float)
+    num_collected = xp.shape[0]
+
+    if num_collected == 0:
+        raise ValueError('Must provide at least one collected index')
+
+    rows = np.arange(seq_length)
+
+    if num_collected == 1:
+        return sp.csr_matrix((np.ones(seq_length), (rows, np.zeros(seq_length, dtype=int))), shape=(seq_length, 1))
+
+    # Clamp the positions to the collected range and find the segment holding each element, [T]
+    positions = np.clip(np.arange(seq_length, dtype=float), xp[0], xp[-1])
+    segment = np.clip(np.searchsorted(xp, positions, side='right') - 1, 0, num_collected - 2)
+
+    upper_weight = (positions - xp[segment]) / (xp[segment + 1] - xp[segment])
+    lower_weight = 1.0 - upper_weight
+
+    matrix = sp.csr_matrix((np.concatenate([lower_weight, upper_weight]), (np.concatenate([rows, rows]), np.concatenate([segment, segment + 1]))),
+                           shape=(seq_length, num_collected))
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def matrix_bytes(matrix: sp.csr_matrix) -> int:
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+class InterpolationCache:
+    """
+    LRU cache of interpolation matrices keyed by the collected-index bit-mask. Policies
+    often repeat the same collection patterns, so reconstruction becomes a single sparse
+    matrix product. The results match np.interp() up to floating-point rounding.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        assert max_bytes > 0, 'The cache size must be positive. Got {0}'.format(max_bytes)
+
+        self._max_bytes = max_bytes
+        self._matrices: 'OrderedDict[Tuple[int, bytes], sp.csr_matrix]' = OrderedDict()
+        self._num_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def num_bytes(self) -> int:
+        return self._num_bytes
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    def __len__(self) -> int:
+        return len(self._matrices)
+
+    def get_matrix(self, collected_indices: List[int], seq_length: int) -> sp.csr_matrix:
+        """
+        Returns the [T, K] interpolation matrix for the given collected indices.
+        """
+        key = (seq_length, encode_collected_mask(collected_indices, seq_length=seq_length))
+
+        matrix = self._matrices.get(key)
+        if matrix is not None:
+            self._hits += 1
+            self._matrices.move_to_end(key)
+            return matrix
+
+        self._misses += 1
+        matrix = interpolation_matrix(collected_indices, seq_length=seq_length)
+        size = matrix_bytes(matrix)
+
+        # Skip matrices which would take over the entire cache
+        if size > self._max_bytes:
+            return matrix
+
+        # Evict the least-recently used matrices
+        while self._num_bytes + size > self._max_bytes:
+            _, evicted = self._matrices.popitem(last=False)
+            self._num_bytes -= matrix_bytes(evicted)
+
+        self._matrices[key] = matrix
+        self._num_bytes += size
+        return matrix
+
+    def reconstruct(self, measurements: np.ndarray, collected_indices: List[int], seq_length: int) -> np.ndarray:
+        """
+        Reconstructs the sequence by linearly interpolating the collected measurements.
+
+        Args:
+            measurements: A [K, D] array of collected measurements
+            collected_indices: A list of [K] indices of the collected measurements
+            seq_length: The length of the full sequence (T)
+        Returns:
+            A [T, D] array of reconstructed measurements.
+        """
+        matrix = self.get_matrix(collected_indices, seq_length=seq_length)
+        return matrix @ np.asarray(measurements, dtype=float)
+
+    def clear(self):
+        self._matrices.clear()
+        self._num_bytes = 0
+
+    def cache_info(self) -> Dict[str, Any]:
+        total = self._hits + self._misses
+
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'size': len(self._matrices),
+            'num_bytes': self._num_bytes,
+            'max_bytes': self._max_bytes,
+            'hit_rate': (self._hits / total) if total > 0 else 0.0
+        }
@@ -0,0 +1,303 @@
+import numpy as np
+from typing import List, Optional, Tuple
+
+from adaptiveleak.server import reconstruct_sequences
+from adaptiveleak.utils.file_utils import read_pickle_gz
+
+
+TRANSITION_L2 = 0.01  # Matches the regularization of transition_model.LinearModel
+
+
+def neighbor_indices(collected_mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the closest collected elements around each position.
+
+    Args:
+        collected_mask: A [N, T] boolean array marking the collected elements
+    Returns:
+        A pair of [N, T] arrays holding the last collected index at or before each
+        position (-1 if none) and the first collected index at or after it (T if none).
+    """
+    seq_length = collected_mask.shape[-1]
+    positions = np.arange(seq_length)
+
+    prev_idx = np.maximum.accumulate(np.where(collected_mask, positions, -1), axis=-1)
+    next_idx = np.flip(np.minimum.accumulate(np.flip(np.where(collected_mask, positions, seq_length), axis=-1), axis=-1), axis=-1)
+    return prev_idx, next_idx
+
+
+def _validate(measurements: np.ndarray, collected_mask: np.ndarray) -> np.ndarray:
+    assert len(measurements.shape) == 3, 'Must provide a 3d array of measurements'
+    assert collected_mask.shape == measurements.shape[:2], 'The mask must have shape [N, T]'
+
+    collected_mask = collected_mask.astype(bool)
+    if not np.all(np.any(collected_mask, axis=-1)):
+        raise ValueError('Each sequence must have at least one collected measurement')
+
+    return collected_mask
+
+
+def _gather(values: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Gathers the [N, T, D] values at the given [N, T] time indices (clipped to the sequence).
+    """
+    batch_idx = np.expand_dims(np.arange(values.shape[0]), axis=-1)
+    return values[batch_idx, np.clip(indices, 0, values.shape[1] - 1)]
+
+
+class Reconstructor:
+    """
+    Infers the missing elements of sequences from the collected measurements. Every
+    backend works on batches, and elements before the first (after the last) collected
+    measurement take the first (last) collected value.
+    """
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError()
+
+    def reconstruct(self, measurements: np.ndarray, collected_mask: np.ndarray) -> np.ndarray:
+        """
+        Reconstructs a batch of sequences.
+
+        Args:
+            measurements: A [N, T, D] array of features. Only the collected
+                elements are read.
+            collected_mask: A [N, T] boolean array marking the collected elements
+        Returns:
+            A [N, T, D] array of reconstructed measurements.
+        """
+        raise NotImplementedError()
+
+    def reconstruct_sequence(self, measurements: np.ndarray, collected_indices: List[int], seq_length: int) -> np.ndarray:
+        """
+        Reconstructs a single sequence from the [K, D] measurements at the collected indices.
+        """
+        measurements = np.asarray(measurements, dtype=float)
+
+        values = np.zeros(shape=(1, seq_length, measurements.shape[-1]))
+        collected_mask = np.zeros(shape=(1, seq_length), dtype=bool)
+
+        values[0, collected_indices] = measurements
+        collected_mask[0, collected_indices] = True
+
+        return self.reconstruct(values, collected_mask)[0]
+
+
+class ZeroOrderHold(Reconstructor):
+    """
+    Holds the most-recent collected value.
+    """
+
+    @property
+    def name(self) -> str:
+        return 'zero_order_hold'
+
+    def reconstruct(self, measurements: np.ndarray, collected_mask: np.ndarray) -> np.ndarray:
+        collected_mask = _validate(measurements, collected_mask)
+        prev_idx, next_idx = neighbor_indices(collected_mask)
+
+        # Elements before the first collected value use the first value
+        source_idx = np.where(prev_idx >= 0, prev_idx, next_idx[:, 0:1])
+        return _gather(np.asarray(measurements, dtype=float), source_idx)
+
+
+class LinearInterpolation(Reconstructor):
+    """
+    Linearly interpolates between collected values (matches reconstruct_sequence()).
+    """
+
+    @property
+    def name(self) -> str:
+        return 'linear'
+
+    def reconstruct(self, measurements: np.ndarray, collected_mask: np.ndarray) -> np.ndarray:
+        return reconstruct_sequences(measurements=measurements, collected_mask=collected_mask)
+
+
+class MonotoneCubic(Reconstructor):
+    """
+    Monotone piecewise cubic Hermite interpolation (PCHIP, Fritsch-Carlson). Between the
+    collected values, this matches scipy.interpolate.PchipInterpolator and never overshoots
+    the collected values. With two collected values, the interpolation is linear.
+    """
+
+    @property
+    def name(self) -> str:
+        return 'pchip'
+
+    def reconstruct(self, measurements: np.ndarray, collected_mask: np.ndarray) -> np.ndarray:
+        collected_mask = _validate(measurements, collected_mask)
+        values = np.asarray(measurements, dtype=float)
+        seq_length = collected_mask.shape[-1]
+        positions = np.arange(seq_length)
+
+        prev_idx, next_idx = neighbor_indices(collected_mask)
+
+        # The neighboring collected indices of each position (excluding itself), [N, T]
+        before = np.concatenate([np.full_like(prev_idx[:, 0:1], -1), prev_idx[:, :-1]], axis=-1)
+        after = np.concatenate([next_idx[:, 1:], np.full_like(next_idx[:, 0:1], seq_length)], axis=-1)
+
+        has_before = np.expand_dims(before >= 0, axis=-1)  # [N, T, 1]
+        has_after = np.expand_dims(after < seq_length, axis=-1)  # [N, T, 1]
+
+        # The spacing and secant slopes on each side of each (collected) position, [N, T, D]
+        h_before = np.expand_dims(np.maximum(positions - before, 1), axis=-1).astype(float)
+        h_after = np.expand_dims(np.maximum(after - positions, 1), axis=-1).astype(float)
+
+        slope_before = (values - _gather(values, before)) / h_before
+        slope_after = (_gather(values, after) - values) / h_after
+
+        # The secants one step further out, used by the shape-preserving end-point derivatives
+        h_far_before = np.take_along_axis(h_before, np.expand_dims(np.clip(before, 0, seq_length - 1), axis=-1), axis=1)
+        h_far_after = np.take_along_axis(h_after, np.expand_dims(np.clip(after, 0, seq_length - 1), axis=-1), axis=1)
+        slope_far_before = _gather(slope_before, before)
+        slope_far_after = _gather(slope_after, after)
+        has_far_before = has_before & np.take_along_axis(has_before, np.expand_dims(np.clip(before, 0, seq_length - 1), axis=-1), axis=1)
+        has_far_after = has_after & np.take_along_axis(has_after, np.expand_dims(np.clip(after, 0, seq_length - 1), axis=-1), axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Interior derivatives use the weighted harmonic mean of the secants
+            w1 = 2.0 * h_after + h_before
+            w2 = h_after + 2.0 * h_before
+            harmonic = (w1 + w2) / (w1 / slope_before + w2 / slope_after)
+            same_sign = (np.sign(slope_before) * np.sign(slope_after)) > 0
+            interior = np.where(same_sign, harmonic, 0.0)
+
+            start = self._edge_derivative(h_after, h_far_after, slope_after, slope_far_after, has_far_after)
+            end = self._edge_derivative(h_before, h_far_before, slope_before, slope_far_before, has_far_before)
+
+        derivatives = np.where(has_before & has_after, interior, np.where(has_after, start, np.where(has_before, end, 0.0)))
+
+        # Evaluate the Hermite cubic between the surrounding collected values
+        lower_idx = np.clip(prev_idx, 0, seq_length - 1)
+        upper_idx = np.clip(next_idx, 0, seq_length - 1)
+
+        y0 = _gather(values, lower_idx)
+        y1 = _gather(values, upper_idx)
+        d0 = _gather(derivatives, lower_idx)
+        d1 = _gather(derivatives, upper_idx)
+
+        width = np.expand_dims(np.maximum(upper_idx - lower_idx, 1), axis=-1).astype(float)
+        s = np.expand_dims(positions - lower_idx, axis=-1) / width
+
+        s2 = s * s
+        s3 = s2 * s
+        reconstructed = (2 * s3 - 3 * s2 + 1) * y0 + (s3 - 2 * s2 + s) * width * d0 + (-2 * s3 + 3 * s2) * y1 + (s3 - s2) * width * d1
+
+        # Use the collected values on exact matches and clamp beyond the edges
+        return self._clamp(reconstructed, values, collected_mask, prev_idx, next_idx)
+
+    @staticmethod
+    def _edge_derivative(h0: np.ndarray, h1: np.ndarray, m0: np.ndarray, m1: np.ndarray, has_far: np.ndarray) -> np.ndarray:
+        """
+        The three-point, shape-preserving end-point derivative (as in scipy's PchipInterpolator).
+        """
+        d = ((2.0 * h0 + h1) * m0 - h0 * m1) / (h0 + h1)
+        d = np.where(np.sign(d) != np.sign(m0), 0.0, d)
+        d = np.where((np.sign(m0) != np.sign(m1)) & (np.abs(d) > np.abs(3.0 * m0)), 3.0 * m0, d)
+
+        # Fall back to the secant with only two collected values
+        return np.where(has_far, d, m0)
+
+    @staticmethod
+    def _clamp(reconstructed: np.ndarray, values: np.ndarray, collected_mask: np.ndarray, prev_idx: np.ndarray, next_idx: np.ndarray) -> np.ndarray:
+        reconstructed[collected_mask] = values[collected_mask]
+
+        first = _gather(values, next_idx[:, 0:1])  # [N, 1, D]
+        last = _gather(values, prev_idx[:, -1:])  # [N, 1, D]
+
+        reconstructed = np.where(np.expand_dims(prev_idx < 0, axis=-1), first, reconstructed)
+        return np.where(np.expand_dims(next_idx >= collected_mask.shape[-1], axis=-1), last, reconstructed)
+
+
+class LinearTransition(Reconstructor):
+    """
+    Predicts the missing elements by rolling a linear transition model (x_{t+1} = x_t W,
+    as in transition_model.LinearModel) forward from the most-recent collected value.
+    The powers of W are pre-computed, so each element costs a single [D, D] product.
+    """
+
+    def __init__(self, weights: np.ndarray, seq_length: int):
+        weights = np.asarray(weights, dtype=float)
+        assert len(weights.shape) == 2 and weights.shape[0] == weights.shape[1], 'Must provide a [D, D] transition matrix'
+
+        self._weights = weights
+
+        # The k-step transition matrices W^k, [T, D, D]
+        powers = np.empty(shape=(seq_length, ) + weights.shape)
+        powers[0] = np.eye(weights.shape[0])
+        for step in range(1, seq_length):
+            powers[step] = powers[step - 1].dot(weights)
+
+        self._powers = powers
+
+    @property
+    def name(self) -> str:
+        return 'linear_transition'
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self._weights
+
+    @classmethod
+    def fit(cls, inputs: np.ndarray, l2: float = TRANSITION_L2):
+        """
+        Fits the (ridge) next-step transition matrix to the [N, T, D] sequences.
+        """
+        num_features = inputs.shape[-1]
+        current = inputs[:, :-1].reshape(-1, num_features)
+        following = inputs[:, 1:].reshape(-1, num_features)
+
+        data_mat = current.T.dot(current) + l2 * np.eye(num_features)
+        weights = np.linalg.solve(data_mat, current.T.dot(following))  # [D, D]
+        return cls(weights=weights, seq_length=inputs.shape[1])
+
+    @classmethod
+    def restore(cls, path: str, seq_length: int):
+        """
+        Restores the [D, D] weights pickled by transition_model.LinearModel.
+        """
+        return cls(weights=read_pickle_gz(path), seq_length=seq_length)
+
+    def reconstruct(self, measurements: np.ndarray, collected_mask: np.ndarray) -> np.ndarray:
+        collected_mask = _validate(measurements, collected_mask)
+        values = np.asarray(measurements, dtype=float)
+        seq_length = collected_mask.shape[-1]
+
+        assert seq_length <= self._powers.shape[0], 'The model supports sequences of at most {0} elements'.format(self._powers.shape[0])
+
+        prev_idx, next_idx = neighbor_indices(collected_mask)
+
+        # Elements before the first collected value use the first value
+        source_idx = np.where(prev_idx >= 0, prev_idx, next_idx[:, 0:1])  # [N, T]
+        steps = np.maximum(np.arange(seq_length) - source_idx, 0)  # [N, T]
+
+        source = _gather(values, source_idx)  # [N, T, D]
+
+        # Apply each power once to all elements with the same step offset (avoids a [N, T, D, D] gather)
+        reconstructed = np.empty_like(source)
+        for step in np.unique(steps):
+            is_step = (steps == step)
+            reconstructed[is_step] = source[is_step].dot(self._powers[step])
+
+        return reconstructed
+
+
+def make_reconstructor(name: str, seq_length: Optional[int] = None, transition_weights: Optional[np.ndarray] = None) -> Reconstructor:
+    name = name.lower()
+
+    if name == 'zero_order_hold':
+        return ZeroOrderHold()
+    elif name == 'linear':
+        return LinearInterpolation()
+    elif name == 'pchip':
+        return MonotoneCubic()
+    elif name == 'linear_transition':
+        assert (seq_length is not None) and (transition_weights is not None), 'Must provide the sequence length and transition weights'
+        return LinearTransition(weights=transition_weights, seq_length=seq_length)
+    else:
+        raise ValueError('Unknown reconstructor: {0}'.format(name))
+
+
+RECONSTRUCTORS = ['zero_order_hold', 'linear', 'pchip', 'linear_transition']
@@ -4,12 +4,12 @@ import os.path
 import time
 from argparse import ArgumentParser
 from collections import defaultdict
-from sklearn.metrics import mean_absolute_error, r2_score, mean_squared_error
 from typing import List, Tuple
 
+from adaptiveleak.evaluation import ParallelEvaluator
 from adaptiveleak.server import reconstruct_sequence
-from adaptiveleak.policies import BudgetWrappedPolicy, Policy, run_policy
-from adaptiveleak.utils.analysis import normalized_mae, normalized_rmse
+from adaptiveleak.policies import BudgetWrappedPolicy, Policy, run_policy, decode_batch
+from adaptiveleak.utils.bits import BitWriter
 from adaptiveleak.utils.constants import ENCODING
 from adaptiveleak.utils.file_utils import read_pickle_gz, save_pickle_gz
 from adaptiveleak.utils.loading import load_data
@@ -23,6 +23,7 @@ if __name__ == '__main__':
     parser.add_argument('--encoding', type=str, choices=ENCODING, default='standard')
     parser.add_argument('--feature', type=int, default=0)
     parser.add_argument('--max-num-samples', type=int)
+    parser.add_argument('--num-workers', type=int, default=1, help='The number of processes which reconstruct and score the sequences.')
     args = parser.parse_args()
 
     # Load the data
@@ -49,15 +50,25 @@ if __name__ == '__main__':
 
     energy_list: List[float] = []
     bytes_list: List[int] = []
-    errors: List[float] = []
-    estimate_list: List[np.ndarray] = []
     collected: List[List[int]] = []
     collected_counts = defaultdict(list)
 
     max_num_seq = num_seq if args.max_num_samples is None else min(num_seq, args.max_num_samples)
 
+    # The policy runs sequentially (the budget carries across sequences), so we record
+    # the received measurements and reconstruct / score all sequences at the end.
+    evaluator = ParallelEvaluator(max_num_sequences=max_num_seq,
+                                  seq_length=seq_length,
+                                  num_features=num_features,
+                                  num_workers=args.num_workers)
+    evaluator.inputs[:] = inputs[0:max_num_seq]
+
     policy.init_for_experiment(num_sequences=max_num_seq)
 
+    # The messages are encoded back-to-back into a single buffer and decoded together at the end
+    writer = BitWriter()
+    offsets = np.zeros(shape=(max_num_seq + 1, ), dtype=np.int64)
+
     collected_seq = 1  # The number of sequences collected under the budget
 
     for idx, (sequence, label) in enumerate(zip(inputs, labels)):
@@ -69,26 +80,13 @@ if __name__ == '__main__':
         # Run the policy
         policy_result = run_policy(policy=policy,
                                    sequence=sequence,
-                                   should_enforce_budget=False)
+                                   should_enforce_budget=False,
+                                   writer=writer)
         policy.step(seq_idx=idx, count=policy_result.num_collected)
 
-        # Decode the sequence (accounts for numerical errors)
-        if policy_result.num_bytes > 0:
-            recv_measurements, recv_indices, _ = policy.decode(message=policy_result.encoded)
-        else:
-            recv_measurements = policy_result.measurements
-            recv_indices = policy_result.collected_indices
-
-        # Reconstruct the sequence
-        reconstructed = reconstruct_sequence(measurements=recv_measurements,
-                                             collected_indices=recv_indices,
-                                             seq_length=seq_length)
-
-        error = mean_absolute_error(y_true=sequence, y_pred=reconstructed)
+        offsets[idx + 1] = len(writer)
 
         # Record the policy results
-        errors.append(error)
-        estimate_list.append(reconstructed)
         collected.append(policy_result.collected_indices)
         collected_counts[label].append(policy_result.num_bytes)
         energy_list.append(policy_result.energy)
@@ -97,22 +95,25 @@ if __name__ == '__main__':
         if not policy.has_exhausted_budget():
             collected_seq = idx + 1
 
+    # Decode the messages (accounts for numerical errors) and record the received measurements for reconstruction
+    decoded = decode_batch(policy, buffer=writer.buffer, offsets=offsets)
+    evaluator.measurements[0:max_num_seq] = decoded.measurements
+    evaluator.collected_mask[0:max_num_seq] = decoded.mask
+
     num_samples = collected_seq * seq_length
     num_collected = sum(len(c) for c in collected[:collected_seq])
 
-    reconstructed = np.vstack([np.expand_dims(r, axis=0) for r in estimate_list])  # [N, T, D]
-    reconstructed = reconstructed.reshape(-1, num_features)
-
-    true = inputs[0:max_num_seq]
-    true = true.reshape(-1, num_features)
+    # Reconstruct and score the sequences
+    eval_result = evaluator.evaluate(num_sequences=max_num_seq)
+    error_accumulator = eval_result.errors
 
-    error = mean_absolute_error(y_true=true, y_pred=reconstructed)
-    norm_error = normalized_mae(y_true=true, y_pred=reconstructed)
+    error = error_accumulator.mae()
+    norm_error = error_accumulator.norm_mae()
 
-    rmse = mean_squared_error(y_true=true, y_pred=reconstructed, squared=False)
-    norm_rmse = normalized_rmse(y_true=true, y_pred=reconstructed)
+    rmse = error_accumulator.rmse()
+    norm_rmse = error_accumulator.norm_rmse()
 
-    r2 = r2_score(y_true=true, y_pred=reconstructed, multioutput='variance_weighted')
+    r2 = error_accumulator.r2_score()
 
     print('MAE: {0:.7f}, Norm MAE: {1:.5f}, RMSE: {2:.5f}, Norm RMSE: {3:.5f}, R^2: {4:.5f}'.format(error, norm_error, rmse, norm_rmse, r2))
     print('Number Collected: {0} / {1} ({2:.4f})'.format(num_collected, num_samples, num_collected / num_samples))
@@ -121,11 +122,16 @@ if __name__ == '__main__':
     print('Byte Count: {0:.5f} ({1:.5f})'.format(np.average(bytes_list[:collected_seq]), np.std(bytes_list[:collected_seq])))
     print('Collected: {0} / {1}'.format(collected_seq, max_num_seq))
 
-    data_idx = np.argmax(errors)
-    estimates = estimate_list[data_idx]
+    data_idx = int(np.argmax(eval_result.maes))
     collected_idx = collected[data_idx]
 
-    print('Max Error: {0:.5f} (Idx: {1})'.format(errors[data_idx], data_idx))
+    recv_indices = np.nonzero(evaluator.collected_mask[data_idx])[0]
+    estimates = reconstruct_sequence(measurements=evaluator.measurements[data_idx, recv_indices],
+                                     collected_indices=recv_indices.tolist(),
+                                     seq_length=seq_length)
+    evaluator.close()
+
+    print('Max Error: {0:.5f} (Idx: {1})'.format(eval_result.maes[data_idx], data_idx))
     print('Max Error Collected: {0}'.format(len(collected_idx)))
 
     print('Label Distribution')
@@ -0,0 +1,105 @@
+import numpy as np
+import math
+import os.path
+import time
+from argparse import ArgumentParser
+from typing import List
+
+from adaptiveleak.utils.compression import Codec, make_codec, codec_names, train_dictionary, DEFAULT_DICT_SIZE
+from adaptiveleak.utils.constants import COMPRESSION_DICT_FILE, BITS_PER_BYTE
+from adaptiveleak.utils.data_utils import array_to_fp
+from adaptiveleak.utils.file_utils import read_json, save_pickle_gz, make_dir
+from adaptiveleak.utils.loading import load_data
+from adaptiveleak.utils.message import encode_compressed_payload
+
+
+def make_payloads(inputs: np.ndarray, collection_rate: float, width: int, precision: int) -> List[bytes]:
+    """
+    Creates the (uncompressed) payloads for uniformly-sampled sequences.
+
+    Args:
+        inputs: A [N, T, D] array of sequences
+        collection_rate: The fraction of elements to collect
+        width: The bit width of each feature
+        precision: The fixed point precision of each feature
+    Returns:
+        A list of N payloads
+    """
+    seq_length = inputs.shape[1]
+    num_collected = max(int(collection_rate * seq_length), 1)
+    collected_indices = np.unique(np.linspace(0, seq_length - 1, num=num_collected).astype(int))
+
+    payloads: List[bytes] = []
+    for sequence in inputs:
+        measurements = sequence[collected_indices]
+        quantized = array_to_fp(measurements.T.reshape(-1), width=width, precision=precision)
+        payloads.append(encode_compressed_payload(quantized, precision=precision))
+
+    return payloads
+
+
+def benchmark(codec: Codec, payloads: List[bytes], num_trials: int):
+    raw_bytes = sum(len(p) for p in payloads)
+
+    encode_time = 0.0
+    decode_time = 0.0
+
+    for _ in range(num_trials):
+        start = time.perf_counter()
+        compressed = [codec.compress(p) for p in payloads]
+        encode_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        decompressed = [codec.decompress(c) for c in compressed]
+        decode_time += time.perf_counter() - start
+
+    assert all(d == p for d, p in zip(decompressed, payloads)), 'Codec {0} is not lossless.'.format(codec.name)
+
+    compressed_bytes = sum(len(c) for c in compressed)
+    megabytes = (raw_bytes * num_trials) / 1e6
+
+    print('{0:>12}: Ratio {1:.4f}, Avg Bytes {2:.2f}, Encode {3:.3f} MB/s, Decode {4:.3f} MB/s'.format(codec.name,
+                                                                                                    compressed_bytes / raw_bytes,
+                                                                                                    compressed_bytes / len(payloads),
+                                                                                                    megabytes / encode_time,
+                                                                                                    megabytes / decode_time))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--dataset', type=str, required=True)
+    parser.add_argument('--collection-rate', type=float, default=0.7)
+    parser.add_argument('--codecs', type=str, nargs='+', choices=codec_names())
+    parser.add_argument('--dict-size', type=int, default=DEFAULT_DICT_SIZE)
+    parser.add_argument('--num-trials', type=int, default=3)
+    parser.add_argument('--save-dictionary', action='store_true')
+    args = parser.parse_args()
+
+    base = os.path.join(os.path.dirname(__file__), '..')
+    quantize_dict = read_json(os.path.join(base, 'datasets', args.dataset, 'quantize.json'))
+    width, precision = quantize_dict['width'], quantize_dict['precision']
+
+    # Train the static dictionary on the training fold
+    train_inputs, _ = load_data(dataset_name=args.dataset, fold='train')
+    train_payloads = make_payloads(train_inputs, collection_rate=args.collection_rate, width=width, precision=precision)
+    dictionary = train_dictionary(train_payloads, max_size=args.dict_size)
+
+    if args.save_dictionary:
+        output_folder = os.path.join(base, 'saved_models', args.dataset)
+        make_dir(output_folder)
+        save_pickle_gz(dictionary, os.path.join(output_folder, COMPRESSION_DICT_FILE))
+
+    # Evaluate on the testing fold
+    test_inputs, _ = load_data(dataset_name=args.dataset, fold='test')
+    test_payloads = make_payloads(test_inputs, collection_rate=args.collection_rate, width=width, precision=precision)
+
+    # The size of the uncompressed (standard) measurement encoding for reference
+    num_collected = max(int(args.collection_rate * test_inputs.shape[1]), 1)
+    standard_bytes = int(math.ceil((num_collected * test_inputs.shape[-1] * width) / BITS_PER_BYTE))
+
+    print('Dataset: {0}, Sequences: {1}, Dictionary: {2} bytes, Standard Encoding: {3} bytes'.format(args.dataset, len(test_payloads), len(dictionary), standard_bytes))
+
+    names = args.codecs if args.codecs is not None else codec_names()
+    for name in names:
+        codec = make_codec(name, dictionary=dictionary)
+        benchmark(codec=codec, payloads=test_payloads, num_trials=args.num_trials)
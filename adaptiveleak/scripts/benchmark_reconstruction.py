@@ -0,0 +1,118 @@
+#!/bin/python3
+
+import numpy as np
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, List, Tuple
+
+from adaptiveleak.policies import run_policy, BudgetWrappedPolicy
+from adaptiveleak.reconstructors import Reconstructor, ZeroOrderHold, LinearInterpolation, MonotoneCubic, LinearTransition
+from adaptiveleak.utils.constants import ENCRYPTION, COLLECTION
+from adaptiveleak.utils.file_utils import save_json
+from adaptiveleak.utils.loading import load_data
+
+
+def collect_masks(policy: BudgetWrappedPolicy, inputs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs the policy on each sequence (ignoring the budget).
+
+    Returns:
+        A tuple of (1) the [N, T, D] collected measurements and (2) the [N, T] collected mask
+    """
+    policy.init_for_experiment(num_sequences=inputs.shape[0])
+
+    measurements = np.zeros_like(inputs, dtype=float)
+    collected_mask = np.zeros(shape=inputs.shape[:2], dtype=bool)
+
+    for seq_idx, sequence in enumerate(inputs):
+        policy.reset()
+        policy_result = run_policy(policy=policy, sequence=sequence, should_enforce_budget=False)
+
+        measurements[seq_idx, policy_result.collected_indices] = policy_result.measurements
+        collected_mask[seq_idx, policy_result.collected_indices] = True
+
+    return measurements, collected_mask
+
+
+def benchmark(reconstructor: Reconstructor, inputs: np.ndarray, measurements: np.ndarray, collected_mask: np.ndarray, num_trials: int) -> Dict[str, float]:
+    """
+    Measures the reconstruction error and the throughput (using the fastest trial).
+    """
+    best_time = None
+
+    for _ in range(num_trials):
+        start = time.perf_counter()
+        reconstructed = reconstructor.reconstruct(measurements=measurements, collected_mask=collected_mask)
+        elapsed = time.perf_counter() - start
+
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    return {
+        'mae': float(np.average(np.abs(inputs - reconstructed))),
+        'seq_per_sec': inputs.shape[0] / max(best_time, 1e-9)
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser('Compares the reconstruction error and throughput of each reconstruction backend.')
+    parser.add_argument('--datasets', type=str, nargs='+', required=True)
+    parser.add_argument('--policy', type=str, default='uniform')
+    parser.add_argument('--collection-rate', type=float, default=0.5)
+    parser.add_argument('--encryption', type=str, choices=ENCRYPTION, default='stream')
+    parser.add_argument('--collect', type=str, choices=COLLECTION, default='tiny')
+    parser.add_argument('--max-num-seq', type=int)
+    parser.add_argument('--num-trials', type=int, default=5)
+    parser.add_argument('--transition-weights', type=str, help='Path to the pickled weights of a linear transition model. When absent, we fit the model on --transition-fold.')
+    parser.add_argument('--transition-fold', type=str, default='validation')
+    parser.add_argument('--output-file', type=str, help='An optional (json) file to hold the results.')
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = dict()
+
+    for dataset in args.datasets:
+        inputs, _ = load_data(dataset_name=dataset, fold='test')
+
+        if args.max_num_seq is not None:
+            inputs = inputs[0:args.max_num_seq]
+
+        num_seq, seq_length, num_features = inputs.shape
+
+        policy = BudgetWrappedPolicy(name=args.policy,
+                                     collection_rate=args.collection_rate,
+                                     seq_length=seq_length,
+                                     num_features=num_features,
+                                     encryption_mode=args.encryption,
+                                     collect_mode=args.collect,
+                                     encoding='standard',
+                                     dataset=dataset,
+                                     should_compress=False)
+
+        measurements, collected_mask = collect_masks(policy=policy, inputs=inputs)
+
+        reconstructors: List[Reconstructor] = [ZeroOrderHold(), LinearInterpolation(), MonotoneCubic()]
+
+        if args.transition_weights is not None:
+            reconstructors.append(LinearTransition.restore(args.transition_weights, seq_length=seq_length))
+        else:
+            transition_inputs, _ = load_data(dataset_name=dataset, fold=args.transition_fold)
+            reconstructors.append(LinearTransition.fit(transition_inputs))
+
+        print('Dataset: {0} ({1} sequences, {2:.3f} collected)'.format(dataset, num_seq, np.average(collected_mask)))
+        print('{0:<20} {1:>12} {2:>14}'.format('Backend', 'MAE', 'Seq / Sec'))
+
+        dataset_results: Dict[str, Dict[str, float]] = dict()
+        for reconstructor in reconstructors:
+            result = benchmark(reconstructor=reconstructor,
+                               inputs=inputs,
+                               measurements=measurements,
+                               collected_mask=collected_mask,
+                               num_trials=args.num_trials)
+
+            print('{0:<20} {1:>12.6f} {2:>14.1f}'.format(reconstructor.name, result['mae'], result['seq_per_sec']))
+            dataset_results[reconstructor.name] = result
+
+        results[dataset] = dataset_results
+        print()
+
+    if args.output_file is not None:
+        save_json(results, args.output_file)
@@ -7,8 +7,9 @@ from typing import Optional
 
 from adaptiveleak.policies import BudgetWrappedPolicy, run_policy
 from adaptiveleak.utils.constants import LENGTH_SIZE, LENGTH_ORDER, ENCODING, ENCRYPTION, COLLECTION, POLICIES
+from adaptiveleak.utils.compression import codec_names, DEFAULT_CODEC
 from adaptiveleak.utils.data_utils import array_to_fp, array_to_float
-from adaptiveleak.utils.encryption import encrypt, EncryptionMode, add_hmac
+from adaptiveleak.utils.encryption import Encryptor, EncryptionMode
 from adaptiveleak.utils.loading import load_data
 from adaptiveleak.utils.file_utils import read_json, read_pickle_gz, save_pickle_gz
 
@@ -47,6 +48,10 @@ class Sensor:
         """
         assert len(inputs.shape) == 3, 'Must provide a 3d input'
 
+        # Build the cipher and HMAC contexts once for all messages
+        key = self._aes_key if policy.encryption_mode == EncryptionMode.BLOCK else self._chacha_key
+        encryptor = Encryptor(key=key, mode=policy.encryption_mode, hmac_secret=self._hmac_secret)
+
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
             # Connect to the server
             sock.connect((self.host, self.port))
@@ -68,8 +73,7 @@ class Sensor:
                                         collected_indices=policy_result.collected_indices)
 
                 # Encrypt and send the message
-                key = self._aes_key if policy.encryption_mode == EncryptionMode.BLOCK else self._chacha_key
-                encrypted_message = encrypt(message=message, key=key, mode=policy.encryption_mode)
+                encrypted_message = encryptor.encrypt(message)
 
                 # Include the true number of collected measurements for proper energy logging. This is NOT
                 # something we send in a real scenario (it would defeat the whole purpose of the defense).
@@ -82,7 +86,7 @@ class Sensor:
                 encrypted_message = true_num_collected + length + encrypted_message
 
                 # Add the HMAC authentication
-                tagged_message = add_hmac(encrypted_message, secret=self._hmac_secret)
+                tagged_message = encryptor.add_hmac(encrypted_message)
 
                 sock.sendall(tagged_message)
 
@@ -103,6 +107,7 @@ if __name__ == '__main__':
     parser.add_argument('--port', type=int, default=50000)
     parser.add_argument('--max-num-seq', type=int)
     parser.add_argument('--should-compress', action='store_true')
+    parser.add_argument('--compression', type=str, choices=codec_names(), default=DEFAULT_CODEC)
     args = parser.parse_args()
 
     # Load the data
@@ -121,7 +126,8 @@ if __name__ == '__main__':
                                  encryption_mode=args.encryption,
                                  collect_mode=args.collect,
                                  encoding=args.encoding,
-                                 should_compress=args.should_compress)
+                                 should_compress=args.should_compress,
+                                 compression=args.compression)
 
     # Initialize the policy for the current budget
     policy.init_for_experiment(num_sequences=num_seq)
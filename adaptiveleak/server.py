@@ -1,23 +1,56 @@
 import numpy as np
-import os.path
+import os
 import h5py
+import select
 import socket
 import time
 from argparse import ArgumentParser
-from collections import namedtuple, Counter
-from sklearn.metrics import mean_absolute_error, r2_score, mean_squared_error
-from typing import Optional, List, Tuple
+from collections import namedtuple, Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterable, Iterator, Optional, List, Tuple
 
-from adaptiveleak.policies import BudgetWrappedPolicy
+from adaptiveleak.policies import BudgetWrappedPolicy, run_policy
+from adaptiveleak.reconstruction import InterpolationCache
 from adaptiveleak.utils.constants import LENGTH_SIZE, LENGTH_ORDER, SMALL_NUMBER, ENCODING, ENCRYPTION, COLLECTION, POLICIES
-from adaptiveleak.utils.analysis import normalized_mae, normalized_rmse
-from adaptiveleak.utils.encryption import decrypt, verify_hmac, SHA256_LEN
+from adaptiveleak.utils.analysis import ErrorAccumulator, Histogram, ResultSummary, summary_path
+from adaptiveleak.utils.compression import codec_names, DEFAULT_CODEC
+from adaptiveleak.utils.data_utils import array_to_fp, array_to_float, calculate_bytes
+from adaptiveleak.utils.encryption import Encryptor, SHA256_LEN, encrypted_size
 from adaptiveleak.utils.loading import load_data
 from adaptiveleak.utils.data_types import EncryptionMode
-from adaptiveleak.utils.file_utils import read_json, save_json_gz, read_pickle_gz
+from adaptiveleak.utils.file_utils import read_json, save_json, save_json_gz, read_pickle_gz
+from adaptiveleak.utils.message_log import write_message_log, message_log_path
+from adaptiveleak.utils.random_pool import ZeroPool, set_padding_pool
 
 
 Message = namedtuple('Message', ['mac', 'length', 'data', 'full', 'num_bytes', 'true_num_collected'])
+ReceivedMessage = namedtuple('ReceivedMessage', ['plaintext', 'ciphertext', 'num_bytes', 'true_num_collected'])
+CryptoResult = namedtuple('CryptoResult', ['seq', 'is_verified', 'plaintext', 'elapsed'])
+
+RECV_SIZE = 1 << 16
+CRYPTO_WORKERS = min(4, os.cpu_count() or 1)
+MAX_PENDING_PER_WORKER = 8
+
+# Buckets (in microseconds) for the crypto time histogram
+CRYPTO_TIME_LOW = 1.0
+CRYPTO_TIME_HIGH = 1e5
+CRYPTO_TIME_BUCKETS = 40
+
+# Settings for the per-label and per-budget-window summaries
+SUMMARY_WINDOW = 100
+SUMMARY_SIZE_BUCKETS = 32
+
+
+def has_complete_message(message_buffer: bytes) -> bool:
+    """
+    Returns whether the buffer starts with a complete message.
+    """
+    data_start = SHA256_LEN + 2 * LENGTH_SIZE
+    if len(message_buffer) < data_start:
+        return False
+
+    length = int.from_bytes(message_buffer[data_start - LENGTH_SIZE:data_start], byteorder=LENGTH_ORDER)
+    return len(message_buffer) >= data_start + length
 
 
 def parse_message(message_buffer: bytes) -> Tuple[Message, int]:
@@ -56,7 +89,9 @@ def parse_message(message_buffer: bytes) -> Tuple[Message, int]:
 
 def reconstruct_sequence(measurements: np.ndarray, collected_indices: List[int], seq_length: int) -> np.ndarray:
     """
-    Reconstructs a sequence using a linear interpolation.
+    Reconstructs a sequence using a linear interpolation. This matches
+    np.interp() on each feature (including the clamping at the edges), but shares
+    the searchsorted segment lookup across all features.
 
     Args:
         measurements: A [K, D] array of sub-sampled features
@@ -65,21 +100,276 @@ def reconstruct_sequence(measurements: np.ndarray, collected_indices: List[int],
     Returns:
         A [T, D] array of reconstructed measurements.
     """
-    feature_list: List[np.ndarray] = []
-    seq_idx = list(range(seq_length))
+    fp = np.asarray(measurements, dtype=float)  # [K, D]
+    xp = np.asarray(collected_indices, dtype=float)  # [K]
+    x = np.arange(seq_length, dtype=float)  # [T]
+
+    if xp.shape[0] == 0:
+        raise ValueError('Must provide at least one collected measurement')
+
+    if xp.shape[0] == 1:
+        return np.repeat(fp, repeats=seq_length, axis=0)
+
+    if fp.shape[1] == 1:
+        return np.interp(x, xp, fp[:, 0])[:, np.newaxis]
+
+    # The sum is finite only when all values are (overflows take the slower path)
+    if np.isfinite(fp.sum()):
+        # Find the segment [xp[j], xp[j + 1]) holding each element. Elements at or beyond
+        # the last index use a zero-slope segment, and elements before the first index are
+        # moved onto it. Both cases then yield the edge values exactly (as do exact matches). [T]
+        positions = np.maximum(x, xp[0])
+        segment = xp.searchsorted(positions, side='right') - 1
+
+        # Interpolate in the same order of operations as np.interp(), [T, D]
+        slopes = np.empty_like(fp)
+        np.divide(fp[1:] - fp[:-1], (xp[1:] - xp[:-1])[:, np.newaxis], out=slopes[:-1])
+        slopes[-1] = 0.0
+
+        return slopes[segment] * (positions - xp[segment])[:, np.newaxis] + fp[segment]
+
+    # Non-finite values need the special cases of np.interp(). Find the segment [xp[j], xp[j + 1]) holding each element, [T]
+    segment = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, xp.shape[0] - 2)
+
+    with np.errstate(invalid='ignore'):
+        slopes = (fp[1:] - fp[:-1]) / np.expand_dims(xp[1:] - xp[:-1], axis=-1)  # [K - 1, D]
+        slopes = slopes[segment]
+
+        lower, upper = fp[segment], fp[segment + 1]
+        reconstructed = slopes * np.expand_dims(x - xp[segment], axis=-1) + lower
+        reconstructed = _fix_nan_interpolation(reconstructed, slopes=slopes, upper_offsets=np.expand_dims(x - xp[segment + 1], axis=-1), lower=lower, upper=upper)
+
+    # Use the collected values on exact matches and clamp beyond the edges
+    is_exact = (x == xp[segment])
+    reconstructed[is_exact] = lower[is_exact]
+    reconstructed[x < xp[0]] = fp[0]
+    reconstructed[x >= xp[-1]] = fp[-1]
+
+    return reconstructed
+
+
+def reconstruct_sequences(measurements: np.ndarray, collected_mask: np.ndarray) -> np.ndarray:
+    """
+    Reconstructs a batch of sequences using a linear interpolation. Each
+    sequence matches reconstruct_sequence() (and thus np.interp()).
+
+    Args:
+        measurements: A [N, T, D] array of features. Only the collected
+            elements are read.
+        collected_mask: A [N, T] boolean array marking the collected elements
+    Returns:
+        A [N, T, D] array of reconstructed measurements.
+    """
+    assert len(measurements.shape) == 3, 'Must provide a 3d array of measurements'
+    assert collected_mask.shape == measurements.shape[:2], 'The mask must have shape [N, T]'
+
+    collected_mask = collected_mask.astype(bool)
+    if not np.all(np.any(collected_mask, axis=-1)):
+        raise ValueError('Each sequence must have at least one collected measurement')
+
+    num_seq, seq_length, _ = measurements.shape
+    fp = np.asarray(measurements, dtype=float)
+    positions = np.arange(seq_length)
+
+    # The last collected index at or before each element, and the first collected
+    # index at or after it. Missing neighbors become -1 and T, respectively. [N, T]
+    prev_idx = np.maximum.accumulate(np.where(collected_mask, positions, -1), axis=-1)
+    next_idx = np.flip(np.minimum.accumulate(np.flip(np.where(collected_mask, positions, seq_length), axis=-1), axis=-1), axis=-1)
+
+    first_idx = next_idx[:, 0:1]  # [N, 1]
+    last_idx = prev_idx[:, -1:]  # [N, 1]
+
+    # Gather the interpolation end-points for elements between two collected indices
+    lower_idx = np.clip(prev_idx, 0, seq_length - 1)
+    upper_idx = np.clip(next_idx, 0, seq_length - 1)
+
+    batch_idx = np.expand_dims(np.arange(num_seq), axis=-1)
+    lower = fp[batch_idx, lower_idx]  # [N, T, D]
+    upper = fp[batch_idx, upper_idx]  # [N, T, D]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = (upper - lower) / np.expand_dims((upper_idx - lower_idx).astype(float), axis=-1)
+        reconstructed = slopes * np.expand_dims((positions - lower_idx).astype(float), axis=-1) + lower
+        reconstructed = _fix_nan_interpolation(reconstructed, slopes=slopes, upper_offsets=np.expand_dims((positions - upper_idx).astype(float), axis=-1), lower=lower, upper=upper)
+
+    # Use the collected values on exact matches and clamp beyond the edges
+    reconstructed[collected_mask] = fp[collected_mask]
+
+    before_first = np.broadcast_to(positions < first_idx, collected_mask.shape)
+    reconstructed[before_first] = np.broadcast_to(fp[batch_idx, first_idx], fp.shape)[before_first]
+
+    after_last = np.broadcast_to(positions > last_idx, collected_mask.shape)
+    reconstructed[after_last] = np.broadcast_to(fp[batch_idx, last_idx], fp.shape)[after_last]
+
+    return reconstructed
+
+
+def _fix_nan_interpolation(reconstructed: np.ndarray, slopes: np.ndarray, upper_offsets: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """
+    Mirrors the fallbacks in np.interp() for non-finite values. When the interpolation
+    is NaN, np.interp() retries from the upper end-point and, for equal end-points, uses
+    the end-point itself.
+    """
+    is_nan = np.isnan(reconstructed)
+    if not np.any(is_nan):
+        return reconstructed
+
+    retry = slopes[is_nan] * np.broadcast_to(upper_offsets, reconstructed.shape)[is_nan] + upper[is_nan]
+    reconstructed[is_nan] = np.where(np.isnan(retry) & (lower[is_nan] == upper[is_nan]), lower[is_nan], retry)
+    return reconstructed
+
+
+class CryptoStage:
+    """
+    Verifies and decrypts the messages of one connection on a (shared) thread pool.
+    The cipher code releases the GIL, so the work spreads across cores while the
+    server decodes earlier messages. Each message gets a per-connection sequence number,
+    and results are returned in this order.
+    """
+
+    def __init__(self, encryptor: Encryptor, executor: ThreadPoolExecutor, crypto_times: Optional[Histogram] = None):
+        self._encryptor = encryptor
+        self._executor = executor
+        self._crypto_times = crypto_times
+        self._pending: Deque[Tuple[int, Message, Future]] = deque()
+        self._next_seq = 0
+
+    @property
+    def num_pending(self) -> int:
+        return len(self._pending)
+
+    def _process(self, seq: int, parsed: Message) -> CryptoResult:
+        start = time.perf_counter()
+
+        is_verified = self._encryptor.verify_hmac(mac=parsed.mac, message=parsed.full)
+        plaintext = self._encryptor.decrypt(parsed.data) if is_verified else None
+
+        return CryptoResult(seq=seq, is_verified=is_verified, plaintext=plaintext, elapsed=time.perf_counter() - start)
+
+    def submit(self, parsed: Message) -> int:
+        """
+        Schedules the message for verification and decryption.
+
+        Returns:
+            The sequence number of this message
+        """
+        seq = self._next_seq
+        self._next_seq += 1
+
+        self._pending.append((seq, parsed, self._executor.submit(self._process, seq, parsed)))
+        return seq
+
+    def pop(self) -> Tuple[Message, CryptoResult]:
+        """
+        Returns the parsed message and crypto result with the lowest outstanding
+        sequence number (blocks until it is ready).
+        """
+        _, parsed, future = self._pending.popleft()
+        result = future.result()
+
+        if self._crypto_times is not None:
+            self._crypto_times.add(result.elapsed * 1e6)  # Microseconds
 
-    # Interpolate the unseen measurements using a linear function
-    for feature_idx in range(measurements.shape[1]):
-        collected_features = measurements[:, feature_idx]  # [K]
-        reconstructed = np.interp(x=seq_idx,
-                                  xp=collected_indices,
-                                  fp=collected_features,
-                                  left=collected_features[0],
-                                  right=collected_features[-1])
+        return parsed, result
 
-        feature_list.append(np.expand_dims(reconstructed, axis=-1))
+    def cancel(self):
+        for _, _, future in self._pending:
+            future.cancel()
 
-    return np.concatenate(feature_list, axis=-1)  # [T, D]
+        self._pending.clear()
+
+
+def receive_messages(conn: socket.socket, encryptor: Encryptor, num_sequences: int, num_workers: int = CRYPTO_WORKERS, crypto_times: Optional[Histogram] = None) -> Iterator[ReceivedMessage]:
+    """
+    Reads, authenticates and decrypts the messages sent by the sensor. The crypto runs
+    on a thread pool while the caller consumes earlier messages. Stops early if a message
+    fails authentication or the connection closes.
+
+    Args:
+        conn: The connection to the sensor
+        encryptor: The cipher and HMAC contexts
+        num_sequences: The number of messages to receive
+        num_workers: The number of crypto threads
+        crypto_times: An optional histogram which records the crypto time per message (in microseconds)
+    Returns:
+        An iterator over the received messages (in order)
+    """
+    max_pending = MAX_PENDING_PER_WORKER * num_workers
+
+    # Create a buffer for messages
+    message_buffer = bytearray()
+    num_submitted = 0
+    num_received = 0
+    is_closed = False
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        stage = CryptoStage(encryptor=encryptor, executor=executor, crypto_times=crypto_times)
+
+        while num_received < num_sequences:
+            # Submit all complete messages in the buffer. The buffer may hold many
+            # (or partial) messages, as the socket does not preserve message boundaries.
+            while (num_submitted < num_sequences) and (stage.num_pending < max_pending) and has_complete_message(message_buffer):
+                parsed, consumed_bytes = parse_message(message_buffer)
+                del message_buffer[:consumed_bytes]
+
+                stage.submit(parsed)
+                num_submitted += 1
+
+            # Read from the socket whenever the stage has room for more messages. We only block on the
+            # socket when there is no outstanding work; otherwise, we take the data which has already
+            # arrived and let the crypto threads keep running.
+            if (not is_closed) and (num_submitted < num_sequences) and (stage.num_pending < max_pending):
+                is_ready = (stage.num_pending == 0) or (len(select.select([conn], [], [], 0.0)[0]) > 0)
+
+                if is_ready:
+                    recv = conn.recv(RECV_SIZE)
+
+                    if len(recv) == 0:
+                        is_closed = True
+                    else:
+                        message_buffer.extend(recv)
+                        continue
+
+            # Stop once the connection closes and every (complete) message has been consumed
+            if stage.num_pending == 0:
+                print('Connection closed after {0} sequences. Quitting.'.format(num_received))
+                return
+
+            parsed, result = stage.pop()
+
+            # Verify the MAC
+            if not result.is_verified:
+                print('Could not verify MAC for sample {0}. Quitting.'.format(result.seq))
+                stage.cancel()
+                return
+
+            num_received += 1
+
+            yield ReceivedMessage(plaintext=result.plaintext,
+                                  ciphertext=parsed.data,
+                                  num_bytes=parsed.num_bytes,
+                                  true_num_collected=parsed.true_num_collected)
+
+
+def simulate_messages(inputs: np.ndarray, policy: BudgetWrappedPolicy, num_sequences: int) -> Iterator[ReceivedMessage]:
+    """
+    Runs the sensor policy in-process and yields the plaintext messages. The message
+    sizes account for the encryption (IV / nonce and block padding) and the length field,
+    exactly as in the messages from the sensor. No encryption is performed.
+    """
+    for idx in range(num_sequences):
+        # Match the sensor's calls exactly, as resets may advance the policy's random state
+        policy.reset()
+        policy_result = run_policy(policy=policy,
+                                   sequence=inputs[idx],
+                                   should_enforce_budget=False)
+
+        num_bytes = LENGTH_SIZE + encrypted_size(len(policy_result.encoded), mode=policy.encryption_mode)
+
+        yield ReceivedMessage(plaintext=policy_result.encoded,
+                              ciphertext=None,
+                              num_bytes=num_bytes,
+                              true_num_collected=policy_result.num_collected)
 
 
 class Server:
@@ -87,9 +377,11 @@ class Server:
     This class mimics a server that infers 'missing' objects
     and performs inference
     """
-    def __init__(self, host: str, port: int):
+    def __init__(self, host: str, port: int, reconstruction_cache: Optional[InterpolationCache] = None, summary_window: int = SUMMARY_WINDOW):
         self._host = host
         self._port = port
+        self._reconstruction_cache = reconstruction_cache
+        self._summary_window = summary_window
 
         # These encryption keys are kept secret from the attacker program
         self._aes_key = bytes.fromhex('349fdc00b44d1aaacaa3a2670fd44244')
@@ -104,10 +396,87 @@ class Server:
     def port(self) -> int:
         return self._port
 
-    def run(self, inputs: np.ndarray, labels: np.ndarray, policy: BudgetWrappedPolicy, num_sequences: int, should_print: bool, should_ignore_budget: bool, output_folder: str):
+    def run(self, inputs: np.ndarray, labels: np.ndarray, policy: BudgetWrappedPolicy, num_sequences: int, should_print: bool, should_ignore_budget: bool, output_folder: str, should_write_log: bool = False, num_crypto_workers: int = CRYPTO_WORKERS):
         """
         Opens the server for connections.
         """
+        # Build the cipher and HMAC contexts once for all messages
+        key = self._aes_key if policy.encryption_mode == EncryptionMode.BLOCK else self._chacha_key
+        encryptor = Encryptor(key=key, mode=policy.encryption_mode, hmac_secret=self._hmac_secret)
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            # Bind the sensor to the selected host and port
+            sock.bind((self.host, self.port))
+
+            if should_print:
+                print('Started Server.')
+
+            # Listen on the given port and accept any inbound connections
+            sock.listen()
+            conn, addr = sock.accept()
+
+            if should_print:
+                print('Accepted connection from {0}'.format(addr))
+
+            with conn:
+                crypto_times = Histogram.log_spaced(low=CRYPTO_TIME_LOW, high=CRYPTO_TIME_HIGH, num_buckets=CRYPTO_TIME_BUCKETS)
+
+                received = receive_messages(conn=conn,
+                                            encryptor=encryptor,
+                                            num_sequences=num_sequences,
+                                            num_workers=num_crypto_workers,
+                                            crypto_times=crypto_times)
+
+                self._process_messages(received=received,
+                                       crypto_times=crypto_times,
+                                       inputs=inputs,
+                                       labels=labels,
+                                       policy=policy,
+                                       num_sequences=num_sequences,
+                                       should_ignore_budget=should_ignore_budget,
+                                       output_folder=output_folder,
+                                       should_write_log=should_write_log,
+                                       is_size_only=False)
+
+    def run_size_only(self, inputs: np.ndarray, sensor_inputs: np.ndarray, labels: np.ndarray, policy: BudgetWrappedPolicy, sensor_policy: BudgetWrappedPolicy, num_sequences: int, should_ignore_budget: bool, output_folder: str, should_write_log: bool = False):
+        """
+        Simulates the sensor in-process and skips all encryption, authentication and
+        random padding. The logged message sizes match those of run(), and the outputs
+        are flagged as size-only.
+
+        Args:
+            inputs: A [N, T, D] array of the true sequences
+            sensor_inputs: A [N, T, D] array of the sequences as read by the sensor
+            labels: A [N] array of sequence labels
+            policy: The (server-side) policy which decodes messages and tracks the energy
+            sensor_policy: A separate instance of the same policy for the sensor
+            num_sequences: The number of sequences to simulate
+            should_ignore_budget: Whether to ignore the energy budget
+            output_folder: The folder in which to save the results
+            should_write_log: Whether to also write the columnar message log
+        """
+        # The padding never leaves the process, so we skip drawing random bytes
+        previous_pool = set_padding_pool(ZeroPool())
+
+        try:
+            received = simulate_messages(inputs=sensor_inputs, policy=sensor_policy, num_sequences=num_sequences)
+            self._process_messages(received=received,
+                                   crypto_times=None,
+                                   inputs=inputs,
+                                   labels=labels,
+                                   policy=policy,
+                                   num_sequences=num_sequences,
+                                   should_ignore_budget=should_ignore_budget,
+                                   output_folder=output_folder,
+                                   should_write_log=should_write_log,
+                                   is_size_only=True)
+        finally:
+            set_padding_pool(previous_pool)
+
+    def _process_messages(self, received: Iterable[ReceivedMessage], crypto_times: Optional[Histogram], inputs: np.ndarray, labels: np.ndarray, policy: BudgetWrappedPolicy, num_sequences: int, should_ignore_budget: bool, output_folder: str, should_write_log: bool, is_size_only: bool):
+        """
+        Decodes and reconstructs the received messages and saves the results.
+        """
         # Validate inputs
         assert len(labels.shape) == 1, 'Labels must be a 1d array'
         assert len(inputs.shape) == 3, 'Inputs must be a 3d array'
@@ -119,6 +488,7 @@ class Server:
 
         # Initialize lists for logging
         num_bytes_list: List[int] = []
+        air_bytes_list: List[int] = []
         num_measurements_list: List[int] = []
         energy_list: List[float] = []
 
@@ -126,122 +496,96 @@ class Server:
         rmses: List[float] = []
 
         label_list: List[int] = []
-        reconstructed_list: List[np.ndarray] = []
+        message_list: List[bytes] = []
+        error_accumulator = ErrorAccumulator(num_features=num_features)
+
+        # The size histograms span up to the (standard) size of a fully-collected sequence
+        max_bytes = calculate_bytes(width=policy.width,
+                                    num_collected=seq_length,
+                                    num_features=num_features,
+                                    seq_length=seq_length,
+                                    encryption_mode=policy.encryption_mode)
+        summary = ResultSummary(size_edges=np.linspace(0, max_bytes, num=SUMMARY_SIZE_BUCKETS + 1),
+                                window_size=self._summary_window)
         width_counts: Counter = Counter()
 
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            # Bind the sensor to the selected host and port
-            sock.bind((self.host, self.port))
+        # Pre-allocate the buffer which holds decoded measurements. The decoders
+        # write into this buffer and return views, so we avoid a new allocation per message.
+        decode_buffer = np.empty((seq_length, num_features), dtype=float)
+
+        # Iterate over all samples
+        for idx, message in enumerate(received):
+            num_bytes = message.num_bytes
+
+            # Decode the measurements
+            measurements, collected_indices, widths = policy.decode(message=message.plaintext, out=decode_buffer)
+            num_collected = len(measurements)
+
+            # Check whether we have exhausted the budget
+            if (policy.has_exhausted_budget()) and (not should_ignore_budget):
+                reconstructed = policy.get_random_sequence()
+                policy._consumed_energy = policy._budget + SMALL_NUMBER
+                num_bytes = 0
+            else:
+                # Record the energy consumption (use the true number of
+                # collected measurements for proper recording in the case of pruning)
+                energy = policy.consume_energy(num_collected=message.true_num_collected,
+                                               num_bytes=num_bytes)
+
+                # Re-check the budget exhaustion (if the most-recent sample goes over
+                # the budget.
+                if (policy.has_exhausted_budget()) and (not should_ignore_budget):
+                    reconstructed = policy.get_random_sequence()
+                    policy._consumed_energy = policy._budget + SMALL_NUMBER
+                    num_bytes = 0
+                else:
+                    # Reconstruct the sequence by inferring the missing elements, [T, D]
+                    if self._reconstruction_cache is not None:
+                        reconstructed = self._reconstruction_cache.reconstruct(measurements=measurements,
+                                                                               collected_indices=collected_indices,
+                                                                               seq_length=seq_length)
+                    else:
+                        reconstructed = reconstruct_sequence(measurements=measurements,
+                                                             collected_indices=collected_indices,
+                                                             seq_length=seq_length)
 
-            if should_print:
-                print('Started Server.')
+            # Compute the reconstruction error in the measurements
+            seq_errors = error_accumulator.add(y_true=inputs[idx], y_pred=reconstructed)
 
-            # Listen on the given port and accept any inbound connections
-            sock.listen()
-            conn, addr = sock.accept()
+            # Log the results of this sequence
+            maes.append(seq_errors.mae)
+            rmses.append(seq_errors.rmse)
+            summary.add(seq_idx=idx,
+                        label=int(labels[idx]),
+                        error=seq_errors.mae,
+                        num_bytes=num_bytes,
+                        energy=energy if num_bytes > 0 else 0.0)
 
-            if should_print:
-                print('Accepted connection from {0}'.format(addr))
+            # Record meta-data for non-exhausted sequences
+            if num_bytes > 0:
+                num_bytes_list.append(num_bytes)
+                air_bytes_list.append(num_bytes + SHA256_LEN)
+                num_measurements_list.append(num_collected)
+                energy_list.append(energy)
+                label_list.append(int(labels[idx]))
 
-            with conn:
-                # Create a buffer for messages
-                message_buffer = bytearray()
-
-                # Create a counter to track the energy consumption
-                consumed_energy = 0.0
-
-                # Iterate over all samples
-                for idx in range(num_sequences):
-                    # Receive the given sequence (large-enough buffer)
-                    recv = conn.recv(5000)
-                    message_buffer.extend(recv)
-
-                    # Parse the message
-                    parsed, consumed_bytes = parse_message(message_buffer)
-                    num_bytes = parsed.num_bytes
-
-                    # Move the message buffer
-                    message_buffer = message_buffer[consumed_bytes:]
-
-                    # Verify the MAC
-                    verification = verify_hmac(mac=parsed.mac,
-                                               message=parsed.full,
-                                               secret=self._hmac_secret)
-                    if not verification:
-                        print('Could not verify MAC for sample {0}. Quitting.'.format(idx))
-                        break
-
-                    # Decrypt the message
-                    key = self._aes_key if policy.encryption_mode == EncryptionMode.BLOCK else self._chacha_key
-                    message = decrypt(ciphertext=parsed.data, key=key, mode=policy.encryption_mode)
-
-                    # Decode the measurements
-                    measurements, collected_indices, widths = policy.decode(message=message)
-                    num_collected = len(measurements)
-
-                    # Check whether we have exhausted the budget
-                    if (policy.has_exhausted_budget()) and (not should_ignore_budget):
-                        reconstructed = policy.get_random_sequence()
-                        policy._consumed_energy = policy._budget + SMALL_NUMBER
-                        num_bytes = 0
-                    else:
-                        # Record the energy consumption (use the true number of
-                        # collected measurements for proper recording in the case of pruning)
-                        energy = policy.consume_energy(num_collected=parsed.true_num_collected,
-                                                       num_bytes=num_bytes)
-
-                        # Re-check the budget exhaustion (if the most-recent sample goes over
-                        # the budget.
-                        if (policy.has_exhausted_budget()) and (not should_ignore_budget):
-                            reconstructed = policy.get_random_sequence()
-                            policy._consumed_energy = policy._budget + SMALL_NUMBER
-                            num_bytes = 0
-                        else:
-                            # Reconstruct the sequence by inferring the missing elements, [T, D]
-                            reconstructed = reconstruct_sequence(measurements=measurements,
-                                                                 collected_indices=collected_indices,
-                                                                 seq_length=seq_length)
-
-                    # Compute the reconstruction error in the measurements
-                    mae = mean_absolute_error(y_true=inputs[idx],
-                                              y_pred=reconstructed)
-
-                    rmse = mean_squared_error(y_true=inputs[idx],
-                                              y_pred=reconstructed,
-                                              squared=False)
-
-                    # Log the results of this sequence
-                    maes.append(mae)
-                    rmses.append(rmse)
-                    reconstructed_list.append(np.expand_dims(reconstructed, axis=0))
-
-                    # Record meta-data for non-exhausted sequences
-                    if num_bytes > 0:
-                        num_bytes_list.append(num_bytes)
-                        num_measurements_list.append(num_collected)
-                        energy_list.append(energy)
-                        label_list.append(int(labels[idx]))
-
-                        for width in widths:
-                            width_counts[width] += 1
-
-                    if ((idx + 1) % 100) == 0:
-                        print('Completed {0} sequences.'.format(idx + 1))
-
-                # Compute the aggregate scores across across all samples
-                true = inputs[0:num_sequences]  # [N, T, D]
-                true = true.reshape(-1, num_features)
-
-                reconstructed = np.vstack(reconstructed_list)  # [N, T, D]
-                pred = reconstructed.reshape(-1, num_features)
-
-                mae = mean_absolute_error(y_true=true, y_pred=pred)
-                norm_mae = normalized_mae(y_true=true, y_pred=pred)
-
-                rmse = mean_squared_error(y_true=true, y_pred=pred, squared=False)
-                norm_rmse = normalized_rmse(y_true=true, y_pred=pred)
-
-                r2 = r2_score(y_true=true, y_pred=pred, multioutput='variance_weighted')
+                if should_write_log and (not is_size_only):
+                    message_list.append(bytes(message.ciphertext))
+
+                for width in widths:
+                    width_counts[width] += 1
+
+            if ((idx + 1) % 100) == 0:
+                print('Completed {0} sequences.'.format(idx + 1))
+
+        # Compute the aggregate scores across across all samples
+        mae = error_accumulator.mae()
+        norm_mae = error_accumulator.norm_mae()
+
+        rmse = error_accumulator.rmse()
+        norm_rmse = error_accumulator.norm_rmse()
+
+        r2 = error_accumulator.r2_score()
 
         # Save the results
         result_dict = {
@@ -259,15 +603,61 @@ class Server:
             'all_rmse': rmses,
             'energy': energy_list,
             'num_bytes': num_bytes_list,
+            'air_bytes': air_bytes_list,
             'num_measurements': num_measurements_list,
             'labels': label_list,
+            'size_only': is_size_only,
             'encryption_mode': policy.encryption_mode.name,
             'policy': policy.as_dict()
         }
 
+        # The crypto time (in microseconds) per message
+        if crypto_times is not None:
+            result_dict['crypto_time'] = crypto_times.as_dict()
+
+        if self._reconstruction_cache is not None:
+            result_dict['reconstruction_cache'] = self._reconstruction_cache.cache_info()
+
         output_path = os.path.join(output_folder, '{0}_{1}.json.gz'.format(str(policy), int(policy.collection_rate * 100)))
         save_json_gz(result_dict, output_path)
 
+        # Write the compact breakdown by label and budget window
+        summary_dict = summary.as_dict()
+        summary_dict['policy'] = policy.as_dict()
+        save_json(summary_dict, summary_path(output_path))
+
+        # Write the (optional) columnar log for fast loading. Size-only logs hold no messages.
+        if should_write_log:
+            columns = {
+                'num_bytes': np.array(num_bytes_list, dtype=np.int32),
+                'air_bytes': np.array(air_bytes_list, dtype=np.int32),
+                'num_measurements': np.array(num_measurements_list, dtype=np.int32),
+                'energy': np.array(energy_list, dtype=np.float64),
+                'labels': np.array(label_list, dtype=np.int32),
+                'all_mae': np.array(maes, dtype=np.float64),
+                'all_rmse': np.array(rmses, dtype=np.float64)
+            }
+
+            metadata = {
+                'mae': float(mae),
+                'rmse': float(rmse),
+                'norm_mae': float(norm_mae),
+                'norm_rmse': float(norm_rmse),
+                'r2_score': float(r2),
+                'count': len(maes),
+                'size_only': is_size_only,
+                'encryption_mode': policy.encryption_mode.name,
+                'policy': policy.as_dict()
+            }
+
+            if crypto_times is not None:
+                metadata['crypto_time'] = crypto_times.as_dict()
+
+            write_message_log(message_log_path(output_path),
+                              columns=columns,
+                              messages=None if is_size_only else message_list,
+                              metadata=metadata)
+
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -281,14 +671,21 @@ if __name__ == '__main__':
     parser.add_argument('--port', type=int, default=50000)
     parser.add_argument('--max-num-seq', type=int)
     parser.add_argument('--should-compress', action='store_true')
+    parser.add_argument('--compression', type=str, choices=codec_names(), default=DEFAULT_CODEC)
     parser.add_argument('--should-ignore-budget', action='store_true')
+    parser.add_argument('--message-log', action='store_true', help='Whether to also write a (memory-mappable) columnar log with the raw messages.')
+    parser.add_argument('--size-only', action='store_true', help='Whether to simulate the sensor in-process and skip all encryption. The outputs only hold valid message sizes.')
+    parser.add_argument('--reconstruction-cache', action='store_true', help='Whether to reconstruct sequences with cached interpolation matrices (matches np.interp up to rounding).')
+    parser.add_argument('--crypto-workers', type=int, default=CRYPTO_WORKERS, help='The number of threads which verify and decrypt messages.')
+    parser.add_argument('--summary-window', type=int, default=SUMMARY_WINDOW, help='The number of sequences in each budget window of the result summary.')
     args = parser.parse_args()
 
     # Load the test data
     inputs, labels = load_data(dataset_name=args.dataset, fold='test')
 
     # Make the server
-    server = Server(host='localhost', port=args.port)
+    reconstruction_cache = InterpolationCache() if args.reconstruction_cache else None
+    server = Server(host='localhost', port=args.port, reconstruction_cache=reconstruction_cache, summary_window=args.summary_window)
 
     # Unpack the input shape
     num_seq, seq_length, num_features = inputs.shape
@@ -303,15 +700,49 @@ if __name__ == '__main__':
                                  encryption_mode=args.encryption,
                                  collect_mode=args.collect,
                                  encoding=args.encoding,
-                                 should_compress=args.should_compress)
+                                 should_compress=args.should_compress,
+                                 compression=args.compression)
 
     policy.init_for_experiment(num_sequences=num_seq)
 
-    # Run the experiment
-    server.run(inputs=inputs,
-               labels=labels,
-               num_sequences=num_seq,
-               should_print=True,
-               policy=policy,
-               output_folder=args.output_folder,
-               should_ignore_budget=args.should_ignore_budget)
+    if args.size_only:
+        # Make a separate sensor policy, as the sensor runs in its own process in full simulations
+        sensor_policy = BudgetWrappedPolicy(name=args.policy,
+                                            collection_rate=round(args.collection_rate, 2),
+                                            num_features=num_features,
+                                            seq_length=seq_length,
+                                            dataset=args.dataset,
+                                            encryption_mode=args.encryption,
+                                            collect_mode=args.collect,
+                                            encoding=args.encoding,
+                                            should_compress=args.should_compress,
+                                            compression=args.compression)
+
+        sensor_policy.init_for_experiment(num_sequences=num_seq)
+
+        # The sensor reads pre-quantized data (see sensor.py)
+        quantized = array_to_fp(inputs, width=sensor_policy.width, precision=sensor_policy.precision)
+        sensor_inputs = array_to_float(quantized, precision=sensor_policy.precision)
+
+        server.run_size_only(inputs=inputs,
+                             sensor_inputs=sensor_inputs,
+                             labels=labels,
+                             num_sequences=num_seq,
+                             policy=policy,
+                             sensor_policy=sensor_policy,
+                             output_folder=args.output_folder,
+                             should_ignore_budget=args.should_ignore_budget,
+                             should_write_log=args.message_log)
+
+        print('Completed Size-Only Simulation.')
+    else:
+        # Run the experiment
+        server.run(inputs=inputs,
+                   labels=labels,
+                   num_sequences=num_seq,
+                   should_print=True,
+                   policy=policy,
+                   output_folder=args.output_folder,
+                   should_ignore_budget=args.should_ignore_budget,
+                   should_write_log=args.message_log,
+                   num_crypto_workers=args.crypto_workers)
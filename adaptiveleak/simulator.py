@@ -49,6 +49,8 @@ if __name__ == '__main__':
     parser.add_argument('--max-num-samples', type=int, help='Maximum number of samples to execute. Useful for debugging.')
     parser.add_argument('--should-print', action='store_true', help='Whether to print status information during execution.')
     parser.add_argument('--should-ignore-budget', action='store_true', help='Whether to ignore the budget. Useful for Skip RNNs.')
+    parser.add_argument('--message-log', action='store_true', help='Whether the server should also write a columnar message log.')
+    parser.add_argument('--size-only', action='store_true', help='Whether to only simulate message sizes. Runs the sensor in the server process and skips all encryption.')
     args = parser.parse_args()
 
     # Unpack the target collection rates
@@ -90,8 +92,29 @@ if __name__ == '__main__':
         if args.should_ignore_budget:
             server_cmd += ' --should-ignore-budget'
 
+        if args.message_log:
+            server_cmd += ' --message-log'
+
         server, sensor = None, None
 
+        if args.size_only:
+            try:
+                server = pexpect.spawn(server_cmd + ' --size-only')
+
+                for line in server:
+                    progress = line.decode().strip()
+                    if progress.startswith('Completed') and args.should_print:
+                        print(progress, end='\r')
+
+                if args.should_print:
+                    print()
+
+                server.expect(pexpect.EOF)
+            finally:
+                server.close()
+
+            continue
+
         try:
             # Start the server
             server = pexpect.spawn(server_cmd)
@@ -0,0 +1,243 @@
+import numpy as np
+import os.path
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+from adaptiveleak.policies import BudgetWrappedPolicy, run_policy
+from adaptiveleak.threshold_sweep import collected_masks, curve_thresholds, CURVE_SIZE
+from adaptiveleak.utils.constants import BITS_PER_BYTE, MIN_WIDTH, SMALL_NUMBER
+from adaptiveleak.utils.data_types import PolicyResult
+from adaptiveleak.utils.file_utils import read_pickle_gz, save_pickle_gz
+
+
+SIZE_MODEL_FILE = 'size_model_{0}.pkl.gz'
+DEFAULT_L2 = 1e-3
+ERROR_PERCENTILE = 99
+NUM_SAMPLES = 500
+
+SizePrediction = namedtuple('SizePrediction', ['num_bytes', 'width'])
+SizeErrors = namedtuple('SizeErrors', ['max_error', 'p99_error', 'mae'])
+
+
+def size_features(measurements: np.ndarray, target_bytes: int, width: int) -> np.ndarray:
+    """
+    Computes cheap statistics of the collected values which determine the size
+    of group-encoded messages.
+
+    Args:
+        measurements: A [K, D] array of collected measurements
+        target_bytes: The target message size of the policy
+        width: The (maximum) bit width of each feature
+    Returns:
+        A [F] array of features
+    """
+    assert len(measurements.shape) == 2, 'Must provide a 2d array of measurements'
+
+    num_collected, num_features = measurements.shape
+    num_values = num_collected * num_features
+    abs_values = np.abs(measurements)
+
+    # The target bits bound the total size when every value uses the full width
+    full_bytes = min(num_values * width, target_bytes * BITS_PER_BYTE) / BITS_PER_BYTE
+    min_bytes = (num_values * MIN_WIDTH) / BITS_PER_BYTE
+
+    # The average number of bits available to each value (bounded by the feasible widths)
+    budget_width = min(max((target_bytes * BITS_PER_BYTE) / max(num_values, 1), MIN_WIDTH), width)
+
+    if num_collected > 1:
+        mean_diff = float(np.average(np.abs(np.diff(measurements, axis=0))))
+    else:
+        mean_diff = 0.0
+
+    return np.array([num_collected,
+                     num_values,
+                     target_bytes,
+                     full_bytes,
+                     min_bytes,
+                     budget_width,
+                     float(np.average(abs_values)),
+                     float(np.std(measurements)),
+                     float(np.log2(1.0 + np.max(abs_values))),
+                     mean_diff])
+
+
+def calibrate_threshold(policy: BudgetWrappedPolicy, inputs: np.ndarray, num_thresholds: int = CURVE_SIZE) -> float:
+    """
+    Sets the (inner) threshold of the adaptive policy to the smallest threshold on the energy
+    curve which collects at most the policy's fraction of elements on the given inputs. We fit and
+    query the predictor on messages at this threshold, so both see the same distribution of messages
+    (the saved thresholds change as we fit them).
+
+    Args:
+        policy: The adaptive policy
+        inputs: A [N, T, D] array of sequences
+        num_thresholds: The number of thresholds on the curve
+    Returns:
+        The chosen threshold
+    """
+    thresholds = curve_thresholds(inputs, num_thresholds=num_thresholds)
+    collected_frac = np.average(collected_masks(policy, inputs=inputs, thresholds=thresholds), axis=(1, 2))  # [M]
+
+    # The last threshold collects the fewest elements, so we fall back to it when no threshold meets the rate
+    feasible_idx = np.nonzero(collected_frac <= policy.collection_rate)[0]
+    threshold = float(thresholds[feasible_idx[0]] if len(feasible_idx) > 0 else thresholds[-1])
+
+    policy.set_threshold(threshold=threshold)
+    return threshold
+
+
+def policy_messages(policy: BudgetWrappedPolicy, inputs: np.ndarray) -> List[PolicyResult]:
+    """
+    Runs the policy (without a budget) on each sequence.
+    """
+    policy.init_for_experiment(num_sequences=inputs.shape[0])
+    return [run_policy(policy=policy, sequence=sequence, should_enforce_budget=False) for sequence in inputs]
+
+
+def message_features(policy: BudgetWrappedPolicy, messages: List[PolicyResult]) -> np.ndarray:
+    """
+    Returns the [N, F] features (see size_features()) of the messages from the given policy.
+    """
+    target_bytes = policy._policy.target_bytes
+    return np.vstack([size_features(message.measurements, target_bytes=target_bytes, width=policy.width) for message in messages])
+
+
+def sample_inputs(inputs: np.ndarray, num_samples: int, rand: np.random.RandomState) -> np.ndarray:
+    if num_samples >= inputs.shape[0]:
+        return inputs
+
+    sample_idx = rand.choice(inputs.shape[0], size=num_samples, replace=False)
+    return inputs[sample_idx]
+
+
+def mean_group_width(widths: List[int], group_sizes: List[int]) -> float:
+    """
+    Returns the average bit width per feature across all groups.
+    """
+    total = sum(group_sizes)
+    if total == 0:
+        return float(MIN_WIDTH)
+
+    return sum(w * s for w, s in zip(widths, group_sizes)) / total
+
+
+class SizePredictor:
+    """
+    Ridge regression from cheap message features (see size_features()) to the
+    unpadded size and average group width of group-encoded messages. The held-out
+    errors bound how far the predictions may deviate from the exact encoder.
+    """
+
+    def __init__(self, weights: np.ndarray, feature_mean: np.ndarray, feature_std: np.ndarray, errors: Optional[Dict[str, SizeErrors]] = None):
+        self._weights = weights  # [F + 1, 2]
+        self._feature_mean = feature_mean  # [F]
+        self._feature_std = feature_std  # [F]
+        self._errors = errors if errors is not None else dict()
+
+    @property
+    def errors(self) -> Dict[str, SizeErrors]:
+        return self._errors
+
+    @classmethod
+    def fit(cls, features: np.ndarray, num_bytes: np.ndarray, widths: np.ndarray, l2: float = DEFAULT_L2):
+        """
+        Fits the predictor to sizes and widths from the exact encoder.
+
+        Args:
+            features: A [N, F] array of message features
+            num_bytes: A [N] array of the unpadded message sizes
+            widths: A [N] array of the average group widths
+            l2: The ridge regularization strength
+        Returns:
+            The fitted size predictor
+        """
+        assert len(features.shape) == 2, 'Must provide a 2d array of features'
+        assert features.shape[0] == num_bytes.shape[0] == widths.shape[0], 'Misaligned features and targets'
+
+        feature_mean = np.average(features, axis=0)
+        feature_std = np.std(features, axis=0) + SMALL_NUMBER
+
+        inputs = cls._design_matrix(features, feature_mean, feature_std)  # [N, F + 1]
+        targets = np.stack([num_bytes, widths], axis=-1).astype(float)  # [N, 2]
+
+        # Solve the (regularized) normal equations without penalizing the bias
+        penalty = l2 * np.eye(inputs.shape[1])
+        penalty[0, 0] = 0.0
+
+        weights = np.linalg.solve(inputs.T.dot(inputs) + penalty, inputs.T.dot(targets))
+        return cls(weights=weights, feature_mean=feature_mean, feature_std=feature_std)
+
+    @staticmethod
+    def _design_matrix(features: np.ndarray, feature_mean: np.ndarray, feature_std: np.ndarray) -> np.ndarray:
+        scaled = (features - feature_mean) / feature_std
+        return np.concatenate([np.ones((features.shape[0], 1)), scaled], axis=-1)
+
+    def predict(self, features: np.ndarray) -> SizePrediction:
+        """
+        Predicts the unpadded message size and average group width.
+
+        Args:
+            features: A [N, F] array of message features
+        Returns:
+            A pair of [N] arrays with the predicted sizes and widths
+        """
+        features = features.reshape(-1, self._feature_mean.shape[0])
+        pred = self._design_matrix(features, self._feature_mean, self._feature_std).dot(self._weights)
+        return SizePrediction(num_bytes=pred[:, 0], width=pred[:, 1])
+
+    def evaluate(self, features: np.ndarray, num_bytes: np.ndarray, widths: np.ndarray) -> Dict[str, SizeErrors]:
+        """
+        Measures (and stores) the deviation from the exact sizes and widths on held-out samples.
+        """
+        pred = self.predict(features)
+
+        for name, predicted, expected in [('num_bytes', pred.num_bytes, num_bytes), ('width', pred.width, widths)]:
+            abs_error = np.abs(predicted - expected)
+            self._errors[name] = SizeErrors(max_error=float(np.max(abs_error)),
+                                            p99_error=float(np.percentile(abs_error, ERROR_PERCENTILE)),
+                                            mae=float(np.average(abs_error)))
+
+        return self._errors
+
+    def width_upper_bound(self, features: np.ndarray) -> np.ndarray:
+        """
+        Returns the largest average width consistent with the worst-case held-out error.
+        """
+        assert 'width' in self._errors, 'Must evaluate the predictor before using error bounds'
+        return self.predict(features).width + self._errors['width'].max_error
+
+    def should_discard(self, features: np.ndarray, min_width: float) -> bool:
+        """
+        Returns whether the messages cannot reach the given average width, even
+        under the most optimistic (worst-case error) prediction.
+        """
+        return bool(np.all(self.width_upper_bound(features) < min_width))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'weights': self._weights,
+            'feature_mean': self._feature_mean,
+            'feature_std': self._feature_std,
+            'errors': {name: errors._asdict() for name, errors in self._errors.items()}
+        }
+
+    def save(self, path: str):
+        save_pickle_gz(self.as_dict(), path)
+
+    @classmethod
+    def restore(cls, path: str):
+        serialized = read_pickle_gz(path)
+        errors = {name: SizeErrors(**values) for name, values in serialized['errors'].items()}
+
+        return cls(weights=serialized['weights'],
+                   feature_mean=serialized['feature_mean'],
+                   feature_std=serialized['feature_std'],
+                   errors=errors)
+
+
+def size_model_path(dataset: str, policy_name: str, encoding: str, encryption: str, collect_mode: str) -> str:
+    """
+    Returns the path to the saved size predictor for the given configuration.
+    """
+    name = '{0}_{1}_{2}_{3}'.format(policy_name, encoding, encryption, collect_mode)
+    return os.path.join(os.path.dirname(__file__), 'saved_models', dataset, SIZE_MODEL_FILE.format(name))
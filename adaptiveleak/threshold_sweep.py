@@ -0,0 +1,363 @@
+import numpy as np
+from collections import namedtuple
+from typing import Any, List, Optional, Tuple
+
+from adaptiveleak.policies import BudgetWrappedPolicy, AdaptiveHeuristic, AdaptiveDeviation
+from adaptiveleak.server import reconstruct_sequences
+from adaptiveleak.utils.constants import BIG_NUMBER
+from adaptiveleak.utils.data_types import EncodingMode
+from adaptiveleak.utils.data_utils import calculate_bytes
+
+
+SweepResult = namedtuple('SweepResult', ['thresholds', 'mae', 'energy', 'did_exhaust'])
+
+MAX_CHUNK_ELEMENTS = 1 << 22  # Bounds the size of the [M, N, T, D] reconstruction chunks
+TOLERANCE = 1e-4
+MAX_ROUNDS = 100
+CURVE_SIZE = 128
+CURVE_PADDING = 1  # The number of curve cells to add on either side of the inverted threshold
+
+
+def supports_sweep(policy: BudgetWrappedPolicy) -> bool:
+    """
+    Returns whether the policy can be simulated for many thresholds at once. Message sizes
+    must only depend on the number of collected elements (standard, uncompressed encoding).
+    """
+    return isinstance(policy._policy, (AdaptiveHeuristic, AdaptiveDeviation)) and \
+        (policy.encoding_mode == EncodingMode.STANDARD) and (not policy.should_compress)
+
+
+def heuristic_masks(inputs: np.ndarray, thresholds: np.ndarray, min_skip: int, max_skip: int) -> np.ndarray:
+    """
+    Simulates AdaptiveHeuristic for every (threshold, sequence) pair.
+
+    Args:
+        inputs: A [N, T, D] array of sequences
+        thresholds: A [M] array of thresholds
+        min_skip: The minimum skip of the policy
+        max_skip: The maximum skip of the policy
+    Returns:
+        A [M, N, T] boolean array marking the collected elements
+    """
+    num_seq, seq_length, num_features = inputs.shape
+    thresholds = np.asarray(thresholds, dtype=float).reshape(-1, 1)  # [M, 1]
+    num_thresholds = thresholds.shape[0]
+
+    estimate = np.zeros(shape=(num_thresholds, num_seq, num_features))  # [M, N, D]
+    current_skip = np.zeros(shape=(num_thresholds, num_seq), dtype=int)  # [M, N]
+    sample_skip = np.zeros(shape=(num_thresholds, num_seq), dtype=int)  # [M, N]
+
+    collected_mask = np.zeros(shape=(num_thresholds, num_seq, seq_length), dtype=bool)
+
+    for seq_idx in range(seq_length):
+        measurement = inputs[:, seq_idx]  # [N, D]
+
+        should_collect = (sample_skip <= 0)
+        sample_skip = np.where(should_collect, sample_skip, sample_skip - 1)
+
+        diff = np.sum(np.abs(estimate - measurement), axis=-1)  # [M, N]
+        estimate = np.where(np.expand_dims(should_collect, axis=-1), measurement, estimate)
+
+        updated_skip = np.where(diff >= thresholds, min_skip, np.minimum(current_skip + 1, max_skip))
+        current_skip = np.where(should_collect, updated_skip, current_skip)
+        sample_skip = np.where(should_collect, current_skip, sample_skip)
+
+        collected_mask[:, :, seq_idx] = should_collect
+
+    return collected_mask
+
+
+def deviation_masks(inputs: np.ndarray, thresholds: np.ndarray, min_skip: int, max_skip: int, alpha: float, beta: float) -> np.ndarray:
+    """
+    Simulates AdaptiveDeviation for every (threshold, sequence) pair.
+
+    Args:
+        inputs: A [N, T, D] array of sequences
+        thresholds: A [M] array of thresholds
+        min_skip: The minimum skip of the policy
+        max_skip: The maximum skip of the policy
+        alpha: The smoothing factor of the mean
+        beta: The smoothing factor of the deviation
+    Returns:
+        A [M, N, T] boolean array marking the collected elements
+    """
+    num_seq, seq_length, num_features = inputs.shape
+    thresholds = np.asarray(thresholds, dtype=float).reshape(-1, 1)  # [M, 1]
+    num_thresholds = thresholds.shape[0]
+
+    mean = np.zeros(shape=(num_thresholds, num_seq, num_features))  # [M, N, D]
+    dev = np.zeros(shape=(num_thresholds, num_seq, num_features))  # [M, N, D]
+    current_skip = np.zeros(shape=(num_thresholds, num_seq), dtype=int)  # [M, N]
+    sample_skip = np.zeros(shape=(num_thresholds, num_seq), dtype=int)  # [M, N]
+
+    collected_mask = np.zeros(shape=(num_thresholds, num_seq, seq_length), dtype=bool)
+
+    for seq_idx in range(seq_length):
+        measurement = inputs[:, seq_idx]  # [N, D]
+
+        if seq_idx == 0:
+            should_collect = np.ones(shape=(num_thresholds, num_seq), dtype=bool)
+        else:
+            should_collect = (sample_skip >= current_skip)
+
+        sample_skip = np.where(should_collect, 0, sample_skip + 1)
+
+        collect_features = np.expand_dims(should_collect, axis=-1)
+        updated_mean = (1.0 - alpha) * mean + alpha * measurement
+        updated_dev = (1.0 - beta) * dev + beta * np.abs(updated_mean - measurement)
+
+        mean = np.where(collect_features, updated_mean, mean)
+        dev = np.where(collect_features, updated_dev, dev)
+
+        norm = np.sum(dev, axis=-1)  # [M, N]
+        updated_skip = np.where(norm > thresholds, np.maximum(current_skip // 2, min_skip), np.minimum(current_skip + 1, max_skip))
+        current_skip = np.where(should_collect, updated_skip, current_skip)
+
+        collected_mask[:, :, seq_idx] = should_collect
+
+    return collected_mask
+
+
+def collected_masks(policy: BudgetWrappedPolicy, inputs: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """
+    Returns the [M, N, T] collected elements of the policy for each threshold.
+    """
+    inner = policy._policy
+
+    if isinstance(inner, AdaptiveDeviation):
+        return deviation_masks(inputs, thresholds=thresholds, min_skip=inner.min_skip, max_skip=inner.max_skip, alpha=inner._alpha, beta=inner._beta)
+    elif isinstance(inner, AdaptiveHeuristic):
+        return heuristic_masks(inputs, thresholds=thresholds, min_skip=inner.min_skip, max_skip=inner.max_skip)
+    else:
+        raise ValueError('Cannot sweep thresholds for the policy {0}'.format(policy.policy_type.name))
+
+
+def sequence_energy(policy: BudgetWrappedPolicy) -> np.ndarray:
+    """
+    Returns the [T + 1] energy of a sequence for each number of collected elements.
+    """
+    energy = np.zeros(shape=(policy.seq_length + 1, ))
+
+    for num_collected in range(1, policy.seq_length + 1):
+        num_bytes = calculate_bytes(width=policy.width,
+                                    num_collected=num_collected,
+                                    num_features=policy.num_features,
+                                    seq_length=policy.seq_length,
+                                    encryption_mode=policy.encryption_mode)
+        energy[num_collected] = policy.energy_unit.get_energy(num_collected=num_collected, num_bytes=num_bytes, use_noise=False)
+
+    return energy
+
+
+def curve_key(policy: BudgetWrappedPolicy) -> Tuple[Any, ...]:
+    """
+    Returns a key for the parameters which determine the collected elements (aside from the threshold).
+    Policies with the same key share their collected counts across collection rates.
+    """
+    inner = policy._policy
+    key: Tuple[Any, ...] = (policy.policy_type.name, inner.min_skip, inner.max_skip)
+
+    if isinstance(inner, AdaptiveDeviation):
+        key += (inner._alpha, inner._beta)
+
+    return key
+
+
+def curve_thresholds(inputs: np.ndarray, num_thresholds: int) -> np.ndarray:
+    """
+    Returns the (sorted) thresholds at which to evaluate the energy curve. We place the thresholds
+    at quantiles of the L1 step sizes between consecutive elements, as the collected elements only change
+    in this range. The last threshold is past any difference or deviation in the data.
+    """
+    assert num_thresholds >= 3, 'Must use at least three thresholds'
+
+    steps = np.sum(np.abs(np.diff(inputs, axis=1)), axis=-1).reshape(-1)
+    quantiles = np.quantile(steps, q=np.linspace(0.0, 1.0, num=num_thresholds - 2))
+    max_threshold = 2.0 * np.max(np.sum(np.abs(inputs), axis=-1)) + 1.0
+
+    return np.unique(np.concatenate([[0.0], quantiles, [max_threshold]]))
+
+
+def collected_counts(policy: BudgetWrappedPolicy, inputs: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """
+    Returns the [M, T + 1] histogram of the number of collected elements per sequence for each threshold.
+    """
+    assert supports_sweep(policy), 'Cannot sweep thresholds for the policy {0}'.format(policy.policy_type.name)
+
+    thresholds = np.asarray(thresholds, dtype=float).reshape(-1)
+    num_seq, seq_length, _ = inputs.shape
+
+    counts = np.zeros(shape=(thresholds.shape[0], seq_length + 1), dtype=int)
+    chunk_size = max(MAX_CHUNK_ELEMENTS // max(num_seq * seq_length, 1), 1)
+
+    for start in range(0, thresholds.shape[0], chunk_size):
+        end = min(start + chunk_size, thresholds.shape[0])
+        num_collected = np.sum(collected_masks(policy, inputs=inputs, thresholds=thresholds[start:end]), axis=-1)  # [C, N]
+
+        for offset, seq_counts in enumerate(num_collected):
+            counts[start + offset] = np.bincount(seq_counts, minlength=seq_length + 1)
+
+    return counts
+
+
+def invert_energy_curve(thresholds: np.ndarray, energy: np.ndarray, target: float, lower: float, upper: float) -> Tuple[float, float]:
+    """
+    Finds the interval which holds the smallest threshold whose average energy per sequence is within the target.
+
+    Args:
+        thresholds: A [M] sorted array of thresholds
+        energy: A [M] array of the average energy per sequence at each threshold
+        target: The target energy per sequence
+        lower: The lower bound of the search
+        upper: The upper bound of the search
+    Returns:
+        The (lower, upper) bounds of the interval, padded by CURVE_PADDING cells on either side to
+        account for the variation between batches.
+    """
+    # The energy does not increase with the threshold
+    energy = np.minimum.accumulate(energy)
+    edges = np.concatenate([[lower], thresholds, [upper]])
+
+    # The index (into the edges) of the first feasible threshold. The upper bound is always feasible.
+    feasible_idx = np.nonzero(energy <= target)[0]
+    upper_idx = (feasible_idx[0] + 1) if len(feasible_idx) > 0 else (len(edges) - 1)
+
+    lower_idx = max(upper_idx - 1 - CURVE_PADDING, 0)
+    upper_idx = min(upper_idx + CURVE_PADDING, len(edges) - 1)
+
+    return float(edges[lower_idx]), float(edges[upper_idx])
+
+
+def sweep_thresholds(policy: BudgetWrappedPolicy, batch: np.ndarray, thresholds: np.ndarray, energy_margin: float, rand: np.random.RandomState) -> SweepResult:
+    """
+    Evaluates the policy on the batch for many thresholds at once. This mirrors
+    fit_threshold.execute_on_batch(), where sequences past the budget become random
+    sequences. The random sequences come from the given state and are shared across thresholds.
+
+    Args:
+        policy: The (adaptive) policy
+        batch: A [N, T, D] array of sequences
+        thresholds: A [M] array of thresholds
+        energy_margin: The fraction of the budget to hold back
+        rand: The random state for the fallback sequences
+    Returns:
+        The [M] arrays of the MAE, (uncapped) total energy and budget exhaustion for each threshold
+    """
+    assert supports_sweep(policy), 'Cannot sweep thresholds for the policy {0}'.format(policy.policy_type.name)
+
+    thresholds = np.asarray(thresholds, dtype=float).reshape(-1)
+    num_seq, seq_length, num_features = batch.shape
+
+    # Match the budget of execute_on_batch()
+    budget = policy.energy_per_seq * num_seq
+    budget -= budget * energy_margin
+
+    collected_mask = collected_masks(policy, inputs=batch, thresholds=thresholds)  # [M, N, T]
+
+    # The cumulative energy determines which sequences fit in the budget, [M, N]
+    energy = sequence_energy(policy)[np.sum(collected_mask, axis=-1)]
+    consumed = np.cumsum(energy, axis=-1)
+    is_valid = (consumed <= budget)
+
+    # The error of the random sequences which replace exhausted sequences, [N]
+    random_seq = np.expand_dims(policy._data_mean, axis=0) + np.expand_dims(policy._data_std, axis=0) * rand.normal(size=batch.shape)
+    random_error = np.sum(np.abs(batch - random_seq), axis=(1, 2))
+
+    # Reconstruct the sequences in chunks of thresholds
+    total_error = np.zeros(shape=(thresholds.shape[0], num_seq))  # [M, N]
+    chunk_size = max(MAX_CHUNK_ELEMENTS // max(batch.size, 1), 1)
+
+    for start in range(0, thresholds.shape[0], chunk_size):
+        end = min(start + chunk_size, thresholds.shape[0])
+        chunk_mask = collected_mask[start:end].reshape(-1, seq_length)  # [C * N, T]
+
+        measurements = np.broadcast_to(batch, (end - start, ) + batch.shape).reshape(-1, seq_length, num_features)
+        reconstructed = reconstruct_sequences(measurements=measurements, collected_mask=chunk_mask)
+
+        seq_error = np.sum(np.abs(measurements - reconstructed), axis=(1, 2))
+        total_error[start:end] = seq_error.reshape(end - start, num_seq)
+
+    total_error = np.where(is_valid, total_error, np.expand_dims(random_error, axis=0))
+    mae = np.sum(total_error, axis=-1) / batch.size
+
+    return SweepResult(thresholds=thresholds,
+                       mae=mae,
+                       energy=consumed[:, -1],
+                       did_exhaust=np.logical_not(is_valid[:, -1]))
+
+
+def fit_by_sweep(policy: BudgetWrappedPolicy,
+                 inputs: np.ndarray,
+                 batch_size: int,
+                 lower: float,
+                 upper: float,
+                 batches_per_trial: int,
+                 energy_margin: float,
+                 num_thresholds: int,
+                 should_print: bool,
+                 rand: Optional[np.random.RandomState] = None) -> float:
+    """
+    Fits the threshold with rounds of grid sweeps. Each round evaluates num_thresholds
+    thresholds on the same batches in one vectorized pass, tracks the lowest error which
+    stays within the budget, and zooms into the grid cell which holds the budget boundary.
+    This matches the selection of fit_threshold.fit() but shrinks the interval by a factor of
+    (num_thresholds - 1) per round instead of 2.
+    """
+    assert num_thresholds >= 3, 'Must sweep at least three thresholds per round'
+    assert batches_per_trial >= 1, 'The # of Batches per Trial must be positive'
+
+    rand = rand if rand is not None else np.random.RandomState(seed=581)
+    sample_idx = np.arange(inputs.shape[0])
+
+    batch_size = min(len(sample_idx), batch_size)
+    if batch_size == len(sample_idx):
+        batches_per_trial = 1
+
+    best_threshold = upper
+    best_error = BIG_NUMBER
+
+    round_count = 0
+    while (round_count < MAX_ROUNDS) and (abs(upper - lower) > TOLERANCE):
+        thresholds = np.linspace(lower, upper, num=num_thresholds)
+
+        error_list: List[np.ndarray] = []
+        exhaust_list: List[np.ndarray] = []
+
+        for _ in range(batches_per_trial):
+            batch_idx = rand.choice(sample_idx, size=batch_size, replace=False)
+            result = sweep_thresholds(policy, batch=inputs[batch_idx], thresholds=thresholds, energy_margin=energy_margin, rand=rand)
+
+            error_list.append(result.mae)
+            exhaust_list.append(result.did_exhaust)
+
+        errors = np.average(np.vstack(error_list), axis=0)  # [M]
+        did_exhaust = np.any(np.vstack(exhaust_list), axis=0)  # [M]
+
+        # Track the best error within the budget
+        feasible_errors = np.where(did_exhaust, BIG_NUMBER, errors)
+        best_idx = int(np.argmin(feasible_errors))
+
+        if feasible_errors[best_idx] < best_error:
+            best_error = float(feasible_errors[best_idx])
+            best_threshold = float(thresholds[best_idx])
+
+        if should_print:
+            print('Best Error: {0:.7f}, Best Threshold: {1:.7f}'.format(best_error, best_threshold), end='\r')
+
+        # Zoom into the cell between the last exhausted threshold and the first feasible threshold
+        feasible_idx = np.nonzero(np.logical_not(did_exhaust))[0]
+
+        if len(feasible_idx) == 0:
+            lower = upper
+        elif feasible_idx[0] == 0:
+            upper = lower
+        else:
+            upper = float(thresholds[feasible_idx[0]])
+            lower = float(thresholds[feasible_idx[0] - 1])
+
+        round_count += 1
+
+    if should_print:
+        print()
+
+    return best_threshold
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+
+from adaptiveleak.evaluation import ParallelEvaluator
+from adaptiveleak.server import reconstruct_sequence
+from adaptiveleak.utils.analysis import ErrorAccumulator
+
+
+class TestParallelEvaluator(unittest.TestCase):
+
+    def fill(self, evaluator: ParallelEvaluator, inputs: np.ndarray, rand: np.random.RandomState) -> ErrorAccumulator:
+        """
+        Fills the evaluator with random collection patterns and returns the sequential metrics.
+        """
+        num_seq, seq_length, num_features = inputs.shape
+        expected = ErrorAccumulator(num_features=num_features)
+
+        evaluator.inputs[0:num_seq] = inputs
+        evaluator.collected_mask[0:num_seq] = False
+
+        for idx, sequence in enumerate(inputs):
+            num_collected = rand.randint(low=1, high=seq_length + 1)
+            collected_indices = np.sort(rand.choice(seq_length, size=num_collected, replace=False))
+
+            evaluator.measurements[idx, collected_indices] = sequence[collected_indices]
+            evaluator.collected_mask[idx, collected_indices] = True
+
+            reconstructed = reconstruct_sequence(sequence[collected_indices], collected_indices.tolist(), seq_length)
+            expected.add(y_true=sequence, y_pred=reconstructed)
+
+        return expected
+
+    def check(self, num_workers: int):
+        rand = np.random.RandomState(seed=5021)
+        inputs = rand.normal(size=(23, 12, 3))
+
+        with ParallelEvaluator(max_num_sequences=30, seq_length=12, num_features=3, num_workers=num_workers, chunk_size=5) as evaluator:
+            expected = self.fill(evaluator, inputs=inputs, rand=rand)
+            result = evaluator.evaluate(num_sequences=23)
+
+            self.assertEqual(result.maes.shape, (23, ))
+            self.assertEqual(result.errors.count, expected.count)
+            self.assertAlmostEqual(result.errors.mae(), expected.mae())
+            self.assertAlmostEqual(result.errors.rmse(), expected.rmse())
+            self.assertAlmostEqual(result.errors.norm_rmse(), expected.norm_rmse())
+            self.assertAlmostEqual(result.errors.r2_score(), expected.r2_score())
+
+            # Re-use the shared arrays on a smaller batch
+            expected = self.fill(evaluator, inputs=inputs[0:4], rand=rand)
+            result = evaluator.evaluate(num_sequences=4)
+
+            self.assertEqual(result.maes.shape, (4, ))
+            self.assertAlmostEqual(result.errors.mae(), expected.mae())
+
+    def test_in_process(self):
+        self.check(num_workers=1)
+
+    def test_pool(self):
+        self.check(num_workers=2)
+
+    def test_sequence_errors(self):
+        rand = np.random.RandomState(seed=5022)
+        inputs = rand.normal(size=(6, 8, 2))
+
+        with ParallelEvaluator(max_num_sequences=6, seq_length=8, num_features=2, num_workers=2, chunk_size=4) as evaluator:
+            evaluator.inputs[:] = inputs
+            evaluator.measurements[:] = inputs
+            evaluator.collected_mask[:] = True
+            evaluator.collected_mask[2, 3] = False
+
+            result = evaluator.evaluate()
+
+        self.assertEqual(np.count_nonzero(result.maes), 1)
+        self.assertGreater(result.maes[2], 0.0)
+        self.assertGreater(result.rmses[2], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,392 @@
+import unittest
+import numpy as np
+from typing import List
+
+from adaptiveleak.fit_threshold import BatchCache, BatchResult, ThresholdSearchPool, fit_by_ksection, execute_on_batch, evaluate_threshold, validate_thresholds, TOLERANCE, VAL_MARGIN_FACTOR
+from adaptiveleak.fit_threshold import collect_batch, score_batch, fit_with_margins
+from adaptiveleak.policies import run_policy
+from adaptiveleak.server import reconstruct_sequences
+from adaptiveleak.threshold_sweep import fit_by_sweep, supports_sweep
+from adaptiveleak.unit_tests.fixtures import FixtureTestCase, random_walks, FIXTURE_DATASET
+
+
+SEQ_LENGTH = 20
+NUM_FEATURES = 3
+
+
+class ThresholdHolder:
+
+    def __init__(self):
+        self.threshold = None
+
+    def set_threshold(self, threshold: float):
+        self.threshold = threshold
+
+
+class BoundaryPool:
+    """
+    Evaluates thresholds against a known budget boundary. Thresholds below the boundary exhaust
+    the budget, and the error grows with the threshold.
+    """
+
+    def __init__(self, boundary: float):
+        self.inputs = np.zeros(shape=(10, 4, 2))
+        self.boundary = boundary
+        self.rounds: List[np.ndarray] = []
+
+    def evaluate(self, policy, thresholds: np.ndarray, batch_indices: np.ndarray, energy_margin: float, seed: int) -> List[BatchResult]:
+        self.rounds.append(np.copy(thresholds))
+        return [BatchResult(mae=t, did_exhaust=(t < self.boundary)) for t in thresholds]
+
+
+class TestKSection(unittest.TestCase):
+
+    def test_boundary(self):
+        for num_thresholds in [1, 2, 5]:
+            pool = BoundaryPool(boundary=3.7)
+            threshold = fit_by_ksection(policy=ThresholdHolder(),
+                                        search_pool=pool,
+                                        batch_size=4,
+                                        lower=-100.0,
+                                        upper=100.0,
+                                        batches_per_trial=2,
+                                        energy_margin=0.0,
+                                        num_thresholds=num_thresholds,
+                                        should_print=False)
+
+            self.assertGreaterEqual(threshold, 3.7)
+            self.assertLess(threshold - 3.7, 2 * TOLERANCE)
+
+    def test_bisection(self):
+        pool = BoundaryPool(boundary=3.7)
+        fit_by_ksection(policy=ThresholdHolder(), search_pool=pool, batch_size=4, lower=-100.0, upper=100.0, batches_per_trial=1, energy_margin=0.0, num_thresholds=1, should_print=False)
+
+        self.assertEqual(pool.rounds[0].tolist(), [0.0])
+        self.assertEqual(pool.rounds[1].tolist(), [50.0])
+        self.assertEqual(pool.rounds[2].tolist(), [25.0])
+
+    def test_rounds(self):
+        bisection = BoundaryPool(boundary=3.7)
+        fit_by_ksection(policy=ThresholdHolder(), search_pool=bisection, batch_size=4, lower=-100.0, upper=100.0, batches_per_trial=1, energy_margin=0.0, num_thresholds=1, should_print=False)
+
+        ksection = BoundaryPool(boundary=3.7)
+        fit_by_ksection(policy=ThresholdHolder(), search_pool=ksection, batch_size=4, lower=-100.0, upper=100.0, batches_per_trial=1, energy_margin=0.0, num_thresholds=7, should_print=False)
+
+        # Seven thresholds per round shrink the interval by 8x (3 bisection steps)
+        self.assertEqual(len(ksection.rounds), int(np.ceil(len(bisection.rounds) / 3)))
+
+    def test_sets_fitted_threshold(self):
+        policy = ThresholdHolder()
+        threshold = fit_by_ksection(policy=policy, search_pool=BoundaryPool(boundary=3.7), batch_size=4, lower=-100.0, upper=100.0, batches_per_trial=1, energy_margin=0.0, num_thresholds=3, should_print=False)
+
+        self.assertEqual(policy.threshold, threshold)
+
+    def test_all_exhausted(self):
+        pool = BoundaryPool(boundary=1000.0)
+        threshold = fit_by_ksection(policy=ThresholdHolder(), search_pool=pool, batch_size=4, lower=-1.0, upper=1.0, batches_per_trial=1, energy_margin=0.0, num_thresholds=3, should_print=False)
+
+        self.assertEqual(threshold, 1.0)  # Falls back to the upper bound
+        self.assertLess(1.0 - pool.rounds[-1][-1], 2 * TOLERANCE)
+
+
+class TestThresholdSearchPool(unittest.TestCase):
+
+    def test_shared_inputs(self):
+        inputs = np.random.RandomState(seed=4701).normal(size=(5, 6, 2))
+
+        with ThresholdSearchPool(inputs=inputs, policy_config=dict(), num_workers=1) as pool:
+            self.assertTrue(np.array_equal(pool.inputs, inputs))
+            self.assertEqual(pool.num_workers, 1)
+
+
+class TestValidation(FixtureTestCase):
+
+    def test_validates_swept_threshold(self):
+        inputs = random_walks(np.random.RandomState(seed=4611), num_seq=40, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        policy = self.make_policy('adaptive_heuristic')
+
+        threshold = fit_by_sweep(policy=policy,
+                                 inputs=inputs,
+                                 batch_size=20,
+                                 lower=-50.0,
+                                 upper=50.0,
+                                 batches_per_trial=2,
+                                 energy_margin=0.01,
+                                 num_thresholds=9,
+                                 should_print=False)
+
+        policy._rand = np.random.RandomState(seed=1)
+        val_results = validate_thresholds(policy=policy, inputs=inputs, threshold=threshold, energy_margin=0.01, num_batches=1, rand=np.random.RandomState(seed=2))
+
+        self.assertEqual(policy._policy.threshold, threshold)
+
+        # Validation must match a fresh policy which runs the fitted threshold
+        expected_policy = self.make_policy('adaptive_heuristic', threshold=threshold, seed=1)
+
+        batch_idx = np.random.RandomState(seed=2).choice(np.arange(len(inputs)), size=len(inputs), replace=False)
+        expected = execute_on_batch(policy=expected_policy, batch=inputs[batch_idx], energy_margin=0.01 * VAL_MARGIN_FACTOR)
+
+        self.assertEqual(len(val_results), 1)
+        self.assertEqual(val_results[0].did_exhaust, expected.did_exhaust)
+        self.assertAlmostEqual(val_results[0].mae, expected.mae)
+        self.assertFalse(expected.did_exhaust)
+
+
+class TestKSectionPolicy(FixtureTestCase):
+
+    def test_evaluate_threshold(self):
+        inputs = random_walks(np.random.RandomState(seed=4702), num_seq=30, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        batch_indices = np.vstack([np.arange(0, 15), np.arange(15, 30)])
+
+        policy = self.make_policy('adaptive_deviation', collection_rate=0.6)
+        caller_rand = policy._rand
+
+        result = evaluate_threshold(policy=policy, inputs=inputs, threshold=2.0, batch_indices=batch_indices, energy_margin=0.01, seed=12)
+        self.assertIs(policy._rand, caller_rand)
+
+        # Compare against executing each batch with the same threshold
+        expected_policy = self.make_policy('adaptive_deviation', collection_rate=0.6)
+        expected_policy.set_threshold(2.0)
+        expected = [execute_on_batch(policy=expected_policy, batch=inputs[batch_idx], energy_margin=0.01) for batch_idx in batch_indices]
+
+        self.assertFalse(any(r.did_exhaust for r in expected))
+        self.assertFalse(result.did_exhaust)
+        self.assertAlmostEqual(result.mae, np.average([r.mae for r in expected]))
+
+        # A threshold which collects every element exhausts the budget
+        self.assertTrue(evaluate_threshold(policy=policy, inputs=inputs, threshold=-1.0, batch_indices=batch_indices, energy_margin=0.01, seed=12).did_exhaust)
+
+    def test_worker_determinism(self):
+        inputs = random_walks(np.random.RandomState(seed=4703), num_seq=30, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        policy_config = dict(name='adaptive_deviation',
+                             seq_length=SEQ_LENGTH,
+                             num_features=NUM_FEATURES,
+                             encryption_mode='stream',
+                             collect_mode='tiny',
+                             encoding='standard',
+                             dataset=FIXTURE_DATASET,
+                             should_compress=False)
+
+        thresholds = []
+        for num_workers in [1, 2]:
+            policy = self.make_policy('adaptive_deviation', collection_rate=0.6)
+
+            with ThresholdSearchPool(inputs=inputs, policy_config=policy_config, num_workers=num_workers) as search_pool:
+                threshold = fit_by_ksection(policy=policy,
+                                            search_pool=search_pool,
+                                            batch_size=10,
+                                            lower=-20.0,
+                                            upper=20.0,
+                                            batches_per_trial=2,
+                                            energy_margin=0.01,
+                                            num_thresholds=3,
+                                            should_print=False)
+
+            self.assertEqual(policy._policy.threshold, threshold)
+            thresholds.append(threshold)
+
+        self.assertEqual(thresholds[0], thresholds[1])
+
+class TestKSectionGroup(FixtureTestCase):
+
+    seq_length = 50  # Leaves room for the group encoding's data bits
+
+    def test_non_sweepable(self):
+        inputs = random_walks(np.random.RandomState(seed=4704), num_seq=30, seq_length=self.seq_length, num_features=NUM_FEATURES)
+        policy_config = dict(name='adaptive_heuristic',
+                             seq_length=self.seq_length,
+                             num_features=NUM_FEATURES,
+                             encryption_mode='stream',
+                             collect_mode='tiny',
+                             encoding='group',
+                             dataset=FIXTURE_DATASET,
+                             should_compress=False)
+
+        batch_indices = np.vstack([np.arange(0, 15), np.arange(15, 30)])
+        candidates = np.array([-1.0, 0.5, 2.0, 5.0])
+
+        thresholds = []
+        results = []
+        for num_workers in [1, 2]:
+            policy = self.make_policy('adaptive_heuristic', encoding='group')
+            self.assertFalse(supports_sweep(policy))
+
+            with ThresholdSearchPool(inputs=inputs, policy_config=policy_config, num_workers=num_workers) as search_pool:
+                results.append(search_pool.evaluate(policy=policy, thresholds=candidates, batch_indices=batch_indices, energy_margin=0.01, seed=3))
+
+                threshold = fit_by_ksection(policy=policy,
+                                            search_pool=search_pool,
+                                            batch_size=10,
+                                            lower=-20.0,
+                                            upper=20.0,
+                                            batches_per_trial=2,
+                                            energy_margin=0.01,
+                                            num_thresholds=3,
+                                            should_print=False)
+
+            self.assertEqual(policy._policy.threshold, threshold)
+            thresholds.append(threshold)
+
+        # The workers build their own (group-encoded) policies, which match the in-process evaluation
+        self.assertEqual(thresholds[0], thresholds[1])
+
+        for expected, result in zip(results[0], results[1]):
+            self.assertEqual(result.did_exhaust, expected.did_exhaust)
+            self.assertAlmostEqual(result.mae, expected.mae)
+
+        self.assertFalse(evaluate_threshold(policy=policy, inputs=inputs, threshold=thresholds[0], batch_indices=batch_indices, energy_margin=0.01, seed=3).did_exhaust)
+
+
+def execute_unsplit(policy, batch: np.ndarray, energy_margin: float) -> BatchResult:
+    """
+    Executes and scores the batch in a single pass (the behavior before splitting the collection and scoring).
+    """
+    policy.init_for_experiment(num_sequences=batch.shape[0])
+    policy._budget -= policy._budget * energy_margin
+
+    collected = np.zeros(shape=batch.shape, dtype=float)
+    collected_mask = np.zeros(shape=batch.shape[:2], dtype=bool)
+
+    for seq_idx, sequence in enumerate(batch):
+        policy.reset()
+        policy_result = run_policy(policy=policy, sequence=sequence, should_enforce_budget=True)
+
+        collected[seq_idx, policy_result.collected_indices] = policy_result.measurements
+        collected_mask[seq_idx, policy_result.collected_indices] = True
+
+    estimated = reconstruct_sequences(measurements=collected, collected_mask=collected_mask)
+    return BatchResult(mae=np.average(np.abs(batch - estimated)), did_exhaust=policy.has_exhausted_budget())
+
+
+class TestSplitExecution(FixtureTestCase):
+
+    def test_exhaust_only(self):
+        inputs = random_walks(np.random.RandomState(seed=4901), num_seq=30, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        did_exhaust_list: List[bool] = []
+        for name in ['adaptive_heuristic', 'adaptive_deviation']:
+            for threshold in [0.0, 0.5, 1.0, 2.5, 10.0]:
+                for energy_margin in [0.0, 0.3]:
+                    expected = execute_on_batch(policy=self.make_policy(name, threshold=threshold, seed=9), batch=inputs, energy_margin=energy_margin)
+                    result = execute_on_batch(policy=self.make_policy(name, threshold=threshold, seed=9), batch=inputs, energy_margin=energy_margin, exhaust_only=True)
+
+                    self.assertEqual(result.did_exhaust, expected.did_exhaust)
+                    self.assertIsNone(result.mae)
+                    did_exhaust_list.append(result.did_exhaust)
+
+        # Cover both outcomes
+        self.assertIn(True, did_exhaust_list)
+        self.assertIn(False, did_exhaust_list)
+
+    def test_within_budget_error(self):
+        inputs = random_walks(np.random.RandomState(seed=4902), num_seq=40, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        batches = [inputs[0:20], inputs[20:40]]
+
+        for name in ['adaptive_heuristic', 'adaptive_deviation']:
+            # A trial with every batch within the budget, as in fit() and evaluate_threshold()
+            expected_list = [execute_unsplit(self.make_policy(name, threshold=10.0, seed=9), batch=batch, energy_margin=0.0) for batch in batches]
+            self.assertFalse(any(r.did_exhaust for r in expected_list))
+
+            error_list: List[float] = []
+            for batch in batches:
+                collection = collect_batch(policy=self.make_policy(name, threshold=10.0, seed=9), batch=batch, energy_margin=0.0, stop_on_exhaust=True)
+                self.assertFalse(collection.did_exhaust)
+                error_list.append(score_batch(batch=batch, collection=collection))
+
+            self.assertAlmostEqual(np.average(error_list), np.average([r.mae for r in expected_list]))
+
+            # The full path matches on each batch (exhausted or not)
+            for threshold in [0.0, 2.5, 10.0]:
+                expected = execute_unsplit(self.make_policy(name, threshold=threshold, seed=9), batch=inputs, energy_margin=0.0)
+                result = execute_on_batch(policy=self.make_policy(name, threshold=threshold, seed=9), batch=inputs, energy_margin=0.0)
+
+                self.assertEqual(result.did_exhaust, expected.did_exhaust)
+                self.assertAlmostEqual(result.mae, expected.mae)
+
+
+class TestBatchCache(FixtureTestCase):
+
+    def test_matches_execute(self):
+        inputs = random_walks(np.random.RandomState(seed=4801), num_seq=40, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        batch_idx = np.random.RandomState(seed=4802).choice(40, size=25, replace=False)
+
+        cache = BatchCache()
+        cached_policy = self.make_policy('adaptive_heuristic', threshold=2.5, seed=9)
+
+        # The larger margin exhausts the budget, the smaller one does not
+        did_exhaust = []
+        for energy_margin in [0.3, 0.0, 0.3]:
+            expected = execute_on_batch(policy=self.make_policy('adaptive_heuristic', threshold=2.5, seed=9), batch=inputs[batch_idx], energy_margin=energy_margin)
+
+            cached_policy._rand = np.random.RandomState(seed=9)
+            result = cache.execute(policy=cached_policy, inputs=inputs, batch_idx=batch_idx, energy_margin=energy_margin)
+
+            self.assertEqual(result.did_exhaust, expected.did_exhaust)
+            self.assertAlmostEqual(result.mae, expected.mae)
+            did_exhaust.append(result.did_exhaust)
+
+        self.assertEqual(did_exhaust, [True, False, True])
+
+        # The exhausted run only holds a prefix, so the full budget needs a second run
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(cache.hits, 1)
+
+    def test_inputs_in_key(self):
+        inputs = random_walks(np.random.RandomState(seed=4803), num_seq=10, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        other = inputs[::-1].copy()
+        batch_idx = np.arange(5)
+
+        cache = BatchCache()
+        policy = self.make_policy('adaptive_heuristic', threshold=0.5, seed=9)
+
+        cache.execute(policy=policy, inputs=inputs, batch_idx=batch_idx, energy_margin=0.0)
+
+        policy._rand = np.random.RandomState(seed=9)
+        result = cache.execute(policy=policy, inputs=other, batch_idx=batch_idx, energy_margin=0.0)
+        expected = execute_on_batch(policy=self.make_policy('adaptive_heuristic', threshold=0.5, seed=9), batch=other[batch_idx], energy_margin=0.0)
+
+        self.assertEqual(cache.misses, 2)
+        self.assertAlmostEqual(result.mae, expected.mae)
+
+    def test_transparent_margins(self):
+        rand = np.random.RandomState(seed=4805)
+        inputs = random_walks(rand, num_seq=60, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        val_inputs = random_walks(rand, num_seq=40, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        thresholds = []
+        val_states = []
+        for cache in [None, BatchCache()]:
+            policy = self.make_policy('adaptive_heuristic')
+            val_rand = np.random.RandomState(seed=2)
+
+            threshold = fit_with_margins(policy=policy,
+                                         inputs=inputs,
+                                         val_inputs=val_inputs,
+                                         lower=-50.0,
+                                         upper=50.0,
+                                         min_threshold=-50.0,
+                                         max_threshold=50.0,
+                                         batch_size=20,
+                                         batches_per_trial=2,
+                                         rand=val_rand,
+                                         should_print=False,
+                                         cache=cache)
+
+            thresholds.append(threshold)
+            val_states.append((val_rand.randint(low=0, high=2**31 - 1), policy._rand.randint(low=0, high=2**31 - 1)))
+
+        # The cache leaves the search (and both random streams) unchanged
+        self.assertEqual(thresholds[0], thresholds[1])
+        self.assertEqual(val_states[0], val_states[1])
+
+    def test_skip_exhausted_scoring(self):
+        inputs = random_walks(np.random.RandomState(seed=4804), num_seq=20, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        result = BatchCache().execute(policy=self.make_policy('adaptive_heuristic', threshold=-1.0, seed=9), inputs=inputs, batch_idx=np.arange(20), energy_margin=0.0, score_exhausted=False)
+
+        self.assertTrue(result.did_exhaust)
+        self.assertIsNone(result.mae)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os.path
+import shutil
+import unittest
+import numpy as np
+from typing import Any, Optional
+
+from adaptiveleak.policies import BudgetWrappedPolicy
+from adaptiveleak.utils.file_utils import save_json
+
+
+FIXTURE_DATASET = 'unit_test_fixture'
+FIXTURE_PRECISION = 10
+FIXTURE_WIDTH = 16
+FIXTURE_SEQ_LENGTH = 20
+FIXTURE_NUM_FEATURES = 3
+
+
+class FixtureDataset:
+    """
+    Writes the quantization and distribution files of a small dataset so the tests can
+    build budget-wrapped policies. The files are removed when the context exits.
+    """
+
+    def __init__(self, num_features: int):
+        base = os.path.join(os.path.dirname(__file__), '..', 'datasets')
+        self._datasets_dir = os.path.abspath(base)
+        self._folder = os.path.join(self._datasets_dir, FIXTURE_DATASET)
+        self._num_features = num_features
+        self._created_base = False
+
+    def __enter__(self):
+        self._created_base = not os.path.exists(self._datasets_dir)
+        os.makedirs(self._folder, exist_ok=True)
+
+        save_json({'precision': FIXTURE_PRECISION, 'width': FIXTURE_WIDTH, 'max_skip': 1}, os.path.join(self._folder, 'quantize.json'))
+        save_json({'mean': [0.0] * self._num_features, 'std': [1.0] * self._num_features}, os.path.join(self._folder, 'distribution.json'))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self._folder, ignore_errors=True)
+
+        if self._created_base and os.path.exists(self._datasets_dir) and (len(os.listdir(self._datasets_dir)) == 0):
+            os.rmdir(self._datasets_dir)
+
+
+def make_fixture_policy(name: str, collection_rate: float, seq_length: int, num_features: int, **kwargs: Any) -> BudgetWrappedPolicy:
+    config = dict(encryption_mode='stream', collect_mode='tiny', encoding='standard', should_compress=False)
+    config.update(kwargs)
+
+    return BudgetWrappedPolicy(name=name,
+                               collection_rate=collection_rate,
+                               seq_length=seq_length,
+                               num_features=num_features,
+                               dataset=FIXTURE_DATASET,
+                               **config)
+
+
+class FixtureTestCase(unittest.TestCase):
+    """
+    Writes the fixture dataset once for the tests of each subclass. Subclasses
+    override the sequence length and number of features of their policies.
+    """
+    seq_length = FIXTURE_SEQ_LENGTH
+    num_features = FIXTURE_NUM_FEATURES
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fixture_dataset = FixtureDataset(num_features=cls.num_features)
+        cls.fixture_dataset.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fixture_dataset.__exit__(None, None, None)
+        super().tearDownClass()
+
+    def make_policy(self, name: str, collection_rate: float = 0.5, threshold: Optional[float] = None, seed: Optional[int] = None, **kwargs: Any) -> BudgetWrappedPolicy:
+        """
+        Builds a policy on the fixture dataset with the (optional) threshold and random seed.
+        """
+        policy = make_fixture_policy(name, collection_rate=collection_rate, seq_length=self.seq_length, num_features=self.num_features, **kwargs)
+
+        if threshold is not None:
+            policy.set_threshold(threshold)
+
+        if seed is not None:
+            policy._rand = np.random.RandomState(seed=seed)
+
+        return policy
+
+
+def random_walks(rand: np.random.RandomState, num_seq: int, seq_length: int, num_features: int) -> np.ndarray:
+    return np.cumsum(rand.normal(scale=0.5, size=(num_seq, seq_length, num_features)), axis=1)
@@ -0,0 +1,152 @@
+import unittest
+import numpy as np
+from typing import List
+
+from adaptiveleak.policies import AdaptiveHeuristic, encode_batch, decode_batch, run_policy
+from adaptiveleak.utils.bits import BitWriter
+from adaptiveleak.utils.data_types import EncryptionMode, EncodingMode, CollectMode
+from adaptiveleak.unit_tests.fixtures import FixtureTestCase, random_walks
+
+
+SEQ_LENGTH = 50
+NUM_FEATURES = 3
+
+
+def make_policy(encoding_mode: EncodingMode) -> AdaptiveHeuristic:
+    return AdaptiveHeuristic(collection_rate=0.5,
+                             threshold=0.5,
+                             precision=10,
+                             width=16,
+                             seq_length=SEQ_LENGTH,
+                             num_features=NUM_FEATURES,
+                             min_skip=0,
+                             max_skip=3,
+                             encryption_mode=EncryptionMode.STREAM,
+                             encoding_mode=encoding_mode,
+                             collect_mode=CollectMode.TINY,
+                             should_compress=False)
+
+
+def make_messages(rand: np.random.RandomState, num_messages: int):
+    measurements_list: List[np.ndarray] = []
+    indices_list: List[List[int]] = []
+
+    for _ in range(num_messages):
+        num_collected = rand.randint(1, SEQ_LENGTH + 1)
+        indices_list.append(np.sort(rand.choice(SEQ_LENGTH, size=num_collected, replace=False)).tolist())
+        measurements_list.append(rand.normal(size=(num_collected, NUM_FEATURES)))
+
+    return measurements_list, indices_list
+
+
+class TestBatchEncoding(unittest.TestCase):
+
+    def check_round_trip(self, encoding_mode: EncodingMode):
+        rand = np.random.RandomState(seed=2701)
+        policy = make_policy(encoding_mode)
+        measurements_list, indices_list = make_messages(rand, num_messages=25)
+
+        buffer, offsets = encode_batch(policy, measurements_list=measurements_list, indices_list=indices_list)
+
+        self.assertEqual(offsets.shape, (26, ))
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(offsets[-1], len(buffer))
+
+        decoded = decode_batch(policy, buffer=buffer, offsets=offsets)
+        self.assertEqual(decoded.measurements.shape, (25, SEQ_LENGTH, NUM_FEATURES))
+
+        for idx, (measurements, collected_indices) in enumerate(zip(measurements_list, indices_list)):
+            # Each message matches the individual encoding (aside from the random padding)
+            message = policy.encode(measurements=measurements, collected_indices=collected_indices)
+            encoded = bytes(buffer[offsets[idx]:offsets[idx + 1]])
+
+            if encoding_mode == EncodingMode.STANDARD:
+                self.assertEqual(encoded, message)
+            else:
+                unpadded = policy.encode_group(measurements=measurements, collected_indices=collected_indices).encoded
+                self.assertEqual(len(encoded), len(message))
+                self.assertEqual(encoded[0:len(unpadded)], unpadded)
+
+            expected, expected_indices, _ = policy.decode(message)
+            self.assertEqual(np.flatnonzero(decoded.mask[idx]).tolist(), list(expected_indices))
+            self.assertTrue(np.allclose(decoded.measurements[idx, expected_indices], expected))
+            self.assertTrue(np.all(decoded.measurements[idx, ~decoded.mask[idx]] == 0.0))
+
+    def test_standard(self):
+        self.check_round_trip(EncodingMode.STANDARD)
+
+    def test_group(self):
+        self.check_round_trip(EncodingMode.GROUP)
+
+    def test_single_group(self):
+        self.check_round_trip(EncodingMode.SINGLE_GROUP)
+
+    def test_empty_message(self):
+        policy = make_policy(EncodingMode.STANDARD)
+        measurements_list, indices_list = make_messages(np.random.RandomState(seed=2702), num_messages=2)
+
+        buffer, offsets = encode_batch(policy, measurements_list=measurements_list, indices_list=indices_list)
+
+        # Sequences which were never sent hold empty messages
+        offsets = np.array([0, offsets[1], offsets[1], offsets[2]])
+        decoded = decode_batch(policy, buffer=buffer, offsets=offsets)
+
+        self.assertFalse(np.any(decoded.mask[1]))
+        self.assertTrue(np.all(decoded.measurements[1] == 0.0))
+        self.assertEqual(np.flatnonzero(decoded.mask[2]).tolist(), indices_list[1])
+
+
+class TestRunPolicyWriter(FixtureTestCase):
+
+    seq_length = SEQ_LENGTH
+
+    def test_shared_buffer(self):
+        inputs = random_walks(np.random.RandomState(seed=2703), num_seq=30, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        for encoding in ['standard', 'group']:
+            policy = self.make_policy('adaptive_heuristic', threshold=0.8, encoding=encoding)
+
+            policy.init_for_experiment(num_sequences=inputs.shape[0])
+            expected = [run_policy(policy, sequence=sequence, should_enforce_budget=False) for sequence in inputs]
+
+            writer = BitWriter()
+            offsets = np.zeros(shape=(inputs.shape[0] + 1, ), dtype=np.int64)
+
+            policy.init_for_experiment(num_sequences=inputs.shape[0])
+            for idx, sequence in enumerate(inputs):
+                result = run_policy(policy, sequence=sequence, should_enforce_budget=False, writer=writer)
+                offsets[idx + 1] = len(writer)
+
+                self.assertIsNone(result.encoded)
+                self.assertEqual(result.num_bytes, expected[idx].num_bytes)
+                self.assertAlmostEqual(result.energy, expected[idx].energy)
+                self.assertEqual(offsets[idx + 1] - offsets[idx], len(expected[idx].encoded))
+
+                if encoding == 'standard':
+                    self.assertEqual(bytes(writer.buffer[offsets[idx]:offsets[idx + 1]]), expected[idx].encoded)
+
+            decoded = decode_batch(policy, buffer=writer.buffer, offsets=offsets)
+            for idx, result in enumerate(expected):
+                self.assertEqual(np.flatnonzero(decoded.mask[idx]).tolist(), result.collected_indices)
+
+    def test_exhausted_message(self):
+        inputs = random_walks(np.random.RandomState(seed=2704), num_seq=30, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        policy = self.make_policy('adaptive_heuristic', collection_rate=0.3, threshold=0.0)  # Collects every element, which exhausts the budget
+        policy.init_for_experiment(num_sequences=inputs.shape[0])
+
+        writer = BitWriter()
+        num_sent = 0
+
+        for sequence in inputs:
+            result = run_policy(policy, sequence=sequence, should_enforce_budget=True, writer=writer)
+            num_sent += int(result.num_bytes > 0)
+
+        # Messages past the budget are not written
+        self.assertTrue(policy.has_exhausted_budget())
+        self.assertLess(num_sent, inputs.shape[0])
+        self.assertEqual(len(writer), num_sent * len(policy.encode(measurements=inputs[0], collected_indices=list(range(SEQ_LENGTH)))))
+
+
+if __name__ == '__main__':
+    unittest.main()
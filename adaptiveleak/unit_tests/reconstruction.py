@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+
+from adaptiveleak.reconstruction import InterpolationCache, interpolation_matrix, matrix_bytes
+from adaptiveleak.server import reconstruct_sequence
+
+
+class TestInterpolationMatrix(unittest.TestCase):
+
+    def test_matrix(self):
+        matrix = interpolation_matrix(collected_indices=[1, 3], seq_length=5).toarray()
+
+        expected = np.array([[1.0, 0.0], [1.0, 0.0], [0.5, 0.5], [0.0, 1.0], [0.0, 1.0]])
+        self.assertTrue(np.allclose(matrix, expected))
+
+    def test_single(self):
+        matrix = interpolation_matrix(collected_indices=[2], seq_length=4)
+        self.assertEqual(matrix.toarray().tolist(), [[1.0], [1.0], [1.0], [1.0]])
+
+    def test_matches_reconstruct(self):
+        rand = np.random.RandomState(seed=8312)
+
+        for _ in range(100):
+            seq_length = rand.randint(low=1, high=50)
+            num_collected = rand.randint(low=1, high=seq_length + 1)
+
+            collected_indices = np.sort(rand.choice(seq_length, size=num_collected, replace=False)).tolist()
+            measurements = rand.normal(size=(num_collected, 3))
+
+            expected = reconstruct_sequence(measurements, collected_indices, seq_length)
+            reconstructed = interpolation_matrix(collected_indices, seq_length) @ measurements
+
+            self.assertTrue(np.allclose(reconstructed, expected))
+            self.assertTrue(np.array_equal(reconstructed[collected_indices], measurements))
+
+
+class TestInterpolationCache(unittest.TestCase):
+
+    def test_hits(self):
+        cache = InterpolationCache()
+        measurements = np.array([[1.0], [2.0], [4.0]])
+
+        first = cache.reconstruct(measurements, collected_indices=[0, 2, 4], seq_length=6)
+        second = cache.reconstruct(2 * measurements, collected_indices=[0, 2, 4], seq_length=6)
+
+        self.assertEqual(first[:, 0].tolist(), [1.0, 1.5, 2.0, 3.0, 4.0, 4.0])
+        self.assertEqual(second[:, 0].tolist(), [2.0, 3.0, 4.0, 6.0, 8.0, 8.0])
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_eviction(self):
+        size = max(matrix_bytes(interpolation_matrix([0, end], seq_length=10)) for end in [5, 6, 7])
+        cache = InterpolationCache(max_bytes=2 * size)
+
+        cache.get_matrix([0, 5], seq_length=10)
+        cache.get_matrix([0, 6], seq_length=10)
+        cache.get_matrix([0, 5], seq_length=10)  # Marks [0, 5] as recently used
+        cache.get_matrix([0, 7], seq_length=10)  # Evicts [0, 6]
+
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.num_bytes, cache.max_bytes)
+
+        cache.get_matrix([0, 5], seq_length=10)
+        cache.get_matrix([0, 6], seq_length=10)
+
+        info = cache.cache_info()
+        self.assertEqual(info['hits'], 2)
+        self.assertEqual(info['misses'], 4)
+
+    def test_oversized(self):
+        cache = InterpolationCache(max_bytes=8)
+        cache.get_matrix([0, 5], seq_length=10)
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.num_bytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+from adaptiveleak.reconstructors import ZeroOrderHold, LinearInterpolation, MonotoneCubic, LinearTransition, make_reconstructor
+from adaptiveleak.server import reconstruct_sequence
+
+
+def random_batch(rand: np.random.RandomState, num_seq: int, seq_length: int, num_features: int):
+    measurements = rand.normal(size=(num_seq, seq_length, num_features))
+    collected_mask = rand.uniform(size=(num_seq, seq_length)) < 0.4
+    collected_mask[np.arange(num_seq), rand.randint(low=0, high=seq_length, size=num_seq)] = True
+    return measurements, collected_mask
+
+
+class TestZeroOrderHold(unittest.TestCase):
+
+    def test_hold(self):
+        measurements = np.array([[1.0], [2.0], [3.0], [4.0], [5.0]])
+        reconstructed = ZeroOrderHold().reconstruct_sequence(measurements[[1, 3]], collected_indices=[1, 3], seq_length=5)
+        self.assertEqual(reconstructed[:, 0].tolist(), [2.0, 2.0, 2.0, 4.0, 4.0])
+
+
+class TestLinearInterpolation(unittest.TestCase):
+
+    def test_matches_reconstruct(self):
+        rand = np.random.RandomState(seed=4501)
+        measurements, collected_mask = random_batch(rand, num_seq=20, seq_length=25, num_features=3)
+
+        reconstructed = LinearInterpolation().reconstruct(measurements, collected_mask)
+
+        for seq_idx in range(measurements.shape[0]):
+            collected_indices = np.nonzero(collected_mask[seq_idx])[0]
+            expected = reconstruct_sequence(measurements[seq_idx, collected_indices], collected_indices.tolist(), 25)
+            self.assertTrue(np.allclose(reconstructed[seq_idx], expected))
+
+
+class TestMonotoneCubic(unittest.TestCase):
+
+    def test_matches_scipy(self):
+        rand = np.random.RandomState(seed=4502)
+        measurements, collected_mask = random_batch(rand, num_seq=50, seq_length=30, num_features=2)
+        measurements[:, :, 1] = np.round(measurements[:, :, 1])  # Includes flat segments
+
+        reconstructed = MonotoneCubic().reconstruct(measurements, collected_mask)
+
+        for seq_idx in range(measurements.shape[0]):
+            collected_indices = np.nonzero(collected_mask[seq_idx])[0]
+            positions = np.clip(np.arange(30), collected_indices[0], collected_indices[-1])
+
+            if len(collected_indices) == 1:
+                expected = np.repeat(measurements[seq_idx, collected_indices], 30, axis=0)
+            else:
+                expected = PchipInterpolator(collected_indices, measurements[seq_idx, collected_indices], axis=0)(positions)
+
+            self.assertTrue(np.allclose(reconstructed[seq_idx], expected))
+
+    def test_monotone(self):
+        measurements = np.array([[0.0], [1.0], [1.0], [5.0], [6.0]])
+        reconstructed = MonotoneCubic().reconstruct_sequence(measurements[[0, 2, 4]], collected_indices=[0, 2, 4], seq_length=5)
+
+        self.assertTrue(np.all(np.diff(reconstructed[:, 0]) >= 0.0))
+        self.assertLessEqual(reconstructed[1, 0], 1.0)  # Never overshoots the collected values
+        self.assertLessEqual(reconstructed[3, 0], 6.0)
+
+
+class TestLinearTransition(unittest.TestCase):
+
+    def test_rollout(self):
+        weights = np.array([[0.5, 0.0], [0.25, 1.0]])
+        model = LinearTransition(weights=weights, seq_length=4)
+
+        measurements = np.array([[2.0, 4.0], [0.0, 0.0], [0.0, 0.0], [1.0, 1.0]])
+        reconstructed = model.reconstruct_sequence(measurements[[0, 3]], collected_indices=[0, 3], seq_length=4)
+
+        self.assertTrue(np.allclose(reconstructed[1], measurements[0].dot(weights)))
+        self.assertTrue(np.allclose(reconstructed[2], measurements[0].dot(weights).dot(weights)))
+        self.assertTrue(np.allclose(reconstructed[3], [1.0, 1.0]))
+
+    def test_batch(self):
+        rand = np.random.RandomState(seed=4504)
+        weights = rand.normal(scale=0.5, size=(3, 3))
+        model = LinearTransition(weights=weights, seq_length=25)
+
+        measurements, collected_mask = random_batch(rand, num_seq=20, seq_length=25, num_features=3)
+        reconstructed = model.reconstruct(measurements, collected_mask)
+
+        # Roll each sequence forward one step at a time
+        for seq_idx in range(measurements.shape[0]):
+            collected_indices = np.flatnonzero(collected_mask[seq_idx])
+            current = measurements[seq_idx, collected_indices[0]]
+
+            for t in range(measurements.shape[1]):
+                if collected_mask[seq_idx, t]:
+                    current = measurements[seq_idx, t]
+                elif t > collected_indices[0]:
+                    current = current.dot(weights)
+
+                self.assertTrue(np.allclose(reconstructed[seq_idx, t], current))
+
+    def test_fit(self):
+        rand = np.random.RandomState(seed=4503)
+        weights = np.array([[0.9, 0.1], [-0.2, 0.8]])
+
+        inputs = np.zeros(shape=(40, 20, 2))
+        inputs[:, 0] = rand.normal(size=(40, 2))
+        for t in range(1, 20):
+            inputs[:, t] = inputs[:, t - 1].dot(weights)
+
+        model = LinearTransition.fit(inputs, l2=1e-8)
+        self.assertTrue(np.allclose(model.weights, weights, atol=1e-5))
+
+    def test_make(self):
+        self.assertEqual(make_reconstructor('pchip').name, 'pchip')
+
+        with self.assertRaises(ValueError):
+            make_reconstructor('spline')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,303 @@
+import os.path
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from adaptiveleak.sensor import Sensor
+from adaptiveleak.server import reconstruct_sequence, reconstruct_sequences, parse_message, receive_messages, CryptoStage, Server
+from adaptiveleak.unit_tests.fixtures import FixtureTestCase, random_walks
+from adaptiveleak.utils.constants import LENGTH_SIZE, LENGTH_ORDER
+from adaptiveleak.utils.data_types import EncryptionMode
+from adaptiveleak.utils.data_utils import array_to_fp, array_to_float
+from adaptiveleak.utils.encryption import Encryptor
+from adaptiveleak.utils.file_utils import read_json_gz
+
+
+CHACHA_KEY = bytes.fromhex('6166867d13e4d3c1686a57b21a453755d38a78943de17d76cb43a72bd5965b00')
+HMAC_SECRET = bytes.fromhex('97de481ffae5701de4f927573772b667')
+
+SEQ_LENGTH = 50
+NUM_FEATURES = 3
+NUM_SEQ = 40
+
+
+def make_encryptor() -> Encryptor:
+    return Encryptor(key=CHACHA_KEY, mode=EncryptionMode.STREAM, hmac_secret=HMAC_SECRET)
+
+
+def make_plaintexts(num_messages: int) -> List[bytes]:
+    rand = np.random.RandomState(seed=3901)
+    return [rand.randint(0, 256, size=rand.randint(1, 120)).astype(np.uint8).tobytes() for _ in range(num_messages)]
+
+
+def tag_message(encryptor: Encryptor, plaintext: bytes, num_collected: int) -> bytes:
+    """
+    Formats the message in the same way as the sensor.
+    """
+    encrypted = encryptor.encrypt(plaintext)
+    fields = num_collected.to_bytes(LENGTH_SIZE, byteorder=LENGTH_ORDER) + len(encrypted).to_bytes(LENGTH_SIZE, byteorder=LENGTH_ORDER) + encrypted
+    return encryptor.add_hmac(fields)
+
+
+def send_chunks(conn: socket.socket, stream: bytes, chunk_size: int):
+    for start in range(0, len(stream), chunk_size):
+        conn.sendall(stream[start:start + chunk_size])
+
+    conn.close()
+
+
+def interp_sequence(measurements: np.ndarray, collected_indices: list, seq_length: int) -> np.ndarray:
+    return np.stack([np.interp(x=np.arange(seq_length), xp=collected_indices, fp=measurements[:, d]) for d in range(measurements.shape[1])], axis=-1)
+
+
+class TestReconstruct(unittest.TestCase):
+
+    def test_interior(self):
+        measurements = np.array([[1.0, -2.0], [3.0, 2.0], [0.0, 4.0]])
+        reconstructed = reconstruct_sequence(measurements, collected_indices=[0, 2, 5], seq_length=6)
+
+        expected = np.array([[1.0, -2.0], [2.0, 0.0], [3.0, 2.0], [2.0, 2.0 + 2.0 / 3.0], [1.0, 2.0 + 4.0 / 3.0], [0.0, 4.0]])
+        self.assertTrue(np.allclose(reconstructed, expected))
+
+    def test_edges(self):
+        measurements = np.array([[1.0], [5.0]])
+        reconstructed = reconstruct_sequence(measurements, collected_indices=[2, 3], seq_length=6)
+
+        self.assertEqual(reconstructed[:, 0].tolist(), [1.0, 1.0, 1.0, 5.0, 5.0, 5.0])
+
+    def test_single(self):
+        measurements = np.array([[1.5, -1.0]])
+        reconstructed = reconstruct_sequence(measurements, collected_indices=[4], seq_length=7)
+
+        self.assertEqual(reconstructed.shape, (7, 2))
+        self.assertTrue(np.all(reconstructed == measurements))
+
+    def test_matches_interp(self):
+        rand = np.random.RandomState(seed=2301)
+
+        for _ in range(200):
+            seq_length = rand.randint(low=1, high=60)
+            num_features = rand.randint(low=1, high=5)
+            num_collected = rand.randint(low=1, high=seq_length + 1)
+
+            collected_indices = np.sort(rand.choice(seq_length, size=num_collected, replace=False)).tolist()
+            measurements = rand.normal(scale=100.0, size=(num_collected, num_features))
+
+            expected = interp_sequence(measurements, collected_indices, seq_length)
+            reconstructed = reconstruct_sequence(measurements, collected_indices, seq_length)
+
+            self.assertTrue(np.array_equal(reconstructed, expected))
+
+    def test_non_finite(self):
+        measurements = np.array([[1.0, np.inf], [np.inf, 2.0], [3.0, 3.0], [np.nan, 4.0]])
+        collected_indices = [1, 3, 4, 7]
+
+        expected = interp_sequence(measurements, collected_indices, seq_length=9)
+        reconstructed = reconstruct_sequence(measurements, collected_indices, seq_length=9)
+
+        self.assertTrue(np.array_equal(reconstructed, expected, equal_nan=True))
+
+    def test_batch(self):
+        rand = np.random.RandomState(seed=9032)
+        measurements = rand.normal(size=(20, 30, 3))
+
+        collected_mask = rand.uniform(size=(20, 30)) < 0.3
+        collected_mask[:, 5] = True
+
+        reconstructed = reconstruct_sequences(measurements, collected_mask)
+
+        for idx in range(measurements.shape[0]):
+            collected_indices = np.flatnonzero(collected_mask[idx]).tolist()
+            expected = reconstruct_sequence(measurements[idx, collected_indices], collected_indices, seq_length=30)
+            self.assertTrue(np.array_equal(reconstructed[idx], expected))
+
+    def test_batch_empty(self):
+        with self.assertRaises(ValueError):
+            reconstruct_sequences(np.ones((2, 4, 1)), np.array([[True, False, False, False], [False] * 4]))
+
+
+class TestCryptoStage(unittest.TestCase):
+
+    def test_order(self):
+        encryptor = make_encryptor()
+        plaintexts = make_plaintexts(num_messages=20)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            stage = CryptoStage(encryptor=encryptor, executor=executor)
+
+            for idx, plaintext in enumerate(plaintexts):
+                parsed, _ = parse_message(tag_message(encryptor, plaintext, num_collected=idx))
+                self.assertEqual(stage.submit(parsed), idx)
+
+            self.assertEqual(stage.num_pending, len(plaintexts))
+
+            for idx, plaintext in enumerate(plaintexts):
+                parsed, result = stage.pop()
+
+                self.assertEqual(result.seq, idx)
+                self.assertEqual(parsed.true_num_collected, idx)
+                self.assertTrue(result.is_verified)
+                self.assertEqual(result.plaintext, plaintext)
+
+            self.assertEqual(stage.num_pending, 0)
+
+    def test_invalid_mac(self):
+        encryptor = make_encryptor()
+        message = bytearray(tag_message(encryptor, b'\x01\x02\x03', num_collected=3))
+        message[-1] ^= 0x01
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            stage = CryptoStage(encryptor=encryptor, executor=executor)
+            stage.submit(parse_message(message)[0])
+
+            _, result = stage.pop()
+            self.assertFalse(result.is_verified)
+            self.assertIsNone(result.plaintext)
+
+
+class TestReceiveMessages(unittest.TestCase):
+
+    def receive(self, stream: bytes, chunk_size: int, num_sequences: int, num_workers: int) -> List[bytes]:
+        receiver, sender = socket.socketpair()
+        thread = threading.Thread(target=send_chunks, args=(sender, stream, chunk_size))
+        thread.start()
+
+        try:
+            received = [message.plaintext for message in receive_messages(conn=receiver, encryptor=make_encryptor(), num_sequences=num_sequences, num_workers=num_workers)]
+        finally:
+            thread.join()
+            receiver.close()
+
+        return received
+
+    def test_split_chunks(self):
+        encryptor = make_encryptor()
+        plaintexts = make_plaintexts(num_messages=60)
+        stream = b''.join(tag_message(encryptor, plaintext, num_collected=1) for plaintext in plaintexts)
+
+        # The chunks split messages at arbitrary points, and the number of messages is beyond the pending limit
+        for chunk_size in [1, 7, 100, len(stream)]:
+            for num_workers in [1, 3]:
+                received = self.receive(stream, chunk_size=chunk_size, num_sequences=len(plaintexts), num_workers=num_workers)
+                self.assertEqual(received, plaintexts)
+
+    def test_num_sequences(self):
+        encryptor = make_encryptor()
+        plaintexts = make_plaintexts(num_messages=10)
+        stream = b''.join(tag_message(encryptor, plaintext, num_collected=1) for plaintext in plaintexts)
+
+        self.assertEqual(self.receive(stream, chunk_size=13, num_sequences=4, num_workers=2), plaintexts[:4])
+
+    def test_connection_closed(self):
+        encryptor = make_encryptor()
+        plaintexts = make_plaintexts(num_messages=10)
+        stream = b''.join(tag_message(encryptor, plaintext, num_collected=1) for plaintext in plaintexts)
+
+        # The partial last message is dropped
+        received = self.receive(stream[:-5], chunk_size=11, num_sequences=len(plaintexts), num_workers=2)
+        self.assertEqual(received, plaintexts[:-1])
+
+    def test_invalid_mac(self):
+        encryptor = make_encryptor()
+        plaintexts = make_plaintexts(num_messages=30)
+        messages = [bytearray(tag_message(encryptor, plaintext, num_collected=1)) for plaintext in plaintexts]
+        messages[12][0] ^= 0x01
+
+        # Stops at the first message which fails authentication (yielding the earlier messages in order)
+        received = self.receive(b''.join(messages), chunk_size=17, num_sequences=len(plaintexts), num_workers=3)
+        self.assertEqual(received, plaintexts[:12])
+
+
+class TestSizeOnly(FixtureTestCase):
+
+    seq_length = SEQ_LENGTH
+
+    def make_experiment_policy(self, encryption_mode: str, encoding: str):
+        # Collects every element, so the budget runs out
+        policy = self.make_policy('adaptive_heuristic', collection_rate=0.4, threshold=0.0, encryption_mode=encryption_mode, encoding=encoding)
+        policy.init_for_experiment(num_sequences=NUM_SEQ)
+        return policy
+
+    def run_encrypted(self, inputs: np.ndarray, labels: np.ndarray, encryption_mode: str, encoding: str, output_folder: str):
+        # Reserve a free port for the server
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(('localhost', 0))
+            port = sock.getsockname()[1]
+
+        server = Server(host='localhost', port=port)
+        thread = threading.Thread(target=server.run,
+                                  kwargs=dict(inputs=inputs,
+                                              labels=labels,
+                                              policy=self.make_experiment_policy(encryption_mode, encoding),
+                                              num_sequences=NUM_SEQ,
+                                              should_print=False,
+                                              should_ignore_budget=False,
+                                              output_folder=output_folder))
+        thread.start()
+
+        sensor = Sensor(server_host='localhost', server_port=port)
+        sensor_policy = self.make_experiment_policy(encryption_mode, encoding)
+
+        # Retry until the server starts listening
+        for _ in range(100):
+            try:
+                sensor.run(inputs=inputs, policy=sensor_policy, num_sequences=NUM_SEQ)
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+
+        thread.join()
+
+    def test_matches_encrypted(self):
+        rand = np.random.RandomState(seed=3801)
+        labels = rand.randint(0, 3, size=NUM_SEQ)
+        num_sent: List[int] = []
+
+        for encryption_mode in ['stream', 'block']:
+            for encoding in ['standard', 'group']:
+                policy = self.make_experiment_policy(encryption_mode, encoding)
+
+                # Both paths read the pre-quantized data (see sensor.py)
+                inputs = random_walks(rand, num_seq=NUM_SEQ, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+                inputs = array_to_float(array_to_fp(inputs, width=policy.width, precision=policy.precision), precision=policy.precision)
+
+                with tempfile.TemporaryDirectory() as encrypted_folder, tempfile.TemporaryDirectory() as size_folder:
+                    self.run_encrypted(inputs=inputs, labels=labels, encryption_mode=encryption_mode, encoding=encoding, output_folder=encrypted_folder)
+
+                    server = Server(host='localhost', port=0)
+                    server.run_size_only(inputs=inputs,
+                                         sensor_inputs=inputs,
+                                         labels=labels,
+                                         policy=policy,
+                                         sensor_policy=self.make_experiment_policy(encryption_mode, encoding),
+                                         num_sequences=NUM_SEQ,
+                                         should_ignore_budget=False,
+                                         output_folder=size_folder)
+
+                    file_name = '{0}_{1}.json.gz'.format(str(policy), int(policy.collection_rate * 100))
+                    expected = read_json_gz(os.path.join(encrypted_folder, file_name))
+                    result = read_json_gz(os.path.join(size_folder, file_name))
+
+                self.assertFalse(expected['size_only'])
+                self.assertTrue(result['size_only'])
+
+                self.assertGreater(len(expected['num_bytes']), 0)
+                num_sent.append(len(expected['num_bytes']))
+
+                for key in ['num_bytes', 'air_bytes', 'num_measurements', 'labels']:
+                    self.assertEqual(result[key], expected[key])
+
+                self.assertTrue(np.allclose(result['energy'], expected['energy']))
+                self.assertTrue(np.allclose(result['all_mae'], expected['all_mae']))
+
+        # Cover the case where the budget runs out part of the way through the sequences
+        self.assertLess(min(num_sent), NUM_SEQ)
+
+
+if __name__ == '__main__':
+    unittest.main()
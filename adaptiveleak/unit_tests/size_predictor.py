@@ -0,0 +1,107 @@
+import unittest
+import numpy as np
+
+from adaptiveleak.fit_size_predictor import collect_samples
+from adaptiveleak.size_predictor import SizePredictor, calibrate_threshold, policy_messages, message_features
+from adaptiveleak.threshold_sweep import collected_masks
+from adaptiveleak.unit_tests.fixtures import FixtureTestCase, random_walks
+
+
+SEQ_LENGTH = 20
+NUM_FEATURES = 3
+
+
+def make_samples(rand: np.random.RandomState, num_samples: int):
+    features = rand.normal(size=(num_samples, 4))
+    num_bytes = features.dot([2.0, -1.0, 0.5, 0.0]) + 40.0
+    widths = features.dot([0.0, 0.25, -0.5, 1.0]) + 6.0
+    return features, num_bytes, widths
+
+
+class TestSizePredictor(unittest.TestCase):
+
+    def test_fit(self):
+        rand = np.random.RandomState(seed=6201)
+        features, num_bytes, widths = make_samples(rand, num_samples=50)
+
+        predictor = SizePredictor.fit(features=features, num_bytes=num_bytes, widths=widths, l2=0.0)
+        pred = predictor.predict(features)
+
+        self.assertTrue(np.allclose(pred.num_bytes, num_bytes))
+        self.assertTrue(np.allclose(pred.width, widths))
+
+    def test_evaluate(self):
+        rand = np.random.RandomState(seed=6202)
+        features, num_bytes, widths = make_samples(rand, num_samples=50)
+        predictor = SizePredictor.fit(features=features, num_bytes=num_bytes, widths=widths, l2=0.0)
+
+        test_features, test_bytes, test_widths = make_samples(rand, num_samples=200)
+        offsets = np.linspace(-1.0, 1.0, num=200)
+
+        errors = predictor.evaluate(features=test_features, num_bytes=test_bytes + offsets, widths=test_widths - 2.0 * offsets)
+
+        self.assertAlmostEqual(errors['num_bytes'].max_error, 1.0)
+        self.assertAlmostEqual(errors['width'].max_error, 2.0)
+        self.assertAlmostEqual(errors['num_bytes'].mae, np.average(np.abs(offsets)))
+        self.assertAlmostEqual(errors['width'].p99_error, np.percentile(np.abs(2.0 * offsets), 99))
+        self.assertEqual(predictor.errors, errors)
+
+    def test_width_upper_bound(self):
+        rand = np.random.RandomState(seed=6203)
+        features, num_bytes, widths = make_samples(rand, num_samples=50)
+        predictor = SizePredictor.fit(features=features, num_bytes=num_bytes, widths=widths, l2=0.0)
+
+        with self.assertRaises(AssertionError):
+            predictor.width_upper_bound(features)
+
+        predictor.evaluate(features=features, num_bytes=num_bytes, widths=widths + 0.5)
+        self.assertTrue(np.allclose(predictor.width_upper_bound(features), widths + 0.5))
+
+    def test_should_discard(self):
+        rand = np.random.RandomState(seed=6204)
+        features, num_bytes, widths = make_samples(rand, num_samples=50)
+        predictor = SizePredictor.fit(features=features, num_bytes=num_bytes, widths=widths, l2=0.0)
+        predictor.evaluate(features=features, num_bytes=num_bytes, widths=widths + 0.5)
+
+        # Only discard when every message falls below the minimum width (even with the worst-case error)
+        max_bound = np.max(widths) + 0.5
+        self.assertTrue(predictor.should_discard(features, min_width=max_bound + 0.01))
+        self.assertFalse(predictor.should_discard(features, min_width=max_bound - 0.01))
+
+
+class TestSizeSamples(FixtureTestCase):
+
+    def test_calibrate(self):
+        rand = np.random.RandomState(seed=6205)
+        inputs = random_walks(rand, num_seq=40, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        for collection_rate in [0.3, 0.5, 0.7]:
+            policy = self.make_policy('adaptive_heuristic', collection_rate=collection_rate, encoding='group')
+            threshold = calibrate_threshold(policy, inputs=inputs)
+
+            self.assertEqual(policy._policy._threshold, threshold)
+
+            collected_frac = np.average(collected_masks(policy, inputs=inputs, thresholds=np.array([threshold])))
+            self.assertLessEqual(collected_frac, collection_rate)
+
+    def test_training_matches_queries(self):
+        rand = np.random.RandomState(seed=6206)
+        inputs = random_walks(rand, num_seq=30, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        # The predictor trains on the same messages we later query (see fit_threshold.should_skip_rate())
+        features, num_bytes, widths = collect_samples(self.make_policy('adaptive_heuristic', encoding='group'), inputs=inputs)
+
+        policy = self.make_policy('adaptive_heuristic', encoding='group')
+        calibrate_threshold(policy, inputs=inputs)
+        messages = policy_messages(policy, inputs=inputs)
+
+        self.assertTrue(np.allclose(features, message_features(policy, messages)))
+        self.assertEqual(features.shape[0], num_bytes.shape[0])
+        self.assertEqual(features.shape[0], widths.shape[0])
+
+        # The calibrated policy collects fewer elements than the full sequence
+        self.assertLess(np.average([len(message.collected_indices) for message in messages]), SEQ_LENGTH)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import numpy as np
+
+from adaptiveleak.fit_threshold import execute_on_batch
+from adaptiveleak.policies import AdaptiveHeuristic, AdaptiveDeviation, run_policy
+from adaptiveleak.threshold_sweep import heuristic_masks, deviation_masks, curve_thresholds, invert_energy_curve, sequence_energy, sweep_thresholds
+from adaptiveleak.unit_tests.fixtures import FixtureTestCase, random_walks
+from adaptiveleak.utils.data_types import EncryptionMode, EncodingMode, CollectMode
+
+
+SEQ_LENGTH = 20
+NUM_FEATURES = 3
+
+
+def make_policy(policy_cls, threshold: float):
+    return policy_cls(collection_rate=0.5,
+                      threshold=threshold,
+                      precision=10,
+                      width=16,
+                      seq_length=SEQ_LENGTH,
+                      num_features=NUM_FEATURES,
+                      min_skip=0,
+                      max_skip=3,
+                      encryption_mode=EncryptionMode.STREAM,
+                      encoding_mode=EncodingMode.STANDARD,
+                      collect_mode=CollectMode.TINY,
+                      should_compress=False)
+
+
+def run_sequence(policy, sequence: np.ndarray) -> np.ndarray:
+    policy.reset()
+    collected_mask = np.zeros(shape=(SEQ_LENGTH, ), dtype=bool)
+
+    for seq_idx in range(SEQ_LENGTH):
+        if policy.should_collect(seq_idx=seq_idx):
+            policy.collect(sequence[seq_idx])
+            collected_mask[seq_idx] = True
+
+    return collected_mask
+
+
+class TestThresholdSweep(unittest.TestCase):
+
+    def check(self, policy_cls, masks: np.ndarray, inputs: np.ndarray, thresholds: np.ndarray):
+        self.assertEqual(masks.shape, (thresholds.shape[0], inputs.shape[0], SEQ_LENGTH))
+
+        for threshold_idx, threshold in enumerate(thresholds):
+            policy = make_policy(policy_cls, threshold=threshold)
+
+            for seq_idx, sequence in enumerate(inputs):
+                expected = run_sequence(policy, sequence)
+                self.assertTrue(np.array_equal(masks[threshold_idx, seq_idx], expected))
+
+    def test_heuristic(self):
+        rand = np.random.RandomState(seed=4601)
+        inputs = np.cumsum(rand.normal(scale=0.5, size=(15, SEQ_LENGTH, NUM_FEATURES)), axis=1)
+        thresholds = np.array([-1.0, 0.0, 0.5, 1.0, 2.0, 10.0])
+
+        masks = heuristic_masks(inputs, thresholds=thresholds, min_skip=0, max_skip=3)
+        self.check(AdaptiveHeuristic, masks=masks, inputs=inputs, thresholds=thresholds)
+
+    def test_deviation(self):
+        rand = np.random.RandomState(seed=4602)
+        inputs = np.cumsum(rand.normal(scale=0.5, size=(15, SEQ_LENGTH, NUM_FEATURES)), axis=1)
+        thresholds = np.array([-1.0, 0.0, 0.25, 0.5, 1.0, 10.0])
+
+        masks = deviation_masks(inputs, thresholds=thresholds, min_skip=0, max_skip=3, alpha=0.7, beta=0.7)
+        self.check(AdaptiveDeviation, masks=masks, inputs=inputs, thresholds=thresholds)
+
+    def test_monotone_collection(self):
+        rand = np.random.RandomState(seed=4603)
+        inputs = rand.normal(size=(10, SEQ_LENGTH, NUM_FEATURES))
+        thresholds = np.linspace(0.0, 5.0, num=11)
+
+        counts = np.sum(heuristic_masks(inputs, thresholds=thresholds, min_skip=0, max_skip=3), axis=(1, 2))
+        self.assertTrue(np.all(np.diff(counts) <= 0))
+
+
+class TestSweepEquivalence(FixtureTestCase):
+
+    def test_sequence_energy(self):
+        inputs = random_walks(np.random.RandomState(seed=4611), num_seq=20, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+
+        for name in ['adaptive_heuristic', 'adaptive_deviation']:
+            for encryption_mode in ['stream', 'block']:
+                policy = self.make_policy(name, encryption_mode=encryption_mode)
+                energy = sequence_energy(policy)
+
+                num_collected = set()
+                for threshold in [0.0, 0.5, 1.0, 2.5, 10.0]:
+                    policy.set_threshold(threshold)
+                    policy.init_for_experiment(num_sequences=inputs.shape[0])
+
+                    for sequence in inputs:
+                        policy_result = run_policy(policy, sequence=sequence, should_enforce_budget=False)
+
+                        self.assertAlmostEqual(policy_result.energy, energy[policy_result.num_collected])
+                        num_collected.add(policy_result.num_collected)
+
+                # Cover a range of message sizes
+                self.assertGreater(len(num_collected), 5)
+
+    def test_matches_execute(self):
+        batch = random_walks(np.random.RandomState(seed=4612), num_seq=25, seq_length=SEQ_LENGTH, num_features=NUM_FEATURES)
+        thresholds = np.array([0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 5.0, 10.0])
+
+        for name in ['adaptive_heuristic', 'adaptive_deviation']:
+            did_exhaust_list = []
+
+            for energy_margin in [0.0, 0.2]:
+                policy = self.make_policy(name)
+                sweep = sweep_thresholds(policy, batch=batch, thresholds=thresholds, energy_margin=energy_margin, rand=np.random.RandomState(seed=9))
+
+                for threshold_idx, threshold in enumerate(thresholds):
+                    policy.set_threshold(threshold)
+                    expected = execute_on_batch(policy=policy, batch=batch, energy_margin=energy_margin)
+
+                    self.assertEqual(bool(sweep.did_exhaust[threshold_idx]), expected.did_exhaust)
+                    did_exhaust_list.append(expected.did_exhaust)
+
+                    # The random fallback sequences differ, so we only compare the errors within the budget
+                    if not expected.did_exhaust:
+                        self.assertAlmostEqual(sweep.mae[threshold_idx], expected.mae)
+
+            # Cover both outcomes
+            self.assertIn(True, did_exhaust_list)
+            self.assertIn(False, did_exhaust_list)
+
+
+class TestEnergyCurve(unittest.TestCase):
+
+    def test_thresholds(self):
+        rand = np.random.RandomState(seed=5001)
+        inputs = rand.normal(size=(10, SEQ_LENGTH, NUM_FEATURES))
+
+        thresholds = curve_thresholds(inputs, num_thresholds=16)
+        steps = np.sum(np.abs(np.diff(inputs, axis=1)), axis=-1)
+
+        self.assertEqual(thresholds[0], 0.0)
+        self.assertTrue(np.all(np.diff(thresholds) > 0))
+        self.assertGreater(thresholds[-1], np.max(steps))
+
+        # The last threshold collects as few elements as any larger threshold
+        masks = heuristic_masks(inputs, thresholds=np.array([thresholds[-1], 1e9]), min_skip=0, max_skip=3)
+        self.assertTrue(np.array_equal(masks[0], masks[1]))
+
+    def test_invert(self):
+        thresholds = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+        energy = np.array([10.0, 8.0, 6.0, 4.0, 2.0])
+
+        self.assertEqual(invert_energy_curve(thresholds, energy, target=5.0, lower=-10.0, upper=10.0), (1.0, 4.0))
+        self.assertEqual(invert_energy_curve(thresholds, energy, target=6.0, lower=-10.0, upper=10.0), (0.0, 3.0))
+
+    def test_invert_bounds(self):
+        thresholds = np.array([0.0, 1.0, 2.0])
+        energy = np.array([3.0, 2.0, 1.0])
+
+        self.assertEqual(invert_energy_curve(thresholds, energy, target=5.0, lower=-10.0, upper=10.0), (-10.0, 1.0))
+        self.assertEqual(invert_energy_curve(thresholds, energy, target=0.5, lower=-10.0, upper=10.0), (1.0, 10.0))
+
+    def test_invert_monotone(self):
+        thresholds = np.array([0.0, 1.0, 2.0, 3.0])
+        energy = np.array([4.0, 2.0, 3.0, 1.0])  # Noisy (non-monotone) estimate
+
+        self.assertEqual(invert_energy_curve(thresholds, energy, target=2.5, lower=-10.0, upper=10.0), (-10.0, 2.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import unittest
+import numpy as np
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+from adaptiveleak.utils.analysis import ErrorAccumulator, Histogram, ResultSummary, RunningStats, normalized_mae, summary_path
+
+
+class TestErrorAccumulator(unittest.TestCase):
+
+    def test_sequence_errors(self):
+        rand = np.random.RandomState(seed=31)
+        y_true = rand.normal(size=(20, 3))
+        y_pred = y_true + rand.normal(scale=0.1, size=(20, 3))
+
+        acc = ErrorAccumulator(num_features=3)
+        errors = acc.add(y_true=y_true, y_pred=y_pred)
+
+        expected_rmse = np.average(np.sqrt(mean_squared_error(y_true=y_true, y_pred=y_pred, multioutput='raw_values')))
+
+        self.assertAlmostEqual(errors.mae, mean_absolute_error(y_true=y_true, y_pred=y_pred))
+        self.assertAlmostEqual(errors.rmse, expected_rmse)
+        self.assertEqual(acc.count, 20)
+
+    def test_aggregate(self):
+        rand = np.random.RandomState(seed=32)
+        y_true = rand.normal(loc=[1.0, -4.0], scale=[0.5, 3.0], size=(12, 25, 2))
+        y_pred = y_true + rand.normal(scale=0.2, size=(12, 25, 2))
+
+        acc = ErrorAccumulator(num_features=2)
+        for true_seq, pred_seq in zip(y_true, y_pred):
+            acc.add(y_true=true_seq, y_pred=pred_seq)
+
+        true = y_true.reshape(-1, 2)
+        pred = y_pred.reshape(-1, 2)
+
+        rmse = np.sqrt(mean_squared_error(y_true=true, y_pred=pred, multioutput='raw_values'))
+
+        self.assertAlmostEqual(acc.mae(), mean_absolute_error(y_true=true, y_pred=pred))
+        self.assertAlmostEqual(acc.rmse(), np.average(rmse))
+        self.assertAlmostEqual(acc.norm_mae(), normalized_mae(y_true=true, y_pred=pred))
+        self.assertAlmostEqual(acc.norm_rmse(), np.average(np.average(rmse) / (np.std(true, axis=0) + 1e-7)))
+        self.assertAlmostEqual(acc.r2_score(), r2_score(y_true=true, y_pred=pred, multioutput='variance_weighted'))
+
+    def test_merge(self):
+        rand = np.random.RandomState(seed=33)
+        y_true = rand.normal(loc=2.0, scale=[1.0, 4.0, 0.5], size=(9, 15, 3))
+        y_pred = y_true + rand.normal(scale=0.3, size=(9, 15, 3))
+
+        full = ErrorAccumulator(num_features=3)
+        first = ErrorAccumulator(num_features=3)
+        second = ErrorAccumulator(num_features=3)
+
+        for idx, (true_seq, pred_seq) in enumerate(zip(y_true, y_pred)):
+            full.add(y_true=true_seq, y_pred=pred_seq)
+            (first if idx < 4 else second).add(y_true=true_seq, y_pred=pred_seq)
+
+        first.merge(second)
+        first.merge(ErrorAccumulator(num_features=3))  # Empty accumulators are no-ops
+
+        self.assertEqual(first.count, full.count)
+        self.assertAlmostEqual(first.mae(), full.mae())
+        self.assertAlmostEqual(first.rmse(), full.rmse())
+        self.assertAlmostEqual(first.norm_mae(), full.norm_mae())
+        self.assertAlmostEqual(first.norm_rmse(), full.norm_rmse())
+        self.assertAlmostEqual(first.r2_score(), full.r2_score())
+
+    def test_constant_feature(self):
+        y_true = np.ones(shape=(10, 2))
+        y_pred = np.ones(shape=(10, 2))
+
+        acc = ErrorAccumulator(num_features=2)
+        acc.add(y_true=y_true, y_pred=y_pred)
+        self.assertEqual(acc.r2_score(), 1.0)
+
+        acc.add(y_true=y_true, y_pred=y_pred + 1.0)
+        self.assertEqual(acc.r2_score(), 0.0)
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_counts(self):
+        hist = Histogram(edges=[0.0, 1.0, 2.0, 4.0])
+        hist.add([0.5, 1.0, 1.5, 3.9, 2.0])
+
+        self.assertEqual(hist.counts.tolist(), [1, 2, 2])
+        self.assertEqual(hist.count, 5)
+
+    def test_out_of_range(self):
+        hist = Histogram(edges=[1.0, 2.0, 3.0])
+        hist.add(np.array([-5.0, 10.0]))
+        hist.add(2.5)
+
+        self.assertEqual(hist.counts.tolist(), [1, 2])
+
+        summary = hist.as_dict()
+        self.assertEqual(summary['min'], -5.0)
+        self.assertEqual(summary['max'], 10.0)
+        self.assertAlmostEqual(summary['mean'], 7.5 / 3)
+
+    def test_merge(self):
+        first = Histogram.log_spaced(low=1.0, high=100.0, num_buckets=2)
+        second = Histogram.log_spaced(low=1.0, high=100.0, num_buckets=2)
+
+        first.add([2.0, 50.0])
+        second.add([20.0])
+        first.merge(second)
+
+        self.assertEqual(first.counts.tolist(), [1, 2])
+        self.assertTrue(np.allclose(first.edges, [1.0, 10.0, 100.0]))
+
+    def test_empty(self):
+        summary = Histogram(edges=[0.0, 1.0]).as_dict()
+        self.assertEqual(summary['count'], 0)
+        self.assertEqual(summary['mean'], 0.0)
+
+
+class TestRunningStats(unittest.TestCase):
+
+    def test_stats(self):
+        values = [3.0, 1.5, 4.0, 1.0, 5.5]
+
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+
+        self.assertEqual(stats.count, 5)
+        self.assertAlmostEqual(stats.mean(), np.average(values))
+        self.assertAlmostEqual(stats.std(), np.std(values))
+        self.assertAlmostEqual(stats.std(ddof=1), np.std(values, ddof=1))
+
+    def test_merge(self):
+        first = RunningStats()
+        second = RunningStats()
+
+        first.add(1.0)
+        second.add(2.0)
+        second.add(6.0)
+        first.merge(second)
+
+        self.assertEqual(first.count, 3)
+        self.assertAlmostEqual(first.mean(), 3.0)
+        self.assertAlmostEqual(first.std(ddof=1), np.std([1.0, 2.0, 6.0], ddof=1))
+
+    def test_empty(self):
+        stats = RunningStats()
+        self.assertEqual(stats.mean(), 0.0)
+        self.assertEqual(stats.std(ddof=1), 0.0)
+
+
+class TestResultSummary(unittest.TestCase):
+
+    def test_groups(self):
+        summary = ResultSummary(size_edges=[0, 32, 64, 96], window_size=2)
+
+        summary.add(seq_idx=0, label=1, error=0.5, num_bytes=40, energy=1.0)
+        summary.add(seq_idx=1, label=0, error=0.25, num_bytes=70, energy=2.0)
+        summary.add(seq_idx=2, label=1, error=1.5, num_bytes=48, energy=1.5)
+        summary.add(seq_idx=3, label=1, error=2.0, num_bytes=0, energy=0.0)  # Exhausted budget
+
+        label_one = summary.labels[1]
+        self.assertEqual(label_one.error.count, 3)
+        self.assertAlmostEqual(label_one.error.mean(), 4.0 / 3)
+        self.assertEqual(label_one.num_bytes.count, 2)
+        self.assertAlmostEqual(label_one.num_bytes.mean(), 44.0)
+        self.assertAlmostEqual(label_one.energy.mean(), 1.25)
+        self.assertEqual(label_one.sizes.counts.tolist(), [0, 2, 0])
+
+        self.assertEqual(sorted(summary.windows.keys()), [0, 1])
+        self.assertEqual(summary.windows[0].num_bytes.count, 2)
+        self.assertEqual(summary.windows[1].num_bytes.count, 1)
+        self.assertEqual(summary.windows[1].error.count, 2)
+
+        serialized = summary.as_dict()
+        self.assertEqual(serialized['window_size'], 2)
+        self.assertEqual(list(serialized['labels'].keys()), ['0', '1'])
+        self.assertEqual(serialized['windows']['0']['sizes']['counts'], [0, 1, 1])
+
+    def test_summary_path(self):
+        self.assertEqual(summary_path('results/uniform_standard_70.json.gz'), 'results/uniform_standard_70_summary.json')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+import numpy as np
+
+from adaptiveleak.utils.bits import BitWriter, BitReader, unpack_fields, gather_indices, gather_cache_info
+from adaptiveleak.utils.data_utils import pack, unpack_array
+
+
+class TestBitWriter(unittest.TestCase):
+
+    def test_write_single(self):
+        writer = BitWriter()
+        writer.write(0x1, width=5)
+        writer.write(0x12, width=5)
+
+        self.assertEqual(writer.getvalue(), bytes([0x41, 0x2]))
+        self.assertEqual(writer.num_bits, 10)
+        self.assertEqual(len(writer), 2)
+
+    def test_write_array(self):
+        writer = BitWriter()
+        writer.write_array(np.array([0x101, 0x092]), width=9)
+
+        self.assertEqual(writer.getvalue(), bytes([0x01, 0x25, 0x01]))
+
+    def test_write_array_unaligned(self):
+        rand = np.random.RandomState(seed=2389)
+        values = rand.randint(low=0, high=(1 << 11), size=50)
+
+        writer = BitWriter()
+        writer.write(0x5, width=3)
+        writer.write_array(values, width=11)
+
+        # Compare against writing each value individually
+        expected = BitWriter()
+        expected.write(0x5, width=3)
+        for value in values:
+            expected.write(value, width=11)
+
+        self.assertEqual(writer.getvalue(), expected.getvalue())
+
+    def test_write_field(self):
+        writer = BitWriter()
+        writer.write(0x1, width=1)
+        writer.write_field([0x1, 0x12, 0x06], width=5)
+        writer.write_field([], width=5)
+
+        expected = bytes([0x01]) + pack([0x1, 0x12, 0x06], width=5) + bytes([0x00])
+        self.assertEqual(writer.getvalue(), expected)
+
+    def test_mask_width(self):
+        writer = BitWriter()
+        writer.write_array([0xFF, 0x0F, 0xF0, 0xFF, 0x0F, 0xF0, 0xFF, 0x0F, 0xF0], width=4)
+
+        self.assertEqual(writer.getvalue(), bytes([0xFF, 0xF0, 0x0F, 0xFF, 0x00]))
+
+    def test_shared_buffer(self):
+        buffer = bytearray(b'\xab\xcd')
+
+        writer = BitWriter(buffer)
+        writer.write(0x1, width=5)
+        writer.write(0x12, width=5)
+        writer.align()
+
+        self.assertIs(writer.buffer, buffer)
+        self.assertEqual(buffer, bytearray([0xab, 0xcd, 0x41, 0x2]))
+        self.assertEqual(len(writer), 4)
+
+
+class TestBitReader(unittest.TestCase):
+
+    def test_read_single(self):
+        reader = BitReader(bytes([0x41, 0x2]))
+
+        self.assertEqual(reader.read(width=5), 0x1)
+        self.assertEqual(reader.read(width=5), 0x12)
+        self.assertEqual(reader.tell(), 2)
+
+    def test_read_array(self):
+        reader = BitReader(bytes([0x01, 0x25, 0x01]))
+        values = reader.read_array(width=9, num_values=2)
+
+        self.assertEqual(values.tolist(), [0x101, 0x092])
+
+    def test_round_trip(self):
+        rand = np.random.RandomState(seed=548)
+
+        for width in [1, 3, 7, 8, 12, 16, 21, 32]:
+            values = rand.randint(low=0, high=(1 << width), size=37)
+
+            writer = BitWriter()
+            writer.write(0x3, width=2)
+            writer.write_array(values, width=width)
+            writer.align()
+            writer.write_bytes(b'\xab')
+
+            reader = BitReader(writer.getvalue())
+            self.assertEqual(reader.read(width=2), 0x3)
+            self.assertEqual(reader.read_array(width=width, num_values=len(values)).tolist(), values.tolist())
+
+            reader.align()
+            self.assertEqual(bytes(reader.read_bytes(1)), b'\xab')
+
+    def test_offset(self):
+        reader = BitReader(bytes([0xFF, 0x41, 0x2]), offset=1)
+        self.assertEqual(reader.read_array(width=5, num_values=2).tolist(), [0x1, 0x12])
+
+    def test_read_past_end(self):
+        reader = BitReader(bytes([0x41, 0x2]))
+
+        with self.assertRaises(IndexError):
+            reader.read_array(width=5, num_values=4)
+
+        with self.assertRaises(IndexError):
+            reader.read(width=17)
+
+
+
+class TestUnpackFields(unittest.TestCase):
+
+    def test_matches_reference(self):
+        rand = np.random.RandomState(seed=4821)
+        data = rand.randint(low=0, high=256, size=64).astype(np.uint8)
+        data_int = int.from_bytes(data.tobytes(), byteorder='little')  # The fields are LSB-first
+
+        for width in [1, 5, 8, 11, 16, 21]:
+            for start_bit in [0, 3, 8, 13]:
+                num_values = (data.shape[0] * 8 - start_bit) // width
+                expected = [(data_int >> (start_bit + idx * width)) & ((1 << width) - 1) for idx in range(num_values)]
+                values = unpack_fields(data, start_bit=start_bit, width=width, num_values=num_values)
+
+                self.assertEqual(values.tolist(), expected)
+
+    def test_unpack_array(self):
+        values = [0x1, 0x12, 0x06, 0x1F]
+        self.assertEqual(unpack_array(pack(values, width=5), width=5, num_values=4).tolist(), values)
+
+    def test_cache_hits(self):
+        gather_indices.cache_clear()
+
+        data = np.arange(16, dtype=np.uint8)
+        unpack_fields(data, start_bit=0, width=6, num_values=10)
+        unpack_fields(data, start_bit=16, width=6, num_values=10)  # Same bit offset within the byte
+        unpack_fields(data, start_bit=3, width=6, num_values=10)
+
+        info = gather_cache_info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 2)
+        self.assertAlmostEqual(info['hit_rate'], 1.0 / 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ from adaptiveleak.utils.constants import LENGTH_SIZE
 from adaptiveleak.utils.encryption import AES_BLOCK_SIZE, encrypt_aes128, encrypt
 from adaptiveleak.utils.data_types import EncryptionMode, CollectMode, PolicyType, EncodingMode
 from adaptiveleak.utils.message import encode_standard_measurements
+from adaptiveleak.utils.random_pool import SeededRandomPool
 
 
 class TestQuantization(unittest.TestCase):
@@ -178,6 +179,39 @@ class TestQuantization(unittest.TestCase):
 
         self.assertTrue(np.isclose(quantized, -0.21875))
 
+    def test_table_params(self):
+        table = data_utils.QuantizationTable(non_fractional=2, max_width=8)
+
+        params = table.params(width=8, shift=-2)
+        self.assertEqual(params.scale, 256.0)
+        self.assertEqual(params.inverse, 1.0 / 256.0)
+        self.assertEqual(params.min_val, -127)
+        self.assertEqual(params.max_val, 127)
+
+        # Widths up to the largest encodable group width are always available
+        self.assertEqual(table.max_width, 20)
+
+        with self.assertRaises(ValueError):
+            table.lookup(widths=[8], shifts=[8])
+
+    def test_table_matches_arrays(self):
+        rand = np.random.RandomState(seed=2390)
+        values = rand.normal(loc=0.0, scale=4.0, size=50)
+
+        table = data_utils.QuantizationTable(non_fractional=3, max_width=16)
+
+        for width in [5, 9, 16]:
+            for shift in [-4, 0, 3]:
+                precision = width - 3 - shift
+                quantized = table.to_fixed_point(values, width=width, shift=shift)
+
+                expected = data_utils.array_to_fp(values, width=width, precision=precision)
+                self.assertEqual(quantized.tolist(), expected.tolist())
+
+                recovered = table.to_float(quantized, width=width, shift=shift)
+                expected = data_utils.array_to_float(expected, precision=precision)
+                self.assertEqual(recovered.tolist(), expected.tolist())
+
 
 class TestRangeShift(unittest.TestCase):
 
@@ -586,6 +620,15 @@ class TestPadding(unittest.TestCase):
 
         self.assertEqual(len(padded), AES_BLOCK_SIZE)
 
+    def test_pad_seeded(self):
+        message = get_random_bytes(9)
+
+        first = data_utils.pad_to_length(message=message, length=AES_BLOCK_SIZE, pool=SeededRandomPool(seed=52))
+        second = data_utils.pad_to_length(message=message, length=AES_BLOCK_SIZE, pool=SeededRandomPool(seed=52))
+
+        self.assertEqual(first[:9], message)
+        self.assertEqual(first, second)
+
 
 class TestPacking(unittest.TestCase):
 
@@ -684,6 +727,23 @@ class TestPacking(unittest.TestCase):
         self.assertEqual(values[0], 0x101)
         self.assertEqual(values[1], 0x092)
 
+    def test_quantize_and_pack_groups(self):
+        values = np.array([0.25, -0.125, 0.75, -0.5, 1.5])
+        packed = data_utils.quantize_and_pack_groups(values, widths=[5, 6], shifts=[-1, 0], group_sizes=[3, 2], non_fractional=2)
+
+        # Group 1: [20, 14, 28] with width 5, Group 2: [24, 56] with width 6 (each byte-aligned)
+        expected = data_utils.pack([20, 14, 28], width=5) + data_utils.pack([24, 56], width=6)
+
+        self.assertEqual(packed, expected)
+        self.assertEqual(packed, bytes([0xD4, 0x71, 0x18, 0x0E]))
+
+    def test_quantize_and_pack_groups_empty(self):
+        values = np.array([0.25])
+        packed = data_utils.quantize_and_pack_groups(values, widths=[5, 6], shifts=[-1, 0], group_sizes=[0, 1], non_fractional=2)
+
+        # Empty groups still take a single byte
+        self.assertEqual(packed, bytes([0x00, 0x24]))
+
 
 class TestGroupTargetBytes(unittest.TestCase):
 
@@ -1093,6 +1153,32 @@ class TestRLE(unittest.TestCase):
         self.assertEqual(decoded_vals, values)
         self.assertEqual(decoded_signs, signs)
 
+    def test_rle_bytes(self):
+        values = [1, 1, 1, 1, 1, 0, 0, 3, 3]
+        signs = [1, 1, 0, 0, 0, 1, 0, 1, 1]
+
+        encoded = data_utils.run_length_encode(values, signs)
+        self.assertEqual(encoded, b'"\x05\x00\x05\x03^\x02\x15')
+
+        encoded = data_utils.run_length_encode(np.array([0, 0, 0, 0, 0, 0]), np.array([1, 0, 0, 1, 1, 0]))
+        self.assertEqual(encoded, b'\x12\x04\x00\x00i\x05')
+
+    def test_rle_batch(self):
+        values = np.array([[1, 1, 1, 1, 1, 0, 0, 3, 3], [2, 2, 2, 2, 2, 2, 2, 2, 2], [0, 1, 0, 1, 0, 1, 0, 1, 0]])
+        signs = np.array([[1, 1, 0, 0, 0, 1, 0, 1, 1], [1, 1, 1, 1, 1, 1, 1, 1, 1], [0, 0, 0, 0, 0, 0, 0, 0, 0]])
+
+        encoded = data_utils.run_length_encode_batch(values, signs)
+
+        self.assertEqual(len(encoded), 3)
+        self.assertEqual(encoded[0], b'"\x05\x00\x05\x03^\x02\x15')
+
+        for row in range(values.shape[0]):
+            self.assertEqual(encoded[row], data_utils.run_length_encode(values[row].tolist(), signs[row].tolist()))
+
+            decoded_vals, decoded_signs = data_utils.run_length_decode(encoded[row])
+            self.assertEqual(decoded_vals, values[row].tolist())
+            self.assertEqual(decoded_signs, signs[row].tolist())
+
     def test_rle_long(self):
         with h5py.File('../../datasets/uci_har/train/data.h5', 'r') as fin:
             inputs = fin['inputs'][0]
@@ -0,0 +1,181 @@
+import os
+import threading
+import unittest
+import numpy as np
+from Cryptodome.Cipher import AES
+from Cryptodome.Util.Padding import pad
+
+from adaptiveleak.utils.data_types import EncryptionMode
+from adaptiveleak.utils.encryption import Encryptor, encrypt, decrypt, decrypt_aes128, add_hmac, verify_hmac, encrypted_size, SHA256_LEN, AES_BLOCK_SIZE
+from adaptiveleak.utils.random_pool import RandomPool, SeededRandomPool, ZeroPool
+
+
+AES_KEY = bytes.fromhex('349fdc00b44d1aaacaa3a2670fd44244')
+CHACHA_KEY = bytes.fromhex('6166867d13e4d3c1686a57b21a453755d38a78943de17d76cb43a72bd5965b00')
+HMAC_SECRET = bytes.fromhex('97de481ffae5701de4f927573772b667')
+
+
+def encrypt_aes128_with_iv(message: bytes, iv: bytes) -> bytes:
+    if (len(message) % AES_BLOCK_SIZE) != 0:
+        message = pad(message, block_size=AES_BLOCK_SIZE, style='x923')
+
+    return iv + AES.new(AES_KEY, AES.MODE_CBC, iv).encrypt(message)
+
+
+class TestEncryptor(unittest.TestCase):
+
+    def test_block_compatible(self):
+        encryptor = Encryptor(key=AES_KEY, mode=EncryptionMode.BLOCK)
+        rand = np.random.RandomState(seed=21)
+
+        for length in [0, 1, 15, 16, 17, 32, 100]:
+            message = rand.randint(0, 256, size=length).astype(np.uint8).tobytes()
+
+            ciphertext = encryptor.encrypt(message)
+            self.assertEqual(decrypt(ciphertext, key=AES_KEY, mode=EncryptionMode.BLOCK)[:length], message)
+
+            ciphertext = encrypt(message, key=AES_KEY, mode=EncryptionMode.BLOCK)
+            self.assertEqual(encryptor.decrypt(ciphertext), decrypt(ciphertext, key=AES_KEY, mode=EncryptionMode.BLOCK))
+
+    def test_block_legacy_decrypt(self):
+        encryptor = Encryptor(key=AES_KEY, mode=EncryptionMode.BLOCK, random_pool=SeededRandomPool(seed=22))
+        ivs = SeededRandomPool(seed=22)
+        rand = np.random.RandomState(seed=23)
+
+        for length in [0, 1, 15, 16, 17, 32, 100]:
+            message = rand.randint(0, 256, size=length).astype(np.uint8).tobytes()
+            ciphertext = encryptor.encrypt(message)
+
+            # Each message matches a fresh CBC context under its own IV (even though the encryptor reuses its context)
+            iv = ivs.get_bytes(AES_BLOCK_SIZE)
+            self.assertEqual(ciphertext, encrypt_aes128_with_iv(message, iv=iv))
+            self.assertEqual(len(ciphertext), encrypted_size(length, mode=EncryptionMode.BLOCK))
+
+            # The legacy decryption returns the (X.923) padded message
+            plaintext = decrypt_aes128(ciphertext, key=AES_KEY)
+            self.assertEqual(plaintext[:length], message)
+            self.assertEqual(len(plaintext), len(ciphertext) - AES_BLOCK_SIZE)
+
+    def test_stream_compatible(self):
+        encryptor = Encryptor(key=CHACHA_KEY, mode=EncryptionMode.STREAM)
+        message = b'\x01\x02\x03\x04\x05'
+
+        ciphertext = encryptor.encrypt(message)
+        self.assertEqual(len(ciphertext), len(message) + 12)
+        self.assertEqual(decrypt(ciphertext, key=CHACHA_KEY, mode=EncryptionMode.STREAM), message)
+
+        ciphertext = encrypt(message, key=CHACHA_KEY, mode=EncryptionMode.STREAM)
+        self.assertEqual(encryptor.decrypt(ciphertext), message)
+
+    def test_encrypt_many(self):
+        rand = np.random.RandomState(seed=35)
+        messages = [rand.randint(0, 256, size=length).astype(np.uint8).tobytes() for length in [5, 16, 0, 70, 33]]
+
+        for key, mode in [(AES_KEY, EncryptionMode.BLOCK), (CHACHA_KEY, EncryptionMode.STREAM)]:
+            encryptor = Encryptor(key=key, mode=mode)
+            buffer, offsets = encryptor.encrypt_many(messages)
+
+            self.assertEqual(offsets.shape, (len(messages) + 1, ))
+            self.assertEqual(offsets[-1], len(buffer))
+
+            for idx, message in enumerate(messages):
+                ciphertext = bytes(buffer[offsets[idx]:offsets[idx + 1]])
+                self.assertEqual(decrypt(ciphertext, key=key, mode=mode)[:len(message)], message)
+
+            plaintext, plain_offsets = encryptor.decrypt_many(buffer, offsets)
+            for idx, message in enumerate(messages):
+                self.assertEqual(bytes(plaintext[plain_offsets[idx]:plain_offsets[idx + 1]])[:len(message)], message)
+
+    def test_unique_ivs(self):
+        encryptor = Encryptor(key=AES_KEY, mode=EncryptionMode.BLOCK, random_pool=RandomPool(pool_size=64))
+        ivs = set(encryptor.encrypt(b'message')[:16] for _ in range(20))
+        self.assertEqual(len(ivs), 20)
+
+    def test_invalid_block_ciphertext(self):
+        encryptor = Encryptor(key=AES_KEY, mode=EncryptionMode.BLOCK)
+
+        with self.assertRaises(ValueError):
+            encryptor.decrypt(b'\x00' * 20)
+
+    def test_hmac(self):
+        encryptor = Encryptor(key=AES_KEY, mode=EncryptionMode.BLOCK, hmac_secret=HMAC_SECRET)
+        message = b'\x0a\x0b\x0c'
+
+        tagged = encryptor.add_hmac(message)
+        self.assertEqual(tagged, add_hmac(message, secret=HMAC_SECRET))
+
+        mac = tagged[:SHA256_LEN]
+        self.assertTrue(encryptor.verify_hmac(mac=mac, message=message))
+        self.assertTrue(verify_hmac(mac=mac, message=message, secret=HMAC_SECRET))
+        self.assertFalse(encryptor.verify_hmac(mac=mac, message=b'\x0a\x0b\x0d'))
+
+
+class TestEncryptedSize(unittest.TestCase):
+
+    def test_sizes(self):
+        for length in [0, 1, 15, 16, 17, 47, 48, 100]:
+            message = bytes(length)
+
+            self.assertEqual(encrypted_size(length, mode=EncryptionMode.BLOCK), len(encrypt(message, key=AES_KEY, mode=EncryptionMode.BLOCK)))
+            self.assertEqual(encrypted_size(length, mode=EncryptionMode.STREAM), len(encrypt(message, key=CHACHA_KEY, mode=EncryptionMode.STREAM)))
+
+
+class TestRandomPool(unittest.TestCase):
+
+    def test_sizes(self):
+        pool = RandomPool(pool_size=32)
+
+        self.assertEqual(len(pool.get_bytes(0)), 0)
+        self.assertEqual(len(pool.get_bytes(12)), 12)
+        self.assertEqual(len(pool.get_bytes(30)), 30)
+        self.assertEqual(len(pool.get_bytes(100)), 100)
+
+    def test_zeros(self):
+        self.assertEqual(ZeroPool().get_bytes(5), bytes(5))
+
+    def test_seeded(self):
+        first = SeededRandomPool(seed=31)
+        second = SeededRandomPool(seed=31)
+
+        self.assertEqual(first.get_bytes(10) + first.get_bytes(5), second.get_bytes(15))
+
+    def test_threads(self):
+        pool = RandomPool(pool_size=64)
+        results = []
+
+        def draw():
+            results.extend(pool.get_bytes(16) for _ in range(100))
+
+        threads = [threading.Thread(target=draw) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(results)), 400)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Requires fork()')
+    def test_fork_reseeds(self):
+        pool = RandomPool(pool_size=64)
+        pool.get_bytes(8)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            os.close(read_fd)
+            os.write(write_fd, pool.get_bytes(16))
+            os._exit(0)
+
+        os.close(write_fd)
+        child_bytes = os.read(read_fd, 16)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+        # The child must not serve the parent's next buffered bytes
+        self.assertEqual(len(child_bytes), 16)
+        self.assertNotEqual(child_bytes, pool.get_bytes(16))
+
+
+if __name__ == '__main__':
+    unittest.main()
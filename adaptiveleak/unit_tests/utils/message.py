@@ -4,6 +4,7 @@ import h5py
 from sklearn.metrics import mean_absolute_error
 
 from adaptiveleak.utils import message
+from adaptiveleak.utils.compression import make_codec
 from adaptiveleak.utils.constants import SMALL_NUMBER
 from adaptiveleak.utils.data_utils import pad_to_length, create_groups, select_range_shifts_array
 from adaptiveleak.utils.shifting import merge_shift_groups
@@ -161,6 +162,67 @@ class TestByte(unittest.TestCase):
         self.assertEqual(indices[1], collected_indices[1])
 
 
+    def test_encode_decode_codecs(self):
+        measurements = np.array([[1.25, -0.125, -0.75], [1.125, -0.625, -0.5], [1.125, -0.625, -0.5]])
+        precision = 4
+        width = 6
+        seq_length = 8
+        collected_indices = [0, 4, 5]
+
+        dictionary = message.encode_compressed_payload(np.array([16, 18, 2, -2, -10, -8, -8, -12]), precision=precision)
+
+        for name in ['none', 'zlib-1', 'zlib-9', 'lzma-0', 'zlib_dict-6']:
+            codec = make_codec(name, dictionary=dictionary)
+
+            encoded = message.encode_standard_measurements(measurements=measurements,
+                                                           precision=precision,
+                                                           width=width,
+                                                           collected_indices=collected_indices,
+                                                           seq_length=seq_length,
+                                                           should_compress=True,
+                                                           codec=codec)
+
+            recovered, indices, _ = message.decode_standard_measurements(byte_str=encoded,
+                                                                         num_features=measurements.shape[1],
+                                                                         seq_length=seq_length,
+                                                                         width=width,
+                                                                         precision=precision,
+                                                                         should_compress=True,
+                                                                         codec=codec)
+
+            self.assertTrue(np.all(np.isclose(measurements, recovered)), msg=name)
+            self.assertEqual(indices, collected_indices)
+
+    def test_decode_into_buffer(self):
+        measurements = np.array([[0.25, -0.125, 0.75], [-0.125, 0.625, -0.5]])
+        precision = 6
+        width = 8
+        seq_length = 8
+        collected_indices = [0, 3]
+
+        encoded = message.encode_standard_measurements(measurements=measurements,
+                                                       precision=precision,
+                                                       width=width,
+                                                       collected_indices=collected_indices,
+                                                       seq_length=seq_length,
+                                                       should_compress=False)
+
+        buffer = np.zeros(shape=(seq_length, measurements.shape[1]))
+        recovered, indices, _ = message.decode_standard_measurements(byte_str=memoryview(encoded),
+                                                                     num_features=measurements.shape[1],
+                                                                     seq_length=seq_length,
+                                                                     width=width,
+                                                                     precision=precision,
+                                                                     should_compress=False,
+                                                                     out=buffer)
+
+        # The result should be a view into the provided buffer
+        self.assertEqual(recovered.shape, measurements.shape)
+        self.assertTrue(np.shares_memory(recovered, buffer))
+        self.assertTrue(np.all(np.isclose(measurements, buffer[0:2])))
+        self.assertEqual(indices, collected_indices)
+
+
 class TestGroupWidths(unittest.TestCase):
 
     def test_encode_decode_widths(self):
@@ -523,6 +585,40 @@ class TestStable(unittest.TestCase):
         self.assertEqual(widths, group_widths)
 
 
+    def test_decode_into_buffer(self):
+        measurements = np.array([[0.25, -0.125, 0.75], [-0.125, 0.625, -0.5]])
+        non_fractional = 2
+        seq_length = 8
+        collected_indices = [0, 1]
+        widths = [5, 5]
+        shifts = [-2, -1]
+        sizes = [3, 3]
+
+        encoded = message.encode_stable_measurements(measurements=measurements,
+                                                     collected_indices=collected_indices,
+                                                     seq_length=seq_length,
+                                                     widths=widths,
+                                                     shifts=shifts,
+                                                     group_sizes=sizes,
+                                                     non_fractional=non_fractional)
+
+        buffer = np.zeros(shape=(seq_length, measurements.shape[1]))
+        decoded, indices, widths = message.decode_stable_measurements(encoded=encoded,
+                                                                      seq_length=seq_length,
+                                                                      num_features=measurements.shape[1],
+                                                                      non_fractional=non_fractional,
+                                                                      out=buffer)
+
+        # The result should be a view into the provided buffer
+        self.assertTrue(np.shares_memory(decoded, buffer))
+
+        error = mean_absolute_error(y_true=measurements, y_pred=buffer[0:2])
+        self.assertLess(error, SMALL_NUMBER)
+
+        self.assertEqual(widths, [5, 5])
+        self.assertEqual(indices, collected_indices)
+
+
 class TestDeltaEncode(unittest.TestCase):
 
     def test_encode(self):
@@ -541,6 +637,24 @@ class TestDeltaEncode(unittest.TestCase):
 
         self.assertTrue(np.all(np.isclose(recovered, expected)))
 
+    def test_batch(self):
+        rand = np.random.RandomState(seed=3489)
+        measurements = rand.randint(low=-100, high=100, size=(4, 7, 3))
+
+        encoded = message.delta_encode_batch(measurements)
+        for idx in range(measurements.shape[0]):
+            self.assertTrue(np.all(np.equal(encoded[idx], message.delta_encode(measurements[idx]))))
+
+        recovered = message.delta_decode_batch(encoded)
+        self.assertTrue(np.all(np.equal(recovered, measurements)))
+
+    def test_compressed_payload(self):
+        payload = message.encode_compressed_payload(np.array([16, 18, 2, -2, -10, -8, -8, -12]), precision=4)
+        self.assertEqual(payload, b'\x07\x00\x12\x06\x00\x05\x95\x06\x13 @(@')
+
+        decoded = message.decode_compressed_payload(payload, precision=4, num_values=8)
+        self.assertEqual(decoded.tolist(), [16, 18, 2, -2, -10, -8, -8, -12])
+
     def test_single_feature(self):
         rand = np.random.RandomState(seed=3489)
         seq_length = 7
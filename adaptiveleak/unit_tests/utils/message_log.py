@@ -0,0 +1,111 @@
+import os.path
+import tempfile
+import unittest
+import numpy as np
+
+from adaptiveleak.utils.file_utils import iterate_dir, save_json_gz
+from adaptiveleak.utils.message_log import write_message_log, read_message_log, message_log_path, COLUMN_ALIGNMENT
+from adaptiveleak.utils.message_log import result_outputs_path, save_result_output, read_result
+
+
+class TestMessageLog(unittest.TestCase):
+
+    def test_round_trip(self):
+        columns = {
+            'num_bytes': np.array([52, 60, 44], dtype=np.int32),
+            'energy': np.array([0.5, 0.25, 1.125]),
+            'labels': [1, 0, 2]
+        }
+        messages = [b'\x01\x02\x03', b'', b'\xff' * 70]
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'result.mlog')
+            write_message_log(path, columns=columns, messages=messages, metadata={'policy': 'uniform'})
+
+            message_log = read_message_log(path)
+
+            self.assertEqual(message_log.metadata, {'policy': 'uniform'})
+            self.assertEqual(message_log.column_names, ['num_bytes', 'energy', 'labels'])
+
+            self.assertEqual(message_log['num_bytes'].tolist(), [52, 60, 44])
+            self.assertEqual(message_log['num_bytes'].dtype, np.int32)
+            self.assertEqual(message_log['energy'].tolist(), [0.5, 0.25, 1.125])
+            self.assertEqual(message_log['labels'].tolist(), [1, 0, 2])
+
+            self.assertEqual(message_log.num_messages, 3)
+            for idx, message in enumerate(messages):
+                self.assertEqual(bytes(message_log.message(idx)), message)
+
+    def test_aligned_columns(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'result.mlog')
+            write_message_log(path, columns={'a': np.arange(3, dtype=np.int8), 'b': np.arange(5.0)})
+
+            message_log = read_message_log(path)
+
+            self.assertEqual(message_log['a'].offset % COLUMN_ALIGNMENT, 0)
+            self.assertEqual(message_log['b'].offset % COLUMN_ALIGNMENT, 0)
+            self.assertEqual(message_log['b'].tolist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+            self.assertEqual(message_log.num_messages, 0)
+
+    def test_empty_column(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'result.mlog')
+            write_message_log(path, columns={'num_bytes': np.array([], dtype=np.int32)}, messages=[])
+
+            message_log = read_message_log(path)
+            self.assertEqual(message_log['num_bytes'].shape, (0, ))
+            self.assertEqual(message_log.num_messages, 0)
+
+    def test_invalid_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'result.mlog')
+            with open(path, 'wb') as fout:
+                fout.write(b'not a log')
+
+            with self.assertRaises(ValueError):
+                read_message_log(path)
+
+    def test_log_path(self):
+        self.assertEqual(message_log_path('results/uniform_standard_70.json.gz'), 'results/uniform_standard_70.mlog')
+
+    def test_outputs_path(self):
+        self.assertEqual(result_outputs_path('results/uniform_standard_70.json.gz'), 'results/uniform_standard_70.outputs.json')
+
+
+class TestResultOutputs(unittest.TestCase):
+
+    def test_sidecar(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'uniform_standard_70.json.gz')
+            save_json_gz({'policy': 'uniform', 'mae': 0.5}, path)
+            modified = os.path.getmtime(path)
+
+            save_result_output(path, key='attack', value={'test_accuracy': 0.25})
+            save_result_output(path, key='mutual_information', value={'p_value': 0.1})
+
+            # The outputs leave the full result untouched
+            self.assertEqual(os.path.getmtime(path), modified)
+
+            result = read_result(path)
+            self.assertEqual(result['mae'], 0.5)
+            self.assertEqual(result['attack'], {'test_accuracy': 0.25})
+            self.assertEqual(result['mutual_information'], {'p_value': 0.1})
+
+            # The result listing (by the json.gz pattern) skips the sidecar
+            self.assertEqual(list(iterate_dir(folder, '.*json.gz')), [path])
+
+    def test_overwrite(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'uniform_standard_70.json.gz')
+            save_json_gz({'attack': {'test_accuracy': 0.5}}, path)
+
+            self.assertEqual(read_result(path)['attack'], {'test_accuracy': 0.5})
+
+            save_result_output(path, key='attack', value={'test_accuracy': 0.75})
+            save_result_output(path, key='attack', value={'test_accuracy': 0.25})
+            self.assertEqual(read_result(path)['attack'], {'test_accuracy': 0.25})
+
+
+if __name__ == '__main__':
+    unittest.main()
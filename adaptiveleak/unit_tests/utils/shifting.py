@@ -1,7 +1,7 @@
 import unittest
 import numpy as np
 
-from adaptiveleak.utils.shifting import merge_shift_groups
+from adaptiveleak.utils.shifting import merge_shift_groups, compute_runs, compute_runs_batch
 
 
 class TestShiftMerging(unittest.TestCase):
@@ -62,5 +62,26 @@ class TestShiftMerging(unittest.TestCase):
         self.assertEqual(reps, [2, 4])
 
 
+class TestRuns(unittest.TestCase):
+
+    def test_runs(self):
+        shifts, reps = compute_runs([0, -1, -1, -2, -2, -2, 0])
+        self.assertEqual(shifts, [0, -1, -2, 0])
+        self.assertEqual(reps, [1, 2, 3, 1])
+
+    def test_runs_single(self):
+        shifts, reps = compute_runs([3])
+        self.assertEqual(shifts, [3])
+        self.assertEqual(reps, [1])
+
+    def test_runs_batch(self):
+        values = np.array([[0, -1, -1, -2, -2, -2, 0], [1, 1, 1, 1, 1, 1, 1], [0, 1, 0, 1, 0, 1, 0]])
+        runs = compute_runs_batch(values)
+
+        self.assertEqual(runs[0], ([0, -1, -2, 0], [1, 2, 3, 1]))
+        self.assertEqual(runs[1], ([1], [7]))
+        self.assertEqual(runs[2], ([0, 1, 0, 1, 0, 1, 0], [1, 1, 1, 1, 1, 1, 1]))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,24 @@
 import numpy as np
+from collections import defaultdict, namedtuple
 from sklearn.metrics import mean_squared_error, mean_absolute_error
+from typing import Any, DefaultDict, Dict, Union
 
 from .constants import SMALL_NUMBER
 
 
+SUMMARY_SUFFIX = '_summary.json'
+
+
+def summary_path(result_path: str) -> str:
+    """
+    Returns the path of the result summary which accompanies the given (json.gz) result file.
+    """
+    if result_path.endswith('.json.gz'):
+        result_path = result_path[:-len('.json.gz')]
+
+    return result_path + SUMMARY_SUFFIX
+
+
 def normalized_rmse(y_true: np.ndarray, y_pred: np.ndarray) -> float:
     """
     Computed the RMSE normalized by the standard deviation.
@@ -74,3 +89,325 @@ def geometric_mean(array: np.ndarray) -> float:
         return 0.0
 
     return float(np.power(prod, (1.0 / array.shape[0])))
+
+
+SequenceErrors = namedtuple('SequenceErrors', ['mae', 'rmse'])
+
+
+class ErrorAccumulator:
+    """
+    Streams the reconstruction error metrics over sequences without storing the
+    sequences. The final values match the sklearn metrics (and normalized_mae() /
+    normalized_rmse()) on the stacked [N * T, D] arrays up to floating-point tolerance.
+    The true values use Welford-style (Chan) updates for the per-feature variance.
+    """
+
+    def __init__(self, num_features: int):
+        self._num_features = num_features
+        self._count = 0  # The number of rows (elements) seen so far
+
+        self._abs_error = np.zeros(shape=(num_features, ))  # [D]
+        self._sq_error = np.zeros(shape=(num_features, ))  # [D]
+
+        self._mean = np.zeros(shape=(num_features, ))  # [D]
+        self._m2 = np.zeros(shape=(num_features, ))  # [D], Sum of squared deviations from the mean
+
+        self._min = np.inf
+        self._max = -np.inf
+
+    @property
+    def num_features(self) -> int:
+        return self._num_features
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def add(self, y_true: np.ndarray, y_pred: np.ndarray) -> SequenceErrors:
+        """
+        Adds a single sequence to the running metrics.
+
+        Args:
+            y_true: A [T, D] array of true values
+            y_pred: A [T, D] array of predicted values
+        Returns:
+            The MAE and RMSE of this sequence (as in the sklearn metrics)
+        """
+        assert y_true.shape == y_pred.shape, 'The true ({0}) and predicted ({1}) values must have the same shape'.format(y_true.shape, y_pred.shape)
+        assert len(y_true.shape) == 2 and y_true.shape[1] == self._num_features, 'Must provide a [T, {0}] array'.format(self._num_features)
+
+        num_rows = y_true.shape[0]
+        errors = y_true - y_pred
+
+        abs_error = np.sum(np.abs(errors), axis=0)  # [D]
+        sq_error = np.sum(np.square(errors), axis=0)  # [D]
+
+        self._abs_error += abs_error
+        self._sq_error += sq_error
+
+        # Merge the mean and squared deviations of this sequence into the running values
+        seq_mean = np.average(y_true, axis=0)  # [D]
+        seq_m2 = np.sum(np.square(y_true - seq_mean), axis=0)  # [D]
+
+        total = self._count + num_rows
+        delta = seq_mean - self._mean
+
+        self._mean += delta * (num_rows / total)
+        self._m2 += seq_m2 + np.square(delta) * (self._count * num_rows / total)
+        self._count = total
+
+        self._min = min(self._min, float(np.min(y_true)))
+        self._max = max(self._max, float(np.max(y_true)))
+
+        return SequenceErrors(mae=float(np.average(abs_error / num_rows)),
+                              rmse=float(np.average(np.sqrt(sq_error / num_rows))))
+
+    def merge(self, other: 'ErrorAccumulator'):
+        """
+        Merges the metrics of another accumulator into this one (using Chan's
+        parallel update for the mean and squared deviations).
+        """
+        assert other.num_features == self._num_features, 'Can only merge accumulators with the same number of features'
+
+        if other.count == 0:
+            return
+
+        total = self._count + other.count
+        delta = other._mean - self._mean
+
+        self._mean += delta * (other.count / total)
+        self._m2 += other._m2 + np.square(delta) * (self._count * other.count / total)
+        self._count = total
+
+        self._abs_error += other._abs_error
+        self._sq_error += other._sq_error
+
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    def mae(self) -> float:
+        return float(np.average(self._abs_error / self._count))
+
+    def rmse(self) -> float:
+        return float(np.average(np.sqrt(self._sq_error / self._count)))
+
+    def norm_mae(self) -> float:
+        """
+        The MAE normalized by the range of the true values (see normalized_mae()).
+        """
+        return self.mae() / (self._max - self._min + SMALL_NUMBER)
+
+    def norm_rmse(self) -> float:
+        """
+        The RMSE normalized by the standard deviation of each feature (see normalized_rmse()).
+        """
+        std_dev = np.sqrt(self._m2 / self._count)  # [D]
+        return float(np.average(self.rmse() / (std_dev + SMALL_NUMBER)))
+
+    def r2_score(self) -> float:
+        """
+        The variance-weighted R^2 score (as in sklearn's r2_score()).
+        """
+        numerator = self._sq_error  # [D]
+        denominator = self._m2  # [D]
+
+        if not np.any(denominator != 0):
+            return 1.0 if not np.any(numerator != 0) else 0.0
+
+        is_valid = (denominator != 0)
+        scores = np.ones_like(numerator)
+        scores[is_valid] = 1.0 - numerator[is_valid] / denominator[is_valid]
+        scores[(numerator != 0) & ~is_valid] = 0.0
+
+        return float(np.average(scores, weights=denominator))
+
+
+class Histogram:
+    """
+    Counts values into fixed buckets, where bucket i spans [edges[i], edges[i + 1]).
+    Values outside the edges are counted in the first or last bucket.
+    """
+
+    def __init__(self, edges: np.ndarray):
+        edges = np.asarray(edges, dtype=float)
+        assert len(edges.shape) == 1 and edges.shape[0] >= 2, 'Must provide at least two bucket edges'
+        assert np.all(np.diff(edges) > 0), 'Bucket edges must be strictly increasing'
+
+        self._edges = edges
+        self._counts = np.zeros(shape=(edges.shape[0] - 1, ), dtype=np.int64)
+        self._total = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+
+    @classmethod
+    def log_spaced(cls, low: float, high: float, num_buckets: int):
+        assert 0 < low < high, 'Must provide 0 < low < high'
+        return cls(edges=np.geomspace(low, high, num=num_buckets + 1))
+
+    @property
+    def edges(self) -> np.ndarray:
+        return self._edges
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self._counts
+
+    @property
+    def count(self) -> int:
+        return int(np.sum(self._counts))
+
+    def add(self, values: Union[float, np.ndarray]):
+        values = np.asarray(values, dtype=float).reshape(-1)
+        if values.shape[0] == 0:
+            return
+
+        bucket_idx = np.clip(np.searchsorted(self._edges, values, side='right') - 1, 0, self._counts.shape[0] - 1)
+        np.add.at(self._counts, bucket_idx, 1)
+
+        self._total += float(np.sum(values))
+        self._min = min(self._min, float(np.min(values)))
+        self._max = max(self._max, float(np.max(values)))
+
+    def merge(self, other: 'Histogram'):
+        assert np.array_equal(self._edges, other.edges), 'Can only merge histograms with the same edges'
+
+        self._counts += other.counts
+        self._total += other._total
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    def as_dict(self) -> Dict[str, Any]:
+        count = self.count
+
+        return {
+            'edges': self._edges.tolist(),
+            'counts': self._counts.tolist(),
+            'count': count,
+            'mean': (self._total / count) if count > 0 else 0.0,
+            'min': self._min if count > 0 else 0.0,
+            'max': self._max if count > 0 else 0.0
+        }
+
+
+class RunningStats:
+    """
+    Tracks the count, sum and sum of squares of a stream of values.
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._total = 0.0
+        self._sq_total = 0.0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def add(self, value: float):
+        self._count += 1
+        self._total += value
+        self._sq_total += value * value
+
+    def merge(self, other: 'RunningStats'):
+        self._count += other.count
+        self._total += other._total
+        self._sq_total += other._sq_total
+
+    def mean(self) -> float:
+        return (self._total / self._count) if self._count > 0 else 0.0
+
+    def std(self, ddof: int = 0) -> float:
+        if self._count <= ddof:
+            return 0.0
+
+        variance = (self._sq_total - self._count * (self.mean() ** 2)) / (self._count - ddof)
+        return float(np.sqrt(max(variance, 0.0)))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self._count,
+            'sum': self._total,
+            'sum_sq': self._sq_total,
+            'mean': self.mean(),
+            'std': self.std(ddof=1)
+        }
+
+
+class GroupStats:
+    """
+    The error, message size and energy aggregates of a single group of sequences.
+    """
+
+    def __init__(self, size_edges: np.ndarray):
+        self.error = RunningStats()
+        self.num_bytes = RunningStats()
+        self.energy = RunningStats()
+        self.sizes = Histogram(edges=size_edges)
+
+    def add(self, error: float, num_bytes: int, energy: float):
+        """
+        Records a single sequence. Sequences with no message (num_bytes = 0) only contribute an error.
+        """
+        self.error.add(error)
+
+        if num_bytes > 0:
+            self.num_bytes.add(num_bytes)
+            self.energy.add(energy)
+            self.sizes.add(num_bytes)
+
+    def merge(self, other: 'GroupStats'):
+        self.error.merge(other.error)
+        self.num_bytes.merge(other.num_bytes)
+        self.energy.merge(other.energy)
+        self.sizes.merge(other.sizes)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'error': self.error.as_dict(),
+            'num_bytes': self.num_bytes.as_dict(),
+            'energy': self.energy.as_dict(),
+            'sizes': self.sizes.as_dict()
+        }
+
+
+class ResultSummary:
+    """
+    Online breakdown of the results by label and by budget window (consecutive blocks
+    of sequences). Each sequence updates two groups in O(1), so the analysis scripts
+    can read these compact aggregates instead of regrouping the full logs.
+    """
+
+    def __init__(self, size_edges: np.ndarray, window_size: int):
+        assert window_size > 0, 'The window size must be positive. Got {0}'.format(window_size)
+
+        self._size_edges = np.asarray(size_edges, dtype=float)
+        self._window_size = window_size
+
+        self._labels: DefaultDict[int, GroupStats] = defaultdict(self._make_group)
+        self._windows: DefaultDict[int, GroupStats] = defaultdict(self._make_group)
+
+    def _make_group(self) -> GroupStats:
+        return GroupStats(size_edges=self._size_edges)
+
+    @property
+    def window_size(self) -> int:
+        return self._window_size
+
+    @property
+    def labels(self) -> Dict[int, GroupStats]:
+        return self._labels
+
+    @property
+    def windows(self) -> Dict[int, GroupStats]:
+        return self._windows
+
+    def add(self, seq_idx: int, label: int, error: float, num_bytes: int, energy: float):
+        self._labels[label].add(error=error, num_bytes=num_bytes, energy=energy)
+        self._windows[seq_idx // self._window_size].add(error=error, num_bytes=num_bytes, energy=energy)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'window_size': self._window_size,
+            'labels': {str(label): group.as_dict() for label, group in sorted(self._labels.items())},
+            'windows': {str(window): group.as_dict() for window, group in sorted(self._windows.items())}
+        }
@@ -0,0 +1,322 @@
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+
+from adaptiveleak.utils.constants import BITS_PER_BYTE
+
+
+MAX_FIELD_WIDTH = 56  # Wider fields (plus a 7-bit offset) do not fit into 64-bit lanes
+SMALL_ARRAY_SIZE = 8  # Arrays below this size are written element-wise
+BYTE_ALIGNED_DTYPES = {8: '<u1', 16: '<u2', 32: '<u4'}
+GATHER_CACHE_SIZE = 256  # The number of (width, count, bit offset) index sets to keep
+
+
+GatherIndices = namedtuple('GatherIndices', ['byte_idx', 'byte_shifts', 'bit_shifts', 'mask'])
+
+
+def scatter_bits(out: np.ndarray, values: np.ndarray, bit_positions: np.ndarray, max_width: int):
+    """
+    ORs the given values into the uint8 buffer at the given (LSB-first) bit positions.
+    The values must be non-negative, fit within their fields, and the fields must not overlap.
+
+    Args:
+        out: The [B] uint8 output buffer
+        values: A [N] array of the field values
+        bit_positions: A [N] array holding the starting bit of each field
+        max_width: The maximum width of any field
+    """
+    assert max_width <= MAX_FIELD_WIDTH, 'Fields can have at most {0} bits. Got {1}'.format(MAX_FIELD_WIDTH, max_width)
+
+    byte_idx = np.right_shift(bit_positions, 3)
+    shifted = np.left_shift(values.astype(np.int64), np.bitwise_and(bit_positions, 7))
+
+    num_bytes = out.shape[0]
+    for offset in range((max_width + BITS_PER_BYTE - 1) // BITS_PER_BYTE + 1):
+        target_idx = byte_idx + offset
+        byte_values = np.bitwise_and(np.right_shift(shifted, offset * BITS_PER_BYTE), 0xFF)
+
+        in_range = (target_idx < num_bytes) & (byte_values != 0)
+        np.bitwise_or.at(out, target_idx[in_range], byte_values[in_range].astype(np.uint8))
+
+
+@lru_cache(maxsize=GATHER_CACHE_SIZE)
+def gather_indices(width: int, num_values: int, bit_offset: int) -> GatherIndices:
+    """
+    Precomputes the (read-only) index arrays which gather consecutive fields
+    of the given width. The byte indices are relative to the starting byte.
+
+    Args:
+        width: The width of each field
+        num_values: The number of fields
+        bit_offset: The bit offset (in [0, 8)) of the first field within the starting byte
+    Returns:
+        A [N, B] array of byte indices, a [B] array of shifts placing each byte within a
+        field, a [N] array of shifts aligning each field, and the field mask
+    """
+    assert width <= MAX_FIELD_WIDTH, 'Fields can have at most {0} bits. Got {1}'.format(MAX_FIELD_WIDTH, width)
+    assert (bit_offset >= 0) and (bit_offset < BITS_PER_BYTE), 'The bit offset must be in [0, 8). Got {0}'.format(bit_offset)
+
+    bit_positions = bit_offset + np.arange(num_values, dtype=np.int64) * width
+    bytes_per_field = (width + BITS_PER_BYTE - 1) // BITS_PER_BYTE + 1
+
+    byte_idx = np.right_shift(bit_positions, 3).reshape(-1, 1) + np.arange(bytes_per_field, dtype=np.int64).reshape(1, -1)
+    byte_shifts = (np.arange(bytes_per_field) * BITS_PER_BYTE).astype(np.uint64)
+    bit_shifts = np.bitwise_and(bit_positions, 7).astype(np.uint64)
+
+    # The arrays are shared across all callers
+    for array in (byte_idx, byte_shifts, bit_shifts):
+        array.flags.writeable = False
+
+    return GatherIndices(byte_idx=byte_idx,
+                         byte_shifts=byte_shifts,
+                         bit_shifts=bit_shifts,
+                         mask=np.uint64((1 << width) - 1))
+
+
+def gather_cache_info() -> Dict[str, float]:
+    """
+    Returns the usage statistics of the gather index cache.
+    """
+    info = gather_indices.cache_info()
+    num_calls = info.hits + info.misses
+
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': (info.hits / num_calls) if num_calls > 0 else 0.0
+    }
+
+
+def unpack_fields(data: np.ndarray, start_bit: int, width: int, num_values: int) -> np.ndarray:
+    """
+    Reads `num_values` consecutive (LSB-first) fields of the given width. Byte-aligned
+    widths map directly onto NumPy types; all other widths use a single gather with
+    cached indices followed by a shift and a mask. The caller must ensure the
+    fields lie within the buffer.
+
+    Args:
+        data: The [B] uint8 input buffer
+        start_bit: The starting bit of the first field
+        width: The width of each field
+        num_values: The number of fields
+    Returns:
+        A [N] int64 array of the field values
+    """
+    start_byte, bit_offset = divmod(start_bit, BITS_PER_BYTE)
+
+    if bit_offset == 0:
+        if width in BYTE_ALIGNED_DTYPES:
+            num_bytes = (width // BITS_PER_BYTE) * num_values
+            return np.frombuffer(data[start_byte:start_byte+num_bytes].tobytes(), dtype=BYTE_ALIGNED_DTYPES[width]).astype(np.int64)
+        elif width == 1:
+            num_bytes = (num_values + BITS_PER_BYTE - 1) // BITS_PER_BYTE
+            bits = np.unpackbits(data[start_byte:start_byte+num_bytes], bitorder='little')
+            return bits[0:num_values].astype(np.int64)
+
+    indices = gather_indices(width, num_values, bit_offset)
+
+    # Bytes past the end of the buffer only hold bits above the field, so
+    # clipping the indices does not affect the (masked) values.
+    byte_idx = np.minimum(indices.byte_idx + start_byte, data.shape[0] - 1)
+
+    chunks = np.left_shift(data[byte_idx].astype(np.uint64), indices.byte_shifts)  # [N, B]
+    combined = np.bitwise_or.reduce(chunks, axis=-1)  # [N]
+
+    return np.bitwise_and(np.right_shift(combined, indices.bit_shifts), indices.mask).astype(np.int64)
+
+
+class BitWriter:
+    """
+    Appends LSB-first bit fields to a growable byte array. Complete bytes
+    are flushed from the accumulator as soon as they are filled. The writer
+    can append to an existing (shared) buffer, so many messages can be
+    written back-to-back without copying.
+    """
+
+    def __init__(self, buffer: Optional[bytearray] = None):
+        self._buffer = buffer if buffer is not None else bytearray()
+        self._accumulator = 0
+        self._num_bits = 0  # The number of pending bits in the accumulator (always < 8)
+
+    @property
+    def buffer(self) -> bytearray:
+        """
+        The written (complete) bytes. Align the writer to include any pending bits.
+        """
+        return self._buffer
+
+    @property
+    def num_bits(self) -> int:
+        return len(self._buffer) * BITS_PER_BYTE + self._num_bits
+
+    def __len__(self) -> int:
+        return len(self._buffer) + int(self._num_bits > 0)
+
+    def write(self, value: int, width: int):
+        """
+        Writes the lowest `width` bits of the given value.
+        """
+        self._accumulator |= (int(value) & ((1 << width) - 1)) << self._num_bits
+        self._num_bits += width
+
+        while self._num_bits >= BITS_PER_BYTE:
+            self._buffer.append(self._accumulator & 0xFF)
+            self._accumulator >>= BITS_PER_BYTE
+            self._num_bits -= BITS_PER_BYTE
+
+    def write_array(self, values: Union[np.ndarray, List[int]], width: int):
+        """
+        Writes the lowest `width` bits of each of the given values.
+        """
+        values = np.asarray(values, dtype=np.int64).reshape(-1)
+        num_values = values.shape[0]
+
+        if (num_values == 0) or (width == 0):
+            return
+
+        if num_values < SMALL_ARRAY_SIZE:
+            for value in values.tolist():
+                self.write(value, width=width)
+            return
+
+        values = np.bitwise_and(values, (1 << width) - 1)
+
+        # Byte-aligned fields map directly onto NumPy types
+        if (self._num_bits == 0) and (width in BYTE_ALIGNED_DTYPES):
+            self._buffer += values.astype(BYTE_ALIGNED_DTYPES[width]).tobytes()
+            return
+        elif (self._num_bits == 0) and (width == 1):
+            packed = np.packbits(values.astype(np.uint8), bitorder='little')
+            num_complete = num_values // BITS_PER_BYTE
+
+            self._buffer += packed[0:num_complete].tobytes()
+            self._num_bits = num_values % BITS_PER_BYTE
+            self._accumulator = int(packed[num_complete]) if self._num_bits > 0 else 0
+            return
+
+        # Pack the values after any pending bits in the accumulator
+        total_bits = self._num_bits + num_values * width
+        packed = np.zeros(shape=((total_bits + BITS_PER_BYTE - 1) // BITS_PER_BYTE, ), dtype=np.uint8)
+
+        bit_positions = self._num_bits + np.arange(num_values, dtype=np.int64) * width
+        scatter_bits(packed, values=values, bit_positions=bit_positions, max_width=width)
+        packed[0] |= self._accumulator
+
+        num_complete = total_bits // BITS_PER_BYTE
+        self._buffer += packed[0:num_complete].tobytes()
+
+        self._num_bits = total_bits % BITS_PER_BYTE
+        self._accumulator = int(packed[num_complete]) if self._num_bits > 0 else 0
+
+    def write_field(self, values: Union[np.ndarray, List[int]], width: int):
+        """
+        Writes the values as a byte-aligned field, matching the layout of pack().
+        Fields without any bits (empty or zero-width) occupy a single zero byte.
+        """
+        self.align()
+
+        if (len(values) == 0) or (width == 0):
+            self._buffer.append(0)
+        else:
+            self.write_array(values, width=width)
+            self.align()
+
+    def write_bytes(self, data: bytes):
+        """
+        Appends the given bytes. The writer must be byte-aligned.
+        """
+        assert self._num_bits == 0, 'Must align the writer before writing bytes'
+        self._buffer += data
+
+    def align(self):
+        """
+        Pads the pending bits (if any) with zeros to complete the current byte.
+        """
+        if self._num_bits > 0:
+            self._buffer.append(self._accumulator & 0xFF)
+            self._accumulator = 0
+            self._num_bits = 0
+
+    def getvalue(self) -> bytes:
+        """
+        Returns the written bytes, including any (zero-padded) partial byte.
+        """
+        if self._num_bits > 0:
+            return bytes(self._buffer) + bytes([self._accumulator & 0xFF])
+
+        return bytes(self._buffer)
+
+
+class BitReader:
+    """
+    Reads LSB-first bit fields from a byte buffer without copying it.
+    Reading past the end of the buffer raises an IndexError.
+    """
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview], offset: int = 0):
+        self._data = memoryview(data)
+        self._array = np.frombuffer(self._data, dtype=np.uint8)
+        self._bit_idx = offset * BITS_PER_BYTE
+
+    def tell(self) -> int:
+        """
+        Returns the number of (possibly partially) consumed bytes.
+        """
+        return (self._bit_idx + BITS_PER_BYTE - 1) // BITS_PER_BYTE
+
+    def _check_bounds(self, num_bits: int):
+        if self._bit_idx + num_bits > len(self._data) * BITS_PER_BYTE:
+            raise IndexError('Cannot read {0} bits at bit {1} from a buffer of {2} bytes'.format(num_bits, self._bit_idx, len(self._data)))
+
+    def read(self, width: int) -> int:
+        """
+        Reads a single field with the given width.
+        """
+        if width == 0:
+            return 0
+
+        self._check_bounds(width)
+
+        start_byte = self._bit_idx // BITS_PER_BYTE
+        end_byte = (self._bit_idx + width + BITS_PER_BYTE - 1) // BITS_PER_BYTE
+        chunk = int.from_bytes(self._data[start_byte:end_byte], 'little')
+
+        value = (chunk >> (self._bit_idx % BITS_PER_BYTE)) & ((1 << width) - 1)
+        self._bit_idx += width
+
+        return value
+
+    def read_array(self, width: int, num_values: int) -> np.ndarray:
+        """
+        Reads `num_values` consecutive fields with the given width.
+        """
+        if (num_values <= 0) or (width == 0):
+            return np.zeros(shape=(max(num_values, 0), ), dtype=np.int64)
+
+        self._check_bounds(width * num_values)
+
+        values = unpack_fields(self._array, start_bit=self._bit_idx, width=width, num_values=num_values)
+
+        self._bit_idx += width * num_values
+        return values
+
+    def read_bytes(self, num_bytes: int) -> memoryview:
+        """
+        Returns a view of the next `num_bytes` bytes. The reader must be byte-aligned.
+        """
+        assert (self._bit_idx % BITS_PER_BYTE) == 0, 'Must align the reader before reading bytes'
+
+        start = self._bit_idx // BITS_PER_BYTE
+        self._check_bounds(num_bytes * BITS_PER_BYTE)
+        self._bit_idx += num_bytes * BITS_PER_BYTE
+
+        return self._data[start:start+num_bytes]
+
+    def align(self):
+        """
+        Skips to the start of the next byte.
+        """
+        self._bit_idx = self.tell() * BITS_PER_BYTE
@@ -0,0 +1,201 @@
+import bz2
+import lzma
+import zlib
+from collections import Counter
+from typing import Iterable, List, Optional
+
+
+DEFAULT_CODEC = 'bz2'
+DEFAULT_DICT_SIZE = 1024
+DICT_NGRAM_SIZES = (4, 6, 8)
+
+
+class Codec:
+    """
+    Base class for byte-level compressors applied to the
+    (delta-encoded) measurement payload.
+    """
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError()
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class NoCompression(Codec):
+
+    @property
+    def name(self) -> str:
+        return 'none'
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+
+class Bz2Codec(Codec):
+
+    @property
+    def name(self) -> str:
+        return 'bz2'
+
+    def compress(self, data: bytes) -> bytes:
+        return bz2.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return bz2.decompress(data)
+
+
+class ZlibCodec(Codec):
+    """
+    Raw DEFLATE streams (no zlib header or checksum). The optional
+    dictionary primes the sliding window, which helps on short messages.
+    """
+
+    def __init__(self, level: int, dictionary: Optional[bytes] = None):
+        assert (level >= 1) and (level <= 9), 'The zlib level must be in [1, 9]. Got: {0}'.format(level)
+        self._level = level
+        self._dictionary = dictionary
+
+    @property
+    def name(self) -> str:
+        if self._dictionary is None:
+            return 'zlib-{0}'.format(self._level)
+
+        return 'zlib_dict-{0}'.format(self._level)
+
+    @property
+    def dictionary(self) -> Optional[bytes]:
+        return self._dictionary
+
+    def compress(self, data: bytes) -> bytes:
+        if self._dictionary is None:
+            compressor = zlib.compressobj(self._level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        else:
+            compressor = zlib.compressobj(self._level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=self._dictionary)
+
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._dictionary is None:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=self._dictionary)
+
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class LzmaCodec(Codec):
+    """
+    Raw LZMA2 streams (no container format) using the given preset.
+    """
+
+    def __init__(self, preset: int):
+        assert (preset >= 0) and (preset <= 9), 'The lzma preset must be in [0, 9]. Got: {0}'.format(preset)
+        self._preset = preset
+        self._filters = [{'id': lzma.FILTER_LZMA2, 'preset': preset}]
+
+    @property
+    def name(self) -> str:
+        return 'lzma-{0}'.format(self._preset)
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=self._filters)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lzma.decompress(data, format=lzma.FORMAT_RAW, filters=self._filters)
+
+
+def codec_names() -> List[str]:
+    """
+    Returns the names of all registered codecs.
+    """
+    names = ['none', 'bz2']
+    names.extend('zlib-{0}'.format(level) for level in range(1, 10))
+    names.extend('lzma-{0}'.format(preset) for preset in range(0, 10))
+    names.extend('zlib_dict-{0}'.format(level) for level in range(1, 10))
+    return names
+
+
+def make_codec(name: str, dictionary: Optional[bytes] = None) -> Codec:
+    """
+    Creates the codec with the given name.
+
+    Args:
+        name: The codec name. One of: none, bz2, zlib-<level>,
+            lzma-<preset> or zlib_dict-<level>. The level / preset
+            may be omitted to use the library default.
+        dictionary: The static dictionary (required for zlib_dict codecs)
+    Returns:
+        The codec object
+    """
+    name = name.lower()
+    codec_type, _, setting = name.partition('-')
+
+    if codec_type == 'none':
+        return NoCompression()
+    elif codec_type == 'bz2':
+        return Bz2Codec()
+    elif codec_type == 'zlib':
+        return ZlibCodec(level=int(setting) if len(setting) > 0 else 6)
+    elif codec_type == 'lzma':
+        return LzmaCodec(preset=int(setting) if len(setting) > 0 else 6)
+    elif codec_type == 'zlib_dict':
+        if dictionary is None:
+            raise ValueError('The codec {0} requires a dictionary.'.format(name))
+
+        return ZlibCodec(level=int(setting) if len(setting) > 0 else 6, dictionary=dictionary)
+    else:
+        raise ValueError('Unknown codec with name: {0}'.format(name))
+
+
+def train_dictionary(samples: Iterable[bytes], max_size: int = DEFAULT_DICT_SIZE) -> bytes:
+    """
+    Builds a static DEFLATE dictionary from the given sample payloads. The dictionary
+    contains the most frequent substrings, with the most common substrings placed at
+    the end (closest to the data and thus cheapest to reference).
+
+    Args:
+        samples: The (uncompressed) sample payloads, e.g. from the training fold
+        max_size: The maximum dictionary size in bytes
+    Returns:
+        The dictionary as a byte string
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        sample = bytes(sample)
+
+        for ngram_size in DICT_NGRAM_SIZES:
+            counts.update(sample[i:i+ngram_size] for i in range(len(sample) - ngram_size + 1))
+
+    # Score substrings by the number of bytes they cover
+    scored = sorted(counts.items(), key=lambda t: (t[1] * len(t[0]), t[0]), reverse=True)
+
+    selected: List[bytes] = []
+    total_size = 0
+
+    for ngram, count in scored:
+        if count <= 1:
+            break
+
+        if total_size + len(ngram) > max_size:
+            continue
+
+        # Skip substrings which are already covered by a selected entry
+        if any(ngram in existing for existing in selected):
+            continue
+
+        selected.append(ngram)
+        total_size += len(ngram)
+
+    return b''.join(reversed(selected))
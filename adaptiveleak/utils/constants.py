@@ -17,6 +17,8 @@ LENGTH_ORDER = 'little'
 PERIOD = 4
 BT_FRAME_SIZE = 20
 
+COMPRESSION_DICT_FILE = 'compression_dict.pkl.gz'
+
 POLICIES = ['random', 'uniform', 'adaptive_heuristic', 'adaptive_deviation', 'skip_rnn']
 ENCODING = ['standard', 'group', 'group_unshifted', 'single_group', 'padded', 'pruned']
 ENCRYPTION = ['stream', 'block']
@@ -32,3 +32,7 @@ class CollectMode(Enum):
 
 
 PolicyResult = namedtuple('PolicyResult', ['measurements', 'collected_indices', 'encoded', 'energy', 'num_bytes', 'num_collected'])
+DecodedBatch = namedtuple('DecodedBatch', ['measurements', 'mask'])
+GroupEncoding = namedtuple('GroupEncoding', ['encoded', 'widths', 'group_sizes', 'num_collected'])
+GroupSelection = namedtuple('GroupSelection', ['measurements', 'collected_indices', 'widths', 'shifts', 'group_sizes'])
+QuantizationParams = namedtuple('QuantizationParams', ['scale', 'inverse', 'min_val', 'max_val'])
@@ -1,13 +1,14 @@
 import numpy as np
 import math
 import time
-from functools import partial
-from Cryptodome.Random import get_random_bytes
-from typing import List, Union, Tuple, Iterable
+from functools import partial, lru_cache
+from typing import List, Union, Tuple, Iterable, Optional
 
-from adaptiveleak.utils.constants import BITS_PER_BYTE, BIG_NUMBER, MIN_WIDTH, SMALL_NUMBER, LENGTH_SIZE
+from adaptiveleak.utils.bits import BitWriter, BitReader, scatter_bits
+from adaptiveleak.utils.constants import BITS_PER_BYTE, BIG_NUMBER, MIN_WIDTH, SMALL_NUMBER, LENGTH_SIZE, SHIFT_BITS
 from adaptiveleak.utils.encryption import AES_BLOCK_SIZE, CHACHA_NONCE_LEN
-from adaptiveleak.utils.data_types import EncryptionMode
+from adaptiveleak.utils.data_types import EncryptionMode, QuantizationParams
+from adaptiveleak.utils.random_pool import BytePool, get_padding_pool
 
 
 MAX_ITER = 100
@@ -39,65 +40,134 @@ def to_float(fp: int, precision: int) -> float:
     return float(fp) / multiplier if precision > 0 else float(fp) * multiplier
 
 
-def array_to_fp(arr: np.ndarray, precision: int, width: int) -> np.ndarray:
-    multiplier = 1 << abs(precision)
+@lru_cache(maxsize=None)
+def quantization_params(width: int, precision: int) -> QuantizationParams:
+    """
+    Returns the (cached) fixed point conversion parameters for the given width and precision.
+    The scales are powers of two, so multiplying by them is exact.
+    """
+    assert width >= 1, 'Must have a non-negative width'
 
-    if precision > 0:
-        quantized = arr * multiplier
-    else:
-        quantized = arr / multiplier
+    max_val = (1 << (width - 1)) - 1
+    return QuantizationParams(scale=math.ldexp(1.0, precision),
+                              inverse=math.ldexp(1.0, -precision),
+                              min_val=-max_val,
+                              max_val=max_val)
 
-    quantized = np.round(quantized).astype(int)
 
-    max_val = (1 << (width - 1)) - 1
-    min_val = -max_val
+class QuantizationTable:
+    """
+    Fixed point conversion parameters for every (width, precision, shift) combination
+    a policy can use. All values share the same number of non-fractional bits, so
+    width w and shift s use precision (w - non_fractional - s). The table covers all
+    widths and shifts which fit into the encoded group metadata.
+    """
+
+    def __init__(self, non_fractional: int, max_width: int, num_shift_bits: int = SHIFT_BITS, min_width: int = MIN_WIDTH):
+        self._non_fractional = non_fractional
+        self._shift_offset = 1 << (num_shift_bits - 1)
+        self._max_width = max(max_width, min_width + (1 << (BITS_PER_BYTE - num_shift_bits)) - 1)
+
+        widths = np.arange(self._max_width + 1).reshape(-1, 1)  # [W, 1]
+        shifts = np.arange(1 << num_shift_bits).reshape(1, -1) - self._shift_offset  # [1, S]
+
+        precisions = widths - non_fractional - shifts  # [W, S]
+        self._scales = np.ldexp(1.0, precisions)
+        self._inverses = np.ldexp(1.0, -precisions)
+        self._max_vals = np.broadcast_to(np.left_shift(1, np.maximum(widths, 1) - 1) - 1, precisions.shape)
+
+    @property
+    def non_fractional(self) -> int:
+        return self._non_fractional
+
+    @property
+    def max_width(self) -> int:
+        return self._max_width
+
+    def params(self, width: int, shift: int = 0) -> QuantizationParams:
+        """
+        Returns the conversion parameters for the given width and shift.
+        """
+        shift_idx = shift + self._shift_offset
+        max_val = int(self._max_vals[width, shift_idx])
+
+        return QuantizationParams(scale=float(self._scales[width, shift_idx]),
+                                  inverse=float(self._inverses[width, shift_idx]),
+                                  min_val=-max_val,
+                                  max_val=max_val)
+
+    def to_fixed_point(self, values: np.ndarray, width: int, shift: int = 0) -> np.ndarray:
+        """
+        Quantizes the values to fixed point using the given width and shift.
+        """
+        params = self.params(width=width, shift=shift)
+
+        quantized = np.round(values * params.scale).astype(int)
+        return np.clip(quantized, a_min=params.min_val, a_max=params.max_val)
+
+    def to_float(self, values: Union[np.ndarray, List[int]], width: int, shift: int = 0) -> np.ndarray:
+        """
+        Converts the fixed point values with the given width and shift back to floating point.
+        """
+        return np.asarray(values).astype(float) * self.params(width=width, shift=shift).inverse
+
+    def lookup(self, widths: Union[np.ndarray, List[int]], shifts: Union[np.ndarray, List[int]]) -> QuantizationParams:
+        """
+        Returns arrays of the conversion parameters for each (width, shift) pair.
+        """
+        width_idx = np.asarray(widths, dtype=int)
+        shift_idx = np.asarray(shifts, dtype=int) + self._shift_offset
+
+        if np.any(width_idx < 1) or np.any(width_idx > self._max_width):
+            raise ValueError('Widths must be in [1, {0}]. Got {1}'.format(self._max_width, width_idx.tolist()))
+
+        if np.any(shift_idx < 0) or np.any(shift_idx >= 2 * self._shift_offset):
+            raise ValueError('Shifts must be in [{0}, {1}). Got {2}'.format(-self._shift_offset, self._shift_offset, (shift_idx - self._shift_offset).tolist()))
+
+        max_vals = self._max_vals[width_idx, shift_idx]
+
+        return QuantizationParams(scale=self._scales[width_idx, shift_idx],
+                                  inverse=self._inverses[width_idx, shift_idx],
+                                  min_val=-max_vals,
+                                  max_val=max_vals)
+
+
+@lru_cache(maxsize=None)
+def get_quantization_table(non_fractional: int, max_width: int) -> QuantizationTable:
+    """
+    Returns the (shared) quantization table for the given number of non-fractional bits.
+    """
+    return QuantizationTable(non_fractional=non_fractional, max_width=max_width)
+
 
-    return np.clip(quantized, a_min=min_val, a_max=max_val)
+def array_to_fp(arr: np.ndarray, precision: int, width: int) -> np.ndarray:
+    params = quantization_params(width=width, precision=precision)
+
+    quantized = np.round(arr * params.scale).astype(int)
+    return np.clip(quantized, a_min=params.min_val, a_max=params.max_val)
 
 
 def array_to_fp_shifted(arr: np.ndarray, precision: int, width: int, shifts: np.ndarray) -> np.ndarray:
     assert len(arr.shape) == 1, 'Must provide a 1d array'
     assert arr.shape == shifts.shape, 'Misaligned data {0} and shifts {1}'.format(arr.shape, shifts.shape)
 
-    shifted_precisions = precision - shifts
-    multipliers = np.left_shift(np.ones_like(shifts), np.abs(shifted_precisions))
-
-    quantized = np.where(shifted_precisions > 0, arr * multipliers, arr / multipliers)
-    quantized = np.round(quantized).astype(int)
+    params = quantization_params(width=width, precision=precision)
 
-    max_val = (1 << (width - 1)) - 1
-    min_val = -max_val
-
-    return np.clip(quantized, a_min=min_val, a_max=max_val)
+    quantized = np.round(np.ldexp(arr, precision - shifts)).astype(int)
+    return np.clip(quantized, a_min=params.min_val, a_max=params.max_val)
 
 
 def array_to_float(fp_arr: Union[np.ndarray, List[int]], precision: int) -> np.ndarray:
-    multiplier = float(1 << abs(precision))
-
-    if isinstance(fp_arr, list):
-        fp_arr = np.array(fp_arr)
-
-    if precision > 0:
-        return fp_arr.astype(float) / multiplier
-    else:
-        return fp_arr.astype(float) * multiplier
+    return np.ldexp(np.asarray(fp_arr, dtype=float), -precision)
 
 
 def array_to_float_shifted(arr: Union[np.ndarray, List[int]], precision: int, shifts: np.ndarray) -> np.ndarray:
-    shifted_precisions = precision - shifts
-    multipliers = np.left_shift(np.ones_like(shifts), np.abs(shifted_precisions))
-
-    if isinstance(arr, list):
-        fp_arr = np.array(arr).astype(float)
-    else:
-        fp_arr = arr.astype(float)
+    fp_arr = np.asarray(arr).astype(float)
 
     assert len(fp_arr.shape) == 1, 'Must provide a 1d array'
     assert fp_arr.shape == shifts.shape, 'Misaligned data {0} and shifts {1}'.format(fp_arr.shape, shifts.shape)
 
-    recovered = np.where(shifted_precisions > 0, fp_arr / multipliers, fp_arr * multipliers)
-
-    return recovered
+    return np.ldexp(fp_arr, shifts - precision)
 
 
 def select_range_shift(measurement: int, old_width: int, old_precision: int, new_width: int, num_range_bits: int, prev_shift: int) -> int:
@@ -247,18 +317,33 @@ def linear_extrapolate(prev: np.ndarray, curr: np.ndarray, delta: float, num_ste
     return slope * delta * num_steps + curr
 
 
-def pad_to_length(message: bytes, length: int) -> bytes:
+def pad_to_length(message: bytes, length: int, pool: Optional[BytePool] = None) -> bytes:
     """
     Pads larger messages to the given length by appending
-    random bytes.
+    random bytes. The bytes come from the given pool or, by default,
+    the process-wide (secure) padding pool.
     """
     if len(message) >= length:
         return message
 
-    padding = get_random_bytes(length - len(message))
+    pool = pool if pool is not None else get_padding_pool()
+    padding = pool.get_bytes(length - len(message))
     return message + padding
 
 
+def pad_buffer(buffer: bytearray, start: int, length: int, pool: Optional[BytePool] = None):
+    """
+    Pads the message at buffer[start:] to the given length (in place) with random
+    bytes, matching pad_to_length().
+    """
+    message_length = len(buffer) - start
+    if message_length >= length:
+        return
+
+    pool = pool if pool is not None else get_padding_pool()
+    buffer += pool.get_bytes(length - message_length)
+
+
 def round_to_block(length: Union[int, float], block_size: int) -> int:
     """
     Rounds the given length to the nearest (larger) multiple of
@@ -342,39 +427,76 @@ def pack(values: List[int], width: int) -> bytes:
     Returns:
         A packed string containing the quantized values.
     """
-    packed: List[int] = [0]
-    consumed = 0
-    num_bytes = int(math.ceil(width / 8))
+    writer = BitWriter()
+    writer.write_field(values, width=width)
+    return writer.getvalue()
 
-    for value in values:
-        for i in range(num_bytes):
-            # Get the current byte
-            current_byte = (value >> (i * 8)) & 0xFF
 
-            # Get the number of used bits in the current byte
-            if i < (num_bytes - 1) or (width % 8) == 0:
-                num_bits = 8
-            else:
-                num_bits = width % 8
+def quantize_and_pack_groups(values: np.ndarray, widths: List[int], shifts: List[int], group_sizes: List[int], non_fractional: int, table: Optional[QuantizationTable] = None) -> bytes:
+    """
+    Quantizes and bit-packs groups of values in a single pass. Group i holds
+    group_sizes[i] consecutive values which are quantized with width widths[i] and
+    precision (widths[i] - non_fractional - shifts[i]), offset to be non-negative,
+    and packed starting on a fresh byte. The result is identical to concatenating
+    pack(array_to_fp(group) + 2^{w-1}, width=w) across all groups.
+
+    Args:
+        values: A 1d array of the values to encode
+        widths: The bit width for each group
+        shifts: The exponent shift for each group
+        group_sizes: The number of values in each group
+        non_fractional: The number of non-fractional bits per value
+        table: The quantization table for the given non-fractional bits. Defaults to the shared table.
+    Returns:
+        The packed groups as a byte string
+    """
+    assert len(values.shape) == 1, 'Must provide a 1d array'
+    assert len(widths) == len(shifts) == len(group_sizes), 'Misaligned groups ({0}, {1}, {2})'.format(len(widths), len(shifts), len(group_sizes))
+
+    group_sizes = np.asarray(group_sizes, dtype=int)
+    group_widths = np.asarray(widths, dtype=int)
+    group_shifts = np.asarray(shifts, dtype=int)
+
+    if np.any(group_sizes < 0) or (np.sum(group_sizes) > values.shape[0]):
+        raise ValueError('Invalid group sizes {0} for {1} values'.format(group_sizes.tolist(), values.shape[0]))
+
+    # Each group starts on a new byte. Empty groups still occupy a single byte (as in pack()).
+    group_bytes = np.maximum((group_sizes * group_widths + BITS_PER_BYTE - 1) // BITS_PER_BYTE, 1)
+    group_byte_offsets = np.concatenate([[0], np.cumsum(group_bytes)[:-1]]).astype(int)
+
+    total_bytes = int(np.sum(group_bytes))
+    packed = np.zeros(shape=(total_bytes, ), dtype=np.uint8)
+
+    num_values = int(np.sum(group_sizes))
+    if num_values == 0:
+        return packed.tobytes()
+
+    if table is None:
+        table = get_quantization_table(non_fractional=non_fractional, max_width=int(np.max(group_widths)))
+
+    assert table.non_fractional == non_fractional, 'Table has {0} non-fractional bits. Expected {1}'.format(table.non_fractional, non_fractional)
+
+    # Expand the group parameters to each element
+    group_params = table.lookup(widths=group_widths, shifts=group_shifts)
+
+    element_widths = np.repeat(group_widths, group_sizes)
+    element_scales = np.repeat(group_params.scale, group_sizes)
+    element_max_vals = np.repeat(group_params.max_val, group_sizes)
 
-            # Set bits in the packed string
-            packed[-1] |= current_byte << consumed
-            packed[-1] &= 0xFF
+    group_starts = np.repeat(np.cumsum(group_sizes) - group_sizes, group_sizes)
+    within_group_idx = np.arange(num_values) - group_starts
 
-            # Add to the number of consumed bits
-            used_bits = min(8 - consumed, num_bits)
-            consumed += num_bits
+    # Quantize all values (scaling by a power of two is exact)
+    quantized = np.round(values[0:num_values] * element_scales).astype(int)
+    quantized = np.clip(quantized, a_min=-element_max_vals, a_max=element_max_vals)
+    quantized += element_max_vals + 1
 
-            # If we have consumed more than a byte, then the remaining amount
-            # spills onto the next byte
-            if consumed > 8:
-                consumed = consumed - 8
-                remaining_value = current_byte >> used_bits
+    # Compute the starting bit position of each element
+    bit_positions = np.repeat(group_byte_offsets, group_sizes) * BITS_PER_BYTE + within_group_idx * element_widths
 
-                # Add the remaining value to the running string
-                packed.append(remaining_value)
+    scatter_bits(packed, values=quantized, bit_positions=bit_positions, max_width=int(np.max(element_widths)))
 
-    return bytes(packed)
+    return packed.tobytes()
 
 
 def unpack(encoded: bytes, width: int,  num_values: int) -> List[int]:
@@ -388,31 +510,15 @@ def unpack(encoded: bytes, width: int,  num_values: int) -> List[int]:
     Returns:
         A list of integer values
     """
-    result: List[int] = []
-    current = 0
-    current_length = 0
-    byte_idx = 0
-    mask = (1 << width) - 1
+    return unpack_array(encoded, width=width, num_values=num_values).tolist()
 
-    for i in range(num_values):
-        # Get at at least the next 'width' bits
-        while (current_length < width):
-            current |= (encoded[byte_idx] << current_length)
-            current_length += 8
-            byte_idx += 1
 
-        # Truncate down to 'width' bits
-        value = current & mask
-        result.append(value)
-
-        current = current >> width
-        current_length = current_length - width
-
-    # Include any residual values
-    if len(result) < num_values:
-        result.append(current)
-
-    return result
+def unpack_array(encoded: bytes, width: int, num_values: int) -> np.ndarray:
+    """
+    Unpacks the encoded values (output of pack()) into an int64 array.
+    """
+    reader = BitReader(encoded)
+    return reader.read_array(width=width, num_values=num_values)
 
 
 def get_max_num_groups(target_bytes: int, num_collected: int, num_features: int, width: int) -> int:
@@ -832,7 +938,7 @@ def get_signs(array: List[int]) -> List[int]:
     """
     Returns a binary array of the signs of each value.
     """
-    return [1 if a >= 0 else 0 for a in array]
+    return (np.asarray(array) >= 0).astype(int).tolist()
 
 
 def apply_signs(array: List[int], signs: List[int]) -> List[int]:
@@ -840,7 +946,11 @@ def apply_signs(array: List[int], signs: List[int]) -> List[int]:
     Applies the signs to the given (absolute value) array.
     """
     assert len(array) == len(signs), 'Misaligned inputs ({0} vs {1})'.format(len(array), len(signs))
-    return [x * (2 * s - 1) for x, s in zip(array, signs)]
+
+    if len(array) == 0:
+        return []
+
+    return (np.asarray(array) * (2 * np.asarray(signs) - 1)).tolist()
 
 
 def fixed_point_integer_part(fixed_point_val: int, precision: int) -> int:
@@ -864,6 +974,27 @@ def fixed_point_frac_part(fixed_point_val: int, precision: int) -> int:
     return 0
 
 
+def fixed_point_integer_part_array(fixed_point_vals: np.ndarray, precision: int) -> np.ndarray:
+    """
+    Extracts the integer parts from the given array of fixed point values.
+    """
+    if (precision >= 0):
+        return np.right_shift(fixed_point_vals, precision)
+
+    return np.left_shift(fixed_point_vals, -precision)
+
+
+def fixed_point_frac_part_array(fixed_point_vals: np.ndarray, precision: int) -> np.ndarray:
+    """
+    Extracts the fractional parts from the given array of fixed point values.
+    """
+    if (precision >= 0):
+        mask = (1 << precision) - 1
+        return np.bitwise_and(fixed_point_vals, mask)
+
+    return np.zeros_like(fixed_point_vals)
+
+
 def num_bits_for_value(x: int) -> int:
     """
     Calculates the number if bits required to
@@ -877,54 +1008,84 @@ def num_bits_for_value(x: int) -> int:
     return max(num_bits, 1)
 
 
+def run_starts(changes: np.ndarray) -> np.ndarray:
+    """
+    Computes the start index of each run given a [L - 1] boolean
+    array denoting where consecutive elements differ.
+    """
+    return np.concatenate([[0], np.flatnonzero(changes) + 1])
+
+
+def run_lengths(starts: np.ndarray, num_values: int) -> np.ndarray:
+    """
+    Computes the length of each run from the run start indices.
+    """
+    return np.diff(np.append(starts, num_values))
+
+
+def pack_run_length(encoded: np.ndarray, reps: np.ndarray, signs: np.ndarray) -> bytes:
+    """
+    Serializes the given runs into the RLE byte format.
+    """
+    # Calculate the maximum number of bits needed to encode the values and repetitions
+    encoded_bits = num_bits_for_value(int(np.max(encoded)))
+    reps_bits = num_bits_for_value(int(np.max(reps)))
+
+    metadata = ((encoded_bits << 4) | (reps_bits & 0xF)) & 0xFF
+    metadata = ((len(encoded) << 8) | metadata) & 0xFFFFFF
+
+    # Each field starts on a new byte
+    writer = BitWriter()
+    writer.write(metadata, width=24)
+    writer.write_field(encoded, width=encoded_bits)
+    writer.write_field(reps, width=reps_bits)
+    writer.write_field(signs, width=1)
+
+    return writer.getvalue()
+
+
 def run_length_encode(values: List[int], signs: List[int]) -> str:
     if len(values) <= 0:
         return ''
 
-    current = abs(values[0])
-    current_count = 1
-    current_sign = signs[0]
+    values = np.abs(np.asarray(values))
+    signs = np.asarray(signs)
 
-    encoded: List[int] = []
-    compressed_signs: List[int] = []
-    reps: List[int] = []
+    # A new run begins whenever either the value or the sign changes
+    changes = (values[1:] != values[:-1]) | (signs[1:] != signs[:-1])
+    starts = run_starts(changes)
+    reps = run_lengths(starts, num_values=len(values))
 
-    for i in range(1, len(values)):
-        val = abs(values[i])
+    return pack_run_length(encoded=values[starts], reps=reps, signs=signs[starts])
 
-        if (val != current) or (signs[i] != current_sign):
-            encoded.append(current)
-            reps.append(current_count)
-            compressed_signs.append(current_sign)
 
-            current = val
-            current_count = 1
-            current_sign = signs[i]
-        else:
-            current_count += 1
+def run_length_encode_batch(values: np.ndarray, signs: np.ndarray) -> List[bytes]:
+    """
+    Run-length encodes each row of the given [N, L] arrays. The result
+    for row i is identical to run_length_encode(values[i], signs[i]).
+    """
+    assert len(values.shape) == 2, 'Must provide a 2d array of values'
+    assert values.shape == signs.shape, 'Misaligned inputs ({0} vs {1})'.format(values.shape, signs.shape)
 
-    # Always include the final element
-    encoded.append(current)
-    reps.append(current_count)
-    compressed_signs.append(current_sign)
+    num_rows, num_values = values.shape
+    if num_values <= 0:
+        return ['' for _ in range(num_rows)]
 
-    # Calculate the maximum number of bits needed to encode the values and repetitions
-    max_encoded = np.max(np.abs(encoded))
-    max_reps = np.max(np.abs(reps))
+    values = np.abs(values)
 
-    encoded_bits = num_bits_for_value(max_encoded)
-    reps_bits = num_bits_for_value(max_reps)
+    # Mark run boundaries across the entire batch. Each row always starts a new run.
+    is_start = np.ones(values.shape, dtype=bool)
+    is_start[:, 1:] = (values[:, 1:] != values[:, :-1]) | (signs[:, 1:] != signs[:, :-1])
 
-    encoded_values = pack(encoded, width=encoded_bits)
-    encoded_reps = pack(reps, width=reps_bits)
-    encoded_signs = pack(compressed_signs, width=1)
+    row_idx, col_idx = np.nonzero(is_start)
+    row_splits = np.searchsorted(row_idx, np.arange(1, num_rows))
 
-    metadata = ((encoded_bits << 4) | (reps_bits & 0xF)) & 0xFF
-    metadata = ((len(encoded) << 8) | metadata) & 0xFFFFFF
-
-    metadata_bytes = metadata.to_bytes(3, 'little')
+    results: List[bytes] = []
+    for row, starts in enumerate(np.split(col_idx, row_splits)):
+        reps = run_lengths(starts, num_values=num_values)
+        results.append(pack_run_length(encoded=values[row, starts], reps=reps, signs=signs[row, starts]))
 
-    return metadata_bytes + encoded_values + encoded_reps + encoded_signs
+    return results
 
 
 def run_length_decode(encoded: bytes) -> List[int]:
@@ -932,30 +1093,21 @@ def run_length_decode(encoded: bytes) -> List[int]:
     Decodes the given RLE values.
     """
     metadata = int.from_bytes(encoded[0:3], 'little')
-    encoded = encoded[3:]
+    reader = BitReader(encoded, offset=3)
 
     num_values = (metadata >> 8) & 0xFFF
     value_bits = (metadata >> 4) & 0xF
     rep_bits = metadata & 0xF
 
-    value_bytes = int(math.ceil((num_values * value_bits) / BITS_PER_BYTE))
-    rep_bytes = int(math.ceil((num_values * rep_bits) / BITS_PER_BYTE))
-    sign_bytes = int(math.ceil(num_values / BITS_PER_BYTE))
-
-    decoded_values = unpack(encoded[0:value_bytes], width=value_bits, num_values=num_values)
-    encoded = encoded[value_bytes:]
-
-    decoded_reps = unpack(encoded[0:rep_bytes], width=rep_bits, num_values=num_values)
-    encoded = encoded[rep_bytes:]
+    decoded_values = reader.read_array(width=value_bits, num_values=num_values)
+    reader.align()
 
-    decoded_signs = unpack(encoded[0:sign_bytes], width=1, num_values=num_values)
+    decoded_reps = reader.read_array(width=rep_bits, num_values=num_values)
+    reader.align()
 
-    values: List[int] = []
-    signs: List[int] = []
+    decoded_signs = reader.read_array(width=1, num_values=num_values)
 
-    for i in range(num_values):
-        for j in range(decoded_reps[i]):
-            values.append(decoded_values[i])
-            signs.append(decoded_signs[i])
+    values = np.repeat(decoded_values, decoded_reps).astype(int).tolist()
+    signs = np.repeat(decoded_signs, decoded_reps).astype(int).tolist()
 
     return values, signs
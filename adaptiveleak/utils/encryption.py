@@ -1,10 +1,17 @@
+import hashlib
+import hmac as std_hmac
+import numpy as np
+import threading
 from enum import Enum, auto
 from Cryptodome.Cipher import AES, ChaCha20
 from Cryptodome.Hash import HMAC, SHA256
 from Cryptodome.Random import get_random_bytes
 from Cryptodome.Util.Padding import pad, unpad
+from Cryptodome.Util.strxor import strxor
+from typing import List, Optional, Tuple, Union
 
 from .data_types import EncryptionMode
+from .random_pool import RandomPool
 
 
 AES_BLOCK_SIZE = 16
@@ -146,6 +153,20 @@ def decrypt_chacha20(ciphertext: bytes, key: bytes) -> bytes:
     return message
 
 
+def encrypted_size(num_bytes: int, mode: EncryptionMode) -> int:
+    """
+    Returns the size of the ciphertext (see encrypt()) of a message with the
+    given number of bytes, without performing the encryption.
+    """
+    if mode == EncryptionMode.BLOCK:
+        num_blocks = (num_bytes + AES_BLOCK_SIZE - 1) // AES_BLOCK_SIZE
+        return AES_BLOCK_SIZE * (num_blocks + 1)  # Includes the IV
+    elif mode == EncryptionMode.STREAM:
+        return num_bytes + CHACHA_NONCE_LEN
+    else:
+        raise ValueError('Unknown encryption mode: {0}'.format(mode))
+
+
 def add_hmac(message: bytes, secret: bytes) -> bytes:
     """
     Generates and appends a message authentication code
@@ -180,3 +201,204 @@ def verify_hmac(mac: bytes, message: bytes, secret: bytes) -> bool:
         return True
     except ValueError:
         return False
+
+
+class Encryptor:
+    """
+    Encrypts and authenticates messages under fixed keys. The message formats
+    match encrypt() and add_hmac(). Key-dependent state (the AES key schedule and the
+    keyed HMAC) is built once and reused, and the IVs / nonces come from a buffered
+    CSPRNG pool.
+
+    Single AES encryptions reuse one CBC context, which continues its chain across messages.
+    We fold the previous chaining block into each message's first block, so every ciphertext
+    matches a fresh CBC context under its own IV. encrypt_many() instead runs CBC across all
+    messages in lock-step with the shared ECB schedule (one call per block position). AES
+    decryption only needs the ECB schedule because CBC decryption is parallel.
+    """
+
+    def __init__(self, key: bytes, mode: EncryptionMode, hmac_secret: Optional[bytes] = None, random_pool: Optional[RandomPool] = None):
+        if mode == EncryptionMode.BLOCK:
+            assert len(key) == AES_BLOCK_SIZE, 'Must provide a {0}-byte key. Got {1} bytes.'.format(AES_BLOCK_SIZE, len(key))
+            self._ecb = AES.new(key, AES.MODE_ECB)
+            self._cbc = AES.new(key, AES.MODE_CBC, bytes(AES_BLOCK_SIZE))
+            self._cbc_chain = bytes(AES_BLOCK_SIZE)  # The last ciphertext block of the CBC context
+        elif mode == EncryptionMode.STREAM:
+            assert len(key) == CHACHA_KEY_LEN, 'Must provide a {0}-byte key. Got {1} bytes'.format(CHACHA_KEY_LEN, len(key))
+            self._ecb = None
+            self._cbc = None
+        else:
+            raise ValueError('Unknown encryption mode: {0}'.format(mode))
+
+        self._key = key
+        self._mode = mode
+        self._random_pool = random_pool if random_pool is not None else RandomPool()
+        self._cbc_lock = threading.Lock()
+
+        # The keyed HMAC state is copied for each message
+        self._hmac = std_hmac.new(hmac_secret, digestmod=hashlib.sha256) if hmac_secret is not None else None
+
+    @property
+    def mode(self) -> EncryptionMode:
+        return self._mode
+
+    def encrypt(self, message: bytes) -> bytes:
+        """
+        Encrypts the message (see encrypt()).
+        """
+        if self._mode == EncryptionMode.BLOCK:
+            iv = self._random_pool.get_bytes(AES_BLOCK_SIZE)
+
+            if (len(message) % AES_BLOCK_SIZE) != 0:
+                message = pad(message, block_size=AES_BLOCK_SIZE, style='x923')
+
+            if len(message) == 0:
+                return iv
+
+            # The shared CBC context chains from the last ciphertext block it produced. XOR-ing
+            # this block (and the new IV) into the first plaintext block gives E(P_1 XOR IV).
+            with self._cbc_lock:
+                first_block = strxor(message[:AES_BLOCK_SIZE], strxor(iv, self._cbc_chain))
+                ciphertext = self._cbc.encrypt(first_block + message[AES_BLOCK_SIZE:])
+                self._cbc_chain = ciphertext[-AES_BLOCK_SIZE:]
+
+            return iv + ciphertext
+        else:
+            nonce = self._random_pool.get_bytes(CHACHA_NONCE_LEN)
+            return nonce + ChaCha20.new(key=self._key, nonce=nonce).encrypt(message)
+
+    def decrypt(self, ciphertext: Union[bytes, memoryview]) -> bytes:
+        """
+        Decrypts the ciphertext (see decrypt()).
+        """
+        ciphertext = bytes(ciphertext)
+
+        if self._mode == EncryptionMode.BLOCK:
+            if (len(ciphertext) < AES_BLOCK_SIZE) or ((len(ciphertext) % AES_BLOCK_SIZE) != 0):
+                raise ValueError('AES ciphertexts must be a positive multiple of {0} bytes. Got {1}.'.format(AES_BLOCK_SIZE, len(ciphertext)))
+
+            # Each plaintext block is D(C_i) XOR C_{i-1}, where C_0 is the IV
+            decrypted = self._ecb.decrypt(ciphertext[AES_BLOCK_SIZE:])
+            chained = int.from_bytes(decrypted, 'little') ^ int.from_bytes(ciphertext[:-AES_BLOCK_SIZE], 'little')
+            return chained.to_bytes(len(decrypted), 'little')
+        else:
+            nonce = ciphertext[:CHACHA_NONCE_LEN]
+            return ChaCha20.new(key=self._key, nonce=nonce).decrypt(ciphertext[CHACHA_NONCE_LEN:])
+
+    def encrypt_many(self, messages: List[bytes]) -> Tuple[bytearray, np.ndarray]:
+        """
+        Encrypts a batch of messages into a single contiguous buffer.
+
+        Args:
+            messages: A list of N plaintext messages
+        Returns:
+            A tuple of two elements:
+                (1) The buffer holding all ciphertexts
+                (2) An [N + 1] array of offsets where ciphertext i
+                    is buffer[offsets[i]:offsets[i + 1]]
+        """
+        num_messages = len(messages)
+
+        if self._mode == EncryptionMode.STREAM:
+            nonces = self._random_pool.get_bytes(CHACHA_NONCE_LEN * num_messages)
+
+            buffer = bytearray()
+            offsets = np.zeros(shape=(num_messages + 1, ), dtype=np.int64)
+
+            for idx, message in enumerate(messages):
+                nonce = nonces[idx * CHACHA_NONCE_LEN:(idx + 1) * CHACHA_NONCE_LEN]
+                buffer += nonce
+                buffer += ChaCha20.new(key=self._key, nonce=nonce).encrypt(message)
+                offsets[idx + 1] = len(buffer)
+
+            return buffer, offsets
+
+        # Lay out the (padded) messages as [N, B, 16] blocks
+        padded = [m if (len(m) % AES_BLOCK_SIZE) == 0 else pad(m, block_size=AES_BLOCK_SIZE, style='x923') for m in messages]
+        num_blocks = np.array([len(m) // AES_BLOCK_SIZE for m in padded], dtype=np.int64)
+        max_blocks = int(np.max(num_blocks)) if num_messages > 0 else 0
+
+        blocks = np.zeros(shape=(num_messages, max_blocks + 1, AES_BLOCK_SIZE), dtype=np.uint8)
+        blocks[:, 0] = np.frombuffer(self._random_pool.get_bytes(AES_BLOCK_SIZE * num_messages), dtype=np.uint8).reshape(-1, AES_BLOCK_SIZE)
+
+        for idx, message in enumerate(padded):
+            blocks[idx, 1:num_blocks[idx] + 1] = np.frombuffer(message, dtype=np.uint8).reshape(-1, AES_BLOCK_SIZE)
+
+        # Run CBC on all messages in lock-step, C_j = E(P_j XOR C_{j-1})
+        for block_idx in range(1, max_blocks + 1):
+            active = np.flatnonzero(num_blocks >= block_idx)
+            chained = np.bitwise_xor(blocks[active, block_idx], blocks[active, block_idx - 1])
+            encrypted = self._ecb.encrypt(chained.tobytes())
+            blocks[active, block_idx] = np.frombuffer(encrypted, dtype=np.uint8).reshape(-1, AES_BLOCK_SIZE)
+
+        # Collect the IV and ciphertext blocks of each message
+        is_valid = np.arange(max_blocks + 1).reshape(1, -1) <= num_blocks.reshape(-1, 1)  # [N, B + 1]
+
+        offsets = np.zeros(shape=(num_messages + 1, ), dtype=np.int64)
+        offsets[1:] = np.cumsum((num_blocks + 1) * AES_BLOCK_SIZE)
+
+        return bytearray(blocks[is_valid].tobytes()), offsets
+
+    def decrypt_many(self, buffer: Union[bytes, bytearray, memoryview], offsets: np.ndarray) -> Tuple[bytearray, np.ndarray]:
+        """
+        Decrypts a batch of ciphertexts (see encrypt_many()).
+
+        Args:
+            buffer: The buffer holding all ciphertexts
+            offsets: An [N + 1] array of the ciphertext offsets
+        Returns:
+            A tuple of two elements:
+                (1) The buffer holding all plaintexts
+                (2) An [N + 1] array of the plaintext offsets
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        num_messages = offsets.shape[0] - 1
+        view = memoryview(buffer)
+
+        if self._mode == EncryptionMode.STREAM:
+            plaintext = bytearray()
+            plain_offsets = np.zeros(shape=(num_messages + 1, ), dtype=np.int64)
+
+            for idx in range(num_messages):
+                plaintext += self.decrypt(view[offsets[idx]:offsets[idx + 1]])
+                plain_offsets[idx + 1] = len(plaintext)
+
+            return plaintext, plain_offsets
+
+        lengths = np.diff(offsets)
+        if np.any(lengths < AES_BLOCK_SIZE) or np.any((lengths % AES_BLOCK_SIZE) != 0):
+            raise ValueError('AES ciphertexts must be a positive multiple of {0} bytes.'.format(AES_BLOCK_SIZE))
+
+        # Decrypt every block at once. Each plaintext block is D(C_i) XOR C_{i-1}, and the
+        # IV blocks (whose decryptions we discard) provide the first chaining values.
+        data = np.frombuffer(view[offsets[0]:offsets[-1]], dtype=np.uint8).reshape(-1, AES_BLOCK_SIZE)
+        decrypted = np.frombuffer(self._ecb.decrypt(data.tobytes()), dtype=np.uint8).reshape(-1, AES_BLOCK_SIZE)
+
+        chained = np.empty_like(decrypted)
+        chained[1:] = np.bitwise_xor(decrypted[1:], data[:-1])
+
+        is_iv = np.zeros(shape=(data.shape[0], ), dtype=bool)
+        is_iv[(offsets[:-1] - offsets[0]) // AES_BLOCK_SIZE] = True
+
+        plain_offsets = offsets - offsets[0] - AES_BLOCK_SIZE * np.arange(num_messages + 1)
+        return bytearray(chained[~is_iv].tobytes()), plain_offsets
+
+    def add_hmac(self, message: bytes) -> bytes:
+        """
+        Prepends the HMAC-SHA256 tag (see add_hmac()).
+        """
+        assert self._hmac is not None, 'Must provide an HMAC secret'
+
+        hmac = self._hmac.copy()
+        hmac.update(message)
+        return hmac.digest() + message
+
+    def verify_hmac(self, mac: bytes, message: bytes) -> bool:
+        """
+        Checks the HMAC-SHA256 tag of the message (see verify_hmac()).
+        """
+        assert self._hmac is not None, 'Must provide an HMAC secret'
+
+        hmac = self._hmac.copy()
+        hmac.update(message)
+        return std_hmac.compare_digest(hmac.digest(), bytes(mac))
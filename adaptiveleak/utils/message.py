@@ -1,63 +1,126 @@
 import numpy as np
-import math
-import time
-import bz2
-from functools import reduce, partial
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Union
 
-from adaptiveleak.utils.constants import SHIFT_BITS, BITS_PER_BYTE, SMALL_NUMBER, MAX_SHIFT_GROUPS, MIN_WIDTH
-from adaptiveleak.utils.data_utils import array_to_fp, array_to_float, pack, unpack, select_range_shift, to_fixed_point, to_float, get_signs, num_bits_for_value
-from adaptiveleak.utils.data_utils import run_length_encode, run_length_decode, integer_part, fractional_part, apply_signs, select_range_shifts_array
-from adaptiveleak.utils.data_utils import fixed_point_integer_part, fixed_point_frac_part, balance_group_size, array_to_fp_shifted, array_to_float_shifted, set_widths
-from adaptiveleak.utils.shifting import merge_shift_groups
+from adaptiveleak.utils.bits import BitWriter, BitReader
+from adaptiveleak.utils.compression import Codec, make_codec, DEFAULT_CODEC
+from adaptiveleak.utils.constants import SHIFT_BITS, BITS_PER_BYTE, MIN_WIDTH
+from adaptiveleak.utils.data_utils import num_bits_for_value, run_length_encode, run_length_decode
+from adaptiveleak.utils.data_utils import QuantizationTable, get_quantization_table
+from adaptiveleak.utils.data_utils import quantize_and_pack_groups, fixed_point_integer_part_array, fixed_point_frac_part_array
 
 
 def encode_collected_mask(collected_indices: List[int], seq_length: int) -> bytes:
     """
     Creates a bit-mask denoting the sent measurements in the sequence.
     """
-    mask = 0
-    collected_idx = 0
-    mask_idx = -1
-    offset = 0
+    writer = BitWriter()
+    write_collected_mask(writer, collected_indices=collected_indices, seq_length=seq_length)
+    return writer.getvalue()
 
-    num_bytes = int(math.ceil(seq_length / BITS_PER_BYTE))
-    masks: List[int] = [0 for _ in range(num_bytes)]
 
-    for seq_idx in range(seq_length):
-        if (seq_idx % BITS_PER_BYTE) == 0:
-            mask_idx += 1
-            offset = seq_idx
-
-        if (collected_idx < len(collected_indices)) and (collected_indices[collected_idx] == seq_idx):
-            masks[mask_idx] |= 1 << (seq_idx - offset)
-            collected_idx += 1
+def write_collected_mask(writer: BitWriter, collected_indices: List[int], seq_length: int):
+    """
+    Writes the (byte-aligned) bit-mask of the collected indices.
+    """
+    is_collected = np.zeros(shape=(seq_length, ), dtype=np.int64)
+    is_collected[collected_indices] = 1
 
-    return bytes(masks)
+    writer.align()
+    writer.write_array(is_collected, width=1)
+    writer.align()
 
 
 def decode_collected_mask(bitmask: bytes, seq_length: int) -> List[int]:
     """
     Decodes the collected bit-mask into a list of indices.
     """
-    indices: List[int] = []
+    return read_collected_mask(BitReader(bitmask), seq_length=seq_length)
+
+
+def read_collected_mask(reader: BitReader, seq_length: int) -> List[int]:
+    """
+    Reads the (byte-aligned) bit-mask and returns the collected indices.
+    """
+    is_collected = reader.read_array(width=1, num_values=seq_length)
+    reader.align()
+
+    return np.flatnonzero(is_collected).tolist()
+
+
+def encode_compressed_payload(quantized: np.ndarray, precision: int) -> bytes:
+    """
+    Creates the (uncompressed) payload for the compressed encoding. The payload
+    holds the RLE integer parts followed by the packed fractional parts of the
+    delta-encoded values.
+
+    Args:
+        quantized: A [K * D] array of fixed-point measurements (feature-major)
+        precision: The fixed point precision of each feature
+    Returns:
+        The payload as a byte string
+    """
+    # Delta encode the features
+    flattened = delta_encode(quantized)
+
+    # Take the absolute value of the flattened values
+    abs_values = np.abs(flattened)
+
+    # Split the features into integer and fractional parts
+    integer_parts = fixed_point_integer_part_array(abs_values, precision=precision)
+    fractional_parts = fixed_point_frac_part_array(abs_values, precision=precision)
+
+    # Encode the integer part using RLE
+    integer_signs = (flattened >= 0).astype(int)
+
+    encoded_integers = run_length_encode(integer_parts, integer_signs)
+
+    writer = BitWriter()
+    writer.write_bytes(len(encoded_integers).to_bytes(2, 'little'))
+    writer.write_bytes(encoded_integers)
+    writer.write_field(fractional_parts, width=precision)
+
+    return writer.getvalue()
+
+
+def decode_compressed_payload(payload: Union[bytes, memoryview], precision: int, num_values: int) -> np.ndarray:
+    """
+    Recovers the fixed-point values from a payload created by encode_compressed_payload.
+
+    Args:
+        payload: The (decompressed) payload
+        precision: The fixed point precision of each feature
+        num_values: The number of encoded values (K * D)
+    Returns:
+        A [K * D] array of fixed-point measurements (feature-major)
+    """
+    payload = memoryview(payload)
+
+    # Extract the length of the integer part
+    int_part_length = int.from_bytes(payload[0:2], 'little')
 
-    mask_idx = -1
-    offset = 0
+    # Unpack the two numerical components
+    encoded_integers = payload[2:2+int_part_length]
+    decoded_integers, decoded_signs = run_length_decode(encoded_integers)
 
-    for seq_idx in range(seq_length):
-        if (seq_idx % BITS_PER_BYTE) == 0:
-            mask_idx += 1
-            offset = seq_idx
+    reader = BitReader(payload, offset=2+int_part_length)
+    decoded_fracs = reader.read_array(width=precision, num_values=num_values)
 
-        is_present = bitmask[mask_idx] & (1 << (seq_idx - offset))
-        if is_present != 0:
-            indices.append(seq_idx)
+    # Combine the numerical parts
+    combined = np.left_shift(decoded_integers, precision) | decoded_fracs[0:len(decoded_integers)]
+    combined *= 2 * np.asarray(decoded_signs, dtype=int) - 1
 
-    return indices
+    # Decode the delta-encoded measurements
+    return delta_decode(combined)
 
 
-def encode_standard_measurements(measurements: np.ndarray, collected_indices: List[int], seq_length: int, width: int, precision: int, should_compress: bool) -> bytes:
+def encode_standard_measurements(measurements: np.ndarray,
+                                 collected_indices: List[int],
+                                 seq_length: int,
+                                 width: int,
+                                 precision: int,
+                                 should_compress: bool,
+                                 codec: Optional[Codec] = None,
+                                 table: Optional[QuantizationTable] = None) -> bytes:
     """
     Encodes the measurements into single-byte features.
 
@@ -69,59 +132,69 @@ def encode_standard_measurements(measurements: np.ndarray, collected_indices: Li
         width: The bit-width of each feature
         precision: The fixed point precision of each feature
         should_compress: Whether the function should compress the measurements after encoding
+        codec: The compressor to use when should_compress is set. Defaults to bz2.
+        table: The quantization table for (width - precision) non-fractional bits. Defaults to the shared table.
     Returns:
         A hex string that represents the encoded measurements.
     """
+    writer = BitWriter()
+    write_standard_measurements(writer,
+                                measurements=measurements,
+                                collected_indices=collected_indices,
+                                seq_length=seq_length,
+                                width=width,
+                                precision=precision,
+                                should_compress=should_compress,
+                                codec=codec,
+                                table=table)
+    return writer.getvalue()
+
+
+def write_standard_measurements(writer: BitWriter,
+                                measurements: np.ndarray,
+                                collected_indices: List[int],
+                                seq_length: int,
+                                width: int,
+                                precision: int,
+                                should_compress: bool,
+                                codec: Optional[Codec] = None,
+                                table: Optional[QuantizationTable] = None):
+    """
+    Writes the encoded measurements (see encode_standard_measurements()) to the given (byte-aligned) writer.
+    """
     assert len(measurements.shape) == 2, 'Must provide a 2d array of measurements.'
 
+    table = table if table is not None else get_quantization_table(non_fractional=width - precision, max_width=width)
+
     # Flatten the measurements into a 1d array
     flattened = measurements.T.reshape(-1)
 
     # Quantize the measurements
-    quantized = array_to_fp(flattened, precision=precision, width=width)
-
-    if should_compress:
-        # Delta encode the features
-        flattened = delta_encode(quantized)
-
-        # Take the absolute value of the flattened values
-        abs_values = np.abs(flattened)
-
-        # Split the features into integer and fractional parts
-        integer_parts = list(map(partial(fixed_point_integer_part, precision=precision), abs_values))
+    quantized = table.to_fixed_point(flattened, width=width)
 
-        frac_fn = np.vectorize(partial(fixed_point_frac_part, precision=precision))
-        fractional_parts = frac_fn(abs_values)
+    # Write the collected indices as a bit-mask
+    write_collected_mask(writer, collected_indices=collected_indices, seq_length=seq_length)
 
-        # Encode the integer part using RLE
-        integer_values = np.abs(integer_parts)
-        integer_signs = get_signs(flattened)
-
-        encoded_integers = run_length_encode(integer_values, integer_signs)
-
-        encoded_fracs = pack(fractional_parts.astype(int).tolist(), width=precision)
-
-        int_part_length = len(encoded_integers).to_bytes(2, 'little')
-        encoded_measurements = int_part_length + encoded_integers + encoded_fracs
+    if should_compress:
+        codec = codec if codec is not None else make_codec(DEFAULT_CODEC)
 
-        encoded_measurements = bz2.compress(encoded_measurements)
+        payload = encode_compressed_payload(quantized, precision=precision)
+        writer.write_bytes(codec.compress(payload))
     else:
-        # Add the offset value to ensure all positive values
-        encoded = quantized + (1 << (width - 1))
-
-        # Flatten measurements array and pack into a single bit-string
-        encoded_list = encoded.astype(int).tolist()  # [K * D]
-
-        encoded_measurements = pack(encoded_list, width=width)  # [K * D]
-
-    # Convert the collected indices into a byte array
-    collected_mask = encode_collected_mask(collected_indices, seq_length=seq_length)
-
-    # Append fields together
-    return collected_mask + encoded_measurements
-
-
-def decode_standard_measurements(byte_str: bytes, seq_length: int, num_features: int, width: int, precision: int, should_compress: bool) -> Tuple[np.ndarray, List[int], List[int]]:
+        # Add the offset value to ensure all positive values and pack into a single bit-string
+        encoded = quantized + (1 << (width - 1))  # [K * D]
+        writer.write_field(encoded, width=width)
+
+
+def decode_standard_measurements(byte_str: Union[bytes, memoryview],
+                                 seq_length: int,
+                                 num_features: int,
+                                 width: int,
+                                 precision: int,
+                                 should_compress: bool,
+                                 out: Optional[np.ndarray] = None,
+                                 codec: Optional[Codec] = None,
+                                 table: Optional[QuantizationTable] = None) -> Tuple[np.ndarray, List[int], List[int]]:
     """
     Decodes the given byte string into an array of measurements.
 
@@ -132,55 +205,42 @@ def decode_standard_measurements(byte_str: bytes, seq_length: int, num_features:
         width: The bit-width of each feature
         precision: The fixed-point precision of each feature
         should_compress: Whether the measurements were compressed during encoding
+        out: An optional [L, D] float64 buffer (L >= K) which holds the decoded values
+        codec: The compressor used during encoding. Defaults to bz2.
+        table: The quantization table for (width - precision) non-fractional bits. Defaults to the shared table.
     Returns:
-        A [K, D] array of recovered measurements
+        A [K, D] array of recovered measurements. When given an output buffer,
+        this array is a view into the first K rows of the buffer.
     """
+    table = table if table is not None else get_quantization_table(non_fractional=width - precision, max_width=width)
+
+    encoded = memoryview(byte_str)
+    reader = BitReader(encoded)
+
     # Retrieve the number of collected measurements
-    num_mask_bytes = int(math.ceil(seq_length / BITS_PER_BYTE))
-    bitmask = byte_str[0:num_mask_bytes]
+    collected_indices = read_collected_mask(reader, seq_length=seq_length)
 
-    collected_indices = decode_collected_mask(bitmask=bitmask,
-                                              seq_length=seq_length)
+    num_collected = len(collected_indices)
+    decoded = make_output_buffer(out=out, num_collected=num_collected, num_features=num_features)
 
     # Unpack the rest of the message
     if should_compress:
-        decompressed = bz2.decompress(byte_str[num_mask_bytes:])
-
-        # Extract the length of the integer part
-        int_part_length = int.from_bytes(decompressed[0:2], 'little')
-
-        # Unpack the two numerical components
-        encoded_integers = decompressed[2:2+int_part_length]
-        encoded_fracs = decompressed[2+int_part_length:]
-
-        decoded_integers, decoded_signs = run_length_decode(encoded_integers)
-
-        decoded_fracs = unpack(encoded=encoded_fracs,
-                               width=precision,
-                               num_values=(len(collected_indices) * num_features))
+        codec = codec if codec is not None else make_codec(DEFAULT_CODEC)
 
-        # Combine the numerical parts
-        combined = [(v << precision) | frac for v, frac in zip(decoded_integers, decoded_fracs)]
-        combined = apply_signs(combined, decoded_signs)
-
-        # Decode the delta-encoded measurements
-        decoded = delta_decode(np.array(combined))
-
-        decoded = array_to_float(decoded, precision=precision)
+        payload = codec.decompress(encoded[reader.tell():])
+        raw_values = decode_compressed_payload(payload,
+                                               precision=precision,
+                                               num_values=num_collected * num_features)
     else:
-        decoded_values = unpack(encoded=byte_str[num_mask_bytes:],
-                                width=width,
-                                num_values=len(collected_indices) * num_features)
+        decoded_values = reader.read_array(width=width, num_values=num_collected * num_features)
 
         # Subtract the offset value (2^{w-1})
-        offset = 1 << (width - 1)
-        raw_values = np.array([x - offset for x in decoded_values])
+        raw_values = decoded_values - (1 << (width - 1))
 
-        # Decode the measurement values
-        decoded = array_to_float(raw_values, precision=precision)
+    # Write the feature-major values into the [K, D] output
+    decoded.T[:] = table.to_float(raw_values, width=width).reshape(num_features, num_collected)
 
-    # Reshape to the proper size
-    return decoded.reshape(num_features, -1).T, collected_indices, [width]
+    return decoded, collected_indices, [width]
 
 
 def encode_stable_measurements(measurements: np.ndarray,
@@ -189,7 +249,8 @@ def encode_stable_measurements(measurements: np.ndarray,
                                shifts: List[int],
                                group_sizes: List[int],
                                seq_length: int,
-                               non_fractional: int) -> bytes:
+                               non_fractional: int,
+                               table: Optional[QuantizationTable] = None) -> bytes:
     """
     Encodes the measurements into sets of grouped features with different widths.
 
@@ -202,9 +263,35 @@ def encode_stable_measurements(measurements: np.ndarray,
         group_sizes: The number of features in each group
         seq_length: The length of the (full) sequence
         non_fractional: The number of non-fractional bits per value
+        table: The quantization table for the non-fractional bits. Defaults to the shared table.
     Returns:
         A hex string that represents the encoded measurements.
     """
+    writer = BitWriter()
+    write_stable_measurements(writer,
+                              measurements=measurements,
+                              collected_indices=collected_indices,
+                              widths=widths,
+                              shifts=shifts,
+                              group_sizes=group_sizes,
+                              seq_length=seq_length,
+                              non_fractional=non_fractional,
+                              table=table)
+    return writer.getvalue()
+
+
+def write_stable_measurements(writer: BitWriter,
+                              measurements: np.ndarray,
+                              collected_indices: List[int],
+                              widths: List[int],
+                              shifts: List[int],
+                              group_sizes: List[int],
+                              seq_length: int,
+                              non_fractional: int,
+                              table: Optional[QuantizationTable] = None):
+    """
+    Writes the grouped measurements (see encode_stable_measurements()) to the given (byte-aligned) writer.
+    """
     assert len(measurements.shape) == 2, 'Must provide a 2d array of measurements.'
     assert len(group_sizes) == len(widths), 'Must have an equal number of group sizes and widths'
     assert len(group_sizes) == len(shifts), 'Must have an equal number of group sizes and shifts'
@@ -215,110 +302,90 @@ def encode_stable_measurements(measurements: np.ndarray,
     # Divide features into groups and encode separately
     flattened = measurements.T.reshape(-1)  # [K * D]
 
-    # Convert the collected indices into a byte array
-    collected_mask = encode_collected_mask(collected_indices, seq_length=seq_length)
+    # Write the collected indices as a bit-mask
+    write_collected_mask(writer, collected_indices=collected_indices, seq_length=seq_length)
 
     # Ensure positive shift values for encoding
     shift_offset = (1 << (SHIFT_BITS - 1))
     shifts_to_encode = [s + shift_offset for s in shifts]
 
     # Encode the shifts
-    encoded_shifts = encode_shifts(shifts=shifts_to_encode,
-                                   reps=group_sizes,
-                                   widths=widths,
-                                   num_shift_bits=SHIFT_BITS,
-                                   min_width=MIN_WIDTH)
-
-    # Encode each group of features
-    encoded_groups: List[bytes] = []
-
-    start_idx = 0
-    for size, shift, width in zip(group_sizes, shifts, widths):
-        # Get the features for this group
-        end_idx = start_idx + size
-        group_features = flattened[start_idx:end_idx]
-
-        # Encode the features
-        precision = width - non_fractional
-        quantized = array_to_fp(group_features,
-                                width=width,
-                                precision=precision - shift)
-
-        quantized += (1 << (width - 1))
-
-        encoded_group = pack(quantized, width=width)
-        encoded_groups.append(encoded_group)
-
-        start_idx += size
-
-    # Pack the data features
-    encoded_features = reduce(lambda x, y: x + y, encoded_groups)
-
-    # Convert to bytes
-    return collected_mask + encoded_shifts + encoded_features
-
-
-def decode_stable_measurements(encoded: bytes, seq_length: int, num_features: int, non_fractional: int) -> Tuple[np.ndarray, List[int], List[int]]:
+    write_shifts(writer,
+                 shifts=shifts_to_encode,
+                 reps=group_sizes,
+                 widths=widths,
+                 num_shift_bits=SHIFT_BITS,
+                 min_width=MIN_WIDTH)
+
+    # Quantize and pack all groups of features
+    encoded_features = quantize_and_pack_groups(flattened,
+                                                widths=widths,
+                                                shifts=shifts,
+                                                group_sizes=group_sizes,
+                                                non_fractional=non_fractional,
+                                                table=table)
+    writer.write_bytes(encoded_features)
+
+
+def decode_stable_measurements(encoded: Union[bytes, memoryview],
+                               seq_length: int,
+                               num_features: int,
+                               non_fractional: int,
+                               out: Optional[np.ndarray] = None,
+                               table: Optional[QuantizationTable] = None) -> Tuple[np.ndarray, List[int], List[int]]:
     """
     Decodes the given byte string into an array of measurements.
 
     Args:
-        byte_str: The raw byte string containing the encoded measurements
+        encoded: The raw byte string containing the encoded measurements
         seq_length: The length of the full sequence (T)
         num_features: The number of features in each measurement (D)
-        width: The bit-width of each feature
-        precision: The fixed-point precision of each feature
-        should_compress: Whether the measurements were compressed during encoding
+        non_fractional: The number of non-fractional bits per value
+        out: An optional [L, D] float64 buffer (L >= K) which holds the decoded values
+        table: The quantization table for the non-fractional bits. Defaults to the shared table.
     Returns:
-        A [K, D] array of recovered measurements
+        A [K, D] array of recovered measurements. When given an output buffer,
+        this array is a view into the first K rows of the buffer.
     """
-    # Retrieve the number of collected measurements
-    num_mask_bytes = int(math.ceil(seq_length / BITS_PER_BYTE))
-    bitmask = encoded[0:num_mask_bytes]
+    reader = BitReader(encoded)
 
-    collected_indices = decode_collected_mask(bitmask=bitmask,
-                                              seq_length=seq_length)
+    # Retrieve the number of collected measurements
+    collected_indices = read_collected_mask(reader, seq_length=seq_length)
 
-    encoded = encoded[num_mask_bytes:]
+    num_collected = len(collected_indices)
+    decoded = make_output_buffer(out=out, num_collected=num_collected, num_features=num_features)
 
     # Retrieve the shifts and run-length decode
-    shifts, widths, reps, shift_bytes = decode_shifts(encoded=encoded, num_shift_bits=SHIFT_BITS, min_width=MIN_WIDTH)
+    shifts, widths, reps = read_shifts(reader,
+                                       num_shift_bits=SHIFT_BITS,
+                                       min_width=MIN_WIDTH)
 
     # Remove the shift offset
     shift_offset = (1 << (SHIFT_BITS - 1))
     shifts = [s - shift_offset for s in shifts]
 
-    encoded = encoded[shift_bytes:]
-
-    decoded_features: List[float] = []
-
-    byte_idx = 0
-    for size, shift, width in zip(reps, shifts, widths):
-        # Get the encoded data for this group
-        num_group_bytes = int(math.ceil((size * width) / BITS_PER_BYTE))
-        encoded_group = encoded[byte_idx:byte_idx+num_group_bytes]
+    if table is None:
+        table = get_quantization_table(non_fractional=non_fractional, max_width=max(widths, default=MIN_WIDTH))
 
-        # Unpack the group features
-        raw_group_features = unpack(encoded=encoded_group,
-                                    width=width,
-                                    num_values=size)
+    # Unpack the (byte-aligned) group features
+    raw_groups: List[np.ndarray] = []
+    for size, width in zip(reps, widths):
+        raw_groups.append(reader.read_array(width=width, num_values=size))
+        reader.align()
 
-        # Convert back to floating point
-        offset = (1 << (width - 1))
-        raw_group_features = [(x - offset) for x in raw_group_features]
+    feature_idx = sum(reps)
+    if feature_idx != num_collected * num_features:
+        raise ValueError('Decoded {0} features but expected {1}'.format(feature_idx, num_collected * num_features))
 
-        precision = width - non_fractional
-        group_features = array_to_float(raw_group_features,
-                                        precision=precision - shift)
+    # Remove the offset (2^{w-1}) and convert back to floating point. The measurements
+    # are encoded in feature-major order, so we write into the transposed output.
+    group_params = table.lookup(widths=widths, shifts=shifts)
+    raw_features = np.concatenate(raw_groups) if len(raw_groups) > 0 else np.zeros(shape=(0, ), dtype=int)
 
-        decoded_features.extend(group_features)
-        byte_idx += num_group_bytes
+    raw_features -= np.repeat(group_params.max_val + 1, reps)
+    decoded.T[:] = (raw_features * np.repeat(group_params.inverse, reps)).reshape(num_features, num_collected)
 
-    # Reshape the measurement values
-    recovered_features = np.reshape(decoded_features, (num_features, -1)).T
-
-    # Reshape to the proper size
-    return recovered_features, collected_indices, widths
+    return decoded, collected_indices, widths
 
 
 def encode_shifts(shifts: List[int], reps: List[int], widths: List[int], num_shift_bits: int, min_width: int) -> bytes:
@@ -334,6 +401,15 @@ def encode_shifts(shifts: List[int], reps: List[int], widths: List[int], num_shi
     Returns:
         The shifts and reps encoded as a byte string
     """
+    writer = BitWriter()
+    write_shifts(writer, shifts=shifts, reps=reps, widths=widths, num_shift_bits=num_shift_bits, min_width=min_width)
+    return writer.getvalue()
+
+
+def write_shifts(writer: BitWriter, shifts: List[int], reps: List[int], widths: List[int], num_shift_bits: int, min_width: int):
+    """
+    Writes the run-length encoded shifts (see encode_shifts()) as byte-aligned fields.
+    """
     assert len(shifts) == len(reps), 'Must provide same number of reps ({0}) and shifts ({1})'.format(len(reps), len(shifts))
     assert num_shift_bits < BITS_PER_BYTE, 'Number of shift bits must be less than {0}'.format(BITS_PER_BYTE)
 
@@ -341,30 +417,26 @@ def encode_shifts(shifts: List[int], reps: List[int], widths: List[int], num_shi
     width_mask = (1 << (BITS_PER_BYTE - num_shift_bits)) - 1
     shift_mask = (1 << num_shift_bits) - 1
 
-    # Encode the shift values
-    group_data: List[int] = []
-    for width, shift in zip(widths, shifts):
-        packed_data = ((width - min_width) & width_mask) << num_shift_bits
-        packed_data |= (shift & shift_mask)
+    # Encode the count and reps width
+    num_shifts = len(shifts)
+    reps_width = num_bits_for_value(max(reps))
 
-        group_data.append(packed_data)
+    combined = (num_shifts << 4) | (reps_width & 0xF)
 
-    encoded_groups = pack(group_data, width=BITS_PER_BYTE)
+    writer.align()
+    writer.write_bytes(combined.to_bytes(1, 'little'))
 
     # Encode the repetitions
-    reps_width = num_bits_for_value(max(reps))
-    encoded_reps = pack(reps, width=reps_width)
+    writer.write_field(reps, width=reps_width)
 
-    # Encode the count and reps width
-    num_shifts = len(shifts)
-    combined = (num_shifts << 4) | (reps_width & 0xF)
-    encoded_header = combined.to_bytes(1, 'little')
+    # Encode the shift values and widths (one byte per group)
+    group_data = np.left_shift(np.bitwise_and(np.asarray(widths) - min_width, width_mask), num_shift_bits)
+    group_data |= np.bitwise_and(shifts, shift_mask)
 
-    # Compile the result
-    return encoded_header + encoded_reps + encoded_groups
+    writer.write_field(group_data, width=BITS_PER_BYTE)
 
 
-def decode_shifts(encoded: bytes, num_shift_bits: int, min_width: int) -> Tuple[List[int], List[int], List[int], int]:
+def decode_shifts(encoded: Union[bytes, memoryview], num_shift_bits: int, min_width: int, offset: int = 0) -> Tuple[List[int], List[int], List[int], int]:
     """
     Decodes the shifts into a list of shift values
     and repetitions.
@@ -373,6 +445,7 @@ def decode_shifts(encoded: bytes, num_shift_bits: int, min_width: int) -> Tuple[
         encoded: The encoded shifts byte string (output of encode_shifts())
         num_shift_bits: The number of bits to use for shifts
         min_width: The minimum bit-width of each feature value
+        offset: The byte offset of the encoded shifts within the given string
     Returns:
         A tuple with four elements.
             (1) The shift values
@@ -380,38 +453,56 @@ def decode_shifts(encoded: bytes, num_shift_bits: int, min_width: int) -> Tuple[
             (3) The repetitions
             (4) The number of consumed bytes
     """
+    reader = BitReader(encoded, offset=offset)
+    shifts, widths, reps = read_shifts(reader, num_shift_bits=num_shift_bits, min_width=min_width)
+
+    return shifts, widths, reps, reader.tell() - offset
+
+
+def read_shifts(reader: BitReader, num_shift_bits: int, min_width: int) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Reads the run-length encoded shifts (see decode_shifts()) from the reader.
+    """
     # Extract the header elements
-    encoded_header = int(encoded[0])
+    encoded_header = reader.read(width=BITS_PER_BYTE)
     reps_width = encoded_header & 0xF
     num_shifts = ((encoded_header >> 4) & 0xF)
 
-    encoded = encoded[1:]
-
     # Get the repetitions
-    num_reps_bytes = int(math.ceil((num_shifts * reps_width) / BITS_PER_BYTE))
-    encoded_reps = encoded[0:num_reps_bytes]
-    reps = unpack(encoded_reps, width=reps_width, num_values=num_shifts)
-
-    encoded = encoded[num_reps_bytes:]
+    reps = reader.read_array(width=reps_width, num_values=num_shifts)
+    reader.align()
 
     # Get the shifts and group bit widths
-    shifts: List[int] = []
-    widths: List[int] = []
-
     width_mask = (1 << (BITS_PER_BYTE - num_shift_bits)) - 1
     shift_mask = (1 << (num_shift_bits)) - 1
 
-    for group_idx in range(num_shifts):
-        packed_data = encoded[group_idx]
-        shift = packed_data & shift_mask
-        width = (packed_data >> num_shift_bits) & width_mask
+    packed_data = reader.read_array(width=BITS_PER_BYTE, num_values=num_shifts)
+
+    shifts = np.bitwise_and(packed_data, shift_mask)
+    widths = np.bitwise_and(np.right_shift(packed_data, num_shift_bits), width_mask) + min_width
+
+    return shifts.tolist(), widths.tolist(), reps.tolist()
 
-        shifts.append(shift)
-        widths.append(width + min_width)
 
-    total_bytes = 1 + num_reps_bytes + num_shifts
+def make_output_buffer(out: Optional[np.ndarray], num_collected: int, num_features: int) -> np.ndarray:
+    """
+    Returns a [K, D] array to hold decoded measurements.
+
+    Args:
+        out: An optional [L, D] float64 buffer supplied by the caller (L >= K)
+        num_collected: The number of collected measurements (K)
+        num_features: The number of features per measurement (D)
+    Returns:
+        A [K, D] view into the given buffer, or a new array when no buffer is given
+    """
+    if out is None:
+        return np.empty((num_collected, num_features), dtype=float)
+
+    assert len(out.shape) == 2 and out.shape[1] == num_features, 'Must provide a [L, {0}] buffer. Got {1}'.format(num_features, out.shape)
+    assert out.shape[0] >= num_collected, 'Buffer has {0} rows but must hold {1} measurements'.format(out.shape[0], num_collected)
+    assert out.dtype == np.float64, 'Must provide a float64 buffer'
 
-    return shifts, widths, reps, total_bytes
+    return out[0:num_collected]
 
 
 def delta_encode(measurements: np.ndarray) -> np.ndarray:
@@ -457,3 +548,38 @@ def delta_decode(measurements: np.ndarray) -> np.ndarray:
         initial = np.expand_dims(measurements[0], axis=0)  # [1, D]
         deltas = np.cumsum(measurements[1:], axis=0)  # [K - 1, D]
         return np.vstack([initial, initial + deltas])
+
+
+def delta_encode_batch(measurements: np.ndarray) -> np.ndarray:
+    """
+    Delta encodes each sequence in the given batch. The result for
+    sequence i is identical to delta_encode(measurements[i]).
+
+    Args:
+        measurements: A [N, K, D] (or [N, K]) array of collected features
+    Returns:
+        A [N, K, D] (or [N, K]) array of delta encoded measurements
+    """
+    assert len(measurements.shape) in (2, 3), 'Must provide a 2d or 3d array'
+
+    encoded = np.empty_like(measurements)
+    encoded[:, 0] = measurements[:, 0]
+    np.subtract(measurements[:, 1:], measurements[:, :-1], out=encoded[:, 1:])
+    return encoded
+
+
+def delta_decode_batch(measurements: np.ndarray) -> np.ndarray:
+    """
+    Decodes each delta encoded sequence in the given batch. The result
+    for sequence i is identical to delta_decode(measurements[i]).
+
+    Args:
+        measurements: A [N, K, D] (or [N, K]) array of delta-encoded features
+    Returns:
+        The raw feature vectors
+    """
+    assert len(measurements.shape) in (2, 3), 'Must provide a 2d or 3d array'
+
+    initial = measurements[:, 0:1]  # [N, 1, D]
+    deltas = np.cumsum(measurements[:, 1:], axis=1)  # [N, K - 1, D]
+    return np.concatenate([initial, initial + deltas], axis=1)
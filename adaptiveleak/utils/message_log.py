@@ -0,0 +1,201 @@
+import json
+import numpy as np
+import os.path
+from typing import Any, Dict, Iterable, List, Optional
+
+from adaptiveleak.utils.file_utils import make_dir, read_json, read_json_gz, save_json
+
+
+MAGIC = b'AGELOG01'
+HEADER_LENGTH_SIZE = 4
+COLUMN_ALIGNMENT = 64
+LOG_EXTENSION = '.mlog'
+OUTPUTS_EXTENSION = '.outputs.json'
+MAX_OFFSET = (1 << 62)  # Placeholder with the most digits of any offset
+
+MESSAGES = 'messages'
+MESSAGE_OFFSETS = 'message_offsets'
+
+
+def message_log_path(result_path: str) -> str:
+    """
+    Returns the path of the message log which accompanies the given (json.gz) result file.
+    """
+    if result_path.endswith('.json.gz'):
+        result_path = result_path[:-len('.json.gz')]
+
+    return result_path + LOG_EXTENSION
+
+
+def result_outputs_path(result_path: str) -> str:
+    """
+    Returns the path of the (small) sidecar file which holds the analysis outputs (e.g. the attack
+    and leakage test results) of the given (json.gz) result file. Writing outputs to the sidecar
+    avoids rewriting the full result.
+    """
+    if result_path.endswith('.json.gz'):
+        result_path = result_path[:-len('.json.gz')]
+
+    return result_path + OUTPUTS_EXTENSION
+
+
+def read_result_outputs(result_path: str) -> Dict[str, Any]:
+    outputs_path = result_outputs_path(result_path)
+
+    if not os.path.exists(outputs_path):
+        return dict()
+
+    return read_json(outputs_path)
+
+
+def save_result_output(result_path: str, key: str, value: Any):
+    """
+    Stores the given output of the result file in its sidecar, keeping any other outputs.
+    """
+    outputs = read_result_outputs(result_path)
+    outputs[key] = value
+    save_json(outputs, result_outputs_path(result_path))
+
+
+def read_result(result_path: str) -> Dict[str, Any]:
+    """
+    Reads the (json.gz) result file along with the outputs in its sidecar. The sidecar
+    outputs take precedence over the same fields in the result.
+    """
+    result = read_json_gz(result_path)
+    result.update(read_result_outputs(result_path))
+    return result
+
+
+def _align(offset: int) -> int:
+    return ((offset + COLUMN_ALIGNMENT - 1) // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+
+
+def write_message_log(path: str, columns: Dict[str, Any], messages: Optional[Iterable[bytes]] = None, metadata: Optional[Dict[str, Any]] = None):
+    """
+    Writes the given columns (and optional raw messages) to a columnar log. The layout is
+    MAGIC | header length (4 bytes) | JSON header | columns, where the header holds the
+    dtype, shape and absolute byte offset of each (aligned) column. The messages are a single
+    uint8 blob where message i spans messages[message_offsets[i]:message_offsets[i + 1]].
+
+    Args:
+        path: The output path
+        columns: A map of column name to a (fixed-width) array or list of values
+        messages: An optional sequence of raw message byte strings
+        metadata: Optional JSON-serializable metadata to store in the header
+    """
+    arrays = {name: np.ascontiguousarray(np.asarray(values)) for name, values in columns.items()}
+
+    if messages is not None:
+        message_list = [bytes(m) for m in messages]
+        offsets = np.zeros(shape=(len(message_list) + 1, ), dtype=np.int64)
+        offsets[1:] = np.cumsum([len(m) for m in message_list])
+
+        arrays[MESSAGE_OFFSETS] = offsets
+        arrays[MESSAGES] = np.frombuffer(b''.join(message_list), dtype=np.uint8)
+
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise ValueError('Column {0} does not have a fixed-width type'.format(name))
+
+    # The header size depends on the column offsets, so we reserve space for the
+    # largest offsets before computing the real ones.
+    def make_header(offsets: Dict[str, int]) -> bytes:
+        header = {
+            'metadata': metadata if metadata is not None else dict(),
+            'columns': {name: {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offsets[name]} for name, array in arrays.items()}
+        }
+        return json.dumps(header).encode('utf-8')
+
+    reserved = len(make_header({name: MAX_OFFSET for name in arrays}))
+    data_start = _align(len(MAGIC) + HEADER_LENGTH_SIZE + reserved)
+
+    offsets: Dict[str, int] = dict()
+    offset = data_start
+    for name, array in arrays.items():
+        offsets[name] = offset
+        offset = _align(offset + array.nbytes)
+
+    header = make_header(offsets)
+    assert len(MAGIC) + HEADER_LENGTH_SIZE + len(header) <= data_start, 'Header overlaps the column data'
+
+    make_dir(os.path.dirname(path) if len(os.path.dirname(path)) > 0 else '.')
+
+    with open(path, 'wb') as fout:
+        fout.write(MAGIC)
+        fout.write(len(header).to_bytes(HEADER_LENGTH_SIZE, 'little'))
+        fout.write(header)
+
+        for name, array in arrays.items():
+            fout.write(b'\x00' * (offsets[name] - fout.tell()))
+            fout.write(array.tobytes())
+
+
+class MessageLog:
+    """
+    Read-only view of a columnar log. Columns are memory-mapped on first access,
+    so opening a log only parses the header.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+
+        with open(path, 'rb') as fin:
+            magic = fin.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError('The file {0} is not a message log'.format(path))
+
+            header_length = int.from_bytes(fin.read(HEADER_LENGTH_SIZE), 'little')
+            header = json.loads(fin.read(header_length).decode('utf-8'))
+
+        self._metadata = header['metadata']
+        self._columns = header['columns']
+        self._cache: Dict[str, np.ndarray] = dict()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self._metadata
+
+    @property
+    def column_names(self) -> List[str]:
+        return [name for name in self._columns if name not in (MESSAGES, MESSAGE_OFFSETS)]
+
+    @property
+    def num_messages(self) -> int:
+        if MESSAGE_OFFSETS not in self._columns:
+            return 0
+
+        return self._columns[MESSAGE_OFFSETS]['shape'][0] - 1
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._cache:
+            if name not in self._columns:
+                raise KeyError('Unknown column {0}'.format(name))
+
+            column = self._columns[name]
+            shape = tuple(column['shape'])
+
+            if int(np.prod(shape)) == 0:
+                self._cache[name] = np.empty(shape=shape, dtype=np.dtype(column['dtype']))
+            else:
+                self._cache[name] = np.memmap(self._path, mode='r', dtype=np.dtype(column['dtype']), offset=column['offset'], shape=shape)
+
+        return self._cache[name]
+
+    def message(self, idx: int) -> memoryview:
+        """
+        Returns the raw bytes of the message with the given index.
+        """
+        offsets = self[MESSAGE_OFFSETS]
+        return memoryview(self[MESSAGES][offsets[idx]:offsets[idx + 1]])
+
+
+def read_message_log(path: str) -> MessageLog:
+    return MessageLog(path)
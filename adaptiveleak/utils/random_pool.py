@@ -0,0 +1,170 @@
+import os
+import threading
+import weakref
+import numpy as np
+from Cryptodome.Random import get_random_bytes
+from typing import List, Optional, Union
+
+
+RANDOM_POOL_SIZE = 4096
+
+
+class _LocalBuffer(threading.local):
+    buffer = b''
+    position = 0
+
+
+class RandomPool:
+    """
+    Serves cryptographically secure random bytes from a buffer which
+    is refilled in large blocks. This amortizes the cost of drawing from
+    the operating system's CSPRNG across many (small) requests.
+
+    Each thread draws from its own buffer, so the pool is thread-safe without
+    locking. A forked child discards the buffered bytes of its parent (otherwise
+    both processes would serve the same bytes) and draws new blocks.
+    """
+
+    def __init__(self, pool_size: int = RANDOM_POOL_SIZE):
+        assert pool_size > 0, 'The pool size must be positive. Got {0}'.format(pool_size)
+        self._pool_size = pool_size
+        self._reset()
+
+        _LIVE_POOLS.add(self)
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    def _reset(self):
+        self._local = _LocalBuffer()
+        self._pid = os.getpid()
+
+    def get_bytes(self, num_bytes: int) -> bytes:
+        """
+        Returns the given number of random bytes. Bytes are never served twice.
+        """
+        if num_bytes <= 0:
+            return b''
+
+        # Serve large requests directly
+        if num_bytes > self._pool_size:
+            return get_random_bytes(num_bytes)
+
+        # The at-fork hook resets the pool where available, so we only pay for
+        # the (syscall-based) pid check on other platforms.
+        if (not _HAS_FORK_HOOK) and (self._pid != os.getpid()):
+            self._reset()
+
+        local = self._local
+        buffer = local.buffer
+        position = local.position
+        end = position + num_bytes
+
+        if end > len(buffer):
+            buffer = get_random_bytes(self._pool_size)
+            local.buffer = buffer
+            position = 0
+            end = num_bytes
+
+        local.position = end
+        return buffer[position:end]
+
+
+class SeededRandomPool:
+    """
+    Deterministic byte source for reproducible benchmarks and tests. This
+    is NOT cryptographically secure and must never produce real padding or IVs.
+
+    The bytes depend only on the seed and the total number of bytes requested
+    (not on how requests are split).
+    """
+
+    def __init__(self, seed: int, pool_size: int = RANDOM_POOL_SIZE):
+        assert pool_size > 0, 'The pool size must be positive. Got {0}'.format(pool_size)
+        self._seed = seed
+        self._pool_size = pool_size
+        self._rand = np.random.RandomState(seed=seed)
+        self._lock = threading.Lock()
+        self._buffer = b''
+        self._position = 0
+
+    @property
+    def seed(self) -> int:
+        return self._seed
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    def get_bytes(self, num_bytes: int) -> bytes:
+        if num_bytes <= 0:
+            return b''
+
+        with self._lock:
+            chunks: List[bytes] = []
+            remaining = num_bytes
+
+            while remaining > 0:
+                if self._position == len(self._buffer):
+                    self._buffer = self._rand.bytes(self._pool_size)
+                    self._position = 0
+
+                end = min(self._position + remaining, len(self._buffer))
+                chunks.append(self._buffer[self._position:end])
+                remaining -= end - self._position
+                self._position = end
+
+        return b''.join(chunks)
+
+
+class ZeroPool:
+    """
+    Serves zero bytes. Only valid when the message contents never leave the
+    process (e.g. size-only simulations which skip all encryption).
+    """
+
+    def get_bytes(self, num_bytes: int) -> bytes:
+        return bytes(max(num_bytes, 0))
+
+
+BytePool = Union[RandomPool, SeededRandomPool, ZeroPool]
+
+
+# Track the live secure pools so forked children can drop the parent's buffers
+_LIVE_POOLS: 'weakref.WeakSet[RandomPool]' = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for pool in list(_LIVE_POOLS):
+        pool._reset()
+
+
+_HAS_FORK_HOOK = hasattr(os, 'register_at_fork')
+if _HAS_FORK_HOOK:
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+_PADDING_POOL: BytePool = RandomPool()
+
+
+def get_padding_pool() -> BytePool:
+    """
+    Returns the process-wide source of message padding.
+    """
+    return _PADDING_POOL
+
+
+def set_padding_pool(pool: Optional[BytePool]) -> BytePool:
+    """
+    Replaces the process-wide source of message padding (e.g. with a SeededRandomPool
+    for reproducible benchmarks or a ZeroPool for size-only simulations). Passing None restores a secure pool.
+
+    Returns:
+        The previous padding pool
+    """
+    global _PADDING_POOL
+
+    previous = _PADDING_POOL
+    _PADDING_POOL = pool if pool is not None else RandomPool()
+    return previous
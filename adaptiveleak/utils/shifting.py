@@ -2,7 +2,7 @@ import numpy as np
 import math
 from typing import List, Tuple
 
-from adaptiveleak.utils.data_utils import array_to_float, array_to_fp, num_bits_for_value
+from adaptiveleak.utils.data_utils import array_to_float, array_to_fp, num_bits_for_value, run_starts, run_lengths
 from adaptiveleak.utils.constants import BIG_NUMBER, BITS_PER_BYTE
 
 
@@ -161,26 +161,31 @@ def merge_shift_groups(values: List[float], shifts: List[int], max_num_groups: i
 
 
 def compute_runs(values: List[int]) -> Tuple[List[int], List[int]]:
-    current = values[0]
-    current_count = 1
+    values = np.asarray(values)
 
-    encoded: List[int] = []
-    reps: List[int] = []
+    starts = run_starts(values[1:] != values[:-1])
+    reps = run_lengths(starts, num_values=len(values))
 
-    for i in range(1, len(values)):
-        val = values[i]
+    return values[starts].tolist(), reps.tolist()
 
-        if (val != current):
-            encoded.append(current)
-            reps.append(current_count)
 
-            current = val
-            current_count = 1
-        else:
-            current_count += 1
+def compute_runs_batch(values: np.ndarray) -> List[Tuple[List[int], List[int]]]:
+    """
+    Computes the runs for each row of the given [N, L] array. The result
+    for row i is identical to compute_runs(values[i]).
+    """
+    assert len(values.shape) == 2, 'Must provide a 2d array of values'
+    num_rows, num_values = values.shape
+
+    is_start = np.ones(values.shape, dtype=bool)
+    is_start[:, 1:] = values[:, 1:] != values[:, :-1]
+
+    row_idx, col_idx = np.nonzero(is_start)
+    row_splits = np.searchsorted(row_idx, np.arange(1, num_rows))
 
-    # Always include the final element
-    encoded.append(current)
-    reps.append(current_count)
+    results: List[Tuple[List[int], List[int]]] = []
+    for row, starts in enumerate(np.split(col_idx, row_splits)):
+        reps = run_lengths(starts, num_values=num_values)
+        results.append((values[row, starts].tolist(), reps.tolist()))
 
-    return encoded, reps
+    return results